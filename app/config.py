@@ -11,19 +11,114 @@ class Settings(BaseSettings):
     # 🔐 SEGURANÇA
     # ============================================================
     SECRET_KEY: str = "auditasimples-super-secret-key"  # troque depois se quiser
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 14
+    AUTH_HASH_THREADS: int = 2       # threads dedicadas ao hash de senha (scrypt)
+    AUTH_USER_RECHECK_SECONDS: int = 60  # de quanto em quanto tempo o token reconfere is_active/token_version
 
     # ============================================================
     # 🌐 CORS / FRONTEND
     # ============================================================
     FRONTEND_ORIGIN: str = "https://auditasimples.io"
 
+    # ============================================================
+    # 🩺 HEALTH / MÉTRICAS
+    # ============================================================
+    METRICS_ENABLED: bool = True
+    HEALTH_MAX_IN_FLIGHT: int = 64   # acima disso o /health responde 503 (instância saturada)
+    HEALTH_MAX_ANALYSES: int = 4     # análises simultâneas por worker antes de sair do balanceador
+
+    # ============================================================
+    # 🚦 LIMITES DAS ROTAS PESADAS (análise / relatório)
+    # ============================================================
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_PER_MINUTE: float = 30    # reposição do token bucket por usuário
+    RATE_LIMIT_BURST: int = 10           # rajada máxima
+    MAX_CONCURRENT_PER_USER: int = 2     # análises simultâneas por usuário
+    MAX_CONCURRENT_PER_CLIENT: int = 2   # análises simultâneas por client_id
+    SINGLEFLIGHT_DIR: str = ""           # diretório compartilhado para coalescer análises entre workers
+    SINGLEFLIGHT_TTL_SECONDS: int = 120  # validade do resultado compartilhado em disco
+
+    # ============================================================
+    # 🧪 PRÉ-ANÁLISE DO ZIP (diretório central + cabeçalho dos membros)
+    # ============================================================
+    ZIP_MAX_MEMBERS: int = 200_000
+    ZIP_MAX_UNCOMPRESSED_MB: int = 2048     # soma declarada dos membros
+    ZIP_MAX_MEMBER_MB: int = 50             # por XML candidato (maiores são ignorados); NF-e tem poucos KB
+    ZIP_MAX_RATIO: int = 100                # taxa de compressão suspeita (zip bomb)
+    ANALYSIS_MB_PER_SECOND: float = 3.0     # vazão medida da análise (MB de XML/s), para estimar o custo
+    ANALYSIS_MAX_ESTIMATED_SECONDS: int = 0 # 0 = sem limite
+    ANALYSIS_CHECKPOINT_ENABLED: bool = True # guarda os membros que falharam por linhagem; não são relidos
+    INCREMENTAL_ANALYSIS_ENABLED: bool = True # nova versão do mesmo ZIP: só membros novos/alterados são analisados
+    ANALYSIS_MEMORY_BUDGET_MB: int = 0      # >0: ZIP com XML acima disso roda fora da memória (agregados em disco)
+    ANALYSIS_SPILL_DIR: str = ""            # arquivos temporários do modo fora da memória (vazio = TMPDIR)
+
+    # ============================================================
+    # 🔗 PRODUTOS QUASE DUPLICADOS (MinHash/LSH)
+    # ============================================================
+    NEAR_DUP_ENABLED: bool = True
+    NEAR_DUP_THRESHOLD: int = 85           # fuzz.ratio mínimo por token para juntar descrições
+    PRODUCT_MASTER_ENABLED: bool = True    # classificação em cache por (cliente, cProd, descrição)
+
+    # ============================================================
+    # 🔝 RANKINGS (produtos duplicados; ver services/topk.py)
+    # ============================================================
+    RANKING_MODE: str = "completo"         # completo | topk | limitado; as rotas aceitam ?ranking=&top=
+    RANKING_TOP_K: int = 50                # itens do ranking nos modos topk/limitado
+    RANKING_CAPACITY: int = 10000          # limitado: descrições retidas (SpaceSaving)
+    RANKING_SKETCH_WIDTH: int = 4096       # limitado: Count-Min das ocorrências (largura x profundidade)
+    RANKING_SKETCH_DEPTH: int = 4
+
+    # ============================================================
+    # 🎯 MOTOR DE CLASSIFICAÇÃO
+    # ============================================================
+    CLASSIFIER_ENGINE: str = "regras"      # regras (JsonMatcher) | tfidf; as rotas aceitam ?motor=
+    TFIDF_MIN_SCORE: float = 0.10          # cosseno mínimo com o centróide da categoria
+
+    # ============================================================
+    # 🗄️ ARMAZENAMENTO DOS UPLOADS (blob store por sha256)
+    # ============================================================
+    LOCAL_STORAGE_DIR: str = "./storage"
+    BLOB_BACKEND: str = "local"           # local | s3 (S3 / MinIO, requer boto3)
+    S3_BUCKET: str = ""
+    S3_ENDPOINT_URL: str = ""             # ex.: http://localhost:9000 para MinIO
+    S3_PREFIX: str = "auditasimples/"
+    ANALYSIS_CACHE_ENABLED: bool = True   # guarda o resultado da análise junto do blob
+    BLOB_GC_GRACE_SECONDS: int = 3600     # blobs sem referência sobrevivem esse tempo
+    ITEM_STORE_DIR: str = ""              # Parquet dos itens para /api/items (vazio = LOCAL_STORAGE_DIR/items; requer duckdb)
+
+    # ============================================================
+    # 📥 INGESTÃO DE PASTAS (python -m app.services.ingest)
+    # ============================================================
+    INGEST_ENABLED: bool = False          # roda o ingestor dentro do app (uma pasta = um só ingestor, via flock)
+    INGEST_DIRS: str = ""                 # client_id=/caminho;client_id=/caminho
+    INGEST_WORKERS: int = 2               # pré-análises simultâneas
+    INGEST_POLL_SECONDS: float = 5.0      # varredura (sem inotify ou como rede de segurança)
+    INGEST_STABLE_SECONDS: float = 10.0   # tamanho/mtime parados por esse tempo = gravação terminou
+    INGEST_PREWARM: bool = True           # pré-calcula a análise do dashboard e o Parquet dos itens
+
+    # ============================================================
+    # 🗜️ COMPRESSÃO E CACHE HTTP
+    # ============================================================
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_BYTES: int = 1024     # respostas menores vão sem compressão
+    COMPRESSION_GZIP_LEVEL: int = 6       # compressão na hora (por requisição)
+    COMPRESSION_BROTLI_QUALITY: int = 4   # br só com o pacote brotli instalado
+    PRECOMPRESSED_RESULTS: bool = True    # dashboard serializado + gzip/br gravados junto do resultado
+    HTTP_ETAGS_ENABLED: bool = True       # ETag / If-None-Match → 304 nas leituras
+
+    # ============================================================
+    # 🚀 STARTUP
+    # ============================================================
+    MATCHER_WARMUP: bool = True      # carrega o dicionário em background no startup
+
     # ============================================================
     # ⚙️ CONFIGURAÇÃO PADRÃO DO Pydantic
     # ============================================================
     class Config:
         env_file = ".env"
         case_sensitive = True
-        extra = "ignore"  # 👈 ignora variáveis extras (ex: DATABASE_URL, LOCAL_STORAGE_DIR)
+        extra = "ignore"  # 👈 ignora variáveis extras (ex: DATABASE_URL)
 
 
 # Instância única usada pelo app inteiro
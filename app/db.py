@@ -1,33 +1,118 @@
 import os
-from sqlalchemy import create_engine
+import logging
+import threading
+from typing import Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import NullPool
 from dotenv import load_dotenv
 
-# ============================================================
-# 🔧 CARREGA VARIÁVEIS DE AMBIENTE (.env)
-# ============================================================
-load_dotenv()
+from app.services.metrics import DB_POOL_EVENTS
+
+logger = logging.getLogger(__name__)
 
 # ============================================================
 # 🌍 DETECÇÃO AUTOMÁTICA DE AMBIENTE
 # ============================================================
-# Render define DATABASE_URL automaticamente (PostgreSQL)
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-if DATABASE_URL:
-    # Corrige o prefixo do Render (necessário para SQLAlchemy)
-    if DATABASE_URL.startswith("postgres://"):
-        DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-    print(f"🌐 Usando banco PostgreSQL (Render): {DATABASE_URL}")
-else:
+def resolve_database_url() -> str:
+    """
+    Lê o .env e resolve a URL do banco. Chamado só na criação do engine
+    (nada de I/O no import do módulo).
+    """
+    load_dotenv()
+
+    # Render define DATABASE_URL automaticamente (PostgreSQL)
+    url = os.getenv("DATABASE_URL")
+    if url:
+        # Corrige o prefixo do Render (necessário para SQLAlchemy)
+        if url.startswith("postgres://"):
+            url = url.replace("postgres://", "postgresql://", 1)
+        return url
+
     # Local MySQL (XAMPP, Laragon etc.)
-    MYSQL_USER = os.getenv("MYSQL_USER", "root")
-    MYSQL_PASS = os.getenv("MYSQL_PASSWORD", "")
-    MYSQL_HOST = os.getenv("MYSQL_HOST", "localhost")
-    MYSQL_DB = os.getenv("MYSQL_DATABASE", "auditasimples")
+    mysql_user = os.getenv("MYSQL_USER", "root")
+    mysql_pass = os.getenv("MYSQL_PASSWORD", "")
+    mysql_host = os.getenv("MYSQL_HOST", "localhost")
+    mysql_db = os.getenv("MYSQL_DATABASE", "auditasimples")
+    return f"mysql+pymysql://{mysql_user}:{mysql_pass}@{mysql_host}/{mysql_db}"
+
+
+def redact_url(url: str) -> str:
+    """DSN sem a senha, seguro para logs."""
+    try:
+        return make_url(url).render_as_string(hide_password=True)
+    except Exception:
+        return "<DATABASE_URL inválida>"
+
+
+# ============================================================
+# 🎛️ POOL DE CONEXÕES (ajustável por variável de ambiente)
+# ============================================================
+# Defaults por backend. Com N workers do uvicorn, o total de conexões é
+# N * (DB_POOL_SIZE + DB_MAX_OVERFLOW) — deixe abaixo do max_connections.
+# pool_recycle fica abaixo do idle timeout do servidor, por isso o
+# pre-ping (1 round-trip a cada checkout) vem desligado por padrão.
+POOL_DEFAULTS = {
+    "postgresql": {"pool_size": 5, "max_overflow": 5, "pool_recycle": 300, "pool_timeout": 10},
+    "mysql":      {"pool_size": 5, "max_overflow": 10, "pool_recycle": 3600, "pool_timeout": 10},
+}
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        logger.warning(f"⚠️ {name}={raw!r} inválido, usando {default}")
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "on")
+
+
+def build_engine_kwargs(url: str) -> dict:
+    """
+    Monta os argumentos do create_engine conforme o backend:
+      - DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_RECYCLE / DB_POOL_TIMEOUT
+      - DB_POOL_PRE_PING=1 para reativar o ping a cada checkout
+      - DB_NULLPOOL=1 para PgBouncer (sem pool no app; o PgBouncer faz o pool)
+      - DB_STATEMENT_TIMEOUT_MS para limitar consultas longas
+    """
+    backend = make_url(url).get_backend_name()
+    kwargs: dict = {
+        "echo": _env_bool("DB_ECHO", False),  # True para debug SQL
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", False),
+    }
+
+    if backend == "sqlite":
+        # SQLite local (README): sem pool dimensionado; libera uso entre threads do FastAPI
+        kwargs["connect_args"] = {"check_same_thread": False}
+        return kwargs
+
+    defaults = POOL_DEFAULTS.get(backend, POOL_DEFAULTS["postgresql"])
+    if _env_bool("DB_NULLPOOL", False):
+        kwargs["poolclass"] = NullPool
+    else:
+        kwargs["pool_size"] = _env_int("DB_POOL_SIZE", defaults["pool_size"])
+        kwargs["max_overflow"] = _env_int("DB_MAX_OVERFLOW", defaults["max_overflow"])
+        kwargs["pool_recycle"] = _env_int("DB_POOL_RECYCLE", defaults["pool_recycle"])
+        kwargs["pool_timeout"] = _env_int("DB_POOL_TIMEOUT", defaults["pool_timeout"])
+        kwargs["pool_use_lifo"] = True  # reaproveita conexões quentes; ociosas expiram pelo recycle
+
+    statement_timeout_ms = _env_int("DB_STATEMENT_TIMEOUT_MS", 0)
+    if statement_timeout_ms > 0 and backend == "postgresql":
+        # parâmetro de startup: vale também atrás do PgBouncer, sem SET por sessão
+        kwargs["connect_args"] = {"options": f"-c statement_timeout={statement_timeout_ms}"}
+
+    return kwargs
 
-    DATABASE_URL = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASS}@{MYSQL_HOST}/{MYSQL_DB}"
-    print(f"💾 Usando banco MySQL local: {DATABASE_URL}")
 
 # ============================================================
 # 🧱 BASE SQLALCHEMY
@@ -35,20 +120,65 @@ else:
 Base = declarative_base()
 
 # ============================================================
-# ⚙️ ENGINE E SESSÃO
+# ⚙️ ENGINE E SESSÃO (criados no primeiro uso)
 # ============================================================
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,  # testa conexões mortas automaticamente
-    echo=False,          # mude para True para debug SQL
-)
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def _register_pool_events(engine: Engine) -> None:
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, conn_record):
+        DB_POOL_EVENTS.inc(event="connect")
+
+        statement_timeout_ms = _env_int("DB_STATEMENT_TIMEOUT_MS", 0)
+        if statement_timeout_ms > 0 and engine.dialect.name == "mysql":
+            # MySQL não aceita timeout na conexão; MAX_EXECUTION_TIME limita SELECTs
+            cursor = dbapi_conn.cursor()
+            cursor.execute(f"SET SESSION MAX_EXECUTION_TIME={statement_timeout_ms}")
+            cursor.close()
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+        DB_POOL_EVENTS.inc(event="checkout")
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_conn, conn_record, exception):
+        DB_POOL_EVENTS.inc(event="invalidate")
+
+
+def get_engine() -> Engine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                url = resolve_database_url()
+                kwargs = build_engine_kwargs(url)
+                engine = create_engine(url, **kwargs)
+                _register_pool_events(engine)
+                SessionLocal.configure(bind=engine)
+                logger.info(
+                    f"💾 Banco {engine.dialect.name}: {redact_url(url)} "
+                    f"(pool={type(engine.pool).__name__}, size={kwargs.get('pool_size', '-')}, "
+                    f"overflow={kwargs.get('max_overflow', '-')})"
+                )
+                _engine = engine
+    return _engine
+
+
+def __getattr__(name: str):
+    # compatibilidade com `from app.db import engine`
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ============================================================
 # 🧩 FUNÇÃO DE SESSÃO (para usar com Depends)
 # ============================================================
 def get_session():
+    get_engine()
     db = SessionLocal()
     try:
         yield db
@@ -64,6 +194,5 @@ def init_db():
     Chame essa função uma vez no main.py se quiser auto-criação.
     """
     import app.models.clients  # importa os modelos (expande conforme necessário)
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
     print("✅ Tabelas criadas com sucesso!")
-
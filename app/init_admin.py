@@ -1,29 +1,48 @@
-import hashlib
+import os
+
 from sqlalchemy.orm import Session
 
-from app.db import SessionLocal, engine, Base
+from app.db import SessionLocal, get_engine, Base
 from app.models import User
-
-def hash_password(password: str) -> str:
-    """Gera hash SHA256 da senha."""
-    return hashlib.sha256(password.encode("utf-8")).hexdigest()
+from app.services.schema import upgrade_schema
+from app.services.security import hash_password
 
 def init_admin():
-    """Cria usuário admin padrão, se não existir."""
+    """
+    Cria as tabelas, adiciona colunas/índices novos em bancos antigos e o
+    usuário admin padrão, se não existir (idempotente).
+    Credenciais: ADMIN_USER / ADMIN_PASS / ADMIN_EMAIL.
+    """
+    engine = get_engine()
     Base.metadata.create_all(bind=engine)
+    for stmt in upgrade_schema(engine):
+        print("🧱", stmt)
     db: Session = SessionLocal()
 
+    username = os.getenv("ADMIN_USER", "admin")
+    password = os.getenv("ADMIN_PASS", "102030")
+    email = os.getenv("ADMIN_EMAIL", "admin@auditasimples.io")
+
     try:
-        admin = db.query(User).filter(User.username == "admin").first()
+        admin = db.query(User).filter(User.username == username).first()
         if admin:
             print("✅ Usuário admin já existe.")
             return
 
-        hashed_pwd = hash_password("102030*")
+        # banco antigo: o admin existia só por email e o upgrade deu a ele
+        # username = email; assume o ADMIN_USER em vez de duplicar o email
+        legacy = db.query(User).filter(User.email == email, User.username == email).first()
+        if legacy:
+            legacy.username = username
+            legacy.role = "admin"
+            db.commit()
+            print(f"✅ Usuário admin antigo ({email}) agora entra como {username}.")
+            return
+
         admin_user = User(
-            username="admin",
-            email="admin@auditasimples.io",
-            hashed_password=hashed_pwd,
+            username=username,
+            email=email,
+            hashed_password=hash_password(password),
             is_active=True,
             role="admin",
         )
@@ -31,8 +50,7 @@ def init_admin():
         db.add(admin_user)
         db.commit()
         print("✅ Usuário admin criado com sucesso!")
-        print("👤 Login: admin")
-        print("🔑 Senha: 102030*")
+        print(f"👤 Login: {username}")
     except Exception as e:
         print("❌ Erro ao criar admin:", e)
     finally:
@@ -1,15 +1,51 @@
-from fastapi import FastAPI
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import auth, uploads, dashboard, dictionary, clients, company
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import text
+
+from app.config import settings
+from app.db import get_engine
+from app.routers import auth, uploads, dashboard, dictionary, clients, company, reports, overrides, items
+from app.services import metrics
+from app.services.ai_matcher import get_matcher, is_matcher_loaded
+from app.utils.compression import CompressionMiddleware
+from app.utils.http_cache import ETagMiddleware
 
 # ============================================================
 # 🚀 CRIAÇÃO DO APP
 # ============================================================
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Aquece o matcher em background: o worker já aceita conexões e o
+    # /health só fica pronto quando o dicionário terminar de carregar.
+    warmup = None
+    if settings.MATCHER_WARMUP:
+        warmup = asyncio.get_running_loop().run_in_executor(None, get_matcher)
+    auth.warm_dummy_hash()  # hash de referência do login, no pool de hash
+    ingestor = None
+    if settings.INGEST_ENABLED:
+        from app.services.ingest import from_settings
+
+        ingestor = from_settings()
+        if ingestor is not None:
+            ingestor.start()
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+    if ingestor is not None:
+        ingestor.stop()
+
+
 app = FastAPI(
     title="AuditaSimples API",
     description="API fiscal e tributária do AuditaSimples (versão simples, sem banco)",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # ============================================================
@@ -30,8 +66,41 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # cursor da paginação das listagens
 )
 
+# ============================================================
+# 📈 MÉTRICAS POR REQUISIÇÃO
+# ============================================================
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    if not settings.METRICS_ENABLED:
+        return await call_next(request)
+
+    metrics.HTTP_REQUESTS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # usa o template da rota (/api/uploads/analyze/{upload_id}) para não explodir cardinalidade
+        metrics.HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=metrics.route_label(request.scope),
+            status=str(status),
+        )
+        metrics.HTTP_REQUESTS_IN_FLIGHT.dec()
+
+# ============================================================
+# 🗜️ COMPRESSÃO E ETAG (a compressão fica por fora: comprime o corpo já versionado)
+# ============================================================
+
+app.add_middleware(ETagMiddleware)
+app.add_middleware(CompressionMiddleware)
 
 # ============================================================
 # 📦 ROTAS
@@ -45,11 +114,64 @@ app.include_router(dashboard.router,  prefix="/api/dashboard",  tags=["Dashboard
 app.include_router(dictionary.router, prefix="/api/dictionary", tags=["Dictionary"])
 app.include_router(clients.router,    prefix="/api/clients",    tags=["Clients"])
 app.include_router(company.router,    prefix="/api/company",    tags=["Company"])
+app.include_router(reports.router,    prefix="/api/reports",    tags=["Reports"])
+app.include_router(overrides.router,  prefix="/api/overrides",  tags=["Overrides"])
+app.include_router(items.router,      prefix="/api/items",      tags=["Items"])
 
 # ============================================================
 # 🩺 HEALTH CHECK
 # ============================================================
 
+def _check_db() -> bool:
+    try:
+        with get_engine().connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+    except Exception:
+        return False
+
+
+def _check_matcher() -> bool:
+    return is_matcher_loaded()
+
+
+@app.get("/health/live")
+def liveness():
+    return {"status": "ok"}
+
+
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "message": "AuditaSimples API funcionando corretamente (sem banco)"}
+    """
+    Readiness para o balanceador: 503 se o banco não responde, o matcher
+    não carregou ou o worker está saturado.
+    """
+    in_flight = int(metrics.HTTP_REQUESTS_IN_FLIGHT.get())
+    analyses = int(metrics.ANALYSIS_IN_PROGRESS.get())
+    checks = {
+        "database": _check_db(),
+        "matcher": _check_matcher(),
+        "capacity": (
+            in_flight <= settings.HEALTH_MAX_IN_FLIGHT
+            and analyses < settings.HEALTH_MAX_ANALYSES
+        ),
+    }
+    ready = all(checks.values())
+    body = {
+        "status": "ok" if ready else "unavailable",
+        "message": "AuditaSimples API funcionando corretamente" if ready else "Instância indisponível",
+        "checks": checks,
+        "in_flight": in_flight,
+        "analyses_in_progress": analyses,
+        "db_pool": metrics.pool_status(get_engine()),
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
+# ============================================================
+# 📊 MÉTRICAS (formato Prometheus)
+# ============================================================
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    return Response(metrics.render_prometheus(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
@@ -2,12 +2,23 @@ from .upload import Upload
 from .company import Company
 from .clients import Client
 from .user import User
+from .refresh_token import RefreshToken
 from .reports import Report
+from .documents import NfeDocument, NfeItem
+from .blob import Blob
+from .product_master import ProductMaster
+from .override import ClassificationOverride
 
 __all__ = [
     "Upload",
     "Company",
     "Client",
     "User",
+    "RefreshToken",
     "Report",
+    "NfeDocument",
+    "NfeItem",
+    "Blob",
+    "ProductMaster",
+    "ClassificationOverride",
 ]
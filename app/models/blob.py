@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime
+from sqlalchemy.sql import func
+from ..db import Base
+
+# ============================================================
+# 🗄️ CONTEÚDO DOS UPLOADS (endereçado por sha256)
+# ============================================================
+# Cada ZIP é guardado uma vez só; uploads com o mesmo conteúdo apontam
+# para o mesmo blob. refcount = nº de uploads que usam o blob; com 0 o
+# blob (e os resultados de análise em cache) é removido pelo GC.
+
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    size_bytes = Column(BigInteger, nullable=False)
+    refcount = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_referenced_at = Column(DateTime(timezone=True), server_default=func.now())
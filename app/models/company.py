@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from ..db import Base
@@ -13,3 +13,7 @@ class Company(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     client = relationship("Client", backref="companies")
+
+    __table_args__ = (
+        Index("ix_companies_client_id", "client_id", "id"),
+    )
@@ -0,0 +1,50 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Numeric, Index
+from ..db import Base
+
+# ============================================================
+# 🧾 DOCUMENTOS E ITENS PARSEADOS (gravados em lote)
+# ============================================================
+# Sem FK entre item e documento: os itens referenciam a chave da NF-e
+# dentro do upload, o que permite inserir tudo em lote sem precisar ler
+# de volta os IDs gerados dos documentos.
+
+class NfeDocument(Base):
+    __tablename__ = "nfe_documents"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    upload_id = Column(Integer, nullable=False)
+    client_id = Column(Integer, nullable=False)
+    chave = Column(String(60), nullable=False)
+    numero = Column(String(20))
+    issue_date = Column(DateTime)
+    total_value = Column(Numeric(15, 2), nullable=False, default=0)
+    member_name = Column(String(512))
+
+    __table_args__ = (
+        Index("ix_nfe_documents_upload_chave", "upload_id", "chave"),
+        Index("ix_nfe_documents_client_issue", "client_id", "issue_date"),
+    )
+
+
+class NfeItem(Base):
+    __tablename__ = "nfe_items"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    upload_id = Column(Integer, nullable=False)
+    client_id = Column(Integer, nullable=False)
+    chave = Column(String(60), nullable=False)
+    n_item = Column(Integer, nullable=False)
+    cprod = Column(String(60))
+    xprod = Column(String(255))
+    ncm = Column(String(10))
+    cfop = Column(String(4))
+    csosn = Column(String(4))
+    qcom = Column(String(30))
+    vuncom = Column(String(30))
+    vprod = Column(Numeric(15, 2), nullable=False, default=0)
+    issue_date = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_nfe_items_upload_chave", "upload_id", "chave"),
+        Index("ix_nfe_items_client_issue", "client_id", "issue_date"),
+    )
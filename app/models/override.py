@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from sqlalchemy.sql import func
+from datetime import datetime, timezone
+from ..db import Base
+
+# ============================================================
+# ✍️ CORREÇÕES DE CLASSIFICAÇÃO CONFIRMADAS PELO CONTADOR
+# ============================================================
+# client_id NULL = vale para todos os clientes.
+# tipo: cprod | descricao | ncm; valor já normalizado (ver services/overrides).
+# categoria NULL = "não é monofásico" (corrige falso positivo).
+
+class ClassificationOverride(Base):
+    __tablename__ = "classification_overrides"
+
+    id = Column(Integer, primary_key=True, index=True)
+    client_id = Column(Integer, nullable=True)
+    tipo = Column(String(10), nullable=False)
+    valor = Column(String(255), nullable=False)
+    categoria = Column(String(100), nullable=True)
+    criado_por = Column(String(100))
+    # default no Python (com microssegundos): entra na versão das correções
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(),
+                        default=lambda: datetime.now(timezone.utc),
+                        onupdate=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index("ix_overrides_client_tipo_valor", "client_id", "tipo", "valor"),
+    )
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+from ..db import Base
+
+# ============================================================
+# 🏷️ CADASTRO DE PRODUTOS POR CLIENTE (classificação em cache)
+# ============================================================
+# O mesmo cliente vende os mesmos cProd todo mês. A classificação da
+# descrição fica gravada por (cliente, cProd, hash da descrição normalizada)
+# junto com a versão do dicionário que a produziu; outra versão do
+# dicionário ou outra descrição para o mesmo código = classifica de novo.
+
+class ProductMaster(Base):
+    __tablename__ = "product_master"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    client_id = Column(Integer, nullable=False)
+    cprod = Column(String(60), nullable=False)
+    desc_hash = Column(String(16), nullable=False)
+    descricao = Column(String(255))
+    categoria = Column(String(100))          # None = não monofásico
+    metodo = Column(String(10), nullable=False)  # token | fuzzy | nenhum
+    score = Column(Integer, nullable=False, default=0)
+    dictionary_version = Column(String(64), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("client_id", "cprod", "desc_hash", name="uq_product_master_key"),
+    )
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy.sql import func
+from ..db import Base
+
+# ============================================================
+# 🔄 REFRESH TOKENS EMITIDOS (uso único)
+# ============================================================
+# Cada refresh token carrega um jti; a troca marca used_at. Reapresentar um
+# jti já usado é reuso (token vazado): o token_version do usuário sobe e
+# todas as sessões dele caem.
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    jti = Column(String(64), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    used_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, JSON, Index
 from datetime import datetime
 from ..db import Base
 
@@ -11,3 +11,8 @@ class Report(Base):
     upload_id = Column(Integer, ForeignKey("uploads.id"), nullable=False)
     data = Column(JSON, nullable=False)  # guarda os resultados da análise
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_reports_company_created", "company_id", "created_at", "id"),
+        Index("ix_reports_client_created", "client_id", "created_at", "id"),
+    )
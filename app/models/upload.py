@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
-from sqlalchemy import LargeBinary
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, Index
 from ..db import Base
 from sqlalchemy.sql import func
+from datetime import datetime, timezone
 
 class Upload(Base):
     __tablename__ = "uploads"
@@ -9,5 +9,18 @@ class Upload(Base):
     id = Column(Integer, primary_key=True, index=True)
     client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
     filename = Column(String, nullable=False)
-    filepath = Column(LargeBinary, nullable=False)
-    uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
+    # caminho de origem informado pelo usuário (informativo); o conteúdo fica no blob store
+    filepath = Column(String(1024), nullable=True)
+    sha256 = Column(String(64), index=True, nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    # versões do mesmo arquivo (mesmo nome ou versao_de): id do primeiro upload da linhagem
+    lineage_id = Column(Integer, ForeignKey("uploads.id"), nullable=True, index=True)
+    # default no Python também: o SQLite grava CURRENT_TIMESTAMP sem microssegundos,
+    # diferente do formato dos parâmetros, o que quebraria o cursor da paginação
+    uploaded_at = Column(DateTime(timezone=True), server_default=func.now(),
+                         default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        # listagem por cliente, mais recentes primeiro (keyset em uploaded_at, id)
+        Index("ix_uploads_client_uploaded", "client_id", "uploaded_at", "id"),
+    )
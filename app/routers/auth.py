@@ -1,70 +1,234 @@
-from datetime import datetime, timedelta
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+import asyncio
+import secrets
+import time
 
-import jwt
 from fastapi import APIRouter, Depends, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 
 from app.config import settings
+from app.db import SessionLocal, get_engine
+from app.models import RefreshToken, User
+from app.services.security import (
+    create_access_token,
+    create_refresh_token,
+    decode_token,
+    hash_password_async,
+    needs_rehash,
+    submit_hash,
+    verify_access_token,
+    verify_password_async,
+)
 
 router = APIRouter(tags=["Auth"])
 security = HTTPBearer(auto_error=False)
 
-# ============================================================
-# 🔐 USUÁRIO FIXO (SEM BANCO)
-# ============================================================
 
-HARDCODED_USERNAME = "admin"
-HARDCODED_PASSWORD = "102030"  # <- senha fixa
+# comparado quando o usuário não existe: o tempo de resposta não revela quais
+# usernames estão cadastrados. Calculado no pool de hash (agendado no startup),
+# nunca no event loop.
+_dummy: Optional[Future] = None
+
+
+def warm_dummy_hash() -> None:
+    global _dummy
+    if _dummy is None:
+        _dummy = submit_hash("auditasimples-dummy")
+
 
-JWT_ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60
+async def _dummy_hash() -> str:
+    warm_dummy_hash()
+    return await asyncio.wrap_future(_dummy)
 
 
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: Optional[str] = None
+    expires_in: int = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
 
 
 # ============================================================
-# 🔐 UTILITÁRIO PARA CRIAR TOKEN
+# 🔐 UTILITÁRIOS DE TOKEN
 # ============================================================
 
 def create_token(sub: str) -> str:
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    payload = {"sub": sub, "exp": expire}
-    return jwt.encode(payload, settings.SECRET_KEY, algorithm=JWT_ALGORITHM)
+    return create_access_token(sub)
+
+
+def _issue_tokens(user: User) -> TokenResponse:
+    """Novo par; o jti do refresh é registrado para valer uma vez só (bloqueante)."""
+    version = user.token_version or 0
+    return TokenResponse(
+        access_token=create_access_token(user.username, role=user.role, ver=version),
+        refresh_token=create_refresh_token(user.username, version, jti=_register_refresh(user.id)),
+    )
+
+
+# ============================================================
+# 👥 USUÁRIOS (banco)
+# ============================================================
+
+def _load_user(username: str) -> Optional[User]:
+    get_engine()
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+        if user is not None:
+            db.expunge(user)
+        return user
+    finally:
+        db.close()
+
+
+def _register_refresh(user_id: int) -> str:
+    jti = secrets.token_urlsafe(24)
+    now = datetime.now(timezone.utc)
+    get_engine()
+    db = SessionLocal()
+    try:
+        # os expirados do usuário saem aqui mesmo, sem job de limpeza
+        db.query(RefreshToken).filter(
+            RefreshToken.user_id == user_id, RefreshToken.expires_at < now
+        ).delete(synchronize_session=False)
+        db.add(RefreshToken(jti=jti, user_id=user_id,
+                            expires_at=now + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)))
+        db.commit()
+    finally:
+        db.close()
+    return jti
+
+
+def _redeem_refresh(username: str, jti: str, version: int) -> Optional[User]:
+    """
+    Consome o refresh token: marca o jti como usado num UPDATE condicional
+    (só um de dois pedidos simultâneos vence). Devolve o usuário, ou None se
+    o token foi revogado. Um jti já usado é reuso: o token_version sobe e
+    todas as sessões do usuário caem.
+    """
+    now = datetime.now(timezone.utc)
+    get_engine()
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+        if user is None or not user.is_active or (user.token_version or 0) != version:
+            return None
+        used = db.query(RefreshToken).filter(
+            RefreshToken.jti == jti,
+            RefreshToken.user_id == user.id,
+            RefreshToken.used_at.is_(None),
+        ).update({"used_at": now}, synchronize_session=False)
+        if used != 1:
+            db.query(User).filter(User.id == user.id).update(
+                {"token_version": User.token_version + 1}, synchronize_session=False
+            )
+            db.commit()
+            _user_status.pop(username, None)
+            return None
+        db.commit()
+        db.refresh(user)
+        db.expunge(user)
+        return user
+    finally:
+        db.close()
+
+
+def _update_password_hash(user_id: int, new_hash: str) -> None:
+    get_engine()
+    db = SessionLocal()
+    try:
+        db.query(User).filter(User.id == user_id).update({"hashed_password": new_hash})
+        db.commit()
+    finally:
+        db.close()
 
 
 # ============================================================
-# 🧠 LOGIN (sem banco, só usuário fixo)
+# 🧠 LOGIN
 # ============================================================
 
 @router.post("/login", response_model=TokenResponse)
-def login(
+async def login(
     username: str = Form(...),
     password: str = Form(...),
 ):
     """
-    Recebe username e password via formulário (FormData)
-    e valida contra o usuário fixo admin / 102030.
+    Recebe username e password via formulário (FormData) e valida contra a
+    tabela users. O hash roda no pool dedicado, fora do event loop.
     """
+    user = await run_in_threadpool(_load_user, username)
+    stored = user.hashed_password if user else await _dummy_hash()
+    ok = await verify_password_async(password, stored)
+    if not user or not ok or not user.is_active:
+        raise HTTPException(status_code=401, detail="Usuário ou senha inválidos")
 
-    if username != HARDCODED_USERNAME:
-        raise HTTPException(status_code=401, detail="Usuário não encontrado")
+    # hashes antigos (sha256 sem salt) migram para scrypt no primeiro login
+    if needs_rehash(user.hashed_password):
+        new_hash = await hash_password_async(password)
+        await run_in_threadpool(_update_password_hash, user.id, new_hash)
 
-    if password != HARDCODED_PASSWORD:
-        raise HTTPException(status_code=401, detail="Senha incorreta")
+    return await run_in_threadpool(_issue_tokens, user)
 
-    token = create_token(username)
-    return TokenResponse(access_token=token)
+
+# ============================================================
+# 🔄 REFRESH
+# ============================================================
+
+@router.post("/refresh", response_model=TokenResponse)
+async def refresh(refresh_token: str = Form(...)):
+    """Troca um refresh token válido por um novo par (rotação, uso único)."""
+    try:
+        claims = decode_token(refresh_token, "refresh")
+    except Exception:
+        raise HTTPException(status_code=401, detail="Refresh token inválido")
+    # refresh emitido antes do jti: não dá para garantir uso único, pede novo login
+    if not claims.get("jti"):
+        raise HTTPException(status_code=401, detail="Refresh token inválido")
+
+    user = await run_in_threadpool(
+        _redeem_refresh, claims.get("sub") or "", claims["jti"], claims.get("ver", 0)
+    )
+    if not user:
+        raise HTTPException(status_code=401, detail="Refresh token revogado")
+    return await run_in_threadpool(_issue_tokens, user)
+
+
+def token_subject(token: str):
+    """'sub' de um token válido, ou None (não levanta erro)."""
+    try:
+        return verify_access_token(token).get("sub")
+    except Exception:
+        return None
 
 
 # ============================================================
 # 👤 OBTÉM USUÁRIO ATUAL A PARTIR DO TOKEN
-# (caso você queira reutilizar nas outras rotas futuramente)
+# (claims verificadas ficam em cache até o token expirar; is_active e
+# token_version do usuário são reconferidos no banco a cada
+# AUTH_USER_RECHECK_SECONDS)
 # ============================================================
 
+# username → (ativo, token_version, quando conferiu)
+_user_status: Dict[str, Tuple[bool, int, float]] = {}
+
+
+def _user_state(username: str) -> Tuple[bool, int]:
+    entry = _user_status.get(username)
+    now = time.monotonic()
+    if entry is None or now - entry[2] >= settings.AUTH_USER_RECHECK_SECONDS:
+        user = _load_user(username)
+        if user is None:
+            entry = (False, 0, now)
+        else:
+            entry = (bool(user.is_active), user.token_version or 0, now)
+        _user_status[username] = entry
+    return entry[0], entry[1]
+
+
 def get_current_user(
     creds: HTTPAuthorizationCredentials = Depends(security),
 ) -> str:
@@ -72,16 +236,16 @@ def get_current_user(
         raise HTTPException(status_code=401, detail="Não autenticado")
 
     try:
-        payload = jwt.decode(
-            creds.credentials,
-            settings.SECRET_KEY,
-            algorithms=[JWT_ALGORITHM],
-        )
+        payload = verify_access_token(creds.credentials)
     except Exception:
         raise HTTPException(status_code=401, detail="Token inválido")
 
     username = payload.get("sub")
-    if username != HARDCODED_USERNAME:
+    if not username:
         raise HTTPException(status_code=401, detail="Usuário inválido")
 
+    active, version = _user_state(username)
+    if not active or payload.get("ver", 0) != version:
+        raise HTTPException(status_code=401, detail="Token revogado")
+
     return username
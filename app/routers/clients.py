@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List
 from ..db import get_session
 from ..models.clients import Client
+from ..utils.pagination import PageParams, keyset_page
 
 router = APIRouter()
 
@@ -43,9 +44,9 @@ def create_client(payload: ClientCreate, db: Session = Depends(get_session)):
 # 📋 Listar clientes
 # ============================================================
 @router.get("/", response_model=List[ClientOut])
-def list_clients(db: Session = Depends(get_session)):
-    clients = db.query(Client).all()
-    return clients
+def list_clients(response: Response, page: PageParams = Depends(), db: Session = Depends(get_session)):
+    # paginado por id (?limit=&cursor=, próximo cursor em X-Next-Cursor)
+    return keyset_page(db.query(Client), Client.id, Client.id, page, response, descending=False)
 
 
 # ============================================================
@@ -1,16 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from ..db import get_session
 from ..models.company import Company
 from ..models.clients import Client
+from ..utils.pagination import PageParams, keyset_page
 
 router = APIRouter()
 
-@router.get("/")
-def company_root():
-    return {"status": "ok"}
-
 # 📌 Criar empresa vinculada a um cliente
 @router.post("/", response_model=dict)
 def create_company(client_id: int, name: str, cnpj: str, db: Session = Depends(get_session)):
@@ -28,10 +25,18 @@ def create_company(client_id: int, name: str, cnpj: str, db: Session = Depends(g
     db.refresh(company)
     return {"id": company.id, "name": company.name, "cnpj": company.cnpj}
 
-# 📌 Listar empresas
+# 📌 Listar empresas (paginado por id; ?client_id= usa o índice client_id+id)
 @router.get("/", response_model=List[dict])
-def list_companies(db: Session = Depends(get_session)):
-    companies = db.query(Company).all()
+def list_companies(
+    response: Response,
+    client_id: Optional[int] = None,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_session),
+):
+    query = db.query(Company)
+    if client_id is not None:
+        query = query.filter(Company.client_id == client_id)
+    companies = keyset_page(query, Company.id, Company.id, page, response, descending=False)
     return [{"id": c.id, "name": c.name, "cnpj": c.cnpj, "client_id": c.client_id} for c in companies]
 
 # 📌 Buscar empresa por ID
@@ -1,27 +1,46 @@
 import logging
 import json
 from collections import defaultdict
+from decimal import Decimal
 from pathlib import Path
-from fastapi import APIRouter, HTTPException, Query, Depends
-from fastapi.responses import FileResponse
+from datetime import date
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from rapidfuzz import fuzz
 
 from app.models import Upload
 from app.db import get_session
 from app.services.analysis import run_analysis_from_bytes
-from app.services.report_docx import gerar_relatorio_fiscal  # mantém seu relatório existente
+from app.services.blobstore import get_cached_result, has_cached_result, open_upload
+from app.services.dictionary_artifact import norm_text
+from app.services.singleflight import run_upload_analysis, start_upload_analysis, upload_params_key
+from app.services.tax_periods import parse_monthly_param
+from app.services.zipscan import ArchiveRejected, check_archive
+from app.services.money import apply_rate, cents_to_float, to_cents
+from app.routers.guards import HeavySlot, heavy_route_guard
+from app.utils.http_cache import (
+    cache_headers, cached_json_response, make_etag, is_not_modified, not_modified, store_json_response,
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 MONOFASICOS_FILE = Path(__file__).resolve().parent.parent / "data" / "monofasicos.json"
+# formato do payload do dashboard: mudou → muda o ETag e as respostas gravadas
+PAYLOAD_VERSION = 4
 
 def load_monofasicos_map() -> dict:
+    """categoria normalizada (norm_text, como no matcher) → palavras normalizadas."""
+    return {cat: palavras for cat, (_, palavras) in _load_monofasicos().items()}
+
+
+def _load_monofasicos() -> dict:
+    """categoria normalizada → (nome como está no JSON, palavras normalizadas)."""
     try:
         with open(MONOFASICOS_FILE, "r", encoding="utf-8") as f:
             data = json.load(f)
-        return {cat.lower(): [p.lower() for p in palavras] for cat, palavras in data.items()}
+        return {norm_text(cat): (cat, [norm_text(p) for p in palavras]) for cat, palavras in data.items()}
     except Exception as e:
         logger.error(f"⚠️ Erro ao carregar monofasicos.json: {e}")
         return {}
@@ -29,7 +48,7 @@ def load_monofasicos_map() -> dict:
 def match_descricao_categoria(descricao: str, mapa: dict, limiar: int = 80):
     if not descricao:
         return False, None, None, 0
-    desc = descricao.lower()
+    desc = norm_text(descricao)
     melhor = (False, None, None, 0)
     for categoria, palavras in mapa.items():
         for kw in palavras:
@@ -39,149 +58,381 @@ def match_descricao_categoria(descricao: str, mapa: dict, limiar: int = 80):
     return melhor
 
 # ============================================================
-# 📊 DASHBOARD
+# 🧩 AUXILIARES DAS ROTAS
 # ============================================================
-@router.get("/")
-def get_dashboard(
-    client_id: int = Query(...),
-    upload_id: int = Query(...),
-    aliquota: float | None = Query(None),
-    imposto_pago: float | None = Query(None),
-    db: Session = Depends(get_session)
-):
+def _parse_inputs(aliquota, imposto_pago):
+    aliq_in = None
+    if aliquota is not None:
+        aliq_in = float(aliquota)
+        if aliq_in > 1:
+            aliq_in /= 100.0
+    imp_pago_in = float(imposto_pago) if imposto_pago is not None else None
+    return aliq_in, imp_pago_in
+
+
+def _check_monthly(aliquotas_mensais: str | None, impostos_pagos_mensais: str | None) -> None:
+    """Entradas mensais malformadas viram 422 antes de abrir o ZIP."""
     try:
-        aliq_in = None
-        if aliquota is not None:
-            aliq_in = float(aliquota)
-            if aliq_in > 1:
-                aliq_in /= 100.0
+        parse_monthly_param(aliquotas_mensais, percent=True)
+        parse_monthly_param(impostos_pagos_mensais)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
-        imp_pago_in = float(imposto_pago) if imposto_pago is not None else None
 
-        upload = db.query(Upload).filter(Upload.id == upload_id).first()
-        if not upload:
-            raise HTTPException(status_code=404, detail="Upload não encontrado")
+def _get_upload(db: Session, upload_id: int) -> Upload:
+    upload = db.query(Upload).filter(Upload.id == upload_id).first()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload não encontrado")
+    return upload
 
-        with open(upload.filepath, "rb") as f:
-            zip_bytes = f.read()
 
-        aliq_para_analise = aliq_in if imp_pago_in is None else None
-        imp_para_analise  = imp_pago_in if imp_pago_in is not None else None
-        result = run_analysis_from_bytes(zip_bytes, aliq_para_analise, imp_para_analise)
+def _check_upload_zip(upload: Upload) -> None:
+    """Conteúdo ausente (404) ou ZIP inválido (422) viram status antes de abrir o stream."""
+    try:
+        with open_upload(upload) as f:
+            check_archive(f)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Arquivo do upload não encontrado")
+    except ArchiveRejected as e:
+        raise HTTPException(status_code=422, detail=e.to_detail())
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao ler o arquivo do upload: {e}")
 
-        tax_raw       = result.get("tax_summary") or {}
-        faturamento   = float(tax_raw.get("faturamento") or result.get("total_value_sum") or 0.0)
-        receita_exc   = float(tax_raw.get("receita_excluida") or 0.0)
-        base_corrig   = float(tax_raw.get("base_corrigida") or (faturamento - receita_exc))
 
-        if aliq_in is not None:
-            aliq_final = aliq_in
-        elif imp_pago_in is not None and faturamento > 0:
-            aliq_final = imp_pago_in / faturamento
-        else:
-            aliq_final = 0.0
-
-        imposto_corr  = base_corrig * aliq_final
-        if imp_pago_in is not None:
-            diff = imp_pago_in - imposto_corr
-            economia = max(round(diff, 2), 0)
-            a_pagar  = abs(min(round(diff, 2), 0))
-            imp_pago_final = imp_pago_in
-        else:
-            economia = round(receita_exc * aliq_final, 2)
-            a_pagar  = 0.0
-            imp_pago_final = 0.0
+def _response_version(upload: Upload, *parts) -> str | None:
+    """
+    Versão da resposta sem abrir o ZIP: conteúdo (sha256) + params_key da
+    análise (dicionário, correções, motor) + o que a rota acrescenta.
+    Uploads antigos (sem sha256) não têm versão.
+    """
+    if not upload.sha256:
+        return None
+    return make_etag(upload.sha256, *parts)
 
-        mapa      = load_monofasicos_map()
-        produtos  = result.get("products", [])
+
+
+def build_dashboard_payload(result: dict, aliq_in, imp_pago_in, mensal: bool = False) -> dict:
+    """Monta a resposta do dashboard a partir do resultado da análise."""
+    # 💰 Tudo em centavos inteiros; float só na resposta
+    faturamento_c = int(result.get("total_value_cents") or 0)
+    receita_exc_c = int(result.get("revenue_excluded_cents") or 0)
+    base_corrig_c = faturamento_c - receita_exc_c
+
+    if mensal:
+        # entradas por competência: a análise já somou mês a mês
+        ts = result["tax_summary"]
+        aliq_final = Decimal(str(ts["aliquota_utilizada"]))
+    elif aliq_in is not None:
+        aliq_final = Decimal(str(aliq_in))
+    elif imp_pago_in is not None and faturamento_c > 0:
+        aliq_final = Decimal(to_cents(imp_pago_in)) / Decimal(faturamento_c)
+    else:
+        aliq_final = Decimal(0)
+
+    imposto_corr_c = apply_rate(base_corrig_c, aliq_final)
+    if mensal:
+        imp_pago_c = to_cents(ts["imposto_pago"])
+        imposto_corr_c = to_cents(ts["imposto_corrigido"])
+        economia_c = to_cents(ts["economia_estimada"])
+    elif imp_pago_in is not None:
+        imp_pago_c = to_cents(imp_pago_in)
+        economia_c = max(imp_pago_c - imposto_corr_c, 0)
+    else:
+        imp_pago_c = 0
+        economia_c = apply_rate(receita_exc_c, aliq_final)
+    economia = cents_to_float(economia_c)
+
+    dicionario = _load_monofasicos()
+    mapa      = {cat: palavras for cat, (_, palavras) in dicionario.items()}
+    produtos  = result.get("products", [])
+    # contagens da análise (contadores completos, categoria normalizada do matcher);
+    # a lista de produtos só dá os exemplos, pela categoria gravada em cada produto
+    mono_desc = result.get("monofasico_desc")
+    cat_counter = result.get("categorias_detectadas")
+    recount = cat_counter is None  # resultado gravado antes das contagens na análise
+    if recount:
         mono_desc = 0
-        cat_counter  = defaultdict(int)
-        cat_examples = defaultdict(list)
-        produtos_dedup = {}
+        cat_counter = defaultdict(int)
+    cat_examples = defaultdict(list)
 
-        for p in produtos:
-            desc  = p.get("descricao") or p.get("xProd") or ""
-            valor = float(p.get("valor_total") or p.get("vProd") or 0.0)
+    for p in produtos:
+        if not recount and all(len(cat_examples[c]) >= 5 for c in cat_counter):
+            break
+        desc  = p.get("descricao") or p.get("xProd") or ""
+        categoria = p.get("categoria")
+        if categoria is not None and not recount:
+            if categoria not in cat_counter or len(cat_examples[categoria]) >= 5:
+                continue
+            # palavra do exemplo: a mais parecida dentro da categoria do matcher
+            _, _, palavra, _ = match_descricao_categoria(desc, {categoria: mapa.get(categoria, [])}, 0)
+            score = p.get("score")
+        else:
             hit, categoria, palavra, score = match_descricao_categoria(desc, mapa, 80)
-            if hit:
+            if not hit:
+                continue
+            if recount:
                 mono_desc += 1
                 cat_counter[categoria] += 1
-                if len(cat_examples[categoria]) < 5:
-                    cat_examples[categoria].append(
-                        {"descricao": desc, "palavra": palavra, "score": score, "valor": valor}
-                    )
-            key = desc.strip().lower()
-            item = produtos_dedup.get(key)
-            if not item:
-                produtos_dedup[key] = {"descricao": desc, "ocorrencias": 1, "valor_total": valor}
-            else:
-                item["ocorrencias"] += 1
-                item["valor_total"] += valor
-
-        produtos_dedup_list = sorted(produtos_dedup.values(), key=lambda x: x["valor_total"], reverse=True)
-        categorias_detectadas = [
-            {"categoria": cat, "ocorrencias": count, "exemplos": cat_examples[cat]}
-            for cat, count in sorted(cat_counter.items(), key=lambda kv: kv[1], reverse=True)
-        ]
-
-        result["tax_summary"] = {
-            "faturamento": round(faturamento, 2),
-            "base_corrigida": round(base_corrig, 2),
-            "receita_excluida": round(receita_exc, 2),
-            "imposto_pago": round(imp_pago_final, 2),
-            "imposto_corrigido": round(imposto_corr, 2),
-            "economia_estimada": round(economia, 2),
-            "aliquota_utilizada": round(aliq_final, 6),
-        }
+            elif categoria not in cat_counter:
+                continue
+        if len(cat_examples[categoria]) < 5:
+            valor_c = p.get("valor_total_cents")
+            if valor_c is None:
+                valor_c = to_cents(p.get("valor_total") or p.get("vProd"))
+            cat_examples[categoria].append(
+                {"descricao": desc, "palavra": palavra, "score": score, "valor": cents_to_float(valor_c)}
+            )
 
-        return {
-            "cards": {
-                "documentos": result.get("documents", 0),
-                "itens": result.get("items", 0),
-                "valor_total": round(result.get("total_value_sum", 0.0), 2),
-                "economia_simulada": economia,
-                "periodo": f"{result.get('period_start')} - {result.get('period_end')}",
-            },
-            "erros_fiscais": {
-                "monofasico_desc": mono_desc,
-                "categorias_detectadas": categorias_detectadas,
-                "produtos_duplicados": produtos_dedup_list,
-            },
-            "tributario": result["tax_summary"],
+    # grupos de quase duplicados já calculados na análise (near_dup)
+    produtos_dedup_list = [
+        {
+            "descricao": g.get("descricao", ""),
+            "ocorrencias": g.get("ocorrencias", 0),
+            "valor_total": g.get("valor_total", 0.0),
+            "variantes": g.get("variantes", [g.get("descricao", "")]),
+            "n_variantes": g.get("n_variantes", 1),
+            # ranking limitado: valor observado + o quanto pode faltar
+            **({"aproximado": True, "erro_max": cents_to_float(g.get("erro_max_cents", 0))}
+               if g.get("aproximado") else {}),
         }
+        for g in result.get("produtos_duplicados", [])
+    ]
+    # nome exibido como está no monofasicos.json (com acento); a chave é normalizada
+    categorias_detectadas = [
+        {"categoria": dicionario.get(cat, (cat,))[0], "ocorrencias": count, "exemplos": cat_examples[cat]}
+        for cat, count in sorted(cat_counter.items(), key=lambda kv: kv[1], reverse=True)
+    ]
+
+    # não altera `result`: ele pode ser compartilhado (single-flight)
+    tax_summary = {
+        "faturamento": cents_to_float(faturamento_c),
+        "base_corrigida": cents_to_float(base_corrig_c),
+        "receita_excluida": cents_to_float(receita_exc_c),
+        "imposto_pago": cents_to_float(imp_pago_c),
+        "imposto_corrigido": cents_to_float(imposto_corr_c),
+        "economia_estimada": economia,
+        "aliquota_utilizada": round(float(aliq_final), 6),
+    }
+
+    return {
+        "cards": {
+            "documentos": result.get("documents", 0),
+            "documentos_com_erro": result.get("documentos_com_erro", 0),
+            "itens": result.get("items", 0),
+            "valor_total": cents_to_float(faturamento_c),
+            "economia_simulada": economia,
+            "periodo": f"{result.get('period_start')} - {result.get('period_end')}",
+        },
+        "erros_fiscais": {
+            "monofasico_desc": mono_desc,
+            "categorias_detectadas": categorias_detectadas,
+            "produtos_duplicados": produtos_dedup_list,
+        },
+        "tributario": tax_summary,
+        "ranking": result.get("ranking", {"modo": "completo"}),
+        "periodos": result.get("periodos", []),
+        "periodos_resumo": result.get("periodos_resumo", {}),
+        "errors": result.get("errors", []),
+    }
+
+
+# ============================================================
+# 📊 DASHBOARD
+# ============================================================
+@router.get("/")
+def get_dashboard(
+    request: Request,
+    client_id: int = Query(...),
+    upload_id: int = Query(...),
+    aliquota: float | None = Query(None),
+    imposto_pago: float | None = Query(None),
+    aliquotas_mensais: str | None = Query(None, description="Alíquota por competência: 2024-01:6,5;2024-02:7"),
+    impostos_pagos_mensais: str | None = Query(None, description="DAS pago por competência: 2024-01:1234,56;2024-02:980"),
+    motor: str | None = Query(None, pattern="^(regras|tfidf)$", description="Motor de classificação (padrão: CLASSIFIER_ENGINE)"),
+    ranking: str | None = Query(None, pattern="^(completo|topk|limitado)$", description="Produtos duplicados: completo, topk ou limitado (memória fixa, aproximado)"),
+    top: int | None = Query(None, ge=1, le=10_000, description="Itens do ranking nos modos topk/limitado (padrão: RANKING_TOP_K)"),
+    db: Session = Depends(get_session),
+    slot: HeavySlot | None = Depends(heavy_route_guard),
+):
+    try:
+        aliq_in, imp_pago_in = _parse_inputs(aliquota, imposto_pago)
+        _check_monthly(aliquotas_mensais, impostos_pagos_mensais)
+        upload = _get_upload(db, upload_id)
+
+        aliq_para_analise = aliq_in if imp_pago_in is None else None
+        imp_para_analise  = imp_pago_in if imp_pago_in is not None else None
+        mensal = bool(aliquotas_mensais or impostos_pagos_mensais)
+        analysis_params = dict(aliquotas_mensais=aliquotas_mensais,
+                               impostos_pagos_mensais=impostos_pagos_mensais, motor=motor,
+                               ranking=ranking, top=top)
+
+        # 304 / resposta já serializada (e comprimida) antes de abrir o ZIP
+        etag = None
+        if upload.sha256:
+            pkey = upload_params_key(upload, aliq_para_analise, imp_para_analise, **analysis_params)
+            etag = _response_version(upload, pkey, "dashboard", PAYLOAD_VERSION, aliq_in, imp_pago_in, mensal)
+            if is_not_modified(request.headers, etag):
+                return not_modified(etag)
+            rendered_name = "dashboard-" + etag.strip('"') + ".json"
+            cached = cached_json_response(request, upload.sha256, rendered_name, etag)
+            if cached is not None:
+                return cached
+
+        # token e vaga do rate limit só quando a análise vai rodar (sem resultado em cache)
+        if slot is not None and not (upload.sha256 and has_cached_result(upload.sha256, pkey)):
+            slot.acquire()
+        # dashboard e DOCX do mesmo upload/parâmetros dividem a mesma análise
+        result, _ = run_upload_analysis(
+            upload, aliquota=aliq_para_analise, imposto_pago=imp_para_analise, **analysis_params,
+        )
+        payload = build_dashboard_payload(result, aliq_in, imp_pago_in, mensal=mensal)
+        if etag is None:
+            return payload
+        return store_json_response(request, upload.sha256, rendered_name, etag, payload)
+    except HTTPException:
+        raise
+    except ArchiveRejected as e:
+        raise HTTPException(status_code=422, detail=e.to_detail())
     except Exception as e:
         logger.exception("❌ Erro inesperado ao gerar dashboard")
         raise HTTPException(status_code=500, detail=f"Erro ao gerar relatório fiscal: {str(e)}")
 
+# ============================================================
+# 📡 DASHBOARD EM STREAMING (NDJSON / SSE)
+# ============================================================
+def _encode_event(event: dict, formato: str) -> str:
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    if formato == "sse":
+        return f"event: {event.get('event', 'message')}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+@router.get("/stream")
+def stream_dashboard(
+    client_id: int = Query(...),
+    upload_id: int = Query(...),
+    aliquota: float | None = Query(None),
+    imposto_pago: float | None = Query(None),
+    aliquotas_mensais: str | None = Query(None),
+    impostos_pagos_mensais: str | None = Query(None),
+    motor: str | None = Query(None, pattern="^(regras|tfidf)$"),
+    ranking: str | None = Query(None, pattern="^(completo|topk|limitado)$"),
+    top: int | None = Query(None, ge=1, le=10_000),
+    formato: str = Query("ndjson", pattern="^(ndjson|sse)$"),
+    db: Session = Depends(get_session),
+    slot: HeavySlot | None = Depends(heavy_route_guard),
+):
+    """
+    Progresso da análise em tempo real. Eventos 'progress' trazem documentos
+    processados, parciais e contagem por categoria; o último evento ('result')
+    traz o mesmo payload de GET /api/dashboard/. A análise é a mesma do
+    dashboard e do DOCX (singleflight + cache de resultado): com o resultado
+    em cache sai só o 'result'; senão um 'status' de início e, se a mesma
+    análise já roda em outra requisição, o 'result' quando ela termina (sem
+    parciais).
+    """
+    aliq_in, imp_pago_in = _parse_inputs(aliquota, imposto_pago)
+    _check_monthly(aliquotas_mensais, impostos_pagos_mensais)
+    upload = _get_upload(db, upload_id)
+    aliq_para_analise = aliq_in if imp_pago_in is None else None
+    mensal = bool(aliquotas_mensais or impostos_pagos_mensais)
+    analysis_params = dict(aliquotas_mensais=aliquotas_mensais,
+                           impostos_pagos_mensais=impostos_pagos_mensais, motor=motor,
+                           ranking=ranking, top=top)
+
+    cached = None
+    if upload.sha256:
+        pkey = upload_params_key(upload, aliq_para_analise, imp_pago_in, **analysis_params)
+        cached = get_cached_result(upload.sha256, pkey)
+    if cached is None:
+        # blob ausente / ZIP inválido: erro HTTP aqui, antes de abrir o stream
+        _check_upload_zip(upload)
+        if slot is not None:
+            slot.acquire()
+
+    # a vaga só é liberada quando a análise (ou o stream do resultado em cache) termina
+    if slot is not None:
+        slot.defer()
+    if cached is not None:
+        steps = iter([{"event": "result", "totals": cached, "compartilhado": True}])
+    else:
+        steps = start_upload_analysis(upload, aliq_para_analise, imp_pago_in, **analysis_params,
+                                      on_done=slot.release if slot is not None else None)
+
+    def _events():
+        try:
+            if cached is None:
+                yield _encode_event({"event": "status", "status": "analisando"}, formato)
+            for step in steps:
+                if step["event"] == "result":
+                    payload = build_dashboard_payload(step["totals"], aliq_in, imp_pago_in, mensal=mensal)
+                    yield _encode_event({"event": "result", "compartilhado": step["compartilhado"],
+                                         "dashboard": payload}, formato)
+                else:
+                    yield _encode_event(step, formato)
+        except ArchiveRejected as e:
+            yield _encode_event({"event": "error", "status": 422, "detail": e.to_detail()}, formato)
+        except Exception as e:
+            logger.exception("❌ Erro no streaming do dashboard")
+            yield _encode_event({"event": "error", "status": 500, "detail": str(e)}, formato)
+        finally:
+            if slot is not None and cached is not None:
+                slot.release()
+
+    media_type = "text/event-stream" if formato == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        _events(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # ============================================================
 # 📄 RELATÓRIO DOCX
 # ============================================================
 @router.get("/relatorio-fiscal")
 def get_relatorio_fiscal_docx(
+    request: Request,
     client_id: int = Query(...),
     upload_id: int = Query(...),
     aliquota: float | None = Query(None),
     imposto_pago: float | None = Query(None),
-    db: Session = Depends(get_session)
+    aliquotas_mensais: str | None = Query(None, description="Alíquota por competência: 2024-01:6,5;2024-02:7"),
+    impostos_pagos_mensais: str | None = Query(None, description="DAS pago por competência: 2024-01:1234,56;2024-02:980"),
+    motor: str | None = Query(None, pattern="^(regras|tfidf)$", description="Motor de classificação (padrão: CLASSIFIER_ENGINE)"),
+    ranking: str | None = Query(None, pattern="^(completo|topk|limitado)$", description="Produtos duplicados: completo, topk ou limitado (memória fixa, aproximado)"),
+    top: int | None = Query(None, ge=1, le=10_000, description="Itens do ranking nos modos topk/limitado (padrão: RANKING_TOP_K)"),
+    db: Session = Depends(get_session),
+    slot: HeavySlot | None = Depends(heavy_route_guard),
 ):
     try:
-        aliq_in = None
-        if aliquota is not None:
-            aliq_in = float(aliquota)
-            if aliq_in > 1:
-                aliq_in /= 100.0
-        imp_pago_in = float(imposto_pago) if imposto_pago is not None else None
-
-        upload = db.query(Upload).filter(Upload.id == upload_id).first()
-        if not upload:
-            raise HTTPException(status_code=404, detail="Upload não encontrado")
-
-        with open(upload.filepath, "rb") as f:
-            zip_bytes = f.read()
+        aliq_in, imp_pago_in = _parse_inputs(aliquota, imposto_pago)
+        _check_monthly(aliquotas_mensais, impostos_pagos_mensais)
+        upload = _get_upload(db, upload_id)
 
         aliq_para_analise = aliq_in if imp_pago_in is None else None
         imp_para_analise  = imp_pago_in if imp_pago_in is not None else None
-        result = run_analysis_from_bytes(zip_bytes, aliq_para_analise, imp_para_analise)
+        analysis_params = dict(aliquotas_mensais=aliquotas_mensais,
+                               impostos_pagos_mensais=impostos_pagos_mensais, motor=motor,
+                               ranking=ranking, top=top)
+
+        # o DOCX traz a data de emissão: a versão vale até o fim do dia
+        etag = None
+        if upload.sha256:
+            pkey = upload_params_key(upload, aliq_para_analise, imp_para_analise, **analysis_params)
+            etag = _response_version(upload, pkey, "docx", client_id, date.today().isoformat())
+            if is_not_modified(request.headers, etag):
+                return not_modified(etag)
+
+        # token e vaga do rate limit só quando a análise vai rodar (sem resultado em cache)
+        if slot is not None and not (upload.sha256 and has_cached_result(upload.sha256, pkey)):
+            slot.acquire()
+        # dashboard e DOCX do mesmo upload/parâmetros dividem a mesma análise
+        result, _ = run_upload_analysis(
+            upload, aliquota=aliq_para_analise, imposto_pago=imp_para_analise, **analysis_params,
+        )
+
+        # python-docx só é importado quando alguém pede o relatório (cold start menor)
+        from app.services.report_docx import gerar_relatorio_fiscal
 
         file_path = gerar_relatorio_fiscal(
             totals=result,
@@ -193,7 +444,12 @@ def get_relatorio_fiscal_docx(
             path=file_path,
             filename=file_path.split("/")[-1],
             media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            headers=cache_headers(etag),
         )
+    except HTTPException:
+        raise
+    except ArchiveRejected as e:
+        raise HTTPException(status_code=422, detail=e.to_detail())
     except Exception as e:
         logger.exception("❌ Erro ao gerar DOCX")
         raise HTTPException(status_code=500, detail=f"Erro ao gerar DOCX: {str(e)}")
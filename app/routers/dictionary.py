@@ -1,20 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
 from pydantic import BaseModel
 import json
 from pathlib import Path
 
 # Importa autenticação
 from ..routers.auth import get_current_user
+from ..services.ai_matcher import reload_matcher
+from ..utils.http_cache import cache_headers, file_validators, is_not_modified, not_modified, render_json
 
 # 📍 Caminho do arquivo do dicionário
 DICTIONARY_FILE = Path(__file__).resolve().parent.parent / "data" / "monofasicos.json"
 router = APIRouter()
 
-@router.get("/")
-def dictionary_root():
-    # Mantido para compatibilidade — preencha à vontade depois.
-    return {"status": "ok"}
-
 class DictionaryUpdate(BaseModel):
     categoria: str
     palavras: list[str]
@@ -47,22 +44,31 @@ def update_dictionary(payload: DictionaryUpdate, user: dict = Depends(get_curren
             data[categoria] = sorted(list(set(palavras)))
 
         save_dictionary(data)
+        # recompila o artefato do dicionário e troca o matcher deste worker
+        reload_matcher()
         return {
             "message": f"Categoria '{categoria}' atualizada com sucesso.",
             "total_palavras": len(data[categoria]),
-            "user": user["username"]  # opcional: logar quem atualizou
+            "user": user  # opcional: logar quem atualizou
         }
     except Exception as e:
         print(f"❌ Erro ao atualizar dicionário: {e}")
         raise HTTPException(status_code=500, detail="Erro ao atualizar dicionário")
 
 @router.get("/")
-def get_dictionary(user: dict = Depends(get_current_user)):
+def get_dictionary(request: Request, user: dict = Depends(get_current_user)):
     """
     🔐 Retorna o dicionário (também exige autenticação).
+    ETag/Last-Modified pelo mtime do arquivo: sem mudança → 304 sem ler o JSON.
     """
     try:
-        return load_dictionary()
+        if not DICTIONARY_FILE.exists():
+            return {}
+        etag, last_modified = file_validators(str(DICTIONARY_FILE))
+        if is_not_modified(request.headers, etag, last_modified):
+            return not_modified(etag, last_modified)
+        return Response(render_json(load_dictionary()), media_type="application/json",
+                        headers=cache_headers(etag, last_modified))
     except Exception as e:
         print(f"❌ Erro ao carregar dicionário: {e}")
         raise HTTPException(status_code=500, detail="Erro ao carregar dicionário")
@@ -0,0 +1,100 @@
+"""
+guards.py
+----------
+Dependências de proteção das rotas pesadas (análise / relatório):
+rate limit por usuário e teto de execuções simultâneas por usuário e por
+client_id. Excesso responde 429 com Retry-After.
+
+A dependência só identifica quem chama; a rota cobra (slot.acquire) quando
+vai de fato trabalhar — 304 e respostas/resultados em cache não gastam
+token nem vaga. Rotas que recebem o upload pelo caminho passam o client_id
+do upload no acquire.
+
+O usuário vem do token Bearer quando houver; sem token, do IP.
+"""
+
+from __future__ import annotations
+import math
+import threading
+from typing import Optional
+
+from fastapi import HTTPException, Query, Request
+
+from app.config import settings
+from app.routers.auth import token_subject
+from app.services.limits import get_limiters
+from app.services.metrics import HEAVY_REJECTED
+
+
+def caller_identity(request: Request) -> str:
+    auth = request.headers.get("authorization") or ""
+    if auth.lower().startswith("bearer "):
+        sub = token_subject(auth[7:].strip())
+        if sub:
+            return f"user:{sub}"
+    host = request.client.host if request.client else "unknown"
+    return f"ip:{host}"
+
+
+class HeavySlot:
+    """
+    Vaga de uma requisição pesada, ocupada no acquire. A dependência libera
+    ao fim da requisição; rotas de streaming chamam defer() e liberam no fim
+    do stream.
+    """
+
+    def __init__(self, user: str, client_id: Optional[int]):
+        self.user = user
+        self.client_id = client_id
+        self.deferred = False
+        self._held = False
+        self._lock = threading.Lock()
+
+    def acquire(self, client_id: Optional[int] = None) -> None:
+        """Cobra um token do usuário e ocupa as vagas (usuário e client_id); 429 se não houver."""
+        if self._held:
+            return
+        if client_id is not None:
+            self.client_id = client_id
+        rate, per_user, per_client = get_limiters()
+        ok, wait = rate.allow(self.user)
+        if not ok:
+            HEAVY_REJECTED.inc(reason="rate")
+            raise HTTPException(status_code=429, detail="Limite de requisições excedido",
+                                headers={"Retry-After": str(max(1, math.ceil(wait)))})
+        if not per_user.try_acquire(self.user):
+            HEAVY_REJECTED.inc(reason="user_concurrency")
+            raise HTTPException(status_code=429, detail="Muitas análises simultâneas para este usuário",
+                                headers={"Retry-After": "5"})
+        if self.client_id is not None and not per_client.try_acquire(self.client_id):
+            per_user.release(self.user)
+            HEAVY_REJECTED.inc(reason="client_concurrency")
+            raise HTTPException(status_code=429, detail="Muitas análises simultâneas para este cliente",
+                                headers={"Retry-After": "5"})
+        self._held = True
+
+    def defer(self) -> None:
+        self.deferred = True
+
+    def release(self) -> None:
+        with self._lock:
+            if not self._held:
+                return
+            self._held = False
+        _, per_user, per_client = get_limiters()
+        per_user.release(self.user)
+        if self.client_id is not None:
+            per_client.release(self.client_id)
+
+
+def heavy_route_guard(request: Request, client_id: Optional[int] = Query(None)):
+    if not settings.RATE_LIMIT_ENABLED:
+        yield None
+        return
+
+    slot = HeavySlot(caller_identity(request), client_id)
+    try:
+        yield slot
+    finally:
+        if not slot.deferred:
+            slot.release()
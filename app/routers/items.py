@@ -0,0 +1,89 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session
+import time
+
+from app.db import get_session
+from app.models import Upload
+from app.services.blobstore import load_upload_bytes
+from app.services.item_store import GROUPABLE, ItemStoreUnavailable, current_path, ensure_item_store, query_items
+from app.services.money import cents_to_float, to_cents
+from app.services.zipscan import ArchiveRejected
+from app.utils.pagination import NEXT_CURSOR_HEADER, PageParams, decode_cursor, encode_cursor
+from app.routers.guards import HeavySlot, heavy_route_guard
+
+router = APIRouter()
+
+
+def _money_fields(row: dict) -> dict:
+    for key in ("valor_cents", "valor_total_cents"):
+        if key in row and row[key] is not None:
+            row[key.replace("_cents", "")] = cents_to_float(row[key])
+    return row
+
+
+# ============================================================
+# 🔎 Consulta de itens (Parquet + DuckDB)
+# ============================================================
+@router.get("/query")
+def query_upload_items(
+    response: Response,
+    client_id: int = Query(...),
+    upload_id: int = Query(...),
+    ncm: str | None = Query(None, description="Prefixo do NCM (2203, 22030000...)"),
+    cfop: str | None = Query(None),
+    csosn: str | None = Query(None),
+    mes: str | None = Query(None, pattern=r"^\d{4}-\d{2}$", description="Competência AAAA-MM"),
+    categoria: str | None = Query(None),
+    cprod: str | None = Query(None),
+    descricao: str | None = Query(None, description="Trecho da descrição (sem diferenciar maiúsculas)"),
+    monofasico: bool | None = Query(None),
+    excluido: bool | None = Query(None, description="Monofásico sem ST correta (receita excluída)"),
+    valor_min: float | None = Query(None, description="Valor mínimo do item em R$"),
+    valor_max: float | None = Query(None, description="Valor máximo do item em R$"),
+    group_by: str | None = Query(None, description=f"Colunas separadas por vírgula: {', '.join(GROUPABLE)}"),
+    ordenar: str = Query("seq", pattern="^(seq|valor)$", description="Itens: ordem do arquivo ou maior valor"),
+    page: PageParams = Depends(),
+    db: Session = Depends(get_session),
+    slot: HeavySlot | None = Depends(heavy_route_guard),
+):
+    """
+    Drilldown dos itens de um upload sem refazer a análise. Na primeira
+    consulta os itens são gravados em Parquet; as seguintes leem só o arquivo.
+    Sem group_by: itens (cursor em X-Next-Cursor). Com group_by: grupos com
+    contagem e soma, ordenados por valor.
+    """
+    upload = db.query(Upload).filter(Upload.id == upload_id, Upload.client_id == client_id).first()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload não encontrado")
+
+    filters = {
+        "ncm": ncm, "cfop": cfop, "csosn": csosn, "mes": mes, "categoria": categoria, "cprod": cprod,
+        "descricao": descricao, "monofasico": monofasico, "excluido": excluido,
+        "valor_min_cents": to_cents(valor_min) if valor_min is not None else None,
+        "valor_max_cents": to_cents(valor_max) if valor_max is not None else None,
+    }
+    grupos = [g.strip() for g in (group_by or "").split(",") if g.strip()]
+    after = decode_cursor(page.cursor) if page.cursor else None
+
+    start = time.perf_counter()
+    try:
+        # gerar o Parquet (primeira consulta) é o trabalho pesado: cobra o rate limit
+        if slot is not None and current_path(client_id, upload_id) is None:
+            slot.acquire()
+        path = ensure_item_store(client_id, upload_id, lambda: load_upload_bytes(upload))
+        result = query_items(path, filters, grupos, ordenar, page.limit, after)
+    except ItemStoreUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ArchiveRejected as e:
+        raise HTTPException(status_code=422, detail=e.to_detail())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if result["proximo"] is not None:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*result["proximo"])
+    return {
+        "linhas": [_money_fields(r) for r in result["linhas"]],
+        "resumo": _money_fields(result["resumo"]),
+        "agrupado_por": grupos,
+        "tempo_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
@@ -0,0 +1,155 @@
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Response, UploadFile
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from typing import List, Optional
+import csv
+import io
+import json
+
+from ..db import get_session
+from ..models.override import ClassificationOverride
+from ..routers.auth import get_current_user
+from ..services.ai_matcher import get_matcher
+from ..services.overrides import (
+    get_override_index,
+    override_to_api,
+    upsert_overrides,
+    validate_override,
+)
+from ..utils.pagination import PageParams, keyset_page
+
+router = APIRouter()
+
+CSV_FIELDS = ["client_id", "tipo", "valor", "categoria"]
+
+# ============================================================
+# 🧾 Schemas
+# ============================================================
+class OverrideIn(BaseModel):
+    client_id: Optional[int] = None   # None = vale para todos os clientes
+    tipo: str                         # cprod | descricao | ncm
+    valor: str
+    categoria: Optional[str] = None   # None = não é monofásico
+
+
+def _validated(items: List[dict]) -> List[dict]:
+    categorias = get_matcher().categorias
+    rows, erros = [], []
+    for n, item in enumerate(items, start=1):
+        try:
+            client_id = item.get("client_id")
+            client_id = int(client_id) if client_id not in (None, "") else None
+            tipo, valor, categoria = validate_override(
+                item.get("tipo"), item.get("valor"), item.get("categoria") or None, categorias
+            )
+        except (ValueError, TypeError) as e:
+            erros.append(f"linha {n}: {e}")
+            continue
+        rows.append({"client_id": client_id, "tipo": tipo, "valor": valor, "categoria": categoria})
+    if erros:
+        raise HTTPException(status_code=400, detail={"erros": erros[:50], "total_erros": len(erros)})
+    return rows
+
+
+# ============================================================
+# 📋 Listar / versão
+# ============================================================
+@router.get("/")
+def list_overrides(
+    response: Response,
+    client_id: int | None = Query(None, description="Sem client_id: só as globais"),
+    incluir_globais: bool = Query(True),
+    page: PageParams = Depends(),
+    db: Session = Depends(get_session),
+):
+    q = db.query(ClassificationOverride)
+    if client_id is None:
+        q = q.filter(ClassificationOverride.client_id.is_(None))
+    elif incluir_globais:
+        q = q.filter((ClassificationOverride.client_id == client_id) | ClassificationOverride.client_id.is_(None))
+    else:
+        q = q.filter(ClassificationOverride.client_id == client_id)
+    rows = keyset_page(q, ClassificationOverride.id, ClassificationOverride.id, page, response, descending=False)
+    return [override_to_api(o) for o in rows]
+
+
+@router.get("/version")
+def overrides_version(client_id: int | None = Query(None)):
+    index = get_override_index(client_id)
+    return {"version": index.version, "total": index.size}
+
+
+# ============================================================
+# ✍️ Criar / atualizar / remover
+# ============================================================
+@router.post("/")
+def save_override(payload: OverrideIn, db: Session = Depends(get_session), user: str = Depends(get_current_user)):
+    rows = _validated([payload.model_dump()])
+    return upsert_overrides(db, rows, user)
+
+
+@router.delete("/{override_id}")
+def delete_override(override_id: int, db: Session = Depends(get_session), user: str = Depends(get_current_user)):
+    obj = db.query(ClassificationOverride).filter(ClassificationOverride.id == override_id).first()
+    if not obj:
+        raise HTTPException(status_code=404, detail="Correção não encontrada")
+    db.delete(obj)
+    db.commit()
+    return {"message": "Correção removida", "id": override_id}
+
+
+# ============================================================
+# 📦 Importar / exportar (JSON ou CSV)
+# ============================================================
+@router.post("/import")
+async def import_overrides(
+    file: UploadFile = File(...),
+    client_id: int | None = Form(None, description="Aplica a todas as linhas sem client_id"),
+    db: Session = Depends(get_session),
+    user: str = Depends(get_current_user),
+):
+    raw = (await file.read()).decode("utf-8-sig")
+    try:
+        if (file.filename or "").lower().endswith(".json"):
+            items = json.loads(raw)
+            if not isinstance(items, list):
+                raise ValueError("esperada uma lista de correções")
+        else:
+            items = list(csv.DictReader(io.StringIO(raw), delimiter=";" if raw.count(";") > raw.count(",") else ","))
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Arquivo inválido: {e}")
+    if client_id is not None:
+        for item in items:
+            if item.get("client_id") in (None, ""):
+                item["client_id"] = client_id
+    return upsert_overrides(db, _validated(items), user)
+
+
+@router.get("/export")
+def export_overrides(
+    client_id: int | None = Query(None, description="Sem client_id: só as globais"),
+    formato: str = Query("csv", pattern="^(csv|json)$"),
+    db: Session = Depends(get_session),
+):
+    q = db.query(ClassificationOverride)
+    if client_id is None:
+        q = q.filter(ClassificationOverride.client_id.is_(None))
+    else:
+        q = q.filter(ClassificationOverride.client_id == client_id)
+    rows = [{k: getattr(o, k) for k in CSV_FIELDS} for o in q.order_by(ClassificationOverride.id)]
+    name = f"correcoes_{client_id if client_id is not None else 'globais'}"
+    if formato == "json":
+        return Response(
+            json.dumps(rows, ensure_ascii=False, indent=2),
+            media_type="application/json",
+            headers={"Content-Disposition": f'attachment; filename="{name}.json"'},
+        )
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=CSV_FIELDS, delimiter=";")
+    writer.writeheader()
+    writer.writerows(rows)
+    return Response(
+        buf.getvalue(),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{name}.csv"'},
+    )
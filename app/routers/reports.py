@@ -1,12 +1,22 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response
 from sqlalchemy.orm import Session
-from ..db import get_db
-from ..models.report import Report
+from ..db import get_session
+from ..models.reports import Report
+from ..utils.pagination import PageParams, keyset_page
 
 router = APIRouter(
     tags=["Reports"]
 )
 
 @router.get("/{company_id}")
-def list_reports(company_id: int, db: Session = Depends(get_db)):
-    return db.query(Report).filter_by(company_id=company_id).order_by(Report.created_at.desc()).all()
+def list_reports(
+    company_id: int,
+    response: Response,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_session),
+):
+    # mais recentes primeiro; índice (company_id, created_at, id)
+    return keyset_page(
+        db.query(Report).filter_by(company_id=company_id),
+        Report.created_at, Report.id, page, response,
+    )
@@ -1,53 +1,114 @@
-from fastapi import APIRouter, Depends, HTTPException, Form
+from fastapi import APIRouter, Depends, HTTPException, File, Form, Query, Response, UploadFile
 from sqlalchemy.orm import Session
-from typing import List
+from typing import IO, List
 import os
 import traceback
 
-from app.db import get_session
+from app.db import get_session, get_engine
 from app.models import Upload
 from app.services.analysis import run_analysis_from_bytes  # mantém seu analisador original
+from app.services.blobstore import open_upload, release_content
+from app.services.bulk_insert import persist_zip
+from app.services.incremental import drop_lineage, lineage_key, move_lineage
+from app.services.item_store import drop_item_store
+from app.services.registration import register_content
+from app.services.zipscan import ArchiveRejected
+from app.routers.guards import HeavySlot, heavy_route_guard
+from app.utils.pagination import PageParams, keyset_page
 
 router = APIRouter()
 
 # ============================================================
-# 🆕 Registrar caminho local (NÃO faz upload)
+# 🆕 Registrar caminho local / enviar arquivo
 # ============================================================
+def _register_content(db: Session, client_id: int, filename: str, fileobj: IO[bytes],
+                      source_path: str | None = None, versao_de: int | None = None) -> dict:
+    """registration.register_content com os erros em HTTP (422 / 404)."""
+    try:
+        return register_content(db, client_id, filename, fileobj, source_path=source_path, versao_de=versao_de)
+    except ArchiveRejected as e:
+        raise HTTPException(status_code=422, detail=e.to_detail())
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
 @router.post("/path")
 def register_local_path(
     client_id: int = Form(...),
     filename: str = Form(...),
     filepath: str = Form(...),
+    versao_de: int | None = Form(None, description="Upload anterior do mesmo arquivo (se o nome mudou)"),
     db: Session = Depends(get_session)
 ):
     """
-    Registra apenas o caminho local de um arquivo ZIP (não faz upload de bytes).
+    Registra um arquivo ZIP a partir de um caminho local do servidor. O
+    conteúdo é copiado para o blobstore; o caminho fica só como referência.
     """
     if not os.path.exists(filepath):
         raise HTTPException(status_code=400, detail="Caminho local não encontrado.")
 
-    new_upload = Upload(client_id=client_id, filename=filename, filepath=filepath)
-    db.add(new_upload)
+    with open(filepath, "rb") as f:
+        return _register_content(db, client_id, filename, f, source_path=filepath, versao_de=versao_de)
+
+
+@router.post("/file")
+def upload_file(
+    client_id: int = Form(...),
+    file: UploadFile = File(...),
+    versao_de: int | None = Form(None, description="Upload anterior do mesmo arquivo (se o nome mudou)"),
+    db: Session = Depends(get_session),
+):
+    """Recebe o ZIP por multipart e grava no blobstore (com deduplicação)."""
+    return _register_content(db, client_id, file.filename or "upload.zip", file.file, versao_de=versao_de)
+
+
+@router.delete("/{upload_id}")
+def delete_upload(upload_id: int, db: Session = Depends(get_session)):
+    """Remove o registro; o blob é apagado pelo GC quando ninguém mais o usa."""
+    upload = db.query(Upload).filter(Upload.id == upload_id).first()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Registro não encontrado")
+    release_content(db, upload.sha256)
+    drop_item_store(upload.client_id, upload.id)
+    # só a raiz carrega a linhagem: remover uma versão filha não mexe no estado guardado
+    old_key = new_key = None
+    if upload.lineage_id is None:
+        old_key = lineage_key(upload)
+        # versões seguintes apontavam para esta raiz: a mais antiga vira a nova raiz
+        children = db.query(Upload).filter(Upload.lineage_id == upload.id).order_by(Upload.id).all()
+        for child in children:
+            child.lineage_id = children[0].id if child is not children[0] else None
+        if children:
+            new_key = lineage_key(children[0])
+    db.delete(upload)
     db.commit()
-    db.refresh(new_upload)
-    return {"message": "Caminho salvo com sucesso", "upload_id": new_upload.id}
+    # estado guardado da linhagem: segue a nova raiz, ou sai com o último upload dela
+    if new_key:
+        move_lineage(old_key, new_key)
+    elif old_key:
+        drop_lineage(old_key)
+    return {"message": "Upload removido", "upload_id": upload_id}
 
 
 # ============================================================
 # 📋 Listar arquivos registrados por cliente
 # ============================================================
 @router.get("/list")
-def list_files(client_id: int, db: Session = Depends(get_session)):
+def list_files(
+    client_id: int,
+    response: Response,
+    page: PageParams = Depends(),
+    db: Session = Depends(get_session),
+):
     """
-    Lista os uploads registrados para um cliente específico.
+    Lista os uploads registrados para um cliente específico (mais recentes
+    primeiro, paginado por cursor: ?limit=&cursor=, próximo em X-Next-Cursor).
     Evita erro de encoding e garante resposta JSON segura.
     """
     try:
-        uploads = (
-            db.query(Upload)
-            .filter(Upload.client_id == client_id)
-            .order_by(Upload.uploaded_at.desc())
-            .all()
+        uploads = keyset_page(
+            db.query(Upload).filter(Upload.client_id == client_id),
+            Upload.uploaded_at, Upload.id, page, response,
         )
 
         result = []
@@ -61,7 +122,7 @@ def list_files(client_id: int, db: Session = Depends(get_session)):
             safe_path = (
                 u.filepath.encode("latin-1", errors="ignore").decode("utf-8", errors="ignore")
                 if isinstance(u.filepath, str)
-                else str(u.filepath)
+                else None
             )
 
             result.append({
@@ -73,10 +134,14 @@ def list_files(client_id: int, db: Session = Depends(get_session)):
                     else None
                 ),
                 "path": safe_path,
+                "sha256": u.sha256,
+                "size_bytes": u.size_bytes,
             })
 
         return result
 
+    except HTTPException:
+        raise
     except Exception as e:
         print("❌ ERRO EM /api/uploads/list:", e)
         traceback.print_exc()
@@ -90,28 +155,40 @@ def list_files(client_id: int, db: Session = Depends(get_session)):
 # 🔍 Rodar análise a partir do caminho local
 # ============================================================
 @router.get("/analyze/{upload_id}")
-def analyze_upload(upload_id: int, db: Session = Depends(get_session)):
+def analyze_upload(
+    upload_id: int,
+    motor: str | None = Query(None, pattern="^(regras|tfidf)$", description="Motor de classificação"),
+    db: Session = Depends(get_session),
+    slot: HeavySlot | None = Depends(heavy_route_guard),
+):
     """
     Executa a análise fiscal a partir de um arquivo ZIP já registrado.
     """
     upload = db.query(Upload).filter(Upload.id == upload_id).first()
     if not upload:
         raise HTTPException(status_code=404, detail="Registro não encontrado")
+    if slot is not None:
+        slot.acquire(upload.client_id)
 
     try:
-        with open(upload.filepath, "rb") as f:
-            zip_bytes = f.read()
-
-        result = run_analysis_from_bytes(zip_bytes)
+        # lido do disco/blob store: só os membros passam pela memória
+        with open_upload(upload) as zip_file:
+            result = run_analysis_from_bytes(zip_file, client_id=upload.client_id, motor=motor,
+                                             lineage=lineage_key(upload))
 
         # Garante JSON serializável
         safe_summary = result.get("tax_summary") if isinstance(result, dict) else {}
         return {
             "status": "ok",
             "summary": safe_summary,
-            "totals": safe_summary
+            "totals": safe_summary,
+            "documentos_com_erro": result.get("documentos_com_erro", 0),
+            "errors": result.get("errors", []),
         }
 
+    except ArchiveRejected as e:
+        raise HTTPException(status_code=422, detail=e.to_detail())
+
     except UnicodeDecodeError as e:
         # Captura específica de erro de encoding
         print("⚠️ ERRO DE ENCODING:", e)
@@ -122,3 +199,36 @@ def analyze_upload(upload_id: int, db: Session = Depends(get_session)):
         print("❌ ERRO EM /api/uploads/analyze:", e)
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Erro na análise: {str(e)}")
+
+
+# ============================================================
+# 💾 Gravar documentos/itens do ZIP no banco (em lote)
+# ============================================================
+@router.post("/persist/{upload_id}")
+def persist_upload(
+    upload_id: int,
+    batch_size: int | None = None,
+    db: Session = Depends(get_session),
+    slot: HeavySlot | None = Depends(heavy_route_guard),
+):
+    """
+    Parseia o ZIP registrado e grava documentos e itens em nfe_documents /
+    nfe_items usando inserção em lote (COPY no PostgreSQL).
+    """
+    upload = db.query(Upload).filter(Upload.id == upload_id).first()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Registro não encontrado")
+    if slot is not None:
+        slot.acquire(upload.client_id)
+
+    try:
+        with open_upload(upload) as zip_file:
+            stats = persist_zip(get_engine(), upload.id, upload.client_id, zip_file, batch_size=batch_size)
+        return {"status": "ok", **stats}
+
+    except ArchiveRejected as e:
+        raise HTTPException(status_code=422, detail=e.to_detail())
+    except Exception as e:
+        print("❌ ERRO EM /api/uploads/persist:", e)
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erro ao gravar itens: {str(e)}")
@@ -6,21 +6,24 @@ e fuzzy matching seguro (RapidFuzz), evitando falsos positivos.
 """
 
 from typing import Optional, Tuple, Dict, List
-from rapidfuzz import fuzz
-import json
+from rapidfuzz import fuzz, process
 import os
 import re
-import unicodedata
+import threading
+import time
 
-DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
-MONO_PATH = os.path.normpath(os.path.join(DATA_DIR, "monofasicos.json"))
-NCM_PATH  = os.path.normpath(os.path.join(DATA_DIR, "ncm_catalog.json"))
+from .dictionary_artifact import (
+    MONO_PATH,
+    NCM_PATH,
+    ARTIFACT_PATH,
+    WORD_RE,
+    WORD_CHAR_RE,
+    load_or_compile,
+    norm_text as _norm,
+)
 
-def _norm(s: str) -> str:
-    s = (s or "").lower().strip()
-    s = unicodedata.normalize("NFKD", s)
-    s = "".join(ch for ch in s if not unicodedata.category(ch).startswith("M"))
-    return s
+# Limite de entradas do cache de classificação (zera ao estourar)
+CLASSIFY_CACHE_MAX = 100_000
 
 class JsonMatcher:
     """
@@ -38,25 +41,32 @@ class JsonMatcher:
       ...
     }
     """
-    def __init__(self, mono_path: str = MONO_PATH, ncm_path: str = NCM_PATH):
-        with open(mono_path, "r", encoding="utf-8") as f:
-            raw = json.load(f)
-        # normaliza chaves e keywords
-        self.categorias: Dict[str, List[str]] = {
-            _norm(cat): list({_norm(w) for w in words if _norm(w)})
-            for cat, words in raw.items()
-        }
+    def __init__(self, mono_path: str = MONO_PATH, ncm_path: str = NCM_PATH,
+                 artifact_path: str = ARTIFACT_PATH):
+        # artefato pré-compilado (ou recompilado do JSON se estiver desatualizado)
+        compiled = load_or_compile(mono_path, ncm_path, artifact_path)
+        self.version: str = compiled["version"]
+        self.categorias: Dict[str, List[str]] = compiled["categorias"]
+        self.ncm_map: Dict[str, str] = compiled["ncm_map"]
 
-        with open(ncm_path, "r", encoding="utf-8") as f:
-            ncm_raw = json.load(f)
-        self.ncm_map: Dict[str, str] = {str(k).strip(): _norm(v) for k, v in ncm_raw.items()}
+        self._cat_order: List[str] = compiled["cat_order"]
+        self._token_index: Dict[str, List[Tuple[str, int]]] = compiled["token_index"]
+        self._fuzzy_choices: List[str] = compiled["fuzzy_choices"]
+        self._fuzzy_cats: List[int] = compiled["fuzzy_cats"]
+        self._ncm_prefix: Dict[str, str] = compiled["ncm_prefix"]
+        self._ncm_prefix_lengths: List[int] = compiled["ncm_prefix_lengths"]
 
-        # compila regex por palavra (match de token exato)
-        self._token_regex: Dict[str, List[re.Pattern]] = {
-            cat: [re.compile(rf"\b{re.escape(w)}\b") for w in words if len(w) >= 3]
-            for cat, words in self.categorias.items()
+        # keywords com pontuação nas pontas (raras) continuam via regex \b...\b
+        self._irregular_regex: Dict[int, List[re.Pattern]] = {
+            idx: [re.compile(rf"\b{re.escape(w)}\b") for w in words]
+            for idx, words in compiled["irregular"].items()
         }
 
+        # cache de classificação por texto normalizado (descrições se repetem muito)
+        self._cache: Dict[str, Optional[Tuple[str, int]]] = {}
+        self._cache_hits = 0
+        self._cache_misses = 0
+
     def classify(self, text: str) -> Optional[Tuple[str, int]]:
         """
         1) tenta token boundary (regex) para cada palavra-chave
@@ -64,33 +74,164 @@ class JsonMatcher:
         Evita falsos positivos como 'pizza'≈'pepsi'.
         """
         t = _norm(text)
-        best_cat, best_score = None, 0
+        try:
+            hit = self._cache[t]
+            self._cache_hits += 1
+            return hit
+        except KeyError:
+            self._cache_misses += 1
 
-        for cat, patterns in self._token_regex.items():
-            # regra 1 — token exato
-            for rgx in patterns:
-                if rgx.search(t):
-                    return cat, 100
+        hit = self._classify_norm(t)
+        if len(self._cache) >= CLASSIFY_CACHE_MAX:
+            self._cache.clear()
+        self._cache[t] = hit
+        return hit
+
+    def cache_stats(self) -> dict:
+        total = self._cache_hits + self._cache_misses
+        return {
+            "size": len(self._cache),
+            "hits": self._cache_hits,
+            "misses": self._cache_misses,
+            "hit_ratio": (self._cache_hits / total) if total else 0.0,
+        }
 
-            # regra 2 — fuzzy forte (≥ 88) em qualquer palavra da categoria
-            for w in self.categorias[cat]:
-                if len(w) < 4:
+    def _exact_category(self, t: str) -> Optional[int]:
+        """
+        Menor índice de categoria com keyword casando em fronteira de token.
+        Equivale a testar rf"\\b{kw}\\b" para cada keyword, mas com uma consulta
+        de dicionário por token do texto.
+        """
+        best: Optional[int] = None
+        n = len(t)
+        for m in WORD_RE.finditer(t):
+            candidates = self._token_index.get(m.group())
+            if not candidates:
+                continue
+            start = m.start()
+            for kw, idx in candidates:
+                if best is not None and idx >= best:
                     continue
-                score = fuzz.token_sort_ratio(t, w)
-                if score > best_score:
-                    best_score, best_cat = score, cat
+                end = start + len(kw)
+                if t.startswith(kw, start) and (end == n or not WORD_CHAR_RE.match(t, end)):
+                    best = idx
+        for idx, patterns in self._irregular_regex.items():
+            if best is not None and idx >= best:
+                continue
+            if any(rgx.search(t) for rgx in patterns):
+                best = idx
+        return best
+
+    def _classify_norm(self, t: str) -> Optional[Tuple[str, int]]:
+        cat, score, _ = self._explain_norm(t)
+        return (cat, score) if cat is not None else None
 
-        if best_score >= 88:
-            return best_cat, best_score
-        return None
+    def _explain_norm(self, t: str) -> Tuple[Optional[str], int, str]:
+        # regra 1 — token exato (primeira categoria do dicionário vence)
+        idx = self._exact_category(t)
+        if idx is not None:
+            return self._cat_order[idx], 100, "token"
+
+        # regra 2 — fuzzy forte (≥ 88) em qualquer palavra com 4+ letras
+        if not self._fuzzy_choices:
+            return None, 0, "nenhum"
+        best = process.extractOne(t, self._fuzzy_choices, scorer=fuzz.token_sort_ratio, score_cutoff=88)
+        if best is None:
+            return None, 0, "nenhum"
+        _, score, pos = best
+        return self._cat_order[self._fuzzy_cats[pos]], int(score), "fuzzy"
+
+    def explain(self, text: str) -> Tuple[Optional[str], int, str]:
+        """(categoria | None, score, método: token | fuzzy | nenhum), sem cache."""
+        return self._explain_norm(_norm(text))
+
+    def ncm_category(self, ncm: str) -> Optional[str]:
+        """Categoria do NCM pelo prefixo mais longo cadastrado (8 dígitos, posição, capítulo...)."""
+        ncm = (ncm or "").strip()
+        for length in self._ncm_prefix_lengths:
+            if len(ncm) >= length:
+                cat = self._ncm_prefix.get(ncm[:length])
+                if cat is not None:
+                    return cat
+        return self.ncm_map.get(ncm)
 
     def is_monofasico(self, categoria: str) -> bool:
         return _norm(categoria) in self.categorias
 
     def validate_ncm_for_category(self, ncm: str, categoria: str) -> dict:
-        ncm = (ncm or "").strip()
-        expected_cat = self.ncm_map.get(ncm)
+        expected_cat = self.ncm_category(ncm)
         return {"ncm_valido": expected_cat == _norm(categoria)}
 
-# Instância global (importada no analysis.py)
-matcher = JsonMatcher()
+# ============================================================
+# 💤 INSTÂNCIA GLOBAL PREGUIÇOSA
+# ============================================================
+# Construída no primeiro uso (ou no aquecimento do lifespan em main.py),
+# e não mais no import — reduz o cold start dos workers.
+_matcher: Optional[JsonMatcher] = None
+_matcher_lock = threading.Lock()
+_matcher_stamp: Optional[Tuple] = None
+_checked_at = 0.0
+
+# Intervalo mínimo entre verificações do JSON em disco (get_matcher é chamado a cada análise)
+SOURCE_CHECK_SECONDS = 2.0
+
+
+def _source_stamp() -> Tuple:
+    """(mtime, tamanho) dos JSON do dicionário: muda quando qualquer worker grava."""
+    stamp = []
+    for path in (MONO_PATH, NCM_PATH):
+        try:
+            st = os.stat(path)
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def get_matcher() -> JsonMatcher:
+    """
+    Matcher do processo. Com vários workers, o PUT do dicionário só recarrega
+    quem o atendeu: os demais percebem a mudança pelo mtime do JSON (verificado
+    a cada SOURCE_CHECK_SECONDS) e recarregam — versão nova, chaves de cache novas.
+    """
+    global _matcher, _checked_at
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                _load()
+        return _matcher
+    now = time.monotonic()
+    if now - _checked_at >= SOURCE_CHECK_SECONDS:
+        _checked_at = now
+        if _source_stamp() != _matcher_stamp:
+            with _matcher_lock:
+                if _source_stamp() != _matcher_stamp:
+                    _load()
+    return _matcher
+
+
+def _load() -> JsonMatcher:
+    """Chamado com _matcher_lock: carimbo lido antes do JSON, então nenhuma gravação se perde."""
+    global _matcher, _matcher_stamp, _checked_at
+    stamp = _source_stamp()
+    _matcher = JsonMatcher()
+    _matcher_stamp = stamp
+    _checked_at = time.monotonic()
+    return _matcher
+
+
+def is_matcher_loaded() -> bool:
+    return _matcher is not None
+
+
+def reload_matcher() -> JsonMatcher:
+    """Recarrega após alteração do dicionário (gera nova versão do artefato)."""
+    with _matcher_lock:
+        return _load()
+
+
+def __getattr__(name: str):
+    # compatibilidade com `from app.services.ai_matcher import matcher`
+    if name == "matcher":
+        return get_matcher()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,12 +1,21 @@
 from __future__ import annotations
 from datetime import datetime
-from typing import Dict, Any
-import io
-import zipfile
+from decimal import Decimal
+from typing import IO, Any, Dict, Iterator, List
 import logging
 
-from .nfe import parse_nfe_xml
-from .ai_matcher import matcher
+from app.config import settings
+from .checkpoint import ErrorLog, document_error, fingerprint, iter_documents, open_checkpoint
+from .incremental import COUNTERS, LineageState, lineage_lock, new_member, open_lineage
+from .overrides import MISSING, get_override_index
+from .product_master import open_classifier
+from .spill import open_spill
+from .ai_matcher import get_matcher
+from .metrics import track_analysis
+from .money import apply_rate, cents_to_float, month_key, to_cents
+from .tax_periods import PeriodLedger, parse_monthly_param, period_to_api, summary_to_api
+from .topk import CANDIDATES_PER_GROUP, BoundedProductRanking, resolve_ranking, top_k
+from .zipscan import ArchiveScan, check_zipfile, open_zip
 
 logger = logging.getLogger(__name__)
 
@@ -55,6 +64,16 @@ def parse_percent(value) -> float:
             return None
     return v / 100.0 if v >= 1.0 else v
 
+MOTORES = ("regras", "tfidf")
+
+
+def resolve_engine(motor: str | None) -> str:
+    """Motor de classificação da requisição (None = CLASSIFIER_ENGINE). ValueError se desconhecido."""
+    motor = (motor or settings.CLASSIFIER_ENGINE or "regras").strip().lower()
+    if motor not in MOTORES:
+        raise ValueError(f"motor de classificação inválido: {motor!r} (use {', '.join(MOTORES)})")
+    return motor
+
 def safe_float(value):
     try:
         return float(value)
@@ -79,170 +98,491 @@ def init_totals() -> dict:
         'erros_outros': 0,
         'monofasico_total': 0,
         'monofasico_sem_cfop_csosn': 0,
+        'documentos_com_erro': 0,
         'tax_summary': {}
     }
 
 # -------------------------------------------------
 # 🧠 Função principal
 # -------------------------------------------------
-def run_analysis_from_bytes(zip_bytes: bytes, aliquota: float = None, imposto_pago: float = None) -> Dict[str, Any]:
+# Emite um evento de progresso a cada N documentos (iter_analysis)
+PROGRESS_EVERY = 50
+
+
+@track_analysis
+def run_analysis_from_bytes(
+    zip_bytes: bytes | IO[bytes],
+    aliquota: float = None,
+    imposto_pago: float = None,
+    aliquotas_mensais: str = None,
+    impostos_pagos_mensais: str = None,
+    client_id: int = None,
+    motor: str = None,
+    lineage: str = None,
+    ranking: str = None,
+    top: int = None,
+) -> Dict[str, Any]:
+    """
+    zip_bytes: o ZIP em bytes ou um arquivo aberto ('rb', com seek): aberto do
+      disco, os membros são lidos sob demanda e o ZIP não fica inteiro na memória.
+    aliquotas_mensais / impostos_pagos_mensais: entradas por competência no
+    formato 'AAAA-MM:valor;AAAA-MM:valor' (ver tax_periods.parse_monthly_param).
+    client_id: ativa o cadastro de produtos do cliente (product_master): só
+      itens novos ou com descrição alterada passam pelo matcher.
+    motor: 'regras' (JsonMatcher, padrão) ou 'tfidf' (tfidf_matcher, classifica
+    os itens de cada documento em lote). None = CLASSIFIER_ENGINE.
+    lineage: chave da linhagem do upload (incremental.lineage_key): numa nova
+      versão do mesmo ZIP só os membros novos/alterados são analisados e os
+      agregados são mesclados aos da versão anterior. Não muda o resultado.
+      O checkpoint da linhagem guarda os membros que falharam (um membro
+      igual a um que falhou não é relido) e, quando a linhagem não guarda os
+      membros, os agregados dos que deram certo: a nova tentativa só
+      processa os que falharam.
+    ranking / top: lista de produtos duplicados (topk.resolve_ranking) —
+      'completo' (tudo, padrão), 'topk' (os `top` maiores, agregação exata) ou
+      'limitado' (memória fixa: heavy hitters aproximados; products e
+      produtos_excluidos viram os `top` de maior valor; sem linhagem).
+    ZIPs com XML acima de ANALYSIS_MEMORY_BUDGET_MB rodam fora da memória
+    (spill.py): mesmo resultado, products/produtos_excluidos lidos do disco.
+    Documentos com erro não derrubam a análise: vão para totals['errors'].
+    """
+    for step in _analysis_steps(zip_bytes, aliquota, imposto_pago,
+                                aliquotas_mensais, impostos_pagos_mensais, progress_every=0,
+                                client_id=client_id, motor=motor, lineage=lineage,
+                                ranking=ranking, top=top):
+        pass
+    return step["totals"]
+
+
+@track_analysis
+def iter_analysis(
+    zip_bytes: bytes | IO[bytes],
+    aliquota: float = None,
+    imposto_pago: float = None,
+    aliquotas_mensais: str = None,
+    impostos_pagos_mensais: str = None,
+    progress_every: int = PROGRESS_EVERY,
+    prescan: ArchiveScan | None = None,
+    client_id: int = None,
+    motor: str = None,
+    lineage: str = None,
+    ranking: str = None,
+    top: int = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Mesma análise de run_analysis_from_bytes, como gerador de estados parciais:
+      {"event": "progress", "documentos": ..., "total_documentos": ..., ...}
+      ...
+      {"event": "result", "totals": {...}}   # idêntico ao retorno de run_analysis_from_bytes
+    prescan: pré-análise já feita pela rota (zipscan.check_archive), para não repetir.
+    """
+    yield from _analysis_steps(zip_bytes, aliquota, imposto_pago,
+                               aliquotas_mensais, impostos_pagos_mensais, progress_every, prescan,
+                               client_id, motor, lineage, ranking, top)
+
+
+def _progress(state: LineageState, total_docs: int, n_erros: int) -> Dict[str, Any]:
+    return {
+        "event": "progress",
+        "documentos": state.documents,
+        "total_documentos": total_docs,
+        "itens": state.counter('items'),
+        "faturamento_parcial": cents_to_float(sum(v[0] for v in state.fat.values())),
+        "receita_excluida_parcial": cents_to_float(
+            sum(v[0] for k, v in state.itens.items() if k[0] == "excluida")
+        ),
+        "monofasicos": state.counter('monofasico_total'),
+        "st_incorretos": state.counter('st_incorreta'),
+        "categorias": dict(state.cats),
+        "erros": n_erros,
+    }
+
+
+def _member_aggregate(doc: Dict[str, Any], matcher, classifier, overrides, motor: str) -> Dict[str, Any]:
+    """Classifica os itens de um documento e devolve o agregado do membro (incremental.new_member)."""
+    member = new_member()
+    member["doc"] = True
+    fat, itens, cont, cats = member["fat"], member["itens"], member["cont"], member["cats"]
+    produtos, dedup = member["prod"], member["dedup"]
+
+    dt = doc.get('issue_date')
+    mes = month_key(dt)
+    doc_cents = doc.get('total_value_cents')
+    if doc_cents is None:
+        doc_cents = to_cents(doc.get('total_value'))
+    fat[mes] = doc_cents
+    member["dt"] = dt or None
+
+    def _inc(name: str) -> None:
+        cont[name] = cont.get(name, 0) + 1
+
+    doc_items = doc.get('items', [])
+    lote = (
+        matcher.classify_many([(it.get('xProd') or '').strip() for it in doc_items])
+        if motor == "tfidf" else None
+    )
+    for pos, item in enumerate(doc_items):
+        _inc('items')
+        desc  = (item.get('xProd') or '').strip()
+        ncm   = (item.get('ncm') or '').strip()
+        cfop  = (item.get('cfop') or '').strip()
+        csosn = (item.get('csosn') or '').strip()
+        cprod = (item.get('cProd') or '').strip()
+        vcents = item.get('vProd_cents')
+        if vcents is None:
+            vcents = to_cents(item.get('vProd'))
+
+        # 👀 IA: Detectar monofásico
+        is_mono = False
+        correcao = overrides.lookup(cprod, desc, ncm) if overrides else MISSING
+        if correcao is not MISSING:
+            _inc('correcoes')
+            hit = (correcao, 100) if correcao else None
+        elif lote is not None:
+            hit = lote[pos]
+        elif classifier:
+            hit = classifier.classify(cprod, desc)
+        else:
+            hit = matcher.classify(desc)
+        if hit and matcher.is_monofasico(hit[0]):
+            is_mono = True
+            _inc('monofasico_palavra_chave')
+            _inc('monofasico_total')
+            cats[hit[0]] = cats.get(hit[0], 0) + 1
+            if not _has_valid_ncm(ncm):
+                _inc('monofasico_sem_ncm')
+            if not (cfop and csosn):
+                _inc('monofasico_sem_cfop_csosn')
+
+        # ✅ ST Correto
+        if is_mono and cfop == "5405" and csosn == "500":
+            _inc('st_cfop_csosn_corretos')
+            key = ("st_correto", hit[0], mes)
+            itens[key] = itens.get(key, 0) + vcents
+        # ❌ ST Incorreto
+        elif is_mono:
+            key = ("excluida", hit[0] if hit else "unknown", mes)
+            itens[key] = itens.get(key, 0) + vcents
+            _inc('st_incorreta')
+
+        # 🚨 NCM vs categoria
+        if hit:
+            val = matcher.validate_ncm_for_category(ncm, hit[0])
+            if not val["ncm_valido"]:
+                _inc('erros_ncm_categoria')
+
+        # 🧾 Guarda produto — apenas monofásico
+        if is_mono:
+            produtos.append({
+                "descricao": desc,
+                "codigo": cprod,
+                "ncm": ncm,
+                "cfop": cfop,
+                "csosn": csosn,
+                "quantidade": item.get('qCom'),
+                "valor_unitario": item.get('vUnCom'),
+                "valor_total": cents_to_float(vcents),
+                "valor_total_cents": vcents,
+                "numero": doc.get('cNF') or doc.get('numero'),
+                "data_emissao": dt.isoformat() if dt else None,
+                "chave": doc.get('chNFe') or doc.get('chave'),
+                "monofasico": True,
+                # categoria do matcher (normalizada, a mesma de categorias_detectadas)
+                "categoria": hit[0],
+                "score": hit[1],
+                "st_correto": (cfop == "5405" and csosn == "500"),
+            })
+
+            # 📊 Deduplicação por código + descrição
+            key = (cprod.lower(), desc.lower())
+            row = dedup.get(key)
+            if row is None:
+                dedup[key] = [cprod, desc, 1, vcents]
+            else:
+                row[2] += 1
+                row[3] += vcents
+    return member
+
+
+def _rank_duplicates(rows: List[Dict[str, Any]], top: int | None) -> List[Dict[str, Any]]:
+    """
+    Produtos duplicados por valor. top=None: todos. Com top, só os
+    top·CANDIDATES_PER_GROUP maiores entram no agrupamento de quase duplicados
+    (heap, sem ordenar tudo); variantes da cauda não somam nos grupos.
+    """
+    if top is not None:
+        rows = top_k(rows, top * CANDIDATES_PER_GROUP, key=lambda r: r["valor_total_cents"])
+    # 🔗 Quase duplicados ("COCA COLA 2L" / "REFRIG COCA-COLA 2LT") num grupo só
+    if settings.NEAR_DUP_ENABLED:
+        # numpy/MinHash só quando há o que agrupar (cold start do app.main)
+        from .near_dup import cluster_products
+
+        duplicados = cluster_products(rows, threshold=settings.NEAR_DUP_THRESHOLD)
+    else:
+        duplicados = sorted(rows, key=lambda x: x["valor_total_cents"], reverse=True)
+        for row in duplicados:
+            row["valor_total"] = cents_to_float(row["valor_total_cents"])
+    return duplicados if top is None else duplicados[:top]
+
+
+def _analysis_steps(
+    zip_bytes: bytes | IO[bytes],
+    aliquota,
+    imposto_pago,
+    aliquotas_mensais,
+    impostos_pagos_mensais,
+    progress_every: int,
+    prescan: ArchiveScan | None = None,
+    client_id: int = None,
+    motor: str = None,
+    lineage: str = None,
+    ranking: str = None,
+    top: int = None,
+) -> Iterator[Dict[str, Any]]:
     totals = init_totals()
+    motor = resolve_engine(motor)
+    modo_ranking, top = resolve_ranking(ranking, top)
+    if motor == "tfidf":
+        # modelo treinado com o dicionário + correções do cliente; classifica em lote por documento
+        from .tfidf_matcher import get_tfidf_matcher
+        matcher = get_tfidf_matcher(client_id)
+        classifier = None
+    else:
+        matcher = get_matcher()
+        classifier = open_classifier(client_id, matcher)
+    # ✍️ correções do contador (globais + do cliente) valem antes de qualquer regra
+    overrides = get_override_index(client_id)
 
     # 🔧 Normaliza entradas do usuário
     aliquota_frac = parse_percent(aliquota) if aliquota is not None else None
     imposto_pago_input = parse_money_brl(imposto_pago) if imposto_pago is not None else None
+    aliquotas_mes = parse_monthly_param(aliquotas_mensais, percent=True)
+    impostos_mes = parse_monthly_param(impostos_pagos_mensais)
+
+    # 🧩 Agregados por membro do ZIP, somados em centavos inteiros. Com linhagem
+    # (versão anterior do mesmo arquivo), só membros novos/alterados são lidos.
+    version = f"{matcher.version}:{overrides.version}:{motor}"
+    erros = ErrorLog()
+    limitado = BoundedProductRanking(top) if modo_ranking == "limitado" else None
+    spill = None
+    n_erros = 0
+
+    # 🔒 uma análise por linhagem de cada vez: o estado e os segmentos lidos em
+    # state.products() são os que esta análise abriu (outra não os troca no meio)
+    with lineage_lock(lineage):
+        # 🧪 Pré-análise: ZIP corrompido / zip bomb / sem NF-e é recusado antes do loop
+        # (ArchiveRejected); só os membros que parecem NF-e chegam ao parser.
+        with open_zip(zip_bytes) as zf:
+            scan = prescan if prescan is not None else check_zipfile(zf)
+            total_docs = scan.candidatos
+            if limitado is None:
+                # 💽 XML acima de ANALYSIS_MEMORY_BUDGET_MB: produtos e dedup transbordam para disco
+                spill = open_spill(scan.bytes_candidatos)
+            if limitado is not None or spill is not None:
+                # memória limitada: a linhagem guarda o agregado de cada membro, então fica de fora;
+                # produtos e descrições vão direto para os agregados e não são retidos por membro
+                state = LineageState(None, version, keep_members=False)
+            else:
+                state = open_lineage(lineage, version)
+            # erros por membro na linhagem do upload; os acertos voltam da linhagem ou,
+            # quando ela não guarda os membros, do próprio checkpoint
+            checkpoint = open_checkpoint(lineage, version,
+                                         keep_successes=not (state.key and state.keep_members))
+            fingerprints = [fingerprint(info) for info in scan.candidates]
+            state.retain(fingerprints)
+            if checkpoint is not None:
+                checkpoint.retain(fingerprints)
+            novos = [info for info, fp in zip(scan.candidates, fingerprints) if fp not in state]
+            state.reused = len(fingerprints) - len(novos)
+            n_erros = sum(1 for m in state.members.values() if m["err"] is not None)
+
+            # ⚠️ Erros por documento (XML malformado, não NF-e...) não param a análise
+            for info, doc, erro in iter_documents(zf, novos, checkpoint):
+                processados = state.documents + n_erros
+                if progress_every and processados and processados % progress_every == 0:
+                    yield _progress(state, total_docs, n_erros)
+
+                if erro is None:
+                    try:
+                        if doc is None:
+                            member = checkpoint.saved_member(info)
+                        else:
+                            member = _member_aggregate(doc, matcher, classifier, overrides, motor)
+                    except Exception as e:
+                        # falha nossa num documento (classificação, checkpoint): só ele fica de fora
+                        logger.exception(f"❌ Erro interno em {info.filename}")
+                        erro = document_error(info, e)
+                        if checkpoint is not None:
+                            checkpoint.put_error(info, erro)
+                if erro is not None:
+                    member = new_member()
+                    member["err"] = erro
+                    n_erros += 1
+                elif checkpoint is not None:
+                    checkpoint.put_member(info, member)
+                if limitado is not None or spill is not None:
+                    (limitado or spill).add_member(member)
+                    if member["err"] is not None:
+                        erros.add(member["err"])
+                    member["prod"], member["dedup"] = [], {}
+                state.add(fingerprint(info), member)
 
-    produtos_raw = []
-    dedup_map = {}
-    excluidos = []
-
-    with zipfile.ZipFile(io.BytesIO(zip_bytes), 'r') as zf:
-        for name in zf.namelist():
-            if not name.lower().endswith('.xml'):
-                continue
-
-            xml_bytes = zf.read(name)
-            doc = parse_nfe_xml(xml_bytes)
-            totals['documents'] += 1
-            totals['total_value_sum'] += doc.get('total_value', 0.0)
-
-            dt = doc.get('issue_date')
-            if dt:
-                if totals['period_start'] is None or dt < totals['period_start']:
-                    totals['period_start'] = dt
-                if totals['period_end'] is None or dt > totals['period_end']:
-                    totals['period_end'] = dt
-
-            for item in doc.get('items', []):
-                totals['items'] += 1
-                desc  = (item.get('xProd') or '').strip()
-                ncm   = (item.get('ncm') or '').strip()
-                cfop  = (item.get('cfop') or '').strip()
-                csosn = (item.get('csosn') or '').strip()
-                cprod = (item.get('cProd') or '').strip()
-                vprod = float(item.get('vProd') or 0)
-
-                # 👀 IA: Detectar monofásico
-                is_mono = False
-                hit = matcher.classify(desc)
-                if hit and matcher.is_monofasico(hit[0]):
-                    is_mono = True
-                    totals['monofasico_palavra_chave'] += 1
-                    totals['monofasico_total'] += 1
-                    if not _has_valid_ncm(ncm):
-                        totals['monofasico_sem_ncm'] += 1
-                    if not (cfop and csosn):
-                        totals['monofasico_sem_cfop_csosn'] += 1
-
-                # ✅ ST Correto
-                if is_mono and cfop == "5405" and csosn == "500":
-                    totals['st_cfop_csosn_corretos'] += 1
-                    totals['st_correct_items_value'] += vprod
-                # ❌ ST Incorreto
-                elif is_mono:
-                    key = hit[0] if hit else "unknown"
-                    totals['revenue_excluded_breakdown'].setdefault(key, 0.0)
-                    totals['revenue_excluded_breakdown'][key] += vprod
-                    totals['revenue_excluded'] += vprod
-                    totals['st_incorreta'] += 1
-
-                # 🚨 NCM vs categoria
-                if hit:
-                    val = matcher.validate_ncm_for_category(ncm, hit[0])
-                    if not val["ncm_valido"]:
-                        totals['erros_ncm_categoria'] += 1
-
-                # 🧾 Guarda produto — apenas monofásico
-                if is_mono:
-                    prod_row = {
-                        "descricao": desc,
-                        "codigo": cprod,
-                        "ncm": ncm,
-                        "cfop": cfop,
-                        "csosn": csosn,
-                        "quantidade": item.get('qCom'),
-                        "valor_unitario": item.get('vUnCom'),
-                        "valor_total": vprod,
-                        "numero": doc.get('cNF') or doc.get('numero'),
-                        "data_emissao": dt.isoformat() if dt else None,
-                        "chave": doc.get('chNFe') or doc.get('chave'),
-                        "monofasico": True,
-                        "st_correto": (cfop == "5405" and csosn == "500"),
-                    }
-
-                    produtos_raw.append(prod_row)
-
-                    # 📊 Deduplicação por código + descrição
-                    key = (cprod.lower(), desc.lower())
-                    if key not in dedup_map:
-                        dedup_map[key] = {
-                            "codigo": cprod,
-                            "descricao": desc,
-                            "ocorrencias": 1,
-                            "valor_total": vprod,
-                        }
-                    else:
-                        dedup_map[key]["ocorrencias"] += 1
-                        dedup_map[key]["valor_total"] += vprod
-
-                    if not prod_row["st_correto"]:
-                        excluidos.append(prod_row)
-
-    if totals['period_start']:
-        totals['period_start'] = totals['period_start'].isoformat()
-    if totals['period_end']:
-        totals['period_end'] = totals['period_end'].isoformat()
-
-    faturamento = totals['total_value_sum']
-    receita_excluida = totals['revenue_excluded']
-    base_corrigida = faturamento - receita_excluida
-
-    imposto_corrigido = 0.0
-    economia_estimada = 0.0
-    imposto_pago_final = 0.0
+        if progress_every:
+            yield _progress(state, total_docs, n_erros)
+        state.save()
+
+        # 📋 Produtos e erros na ordem dos membros do ZIP atual
+        if spill is not None:
+            # mesma ordem e mesmas somas da análise em memória, lidas do disco
+            produtos_raw, excluidos = spill.finish()
+            # com top, só as candidatas do ranking vêm para a memória; sem top,
+            # o agrupamento roda por partição em disco (spill.duplicates)
+            dedup_rows = spill.top_dedup_rows(top * CANDIDATES_PER_GROUP) if top is not None else None
+        elif limitado is None:
+            for fp in fingerprints:
+                member = state.members[fp]
+                if member["err"] is not None:
+                    erros.add(member["err"])
+            produtos_raw = list(state.products(fingerprints))
+            excluidos = [p for p in produtos_raw if not p["st_correto"]]
+            dedup_rows = [dict(v) for v in state.dedup.values()]
+        else:
+            # modo limitado: os `top` de maior valor
+            produtos_raw = limitado.products.items()
+            excluidos = limitado.excluded.items()
+            dedup_rows = limitado.dedup_rows()
+
+    totals['documents'] = state.documents
+    for name in COUNTERS:
+        if name in totals:
+            totals[name] = state.counter(name)
+    totals['documentos_com_erro'] = erros.count
+    period_start, period_end = state.period()
+    if period_start:
+        totals['period_start'] = period_start.isoformat()
+    if period_end:
+        totals['period_end'] = period_end.isoformat()
+
+    # ➕ Somas por grupo/categoria/mês (já agregadas por membro)
+    faturamento_por_mes = {m: v[0] for m, v in state.fat.items()}
+    itens_sums = {k: v[0] for k, v in state.itens.items()}
+    excluida_por_cat: Dict[str, int] = {}
+    excluida_por_mes: Dict[Any, int] = {}
+    st_correto_cents = 0
+    for (grupo, cat, mes), cents in itens_sums.items():
+        if grupo == "excluida":
+            excluida_por_cat[cat] = excluida_por_cat.get(cat, 0) + cents
+            excluida_por_mes[mes] = excluida_por_mes.get(mes, 0) + cents
+        else:
+            st_correto_cents += cents
+
+    faturamento_cents = sum(faturamento_por_mes.values())
+    receita_excluida_cents = sum(excluida_por_cat.values())
+    base_corrigida_cents = faturamento_cents - receita_excluida_cents
+
+    totals['total_value_cents'] = faturamento_cents
+    totals['revenue_excluded_cents'] = receita_excluida_cents
+    totals['total_value_sum'] = cents_to_float(faturamento_cents)
+    totals['revenue_excluded'] = cents_to_float(receita_excluida_cents)
+    totals['revenue_excluded_breakdown'] = {k: cents_to_float(v) for k, v in excluida_por_cat.items()}
+    totals['st_correct_items_value'] = cents_to_float(st_correto_cents)
+    totals['faturamento_por_mes'] = {
+        (m or "sem_data"): cents_to_float(v) for m, v in sorted(faturamento_por_mes.items(), key=lambda kv: kv[0] or "")
+    }
+    totals['receita_excluida_por_mes'] = {
+        (m or "sem_data"): cents_to_float(v) for m, v in sorted(excluida_por_mes.items(), key=lambda kv: kv[0] or "")
+    }
+
+    imposto_corrigido_cents = 0
+    economia_cents = 0
+    imposto_pago_cents = 0
+    aliquota_utilizada = Decimal(0)
 
     try:
         if aliquota_frac is not None:
-            imposto_base_atual = faturamento * aliquota_frac
-            imposto_corrigido = base_corrigida * aliquota_frac
-            economia_estimada = max(0, imposto_base_atual - imposto_corrigido)
-            imposto_pago_final = imposto_base_atual
+            aliquota_utilizada = Decimal(str(aliquota_frac))
+            imposto_base_atual = apply_rate(faturamento_cents, aliquota_utilizada)
+            imposto_corrigido_cents = apply_rate(base_corrigida_cents, aliquota_utilizada)
+            economia_cents = max(0, imposto_base_atual - imposto_corrigido_cents)
+            imposto_pago_cents = imposto_base_atual
         elif imposto_pago_input is not None:
-            imposto_bruto = imposto_pago_input
-            if faturamento > 0 and imposto_bruto > (faturamento * 3):
-                imposto_bruto = imposto_bruto / 100.0
-
-            aliquota_media = (imposto_bruto / faturamento) if faturamento > 0 else 0.0
-            imposto_corrigido = base_corrigida * aliquota_media
-            economia_estimada = max(0, imposto_bruto - imposto_corrigido)
-            imposto_pago_final = imposto_bruto
+            imposto_bruto = to_cents(imposto_pago)
+            if faturamento_cents > 0 and imposto_bruto > (faturamento_cents * 3):
+                imposto_bruto = apply_rate(imposto_bruto, Decimal("0.01"))
+
+            if faturamento_cents > 0:
+                aliquota_utilizada = Decimal(imposto_bruto) / Decimal(faturamento_cents)
+            imposto_corrigido_cents = apply_rate(base_corrigida_cents, aliquota_utilizada)
+            economia_cents = max(0, imposto_bruto - imposto_corrigido_cents)
+            imposto_pago_cents = imposto_bruto
     except Exception as e:
         logger.warning(f"[ANÁLISE] Falha no cálculo tributário: {e}")
-        economia_estimada = 0.0
-        imposto_corrigido = 0.0
+        economia_cents = 0
+        imposto_corrigido_cents = 0
+
+    # 🗓️ Apuração por competência (PGDAS-D): RBT12 e alíquota de cada mês
+    ledger = PeriodLedger(aliquota_padrao=aliquota_utilizada if aliquota_utilizada else None)
+    for mes, cents in faturamento_por_mes.items():
+        if mes is not None:
+            ledger.add_revenue(mes, cents, excluida_por_mes.get(mes, 0))
+    for mes, aliq in aliquotas_mes.items():
+        ledger.set_month_inputs(mes, aliquota=aliq)
+    for mes, cents in impostos_mes.items():
+        ledger.set_month_inputs(mes, imposto_pago=cents)
+    periodos = ledger.results()
+    periodos_resumo = ledger.summary()
 
+    if aliquotas_mes or impostos_mes:
+        # com entradas mensais, o total é a soma das competências
+        imposto_pago_cents = sum(p["imposto_pago_cents"] for p in periodos)
+        imposto_corrigido_cents = sum(p["imposto_corrigido_cents"] for p in periodos)
+        economia_cents = periodos_resumo["economia_cents"]
+        if faturamento_cents > 0:
+            aliquota_utilizada = Decimal(imposto_pago_cents) / Decimal(faturamento_cents)
+
+    # 🔚 Borda da API: centavos → float só aqui
     tax_summary = {
-        'faturamento': faturamento,
-        'base_corrigida': base_corrigida,
-        'receita_excluida': receita_excluida,
-        'imposto_corrigido': imposto_corrigido,
-        'economia_estimada': economia_estimada,
-        'aliquota_utilizada': (
-            aliquota_frac if aliquota_frac is not None
-            else ((imposto_pago_final / faturamento) if faturamento > 0 else 0.0)
-        ),
-        'imposto_pago': imposto_pago_final,
+        'faturamento': cents_to_float(faturamento_cents),
+        'base_corrigida': cents_to_float(base_corrigida_cents),
+        'receita_excluida': cents_to_float(receita_excluida_cents),
+        'imposto_corrigido': cents_to_float(imposto_corrigido_cents),
+        'economia_estimada': cents_to_float(economia_cents),
+        'aliquota_utilizada': float(aliquota_utilizada),
+        'imposto_pago': cents_to_float(imposto_pago_cents),
         'imposto_pago_informado': imposto_pago_input
     }
 
     for k, v in tax_summary.items():
         tax_summary[k] = safe_float(v)
 
+    duplicados = spill.duplicates() if dedup_rows is None else _rank_duplicates(dedup_rows, top)
+
     totals['tax_summary'] = tax_summary
+    totals['periodos'] = [period_to_api(p) for p in periodos]
+    totals['periodos_resumo'] = summary_to_api(periodos_resumo)
+    # contagens do dashboard pelos contadores completos: com ranking topk/limitado
+    # a lista de produtos vem truncada e não serve para contar
+    totals['monofasico_desc'] = state.counter('monofasico_palavra_chave')
+    totals['categorias_detectadas'] = dict(sorted(state.cats.items(), key=lambda kv: (-kv[1], kv[0])))
     totals['products'] = produtos_raw
-    totals['produtos_duplicados'] = sorted(dedup_map.values(), key=lambda x: x["valor_total"], reverse=True)
+    totals['produtos_duplicados'] = duplicados
     totals['produtos_excluidos'] = excluidos
+    totals['pre_analise'] = scan.to_api()
+    totals['errors'] = erros.items
+    totals['erros_por_motivo'] = erros.by_reason
+    totals['documentos_do_checkpoint'] = checkpoint.reused if checkpoint is not None else 0
+    totals['classificacao'] = {"motor": motor, "correcoes": state.counter('correcoes'),
+                               "versao_correcoes": overrides.version}
+    totals['incremental'] = state.stats()
+    totals['memoria'] = spill.stats() if spill is not None else {"fora_da_memoria": False}
+    totals['ranking'] = {"modo": modo_ranking, "top": top,
+                         "aproximado": any(g.get("aproximado") for g in duplicados)}
+    if limitado is not None:
+        totals['ranking'].update(limitado.stats())
+    if classifier is not None:
+        classifier.flush()
+        totals['classificacao'].update(classifier.stats())
 
     logger.info(f"[DEBUG ANALYSIS] tax_summary final: {tax_summary}")
     logger.info(f"[DEBUG ANALYSIS] Monofásicos totais: {totals['monofasico_total']} / ST incorretos: {totals['st_incorreta']} / sem CFOP/CSOSN: {totals['monofasico_sem_cfop_csosn']}")
-    return totals
+    yield {"event": "result", "totals": totals}
@@ -0,0 +1,402 @@
+"""
+blobstore.py
+-------------
+Armazenamento dos ZIPs endereçado por conteúdo (sha256).
+
+  blobs/<ab>/<sha256>                 conteúdo do upload (uma cópia por conteúdo)
+  results/<sha256>/<params>.pkl       resultado da análise em cache
+  results/<sha256>/rendered/<nome>    resposta serializada (+ .gz/.br), ver http_cache.py
+
+Backends:
+  - LocalBlobStore: diretório local (LOCAL_STORAGE_DIR), gravação atômica
+  - S3BlobStore: qualquer S3 compatível (AWS, MinIO...) via boto3, opcional
+
+Uploads com o mesmo conteúdo apontam para o mesmo blob (tabela blobs,
+refcount). Quando o refcount chega a 0 e passa o período de carência, o GC
+apaga o blob e os resultados em cache:
+
+    python -m app.services.blobstore gc
+"""
+
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+import hashlib
+import io
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.blob import Blob
+
+logger = logging.getLogger(__name__)
+
+CHUNK = 1024 * 1024
+
+
+# ============================================================
+# 🧱 BACKENDS
+# ============================================================
+class BlobStore:
+    """Interface mínima de objeto (chave → bytes), igual à do S3."""
+
+    def put(self, key: str, data: bytes) -> None:
+        self.put_file(key, io.BytesIO(data))
+
+    def put_file(self, key: str, fileobj: IO[bytes]) -> None:
+        raise NotImplementedError
+
+    def get(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    def open(self, key: str) -> IO[bytes]:
+        """Arquivo ('rb', com seek) com o conteúdo da chave; quem chama fecha."""
+        return io.BytesIO(self.get(key))
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def list(self, prefix: str) -> Iterator[str]:
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str) -> int:
+        n = 0
+        for key in list(self.list(prefix)):
+            self.delete(key)
+            n += 1
+        return n
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def put_file(self, key: str, fileobj: IO[bytes]) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".blob-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(fileobj, f, CHUNK)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def get(self, key: str) -> bytes:
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def open(self, key: str) -> IO[bytes]:
+        return open(self.path(key), "rb")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix: str) -> Iterator[str]:
+        base = self.path(prefix.rstrip("/"))
+        if not os.path.isdir(base):
+            return
+        for dirpath, _, files in os.walk(base):
+            for name in files:
+                full = os.path.join(dirpath, name)
+                yield os.path.relpath(full, self.root).replace(os.sep, "/")
+
+    def delete_prefix(self, prefix: str) -> int:
+        n = super().delete_prefix(prefix)
+        base = self.path(prefix.rstrip("/"))
+        if os.path.isdir(base):
+            shutil.rmtree(base, ignore_errors=True)
+        return n
+
+
+class S3BlobStore(BlobStore):
+    """S3 / MinIO. boto3 é importado só quando este backend é usado."""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("BLOB_BACKEND=s3 requer o pacote boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None)
+
+    def _k(self, key: str) -> str:
+        return self.prefix + key
+
+    def put_file(self, key: str, fileobj: IO[bytes]) -> None:
+        self.client.upload_fileobj(fileobj, self.bucket, self._k(key))
+
+    def get(self, key: str) -> bytes:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._k(key))["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(key)
+
+    def open(self, key: str) -> IO[bytes]:
+        # baixa em arquivo temporário: o ZIP não passa inteiro pela memória
+        f = tempfile.TemporaryFile()
+        try:
+            self.client.download_fileobj(self.bucket, self._k(key), f)
+        except self.client.exceptions.ClientError as e:
+            f.close()
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                raise FileNotFoundError(key)
+            raise
+        f.seek(0)
+        return f
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._k(key))
+            return True
+        except Exception:
+            return False
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._k(key))
+
+    def list(self, prefix: str) -> Iterator[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._k(prefix)):
+            for obj in page.get("Contents", []):
+                yield obj["Key"][len(self.prefix):]
+
+
+_store: Optional[BlobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if settings.BLOB_BACKEND == "s3":
+                    _store = S3BlobStore(settings.S3_BUCKET, settings.S3_PREFIX, settings.S3_ENDPOINT_URL)
+                else:
+                    _store = LocalBlobStore(settings.LOCAL_STORAGE_DIR)
+    return _store
+
+
+# ============================================================
+# 🔑 CHAVES
+# ============================================================
+def blob_key(sha256: str) -> str:
+    return f"blobs/{sha256[:2]}/{sha256}"
+
+
+def result_key(sha256: str, params_key: str) -> str:
+    return f"results/{sha256}/{params_key}.pkl"
+
+
+def hash_fileobj(fileobj: IO[bytes]) -> Tuple[str, int]:
+    h = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = fileobj.read(CHUNK)
+        if not chunk:
+            break
+        h.update(chunk)
+        size += len(chunk)
+    return h.hexdigest(), size
+
+
+# ============================================================
+# 📥 CONTEÚDO DOS UPLOADS
+# ============================================================
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def store_content(db: Session, fileobj: IO[bytes]) -> Tuple[str, int]:
+    """
+    Grava o conteúdo (se ainda não existir) e soma uma referência ao blob.
+    O commit fica com quem chamou, junto com o Upload que referencia o blob.
+    """
+    fileobj.seek(0)
+    sha, size = hash_fileobj(fileobj)
+    store = get_blob_store()
+    key = blob_key(sha)
+    if not store.exists(key):
+        fileobj.seek(0)
+        store.put_file(key, fileobj)
+
+    if db.get(Blob, sha) is None:
+        try:
+            # savepoint: se outro worker criar o mesmo blob ao mesmo tempo, só
+            # esta inserção é desfeita e a referência é somada à linha dele
+            with db.begin_nested():
+                db.add(Blob(sha256=sha, size_bytes=size, refcount=0))
+        except IntegrityError:
+            pass
+    # incremento no banco (refcount = refcount + 1), sem ler-modificar-gravar
+    db.query(Blob).filter(Blob.sha256 == sha).update(
+        {Blob.refcount: Blob.refcount + 1, Blob.last_referenced_at: _now()},
+        synchronize_session=False,
+    )
+    return sha, size
+
+
+def release_content(db: Session, sha256: Optional[str]) -> None:
+    """Tira uma referência; o conteúdo só sai no GC."""
+    if not sha256:
+        return
+    db.query(Blob).filter(Blob.sha256 == sha256, Blob.refcount > 0).update(
+        {Blob.refcount: Blob.refcount - 1, Blob.last_referenced_at: _now()},
+        synchronize_session=False,
+    )
+
+
+def _legacy_path(upload) -> str:
+    path = upload.filepath
+    if isinstance(path, (bytes, bytearray, memoryview)):  # coluna antiga LargeBinary
+        path = bytes(path).decode("utf-8", errors="ignore")
+    return path
+
+
+def load_upload_bytes(upload) -> bytes:
+    """Conteúdo do upload: blob store; uploads antigos (sem sha256) leem o caminho."""
+    if upload.sha256:
+        return get_blob_store().get(blob_key(upload.sha256))
+    with open(_legacy_path(upload), "rb") as f:
+        return f.read()
+
+
+def open_upload(upload) -> IO[bytes]:
+    """Como load_upload_bytes, mas em arquivo aberto: a análise lê só os membros."""
+    if upload.sha256:
+        return get_blob_store().open(blob_key(upload.sha256))
+    return open(_legacy_path(upload), "rb")
+
+
+# ============================================================
+# 🧾 RESULTADOS DE ANÁLISE EM CACHE
+# ============================================================
+def get_cached_result(sha256: str, params_key: str) -> Optional[Dict[str, Any]]:
+    if not settings.ANALYSIS_CACHE_ENABLED:
+        return None
+    try:
+        return pickle.loads(get_blob_store().get(result_key(sha256, params_key)))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"⚠️ Resultado em cache ilegível ({sha256[:12]}): {e}")
+        return None
+
+
+def has_cached_result(sha256: Optional[str], params_key: str) -> bool:
+    """Resultado em cache sem carregá-lo (as rotas só cobram o rate limit sem ele)."""
+    if not (sha256 and settings.ANALYSIS_CACHE_ENABLED):
+        return False
+    try:
+        return get_blob_store().exists(result_key(sha256, params_key))
+    except Exception:
+        return False
+
+
+def put_cached_result(sha256: str, params_key: str, result: Dict[str, Any]) -> None:
+    if not settings.ANALYSIS_CACHE_ENABLED:
+        return
+    try:
+        # em arquivo: resultados fora da memória (spill.SpillList) são gravados em lotes
+        with tempfile.SpooledTemporaryFile(max_size=8 * CHUNK) as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.seek(0)
+            get_blob_store().put_file(result_key(sha256, params_key), f)
+    except Exception as e:
+        logger.warning(f"⚠️ Não foi possível gravar o resultado em cache: {e}")
+
+
+def rendered_key(sha256: str, name: str, encoding: Optional[str] = None) -> str:
+    suffix = {"gzip": ".gz", "br": ".br"}.get(encoding or "", "")
+    return f"results/{sha256}/rendered/{name}{suffix}"
+
+
+def get_rendered(sha256: str, name: str, encoding: Optional[str] = None) -> Optional[bytes]:
+    """Resposta já serializada (e comprimida em `encoding`) guardada junto do resultado."""
+    if not (settings.ANALYSIS_CACHE_ENABLED and settings.PRECOMPRESSED_RESULTS):
+        return None
+    try:
+        return get_blob_store().get(rendered_key(sha256, name, encoding))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"⚠️ Resposta em cache ilegível ({sha256[:12]}/{name}): {e}")
+        return None
+
+
+def put_rendered(sha256: str, name: str, variants: Dict[str, bytes]) -> None:
+    """variants: codificação ('identity', 'gzip', 'br') → corpo."""
+    if not (settings.ANALYSIS_CACHE_ENABLED and settings.PRECOMPRESSED_RESULTS):
+        return
+    store = get_blob_store()
+    try:
+        for encoding in variants:
+            store.put(rendered_key(sha256, name, None if encoding == "identity" else encoding),
+                      variants[encoding])
+    except Exception as e:
+        logger.warning(f"⚠️ Não foi possível gravar a resposta em cache: {e}")
+
+
+# ============================================================
+# 🧹 GC
+# ============================================================
+def collect_garbage(db: Session, grace_seconds: Optional[int] = None) -> List[str]:
+    """Apaga blobs sem referência há mais de `grace_seconds` (e seus resultados)."""
+    grace = settings.BLOB_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    cutoff = _now() - timedelta(seconds=grace)
+    store = get_blob_store()
+    removed = []
+    for blob in db.query(Blob).filter(Blob.refcount <= 0).all():
+        last = blob.last_referenced_at
+        if last is not None and last.tzinfo is None:
+            last = last.replace(tzinfo=timezone.utc)
+        if last is not None and last > cutoff:
+            continue
+        store.delete(blob_key(blob.sha256))
+        store.delete_prefix(f"results/{blob.sha256}/")
+        db.delete(blob)
+        removed.append(blob.sha256)
+    db.commit()
+    return removed
+
+
+if __name__ == "__main__":
+    import sys
+    from app.db import SessionLocal, get_engine
+
+    if len(sys.argv) < 2 or sys.argv[1] != "gc":
+        print("uso: python -m app.services.blobstore gc [carencia_segundos]")
+        sys.exit(2)
+    get_engine()
+    db = SessionLocal()
+    try:
+        grace = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        removed = collect_garbage(db, grace)
+        print(f"🧹 {len(removed)} blob(s) removido(s)")
+    finally:
+        db.close()
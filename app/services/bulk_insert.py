@@ -0,0 +1,316 @@
+"""
+bulk_insert.py
+---------------
+Persistência em lote dos documentos/itens parseados das NF-e.
+
+O padrão db.add() + commit() por linha (usado nos cadastros) não escala para
+centenas de milhares de itens por upload. Aqui usamos SQLAlchemy Core, com a
+estratégia mais rápida de cada backend:
+  - PostgreSQL: COPY FROM STDIN (psycopg2 copy_expert / psycopg3 copy)
+  - MySQL: INSERT multi-linha (insert().values([...]))
+  - SQLite e demais: executemany do driver
+Cada lote roda na sua própria transação.
+"""
+
+from __future__ import annotations
+from datetime import datetime
+from decimal import Decimal
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import io
+import logging
+import time
+
+from sqlalchemy import Table, delete
+from sqlalchemy.engine import Engine
+
+from app.models.documents import NfeDocument, NfeItem
+from .money import cents_to_decimal, to_cents
+from .checkpoint import ErrorLog, iter_documents
+from .zipscan import check_zipfile, open_zip
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Limite de parâmetros por statement (INSERT multi-linha)
+MAX_BIND_PARAMS = {
+    "sqlite": 32766,
+    "postgresql": 32767,
+    "mysql": 65535,
+}
+
+
+# -------------------------------------------------
+# 🎛️ Tamanho de lote
+# -------------------------------------------------
+def tune_batch_size(dialect: str, n_columns: int, requested: Optional[int] = None, method: str = "values") -> int:
+    """
+    Ajusta o lote ao backend: para INSERT multi-linha o limite é o número de
+    bind params do driver; COPY e executemany só dependem de memória.
+    """
+    size = requested or DEFAULT_BATCH_SIZE
+    if method == "values":
+        max_rows = MAX_BIND_PARAMS.get(dialect, 999) // max(n_columns, 1)
+        size = min(size, max_rows)
+    return max(size, 1)
+
+
+def _chunks(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk: List[Dict[str, Any]] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _default_method(engine: Engine) -> str:
+    dialect = engine.dialect.name
+    if dialect == "postgresql" and engine.dialect.driver in ("psycopg2", "psycopg"):
+        return "copy"
+    if dialect == "mysql":
+        return "values"
+    return "executemany"
+
+
+# -------------------------------------------------
+# 🐘 COPY (PostgreSQL)
+# -------------------------------------------------
+def _csv_field(value: Any) -> str:
+    # CSV do COPY: vazio sem aspas = NULL; "" = string vazia
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _copy_chunk(conn, table: Table, columns: List[str], chunk: List[Dict[str, Any]]) -> None:
+    dbapi_conn = conn.connection.dbapi_connection
+    cols_sql = ", ".join(columns)
+    sql = f"COPY {table.name} ({cols_sql}) FROM STDIN WITH (FORMAT csv)"
+
+    cursor = dbapi_conn.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):  # psycopg2
+            buf = io.StringIO()
+            for row in chunk:
+                buf.write(",".join(_csv_field(row.get(c)) for c in columns))
+                buf.write("\n")
+            buf.seek(0)
+            cursor.copy_expert(sql, buf)
+        else:  # psycopg 3
+            with cursor.copy(f"COPY {table.name} ({cols_sql}) FROM STDIN") as copy:
+                for row in chunk:
+                    copy.write_row(tuple(row.get(c) for c in columns))
+    finally:
+        cursor.close()
+
+
+# -------------------------------------------------
+# ⚡ executemany direto no driver (sem compilar parâmetros por linha)
+# -------------------------------------------------
+_PLACEHOLDERS = {"qmark": "?", "format": "%s", "pyformat": "%s"}
+
+
+def _driver_value(value: Any, dialect: str) -> Any:
+    # sqlite3 não adapta Decimal/datetime sozinho; os demais drivers sim
+    if dialect == "sqlite":
+        if isinstance(value, Decimal):
+            return str(value)
+        if isinstance(value, datetime):
+            return value.isoformat(" ")
+    return value
+
+
+def _executemany_chunk(conn, table: Table, columns: List[str], chunk: List[Dict[str, Any]]) -> None:
+    dialect = conn.dialect
+    placeholder = _PLACEHOLDERS.get(dialect.paramstyle)
+    if placeholder is None:
+        conn.execute(table.insert(), chunk)
+        return
+    sql = (
+        f"INSERT INTO {table.name} ({', '.join(columns)}) "
+        f"VALUES ({', '.join([placeholder] * len(columns))})"
+    )
+    name = dialect.name
+    params = [tuple(_driver_value(row.get(c), name) for c in columns) for row in chunk]
+    conn.exec_driver_sql(sql, params)
+
+
+# -------------------------------------------------
+# 🚚 Inserção genérica em lote
+# -------------------------------------------------
+def bulk_insert(
+    engine: Engine,
+    table: Table,
+    rows: Iterable[Dict[str, Any]],
+    batch_size: Optional[int] = None,
+    method: Optional[str] = None,
+) -> int:
+    """
+    Insere `rows` (dicts com as mesmas chaves) em `table`, uma transação por lote.
+    method: "copy" | "values" | "executemany" (None = melhor para o backend).
+    Retorna o número de linhas inseridas.
+    """
+    method = method or _default_method(engine)
+    dialect = engine.dialect.name
+    columns = [c.name for c in table.columns if not (c.primary_key and c.autoincrement)]
+    size = tune_batch_size(dialect, len(columns), batch_size, method)
+
+    total = 0
+    for chunk in _chunks(rows, size):
+        with engine.begin() as conn:
+            if method == "copy":
+                _copy_chunk(conn, table, columns, chunk)
+            elif method == "values":
+                conn.execute(table.insert().values(chunk))
+            else:
+                _executemany_chunk(conn, table, columns, chunk)
+        total += len(chunk)
+    return total
+
+
+# -------------------------------------------------
+# 🧾 Linhas a partir das NF-e parseadas
+# -------------------------------------------------
+def _money(cents: Optional[int], value: Any) -> Decimal:
+    # prefere os centavos exatos do parser; float só para dicts antigos
+    return cents_to_decimal(cents if cents is not None else to_cents(value))
+
+
+def iter_parsed_documents(zip_bytes: Union[bytes, IO[bytes]], errors: Optional[ErrorLog] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    # pré-análise (zipscan): só membros que parecem NF-e, sem duplicados;
+    # documentos com erro são pulados (e anotados em `errors`)
+    with open_zip(zip_bytes) as zf:
+        for info, doc, error in iter_documents(zf, check_zipfile(zf).candidates):
+            if error is not None:
+                if errors is not None:
+                    errors.add(error)
+                continue
+            yield info.filename, doc
+
+
+def document_and_item_rows(
+    upload_id: int,
+    client_id: int,
+    documents: Iterable[Tuple[str, Dict[str, Any]]],
+) -> Tuple[List[Dict[str, Any]], Iterator[Dict[str, Any]]]:
+    """
+    Separa o fluxo de documentos parseados em linhas de nfe_documents e
+    nfe_items. Os itens são gerados sob demanda (só o lote corrente fica em
+    memória); as linhas de documento se acumulam e são gravadas no final.
+    """
+    doc_rows: List[Dict[str, Any]] = []
+
+    def _items() -> Iterator[Dict[str, Any]]:
+        for name, doc in documents:
+            chave = doc.get("chNFe") or name
+            dt = doc.get("issue_date")
+            if isinstance(dt, datetime) and dt.tzinfo is not None:
+                dt = dt.replace(tzinfo=None)
+            doc_rows.append({
+                "upload_id": upload_id,
+                "client_id": client_id,
+                "chave": chave,
+                "numero": doc.get("cNF") or None,
+                "issue_date": dt,
+                "total_value": _money(doc.get("total_value_cents"), doc.get("total_value")),
+                "member_name": name,
+            })
+            for n, item in enumerate(doc.get("items", []), start=1):
+                yield {
+                    "upload_id": upload_id,
+                    "client_id": client_id,
+                    "chave": chave,
+                    "n_item": n,
+                    "cprod": item.get("cProd") or None,
+                    "xprod": (item.get("xProd") or "")[:255],
+                    "ncm": item.get("ncm") or None,
+                    "cfop": item.get("cfop") or None,
+                    "csosn": item.get("csosn") or None,
+                    "qcom": item.get("qCom") or None,
+                    "vuncom": item.get("vUnCom") or None,
+                    "vprod": _money(item.get("vProd_cents"), item.get("vProd")),
+                    "issue_date": dt,
+                }
+
+    return doc_rows, _items()
+
+
+def persist_parsed_documents(
+    engine: Engine,
+    upload_id: int,
+    client_id: int,
+    documents: Iterable[Tuple[str, Dict[str, Any]]],
+    batch_size: Optional[int] = None,
+    method: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Grava documentos e itens de um upload. Reprocessar o mesmo upload
+    substitui as linhas anteriores.
+    """
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        # client_id no filtro: com as tabelas particionadas, toca só a partição do cliente
+        conn.execute(delete(NfeItem.__table__).where(
+            NfeItem.client_id == client_id, NfeItem.upload_id == upload_id))
+        conn.execute(delete(NfeDocument.__table__).where(
+            NfeDocument.client_id == client_id, NfeDocument.upload_id == upload_id))
+
+    doc_rows, item_rows = document_and_item_rows(upload_id, client_id, documents)
+    n_items = bulk_insert(engine, NfeItem.__table__, item_rows, batch_size, method)
+    n_docs = bulk_insert(engine, NfeDocument.__table__, doc_rows, batch_size, method)
+
+    elapsed = time.perf_counter() - start
+    rate = n_items / elapsed if elapsed > 0 else 0.0
+    logger.info(f"[BULK] upload {upload_id}: {n_docs} documentos / {n_items} itens em {elapsed:.2f}s ({rate:,.0f} itens/s)")
+    return {"documents": n_docs, "items": n_items, "seconds": round(elapsed, 3)}
+
+
+def persist_zip(engine: Engine, upload_id: int, client_id: int, zip_bytes: Union[bytes, IO[bytes]], **kwargs) -> Dict[str, Any]:
+    errors = ErrorLog()
+    stats = persist_parsed_documents(engine, upload_id, client_id, iter_parsed_documents(zip_bytes, errors), **kwargs)
+    stats["documentos_com_erro"] = errors.count
+    stats["errors"] = errors.items
+    return stats
+
+
+# -------------------------------------------------
+# ⏱️ Benchmark local: python -m app.services.bulk_insert [URL] [N_ITENS]
+# -------------------------------------------------
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    from sqlalchemy import create_engine
+
+    url = sys.argv[1] if len(sys.argv) > 1 else f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    n_items = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+
+    bench_engine = create_engine(url)
+    NfeDocument.__table__.create(bench_engine, checkfirst=True)
+    NfeItem.__table__.create(bench_engine, checkfirst=True)
+
+    def _synthetic():
+        per_doc = 20
+        for d in range(n_items // per_doc):
+            yield f"{d}.xml", {
+                "chNFe": f"{d:044d}",
+                "cNF": str(d),
+                "issue_date": datetime(2024, 1 + d % 12, 1 + d % 28),
+                "total_value": 199.8,
+                "total_value_cents": 19980,
+                "items": [
+                    {"cProd": f"P{i}", "xProd": f"PRODUTO {i}", "ncm": "22030000", "cfop": "5405",
+                     "csosn": "500", "qCom": "1", "vUnCom": "9.99", "vProd": 9.99, "vProd_cents": 999}
+                    for i in range(per_doc)
+                ],
+            }
+
+    stats = persist_parsed_documents(bench_engine, 1, 1, _synthetic())
+    print(f"{bench_engine.dialect.name}: {stats['items']} itens em {stats['seconds']}s "
+          f"= {stats['items'] / stats['seconds']:,.0f} itens/s")
@@ -0,0 +1,277 @@
+"""
+checkpoint.py
+--------------
+Parse isolado por documento + checkpoint dos membros de uma análise com falhas.
+
+  - iter_documents: lê e parseia cada membro candidato do ZIP; um XML
+    malformado ou que não é NF-e vira um erro com código de motivo e a
+    análise continua com os demais.
+  - DocumentCheckpoint: guarda, por linhagem de upload e por (nome, CRC32,
+    tamanho), os erros dos membros que falharam e — quando a análise teve
+    falhas e a linhagem não guarda os membros (ranking limitado, modo fora
+    da memória, INCREMENTAL_ANALYSIS_ENABLED=False) — o agregado de cada
+    membro que deu certo. Na nova tentativa (ZIP corrigido reenviado na
+    mesma linhagem) só os membros que falharam são lidos de novo.
+
+Erros internos (erro_interno: falha do nosso código, não do arquivo) não
+ficam no checkpoint: o membro é tentado de novo na próxima análise.
+
+  checkpoints/<chave>.pkl             índice: formato, versão da análise,
+                                      erros e posição de cada agregado
+  checkpoints/<chave>/<hex>.seg       agregados (pickle em sequência)
+
+O índice de outro formato é ignorado; os agregados só valem na mesma versão
+da análise (dicionário, correções e motor), os erros de parse em qualquer
+uma. O checkpoint só tem membros que ainda estão no último ZIP analisado e
+é apagado quando uma análise termina sem falhas.
+"""
+
+from __future__ import annotations
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+import os
+import pickle
+import tempfile
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
+
+from app.config import settings
+from .nfe import NfeParseError, parse_nfe_xml
+from .zipscan import ArchiveRejected, read_member
+
+logger = logging.getLogger(__name__)
+
+MAX_ERRORS_LISTED = 1000
+CHECKPOINT_FORMAT = 2
+
+# códigos de motivo dos erros por documento
+MALFORMED = "xml_malformado"
+CORRUPTED_MEMBER = "membro_corrompido"
+INTERNAL = "erro_interno"
+
+Fingerprint = Tuple[str, int, int]
+
+
+def fingerprint(info: zipfile.ZipInfo) -> Fingerprint:
+    return (info.filename, info.CRC, info.file_size)
+
+
+def error_reason(exc: BaseException) -> str:
+    if isinstance(exc, NfeParseError):
+        return exc.reason
+    if isinstance(exc, ET.ParseError):
+        return MALFORMED
+    if isinstance(exc, (zipfile.BadZipFile, zlib.error, EOFError)):
+        return CORRUPTED_MEMBER
+    return INTERNAL
+
+
+def document_error(info: zipfile.ZipInfo, exc: BaseException) -> Dict[str, str]:
+    return {"arquivo": info.filename, "motivo": error_reason(exc), "detalhe": str(exc)[:200]}
+
+
+# ============================================================
+# 💾 CHECKPOINT
+# ============================================================
+def _index_key(key: str) -> str:
+    return f"checkpoints/{key}.pkl"
+
+
+def _segment_key(key: str, segment: str) -> str:
+    return f"checkpoints/{key}/{segment}.seg"
+
+
+class DocumentCheckpoint:
+    """
+    keep_successes: guarda também os agregados dos membros que deram certo
+    (quem chama passa True quando a linhagem não os guarda).
+    """
+
+    def __init__(self, key: str, version: str = "", keep_successes: bool = False):
+        self.key = key
+        self.version = version
+        self.keep_successes = keep_successes
+        index = self._load()
+        self._previous: Dict[Fingerprint, Dict[str, str]] = index.get("erros", {})
+        self._saved: Dict[Fingerprint, int] = {}
+        self._segment: Optional[str] = index.get("segmento")
+        if keep_successes and index.get("versao") == version:
+            self._saved = index.get("ok", {})
+        self._stale = bool(index.get("ok")) and not self._saved  # agregados de outra versão
+        self._current: Dict[Fingerprint, Dict[str, str]] = {}
+        self._ok: Dict[Fingerprint, int] = {}
+        self._in: Optional[IO[bytes]] = None
+        self._out: Optional[IO[bytes]] = None
+        self.failed = 0
+        self.reused = 0
+
+    def _load(self) -> Dict[str, Any]:
+        from .blobstore import get_blob_store
+
+        try:
+            index = pickle.loads(get_blob_store().get(_index_key(self.key)))
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"⚠️ Checkpoint ilegível ({self.key}): {e}")
+            return {}
+        if not isinstance(index, dict) or index.get("formato") != CHECKPOINT_FORMAT:
+            return {}  # formato antigo: a análise refaz os membros
+        return index
+
+    def retain(self, fingerprints: Iterable[Fingerprint]) -> None:
+        """Mantém os erros dos membros que continuam no ZIP (lidos ou não)."""
+        self._current = {fp: self._previous[fp] for fp in fingerprints if fp in self._previous}
+
+    def get_error(self, info: zipfile.ZipInfo) -> Optional[Dict[str, str]]:
+        err = self._previous.get(fingerprint(info))
+        if err is not None:
+            self.failed += 1
+            self.reused += 1
+        return err
+
+    def put_error(self, info: zipfile.ZipInfo, err: Dict[str, str]) -> None:
+        self.failed += 1
+        if err["motivo"] != INTERNAL:
+            self._current[fingerprint(info)] = err
+
+    def has_member(self, info: zipfile.ZipInfo) -> bool:
+        return fingerprint(info) in self._saved
+
+    def saved_member(self, info: zipfile.ZipInfo) -> Dict[str, Any]:
+        """Agregado guardado de um membro que deu certo (has_member)."""
+        if self._in is None:
+            from .blobstore import get_blob_store
+
+            self._in = get_blob_store().open(_segment_key(self.key, self._segment))
+        self._in.seek(self._saved[fingerprint(info)])
+        member = pickle.load(self._in)
+        self.reused += 1
+        return member
+
+    def put_member(self, info: zipfile.ZipInfo, member: Dict[str, Any]) -> None:
+        """Agregado de um membro que deu certo (incremental.new_member), antes de esvaziar prod/dedup."""
+        if not self.keep_successes:
+            return
+        if self._out is None:
+            self._out = tempfile.TemporaryFile()
+        self._ok[fingerprint(info)] = self._out.tell()
+        pickle.dump(member, self._out, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def save(self) -> None:
+        """Grava erros e agregados deste ZIP se houve falha (e se algo mudou desde o último)."""
+        from .blobstore import get_blob_store
+
+        ok = self._ok if self.failed else {}
+        try:
+            if self._in is not None:
+                self._in.close()
+                self._in = None
+            if self._current == self._previous and ok.keys() == self._saved.keys() and not self._stale:
+                return
+            store = get_blob_store()
+            previous = self._segment
+            self._segment = None
+            if ok:
+                # o segmento novo antes do índice que aponta para ele
+                self._segment = os.urandom(8).hex()
+                self._out.seek(0)
+                store.put_file(_segment_key(self.key, self._segment), self._out)
+            if self._current or ok:
+                index = {"formato": CHECKPOINT_FORMAT, "versao": self.version, "erros": self._current,
+                         "ok": ok, "segmento": self._segment}
+                store.put(_index_key(self.key), pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL))
+            else:
+                store.delete(_index_key(self.key))
+            if previous and previous != self._segment:
+                store.delete(_segment_key(self.key, previous))
+        except Exception as e:
+            logger.warning(f"⚠️ Não foi possível gravar o checkpoint ({self.key}): {e}")
+        finally:
+            if self._out is not None:
+                self._out.close()
+                self._out = None
+
+
+def open_checkpoint(key: Optional[str], version: str = "",
+                    keep_successes: bool = False) -> Optional[DocumentCheckpoint]:
+    """Checkpoint da linhagem `key` (incremental.lineage_key); sem chave → None."""
+    if not key or not settings.ANALYSIS_CHECKPOINT_ENABLED:
+        return None
+    return DocumentCheckpoint(key, version, keep_successes)
+
+
+def move_checkpoint(old_key: str, new_key: Optional[str]) -> None:
+    """Leva o checkpoint para outra chave (new_key=None apaga)."""
+    from .blobstore import get_blob_store
+
+    store = get_blob_store()
+    try:
+        if new_key:
+            old_prefix = f"checkpoints/{old_key}/"
+            for k in list(store.list(old_prefix)):
+                with store.open(k) as f:
+                    store.put_file(f"checkpoints/{new_key}/{k[len(old_prefix):]}", f)
+            try:
+                store.put(_index_key(new_key), store.get(_index_key(old_key)))
+            except FileNotFoundError:
+                pass
+        store.delete(_index_key(old_key))
+        store.delete_prefix(f"checkpoints/{old_key}/")
+    except Exception as e:
+        logger.warning(f"⚠️ Não foi possível mover o checkpoint ({old_key}): {e}")
+
+
+# ============================================================
+# 🧾 PARSE ISOLADO POR DOCUMENTO
+# ============================================================
+def iter_documents(
+    zf: zipfile.ZipFile,
+    candidates: Iterable[zipfile.ZipInfo],
+    checkpoint: Optional[DocumentCheckpoint] = None,
+) -> Iterator[Tuple[zipfile.ZipInfo, Optional[Dict[str, Any]], Optional[Dict[str, str]]]]:
+    """
+    (membro, documento, None) para cada NF-e parseada,
+    (membro, None, erro) para cada membro com falha ou
+    (membro, None, None) para um membro que já deu certo no checkpoint
+    (o agregado vem de checkpoint.saved_member).
+    Só ArchiveRejected (tamanho real acima do declarado) interrompe o ZIP.
+    """
+    for info in candidates:
+        # o mesmo membro (nome, CRC, tamanho) falha do mesmo jeito: não relê
+        err = checkpoint.get_error(info) if checkpoint is not None else None
+        if err is not None:
+            yield info, None, err
+            continue
+        if checkpoint is not None and checkpoint.has_member(info):
+            yield info, None, None
+            continue
+        try:
+            doc = parse_nfe_xml(read_member(zf, info))
+        except ArchiveRejected:
+            raise
+        except Exception as e:
+            err = document_error(info, e)
+            if checkpoint is not None:
+                checkpoint.put_error(info, err)
+            yield info, None, err
+            continue
+        yield info, doc, None
+    if checkpoint is not None:
+        checkpoint.save()
+
+
+class ErrorLog:
+    """Erros por documento: contagem total + lista limitada para a resposta."""
+
+    def __init__(self):
+        self.count = 0
+        self.items: List[Dict[str, str]] = []
+        self.by_reason: Dict[str, int] = {}
+
+    def add(self, error: Dict[str, str]) -> None:
+        self.count += 1
+        self.by_reason[error["motivo"]] = self.by_reason.get(error["motivo"], 0) + 1
+        if len(self.items) < MAX_ERRORS_LISTED:
+            self.items.append(error)
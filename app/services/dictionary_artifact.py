@@ -0,0 +1,196 @@
+"""
+dictionary_artifact.py
+-----------------------
+Compila o dicionário (monofasicos.json + ncm_catalog.json) uma única vez num
+artefato binário versionado, carregado pelos workers via mmap + pickle.
+
+Conteúdo do artefato:
+  - categorias com keywords já normalizadas (sem acento, minúsculas)
+  - índice de tokens ("autômato"): 1º token da keyword → [(keyword, categoria)],
+    equivalente ao antigo regex \\bkeyword\\b por palavra, sem compilar regex
+  - lista achatada de palavras para o fuzzy (RapidFuzz)
+  - tabela de prefixos de NCM (trie achatada; aceita códigos de 2 a 8 dígitos)
+
+A versão é o sha256 dos dois JSON + FORMAT_VERSION. Se o artefato não existe
+ou é de outra versão, o matcher recompila a partir do JSON (e regrava o
+artefato quando o diretório permite).
+
+Gerar no deploy:
+    python -m app.services.dictionary_artifact
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pickle
+import re
+import tempfile
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+MONO_PATH = os.path.normpath(os.path.join(DATA_DIR, "monofasicos.json"))
+NCM_PATH  = os.path.normpath(os.path.join(DATA_DIR, "ncm_catalog.json"))
+ARTIFACT_PATH = os.getenv(
+    "DICTIONARY_ARTIFACT_PATH",
+    os.path.normpath(os.path.join(DATA_DIR, "dictionary.artifact")),
+)
+
+# Mude quando a estrutura do artefato mudar
+FORMAT_VERSION = 1
+MAGIC = b"AUDSDICT"
+_HEADER_LEN = len(MAGIC) + 64 + 1  # magic + sha256 hex + "\n"
+
+WORD_RE = re.compile(r"\w+")
+WORD_CHAR_RE = re.compile(r"\w")
+
+
+def norm_text(s: str) -> str:
+    s = (s or "").lower().strip()
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch for ch in s if not unicodedata.category(ch).startswith("M"))
+    return s
+
+
+# ============================================================
+# 🔖 VERSÃO
+# ============================================================
+def dictionary_version(mono_path: str = MONO_PATH, ncm_path: str = NCM_PATH) -> str:
+    h = hashlib.sha256()
+    h.update(f"format={FORMAT_VERSION}\n".encode())
+    for path in (mono_path, ncm_path):
+        with open(path, "rb") as f:
+            h.update(f.read())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+# ============================================================
+# 🛠️ COMPILAÇÃO
+# ============================================================
+def _is_regular(keyword: str) -> bool:
+    # começa e termina com caractere de palavra: dá para casar pelo índice de tokens
+    return bool(WORD_CHAR_RE.match(keyword[0])) and bool(WORD_CHAR_RE.match(keyword[-1]))
+
+
+def compile_dictionary(mono_path: str = MONO_PATH, ncm_path: str = NCM_PATH) -> Dict[str, Any]:
+    with open(mono_path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    with open(ncm_path, "r", encoding="utf-8") as f:
+        ncm_raw = json.load(f)
+
+    categorias: Dict[str, List[str]] = {}
+    for cat, words in raw.items():
+        normed = {norm_text(w) for w in words}
+        normed.discard("")
+        categorias[norm_text(cat)] = sorted(normed)
+    cat_order = list(categorias)
+
+    token_index: Dict[str, List[Tuple[str, int]]] = {}
+    irregular: Dict[int, List[str]] = {}
+    fuzzy_choices: List[str] = []
+    fuzzy_cats: List[int] = []
+    for idx, cat in enumerate(cat_order):
+        for w in categorias[cat]:
+            if len(w) >= 3:
+                if _is_regular(w):
+                    first = WORD_RE.match(w).group()
+                    token_index.setdefault(first, []).append((w, idx))
+                else:
+                    irregular.setdefault(idx, []).append(w)
+            if len(w) >= 4:
+                fuzzy_choices.append(w)
+                fuzzy_cats.append(idx)
+
+    ncm_map = {str(k).strip(): norm_text(v) for k, v in ncm_raw.items()}
+    ncm_prefix = {k: v for k, v in ncm_map.items() if k.isdigit() and 2 <= len(k) <= 8}
+    ncm_prefix_lengths = sorted({len(k) for k in ncm_prefix}, reverse=True)
+
+    return {
+        "format": FORMAT_VERSION,
+        "version": dictionary_version(mono_path, ncm_path),
+        "categorias": categorias,
+        "cat_order": cat_order,
+        "token_index": token_index,
+        "irregular": irregular,
+        "fuzzy_choices": fuzzy_choices,
+        "fuzzy_cats": fuzzy_cats,
+        "ncm_map": ncm_map,
+        "ncm_prefix": ncm_prefix,
+        "ncm_prefix_lengths": ncm_prefix_lengths,
+    }
+
+
+# ============================================================
+# 💾 ARTEFATO EM DISCO
+# ============================================================
+def save_artifact(compiled: Dict[str, Any], path: str = ARTIFACT_PATH) -> str:
+    """Grava de forma atômica (tmp + rename) para não expor arquivo parcial a outros workers."""
+    header = MAGIC + compiled["version"].encode("ascii") + b"\n"
+    payload = pickle.dumps(compiled, protocol=pickle.HIGHEST_PROTOCOL)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".dictionary-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(payload)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return path
+
+
+def load_artifact(expected_version: str, path: str = ARTIFACT_PATH) -> Optional[Dict[str, Any]]:
+    """Retorna o artefato se existir e for da versão esperada; None se estiver ausente/velho."""
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header = mm[:_HEADER_LEN]
+            if not header.startswith(MAGIC) or header[len(MAGIC):-1].decode("ascii") != expected_version:
+                return None
+            view = memoryview(mm)[_HEADER_LEN:]
+            try:
+                compiled = pickle.loads(view)
+            finally:
+                view.release()
+    except (FileNotFoundError, ValueError):
+        return None
+    except Exception as e:
+        logger.warning(f"⚠️ Artefato do dicionário ilegível ({path}): {e}")
+        return None
+    if compiled.get("format") != FORMAT_VERSION:
+        return None
+    return compiled
+
+
+def load_or_compile(mono_path: str = MONO_PATH, ncm_path: str = NCM_PATH,
+                    path: str = ARTIFACT_PATH, write: bool = True) -> Dict[str, Any]:
+    version = dictionary_version(mono_path, ncm_path)
+    compiled = load_artifact(version, path)
+    if compiled is not None:
+        return compiled
+
+    logger.info(f"🔄 Artefato do dicionário ausente ou desatualizado; recompilando ({version[:12]})")
+    compiled = compile_dictionary(mono_path, ncm_path)
+    if write:
+        try:
+            save_artifact(compiled, path)
+        except OSError as e:
+            # disco somente leitura: segue com o dicionário em memória
+            logger.warning(f"⚠️ Não foi possível gravar o artefato do dicionário: {e}")
+    return compiled
+
+
+if __name__ == "__main__":
+    compiled = compile_dictionary()
+    out = save_artifact(compiled)
+    n_kw = sum(len(v) for v in compiled["categorias"].values())
+    print(f"✅ Artefato {out} gerado: versão {compiled['version'][:12]}, "
+          f"{len(compiled['categorias'])} categorias, {n_kw} keywords, {len(compiled['ncm_prefix'])} NCM")
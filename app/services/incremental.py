@@ -0,0 +1,368 @@
+"""
+incremental.py
+---------------
+Análise incremental de ZIPs que só crescem.
+
+O cliente manda todo mês o mesmo ZIP com as NF-e do mês novo acrescentadas.
+Cada membro do ZIP tem uma impressão digital (nome, CRC32 do diretório
+central, tamanho) e o seu agregado parcial (faturamento por mês, somas por
+categoria, contadores, produtos monofásicos...). Por linhagem de upload
+(mesmo arquivo reenviado) fica guardado, no blobstore:
+
+    lineages/<chave>.pkl = membros {impressão → agregado} + totais somados
+    lineages/<chave>/prod-<segmento>.pkl = linhas de produto dos membros
+        analisados numa execução {impressão → linhas}
+
+O estado guarda só o que é somável por membro; as linhas de produto de cada
+execução vão num segmento próprio, gravado uma vez e lido só para montar a
+lista de produtos. Segmentos sem membro que os use são apagados no save.
+
+Na versão nova do ZIP:
+  - membros removidos ou alterados: o agregado é subtraído dos totais
+  - membros novos ou alterados: só eles são parseados e classificados,
+    e o agregado é somado
+  - o resto não é lido
+
+A linhagem vale para uma versão da classificação (dicionário + correções +
+motor); mudou a versão, começa do zero. O resultado é o mesmo da análise
+completa; só o trabalho por membro deixa de ser refeito.
+
+Duas análises da mesma linhagem ao mesmo tempo trocariam os segmentos uma da
+outra (o save de uma apaga o que a outra ainda vai ler). lineage_lock(chave)
+serializa abertura → save → leitura dos produtos, e também drop/move: Lock no
+processo + flock entre workers do mesmo host (o diretório de locks é local;
+vários hosts no mesmo bucket não são coordenados).
+"""
+
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import weakref
+
+try:
+    import fcntl
+except ImportError:  # Windows: só o lock do processo
+    fcntl = None
+
+from .checkpoint import Fingerprint
+
+logger = logging.getLogger(__name__)
+
+# contadores somáveis por membro (mesmos nomes de init_totals)
+COUNTERS = (
+    "items",
+    "monofasico_palavra_chave",
+    "monofasico_total",
+    "monofasico_sem_ncm",
+    "monofasico_sem_cfop_csosn",
+    "st_cfop_csosn_corretos",
+    "st_incorreta",
+    "erros_ncm_categoria",
+    "correcoes",
+)
+
+
+def new_member() -> Dict[str, Any]:
+    """Agregado de um membro do ZIP (um documento ou um erro)."""
+    return {
+        "doc": False,
+        "err": None,       # erro do documento (checkpoint.document_error)
+        "dt": None,        # data de emissão
+        "fat": {},         # mês → centavos do documento
+        "itens": {},       # (grupo, categoria, mês) → centavos
+        "cont": {},        # contador → n
+        "cats": {},        # categoria → itens monofásicos
+        "prod": [],        # linhas de produto monofásico, na ordem do documento (não vão no estado)
+        "dedup": {},       # (cprod, descrição) em minúsculas → [código, descrição, ocorrências, centavos]
+    }
+
+
+def _merge_counts(dst: Dict[Hashable, int], src: Dict[Hashable, int], sign: int) -> None:
+    for key, n in src.items():
+        total = dst.get(key, 0) + sign * n
+        if total:
+            dst[key] = total
+        else:
+            dst.pop(key, None)
+
+
+def _merge_sums(dst: Dict[Hashable, List[int]], src: Dict[Hashable, int], sign: int) -> None:
+    """dst: chave → [centavos, nº de membros]; a chave some quando nenhum membro contribui."""
+    for key, cents in src.items():
+        slot = dst.get(key)
+        if slot is None:
+            slot = dst[key] = [0, 0]
+        slot[0] += sign * cents
+        slot[1] += sign
+        if slot[1] <= 0:
+            del dst[key]
+
+
+# ============================================================
+# 🧮 TOTAIS MESCLÁVEIS
+# ============================================================
+class LineageState:
+    """
+    Agregados por membro + totais; add/remove mantêm os totais em O(membro).
+    keep_members=False (ranking limitado): só os totais, sem linhagem nem remoção.
+    Por membro fica o agregado sem "prod" e o segmento ("seg") onde estão as
+    linhas de produto; as da execução atual ficam em memória até o save.
+    """
+
+    def __init__(self, key: Optional[str], version: str, keep_members: bool = True):
+        self.key = key
+        self.version = version
+        self.keep_members = keep_members
+        self.members: Dict[Fingerprint, Dict[str, Any]] = {}
+        self.documents = 0
+        self.fat: Dict[Any, List[int]] = {}
+        self.itens: Dict[tuple, List[int]] = {}
+        self.cont: Dict[str, int] = {}
+        self.cats: Dict[str, int] = {}
+        self.dedup: Dict[tuple, Dict[str, Any]] = {}
+        self.segments: set = set()
+        self._pending: Dict[Fingerprint, List[Dict[str, Any]]] = {}
+        self._segment: Optional[str] = None
+        self.dt_min = None
+        self.dt_max = None
+        self._dt_stale = False
+        self.added = 0
+        self.removed = 0
+        self.reused = 0
+
+    def __contains__(self, fp: Fingerprint) -> bool:
+        return fp in self.members
+
+    def add(self, fp: Fingerprint, member: Dict[str, Any]) -> None:
+        if fp in self.members:
+            self.remove(fp)
+        if self.keep_members:
+            slim = {k: v for k, v in member.items() if k != "prod"}
+            slim["seg"] = None
+            if member["prod"]:
+                if self._segment is None:
+                    self._segment = os.urandom(8).hex()
+                slim["seg"] = self._segment
+                self._pending[fp] = member["prod"]
+            self.members[fp] = slim
+        self.added += 1
+        self._apply(member, +1)
+        dt = member["dt"]
+        if dt is not None:
+            if self.dt_min is None or dt < self.dt_min:
+                self.dt_min = dt
+            if self.dt_max is None or dt > self.dt_max:
+                self.dt_max = dt
+
+    def remove(self, fp: Fingerprint) -> None:
+        member = self.members.pop(fp)
+        self._pending.pop(fp, None)
+        self.removed += 1
+        self._apply(member, -1)
+        if member["dt"] is not None and member["dt"] in (self.dt_min, self.dt_max):
+            self._dt_stale = True
+
+    def _apply(self, member: Dict[str, Any], sign: int) -> None:
+        if member["doc"]:
+            self.documents += sign
+        _merge_sums(self.fat, member["fat"], sign)
+        _merge_sums(self.itens, member["itens"], sign)
+        _merge_counts(self.cont, member["cont"], sign)
+        _merge_counts(self.cats, member["cats"], sign)
+        for key, (codigo, desc, n, cents) in member["dedup"].items():
+            row = self.dedup.get(key)
+            if row is None:
+                row = self.dedup[key] = {"codigo": codigo, "descricao": desc,
+                                         "ocorrencias": 0, "valor_total_cents": 0}
+            row["ocorrencias"] += sign * n
+            row["valor_total_cents"] += sign * cents
+            if row["ocorrencias"] <= 0:
+                del self.dedup[key]
+
+    def retain(self, fingerprints: Iterable[Fingerprint]) -> None:
+        """Subtrai os membros que não estão mais no ZIP."""
+        keep = set(fingerprints)
+        for fp in [fp for fp in self.members if fp not in keep]:
+            self.remove(fp)
+
+    def period(self):
+        if self._dt_stale:
+            dts = [m["dt"] for m in self.members.values() if m["dt"] is not None]
+            self.dt_min = min(dts) if dts else None
+            self.dt_max = max(dts) if dts else None
+            self._dt_stale = False
+        return self.dt_min, self.dt_max
+
+    def products(self, fingerprints: Iterable[Fingerprint]) -> Iterator[Dict[str, Any]]:
+        """Linhas de produto dos membros, na ordem dada (segmentos lidos uma vez)."""
+        loaded: Dict[str, Dict[Fingerprint, List[Dict[str, Any]]]] = {}
+        for fp in fingerprints:
+            seg = self.members[fp].get("seg")
+            if seg is None:
+                continue
+            rows = self._pending.get(fp)
+            if rows is None:
+                if seg not in loaded:
+                    loaded[seg] = pickle.loads(_store().get(self._segment_key(seg)))
+                rows = loaded[seg].get(fp, ())
+            yield from rows
+
+    def counter(self, name: str) -> int:
+        return self.cont.get(name, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "linhagem": self.key,
+            "membros_reaproveitados": self.reused,
+            "membros_analisados": self.added,
+            "membros_removidos": self.removed,
+        }
+
+    # ---- persistência ----
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in ("added", "removed", "reused"):
+            state[k] = 0
+        state["_pending"] = {}
+        state["_segment"] = None
+        return state
+
+    @property
+    def _blob_key(self) -> str:
+        return f"lineages/{self.key}.pkl"
+
+    def _segment_key(self, seg: str) -> str:
+        return f"lineages/{self.key}/prod-{seg}.pkl"
+
+    def save(self) -> None:
+        if not self.key or not (self.added or self.removed):
+            return
+        store = _store()
+        try:
+            # o segmento novo antes do estado que aponta para ele; os sem uso depois
+            if self._pending:
+                store.put(self._segment_key(self._segment),
+                          pickle.dumps(self._pending, protocol=pickle.HIGHEST_PROTOCOL))
+            previous = self.segments
+            self.segments = {m["seg"] for m in self.members.values() if m.get("seg")}
+            store.put(self._blob_key, pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL))
+            for seg in previous - self.segments:
+                store.delete(self._segment_key(seg))
+        except Exception as e:
+            logger.warning(f"⚠️ Não foi possível gravar a linhagem ({self.key}): {e}")
+
+
+def _store():
+    from .blobstore import get_blob_store
+
+    return get_blob_store()
+
+
+# ============================================================
+# 🔒 EXCLUSÃO POR LINHAGEM
+# ============================================================
+_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = weakref.WeakValueDictionary()
+_locks_guard = threading.Lock()
+
+
+def _lock_dir() -> str:
+    directory = os.path.join(tempfile.gettempdir(), "auditasimples-lineages")
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+@contextmanager
+def lineage_lock(key: Optional[str]) -> Iterator[None]:
+    """Uma análise (ou drop/move) por linhagem de cada vez; sem chave, não trava."""
+    from app.config import settings
+
+    if not key or not settings.INCREMENTAL_ANALYSIS_ENABLED:
+        yield
+        return
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = threading.Lock()
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(_lock_dir(), f"{key}.lock"), "a+") as fh:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+def open_lineage(key: Optional[str], version: str) -> LineageState:
+    """Estado da linhagem na versão pedida; sem chave/desativado/outra versão → vazio."""
+    from app.config import settings
+
+    if key and settings.INCREMENTAL_ANALYSIS_ENABLED:
+        try:
+            store = _store()
+            state = pickle.loads(store.get(f"lineages/{key}.pkl"))
+            if isinstance(state, LineageState) and state.version == version:
+                state.key = key  # a linhagem pode ter mudado de chave (move_lineage)
+                # sem algum segmento, as linhas de produto não voltariam: começa do zero
+                if all(store.exists(state._segment_key(seg)) for seg in state.segments):
+                    return state
+                logger.warning(f"⚠️ Linhagem sem segmento de produtos ({key}); recomeçando")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"⚠️ Linhagem ilegível ({key}): {e}")
+    return LineageState(key if settings.INCREMENTAL_ANALYSIS_ENABLED else None, version)
+
+
+def lineage_key(upload) -> Optional[str]:
+    """Chave da linhagem de um upload (versões do mesmo arquivo compartilham)."""
+    if upload is None or upload.id is None:
+        return None
+    return f"client-{upload.client_id}-upload-{upload.lineage_id or upload.id}"
+
+
+def drop_lineage(key: Optional[str]) -> None:
+    """Apaga o estado guardado da linhagem e o checkpoint (último upload dela removido)."""
+    if not key:
+        return
+    from .checkpoint import move_checkpoint
+
+    with lineage_lock(key):
+        try:
+            store = _store()
+            store.delete(f"lineages/{key}.pkl")
+            store.delete_prefix(f"lineages/{key}/")
+        except Exception as e:
+            logger.warning(f"⚠️ Não foi possível apagar a linhagem ({key}): {e}")
+        move_checkpoint(key, None)
+
+
+def move_lineage(old_key: Optional[str], new_key: Optional[str]) -> None:
+    """A raiz da linhagem mudou (raiz removida): estado, segmentos e checkpoint vão para a chave nova."""
+    if not old_key or not new_key or old_key == new_key:
+        return
+    from .checkpoint import move_checkpoint
+
+    first, second = sorted((old_key, new_key))  # ordem fixa: dois moves não se travam
+    with lineage_lock(first), lineage_lock(second):
+        try:
+            store = _store()
+            old_prefix = f"lineages/{old_key}/"
+            for k in list(store.list(old_prefix)):
+                store.put(f"lineages/{new_key}/{k[len(old_prefix):]}", store.get(k))
+            try:
+                store.put(f"lineages/{new_key}.pkl", store.get(f"lineages/{old_key}.pkl"))
+            except FileNotFoundError:
+                pass
+            store.delete(f"lineages/{old_key}.pkl")
+            store.delete_prefix(old_prefix)
+        except Exception as e:
+            logger.warning(f"⚠️ Não foi possível mover a linhagem ({old_key} → {new_key}): {e}")
+        move_checkpoint(old_key, new_key)
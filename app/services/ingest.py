@@ -0,0 +1,338 @@
+"""
+ingest.py
+----------
+Ingestão de ZIPs deixados em pastas do servidor.
+
+Hoje o usuário copia o ZIP para o servidor e registra o caminho na mão
+(POST /api/uploads/path). Aqui cada pasta configurada pertence a um cliente
+(INGEST_DIRS="1=/srv/drop/cliente1;2=/srv/drop/cliente2") e:
+
+  1. eventos de arquivo vêm do inotify (pacote watchdog, opcional); sem ele,
+     ou como rede de segurança, a pasta é varrida a cada INGEST_POLL_SECONDS
+  2. o arquivo só é pego quando tamanho e mtime ficam parados por
+     INGEST_STABLE_SECONDS e o ZIP abre (diretório central completo)
+  3. registro do Upload (registration.register_content: dedup por sha256,
+     linhagem pelo nome do arquivo)
+  4. pré-cálculo num pool limitado (INGEST_WORKERS): análise com os
+     parâmetros padrão do dashboard (fica no cache de resultados) e o
+     Parquet dos itens (item_store, se o duckdb estiver instalado)
+
+Depois o arquivo vai para <pasta>/processados/ (ou rejeitados/, com o motivo
+em .json). Um lock por pasta (flock) garante um só ingestor por pasta, mesmo
+com vários workers.
+
+Rodar: python -m app.services.ingest   (ou INGEST_ENABLED=true no app)
+"""
+
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import json
+import logging
+import os
+import threading
+import time
+import zipfile
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+DONE_DIR = "processados"
+REJECTED_DIR = "rejeitados"
+LOCK_FILE = ".ingest.lock"
+
+
+def parse_dirs(raw: str) -> Dict[str, int]:
+    """'1=/srv/a;2=/srv/b' → {'/srv/a': 1, '/srv/b': 2}"""
+    out: Dict[str, int] = {}
+    for part in (raw or "").split(";"):
+        part = part.strip()
+        if not part:
+            continue
+        client, sep, path = part.partition("=")
+        if not sep or not client.strip().isdigit() or not path.strip():
+            raise ValueError(f"INGEST_DIRS inválido: {part!r} (use client_id=/caminho)")
+        out[os.path.abspath(path.strip())] = int(client)
+    return out
+
+
+def _archive_complete(path: str) -> bool:
+    """Um ZIP ainda sendo gravado não tem o diretório central no fim."""
+    try:
+        with zipfile.ZipFile(path) as zf:
+            zf.infolist()
+        return True
+    except (zipfile.BadZipFile, OSError):
+        return False
+
+
+@dataclass
+class _Pending:
+    size: int
+    mtime: float
+    since: float           # desde quando tamanho/mtime estão parados
+    first_seen: float = field(default_factory=time.monotonic)
+
+
+# ============================================================
+# 📥 INGESTOR
+# ============================================================
+class FolderIngestor:
+    def __init__(self, dirs: Dict[str, int], workers: int = 2, poll_seconds: float = 5.0,
+                 stable_seconds: float = 10.0, give_up_seconds: float = 3600.0, prewarm: bool = True):
+        self.dirs = dirs
+        self.poll_seconds = poll_seconds
+        self.stable_seconds = stable_seconds
+        self.give_up_seconds = give_up_seconds
+        self.prewarm = prewarm
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._slots = threading.BoundedSemaphore(workers * 2)  # na fila + rodando
+        self._pending: Dict[str, _Pending] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._locks: List[int] = []
+        self._observer = None
+        self.stats = {"registrados": 0, "deduplicados": 0, "rejeitados": 0, "erros": 0}
+
+    # ---- descoberta ----
+    def _claim_dirs(self) -> None:
+        """Fica só com as pastas cujo lock conseguiu (outro processo já ingere as demais)."""
+        claimed = {}
+        for path, client_id in self.dirs.items():
+            os.makedirs(path, exist_ok=True)
+            if fcntl is not None:
+                fd = os.open(os.path.join(path, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    os.close(fd)
+                    logger.info(f"[INGEST] {path}: outro processo já está ingerindo")
+                    continue
+                self._locks.append(fd)
+            claimed[path] = client_id
+        self.dirs = claimed
+
+    def notice(self, path: str) -> None:
+        """Arquivo criado/alterado (evento do inotify ou varredura)."""
+        if not path.lower().endswith(".zip") or os.path.dirname(path) not in self.dirs:
+            return
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._pending.pop(path, None)
+            return
+        now = time.monotonic()
+        with self._lock:
+            if path in self._inflight:
+                return
+            p = self._pending.get(path)
+            if p is None or (p.size, p.mtime) != (st.st_size, st.st_mtime):
+                first = p.first_seen if p is not None else now
+                self._pending[path] = _Pending(st.st_size, st.st_mtime, now, first)
+
+    def scan(self) -> None:
+        for path in self.dirs:
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.is_file():
+                            self.notice(entry.path)
+            except FileNotFoundError:
+                continue
+
+    def _start_observer(self) -> None:
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            logger.info("[INGEST] watchdog não instalado: só varredura periódica")
+            return
+
+        ingestor = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    ingestor.notice(event.src_path)
+
+            on_modified = on_created
+
+            def on_moved(self, event):
+                if not event.is_directory:
+                    ingestor.notice(event.dest_path)
+
+        observer = Observer()
+        for path in self.dirs:
+            observer.schedule(_Handler(), path, recursive=False)
+        observer.daemon = True
+        observer.start()
+        self._observer = observer
+
+    # ---- despacho ----
+    def tick(self) -> int:
+        """Revalida os pendentes e despacha os estáveis. Retorna quantos saíram para o pool."""
+        now = time.monotonic()
+        for path in list(self._pending):
+            self.notice(path)  # atualiza tamanho/mtime (polling também vale com inotify)
+        ready: List[str] = []
+        with self._lock:
+            for path, p in list(self._pending.items()):
+                if now - p.since < self.stable_seconds:
+                    continue
+                if _archive_complete(path):
+                    ready.append(path)
+                elif now - p.first_seen > self.give_up_seconds:
+                    self._pending.pop(path)
+                    self._move(path, REJECTED_DIR, {"motivo": "zip_incompleto"})
+        submitted = 0
+        for path in ready:
+            if not self._slots.acquire(blocking=False):
+                break  # pool cheio: fica pendente para o próximo tick
+            with self._lock:
+                self._pending.pop(path, None)
+                self._inflight[path] = self._pool.submit(self._ingest, path)
+            submitted += 1
+        return submitted
+
+    def _ingest(self, path: str) -> None:
+        from app.db import SessionLocal, get_engine
+        from .zipscan import ArchiveRejected
+        from .registration import register_content
+
+        client_id = self.dirs[os.path.dirname(path)]
+        try:
+            get_engine()  # vincula o SessionLocal
+            with SessionLocal() as db:
+                with open(path, "rb") as f:
+                    info = register_content(db, client_id, os.path.basename(path), f, source_path=path)
+                if info["deduplicado"]:
+                    self._count("deduplicados")
+                else:
+                    self._count("registrados")
+                    if self.prewarm:
+                        self._prewarm(db, info["upload_id"])
+            self._move(path, DONE_DIR)
+            logger.info(f"[INGEST] {path} → upload {info['upload_id']}"
+                        f"{' (já registrado)' if info['deduplicado'] else ''}")
+        except ArchiveRejected as e:
+            self._count("rejeitados")
+            self._move(path, REJECTED_DIR, e.to_detail())
+        except Exception as e:
+            # erro transitório (banco fora...): volta para a fila no próximo tick
+            self._count("erros")
+            logger.exception(f"❌ [INGEST] falha em {path}: {e}")
+        finally:
+            with self._lock:
+                self._inflight.pop(path, None)
+            self._slots.release()
+
+    def _count(self, result: str) -> None:
+        from .metrics import INGESTED_FILES
+
+        with self._lock:
+            self.stats[result] += 1
+        INGESTED_FILES.inc(result=result)
+
+    def _prewarm(self, db, upload_id: int) -> None:
+        """Análise padrão do dashboard (cache de resultados) + Parquet dos itens."""
+        from app.models import Upload
+        from .blobstore import load_upload_bytes
+        from .item_store import ItemStoreUnavailable, ensure_item_store
+        from .singleflight import run_upload_analysis
+
+        upload = db.query(Upload).filter(Upload.id == upload_id).first()
+        start = time.perf_counter()
+        run_upload_analysis(upload)
+        try:
+            ensure_item_store(upload.client_id, upload.id, lambda: load_upload_bytes(upload))
+        except ItemStoreUnavailable:
+            pass
+        logger.info(f"[INGEST] upload {upload_id} pré-analisado em {time.perf_counter() - start:.2f}s")
+
+    def _move(self, path: str, subdir: str, detail: Optional[dict] = None) -> None:
+        target_dir = os.path.join(os.path.dirname(path), subdir)
+        os.makedirs(target_dir, exist_ok=True)
+        target = os.path.join(target_dir, os.path.basename(path))
+        if os.path.exists(target):
+            stem, ext = os.path.splitext(target)
+            target = f"{stem}.{int(time.time())}{ext}"
+        try:
+            os.replace(path, target)
+        except FileNotFoundError:
+            return
+        if detail is not None:
+            with open(target + ".json", "w", encoding="utf-8") as f:
+                json.dump(detail, f, ensure_ascii=False, indent=2, default=str)
+
+    # ---- ciclo de vida ----
+    def start(self) -> "FolderIngestor":
+        self._claim_dirs()
+        if not self.dirs:
+            return self
+        self._start_observer()
+        self.scan()  # arquivos deixados enquanto o serviço estava parado
+        threading.Thread(target=self._loop, name="ingest-loop", daemon=True).start()
+        logger.info(f"[INGEST] observando {', '.join(self.dirs)}")
+        return self
+
+    def _loop(self) -> None:
+        last_scan = time.monotonic()
+        while not self._stop.wait(min(1.0, self.poll_seconds)):
+            if time.monotonic() - last_scan >= self.poll_seconds:
+                self.scan()
+                last_scan = time.monotonic()
+            self.tick()
+
+    def drain(self, timeout: float = 60.0) -> None:
+        """Espera os ingestões em andamento (testes / desligamento)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                futures = list(self._inflight.values())
+            if not futures:
+                return
+            futures[0].result(timeout=max(0.0, deadline - time.monotonic()))
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+        self._pool.shutdown(wait=True)
+        for fd in self._locks:
+            os.close(fd)
+        self._locks.clear()
+
+
+def from_settings() -> Optional[FolderIngestor]:
+    dirs = parse_dirs(settings.INGEST_DIRS)
+    if not dirs:
+        return None
+    return FolderIngestor(
+        dirs,
+        workers=settings.INGEST_WORKERS,
+        poll_seconds=settings.INGEST_POLL_SECONDS,
+        stable_seconds=settings.INGEST_STABLE_SECONDS,
+        prewarm=settings.INGEST_PREWARM,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    ingestor = from_settings()
+    if ingestor is None:
+        raise SystemExit("Defina INGEST_DIRS (ex.: 1=/srv/drop/cliente1;2=/srv/drop/cliente2)")
+    ingestor.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        ingestor.stop()
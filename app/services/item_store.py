@@ -0,0 +1,381 @@
+"""
+item_store.py
+--------------
+Itens das NF-e em Parquet, consultados com DuckDB embarcado.
+
+Perguntas como "itens por NCM", "por CFOP no mês" ou "excluídos acima de
+R$ X" não devem rodar run_analysis_from_bytes de novo. Na primeira consulta
+de um upload os itens são parseados e classificados uma vez (mesma ordem da
+análise: correções do contador > cadastro do cliente > JsonMatcher) e
+gravados num Parquet comprimido (ZSTD):
+
+    <ITEM_STORE_DIR>/client_id=<c>/upload_id=<u>/items-<versão>.parquet
+
+A versão combina dicionário + correções: mudou a classificação, o arquivo
+é refeito na próxima consulta. As consultas (filtros, agrupamento, keyset)
+rodam no DuckDB em memória direto sobre o Parquet — colunar, só lê as
+colunas e row groups necessários, sem serviço externo.
+
+DuckDB é opcional (pip install duckdb): sem ele as rotas de /api/items
+respondem 503 e o resto da API segue igual.
+
+Benchmark: python -m app.services.item_store [N_ITENS]
+"""
+
+from __future__ import annotations
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import csv
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+# coluna → tipo DuckDB (ordem do arquivo)
+COLUMNS: Dict[str, str] = {
+    "seq": "BIGINT",
+    "chave": "VARCHAR",
+    "n_item": "INTEGER",
+    "data_emissao": "TIMESTAMP",
+    "mes": "VARCHAR",
+    "cprod": "VARCHAR",
+    "descricao": "VARCHAR",
+    "ncm": "VARCHAR",
+    "cfop": "VARCHAR",
+    "csosn": "VARCHAR",
+    "quantidade": "DOUBLE",
+    "valor_unitario": "DOUBLE",
+    "valor_cents": "BIGINT",
+    "categoria": "VARCHAR",
+    "monofasico": "BOOLEAN",
+    "st_correto": "BOOLEAN",
+    "excluido": "BOOLEAN",
+}
+GROUPABLE = ("ncm", "cfop", "csosn", "mes", "categoria", "cprod", "monofasico", "st_correto", "excluido")
+ROW_GROUP_SIZE = 122_880
+
+
+class ItemStoreUnavailable(RuntimeError):
+    """DuckDB não instalado."""
+
+
+def _duckdb():
+    try:
+        import duckdb
+    except ImportError:
+        raise ItemStoreUnavailable("consultas de itens requerem o pacote duckdb (pip install duckdb)")
+    return duckdb
+
+
+def _sql_str(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def store_dir() -> Path:
+    from app.config import settings
+
+    return Path(settings.ITEM_STORE_DIR or os.path.join(settings.LOCAL_STORAGE_DIR, "items"))
+
+
+def upload_dir(client_id: int, upload_id: int) -> Path:
+    return store_dir() / f"client_id={client_id}" / f"upload_id={upload_id}"
+
+
+def store_version(client_id: Optional[int]) -> str:
+    """Versão da classificação gravada: dicionário + correções do cliente."""
+    from .ai_matcher import get_matcher
+    from .overrides import override_version
+
+    raw = f"{get_matcher().version}:{override_version(client_id)}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+
+# ============================================================
+# 🧾 LINHAS CLASSIFICADAS
+# ============================================================
+def _to_float(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def classified_items(client_id: Optional[int], documents: Iterable[Tuple[str, Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+    """Um dict por item, classificado como na análise (regras)."""
+    from .ai_matcher import get_matcher
+    from .money import month_key, to_cents
+    from .overrides import MISSING, get_override_index
+    from .product_master import open_classifier
+
+    matcher = get_matcher()
+    classifier = open_classifier(client_id, matcher)
+    overrides = get_override_index(client_id)
+    seq = 0
+    for name, doc in documents:
+        chave = doc.get("chNFe") or name
+        dt = doc.get("issue_date")
+        if isinstance(dt, datetime) and dt.tzinfo is not None:
+            dt = dt.replace(tzinfo=None)
+        mes = month_key(dt)
+        for n, item in enumerate(doc.get("items", []), start=1):
+            desc = (item.get("xProd") or "").strip()
+            ncm = (item.get("ncm") or "").strip()
+            cfop = (item.get("cfop") or "").strip()
+            csosn = (item.get("csosn") or "").strip()
+            cprod = (item.get("cProd") or "").strip()
+            vcents = item.get("vProd_cents")
+            if vcents is None:
+                vcents = to_cents(item.get("vProd"))
+
+            correcao = overrides.lookup(cprod, desc, ncm) if overrides else MISSING
+            if correcao is not MISSING:
+                hit = (correcao, 100) if correcao else None
+            elif classifier:
+                hit = classifier.classify(cprod, desc)
+            else:
+                hit = matcher.classify(desc)
+            mono = bool(hit and matcher.is_monofasico(hit[0]))
+            st_ok = cfop == "5405" and csosn == "500"
+            seq += 1
+            yield {
+                "seq": seq,
+                "chave": chave,
+                "n_item": n,
+                "data_emissao": dt,
+                "mes": mes,
+                "cprod": cprod or None,
+                "descricao": desc[:255],
+                "ncm": ncm or None,
+                "cfop": cfop or None,
+                "csosn": csosn or None,
+                "quantidade": _to_float(item.get("qCom")),
+                "valor_unitario": _to_float(item.get("vUnCom")),
+                "valor_cents": vcents,
+                "categoria": hit[0] if hit else None,
+                "monofasico": mono,
+                "st_correto": mono and st_ok,
+                "excluido": mono and not st_ok,
+            }
+    if classifier is not None:
+        classifier.flush()
+
+
+# ============================================================
+# 💾 GRAVAÇÃO (CSV temporário → COPY ... FORMAT PARQUET)
+# ============================================================
+def write_parquet(rows: Iterable[Dict[str, Any]], path: Path) -> int:
+    """Grava as linhas num Parquet ZSTD (atômico). Retorna o nº de linhas."""
+    duckdb = _duckdb()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    n = 0
+    with tempfile.TemporaryDirectory(dir=path.parent) as tmp:
+        csv_path = os.path.join(tmp, "items.csv")
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            for row in rows:
+                writer.writerow(["" if row[c] is None else row[c] for c in COLUMNS])
+                n += 1
+        columns = "{" + ", ".join(f"{_sql_str(c)}: {_sql_str(t)}" for c, t in COLUMNS.items()) + "}"
+        part = os.path.join(tmp, "items.parquet")
+        con = duckdb.connect()
+        try:
+            con.execute(
+                f"COPY (SELECT * FROM read_csv({_sql_str(csv_path)}, header=true, nullstr='', "
+                f"quote='\"', escape='\"', columns={columns})) "
+                f"TO {_sql_str(part)} (FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE {ROW_GROUP_SIZE})"
+            )
+        finally:
+            con.close()
+        os.replace(part, path)
+    return n
+
+
+def build_item_store(client_id: int, upload_id: int, zip_bytes: bytes) -> Dict[str, Any]:
+    """Parseia, classifica e grava os itens do upload; apaga versões anteriores."""
+    from .bulk_insert import iter_parsed_documents
+
+    _duckdb()
+    start = time.perf_counter()
+    version = store_version(client_id)
+    path = upload_dir(client_id, upload_id) / f"items-{version}.parquet"
+    n = write_parquet(classified_items(client_id, iter_parsed_documents(zip_bytes)), path)
+    for old in path.parent.glob("items-*.parquet"):
+        if old != path:
+            old.unlink(missing_ok=True)
+    elapsed = time.perf_counter() - start
+    logger.info(f"[ITENS] upload {upload_id}: {n} itens em Parquet em {elapsed:.2f}s")
+    return {"path": str(path), "itens": n, "segundos": round(elapsed, 3), "versao": version}
+
+
+def current_path(client_id: int, upload_id: int) -> Optional[Path]:
+    path = upload_dir(client_id, upload_id) / f"items-{store_version(client_id)}.parquet"
+    return path if path.exists() else None
+
+
+def ensure_item_store(client_id: int, upload_id: int, load_zip) -> Path:
+    """Caminho do Parquet da versão atual; gera (uma vez, com singleflight) se faltar."""
+    from .singleflight import get_singleflight
+
+    path = current_path(client_id, upload_id)
+    if path is not None:
+        return path
+    key = ("item-store", client_id, upload_id, store_version(client_id))
+    info, _ = get_singleflight().do(key, lambda: build_item_store(client_id, upload_id, load_zip()))
+    return Path(info["path"])
+
+
+def drop_item_store(client_id: int, upload_id: int) -> None:
+    shutil.rmtree(upload_dir(client_id, upload_id), ignore_errors=True)
+
+
+# ============================================================
+# 🔎 CONSULTA
+# ============================================================
+def _where(filters: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+    conds: List[str] = []
+    params: List[Any] = []
+    if filters.get("ncm"):
+        conds.append("starts_with(ncm, ?)")
+        params.append(filters["ncm"])
+    for col in ("cfop", "csosn", "mes", "categoria", "cprod"):
+        if filters.get(col):
+            conds.append(f"{col} = ?")
+            params.append(filters[col])
+    for col in ("monofasico", "excluido", "st_correto"):
+        if filters.get(col) is not None:
+            conds.append(f"{col} = ?")
+            params.append(bool(filters[col]))
+    if filters.get("valor_min_cents") is not None:
+        conds.append("valor_cents >= ?")
+        params.append(filters["valor_min_cents"])
+    if filters.get("valor_max_cents") is not None:
+        conds.append("valor_cents <= ?")
+        params.append(filters["valor_max_cents"])
+    if filters.get("descricao"):
+        conds.append("descricao ILIKE ?")
+        params.append(f"%{filters['descricao']}%")
+    return conds, params
+
+
+def _rows(cur) -> List[Dict[str, Any]]:
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, r)) for r in cur.fetchall()]
+
+
+def query_items(
+    path: Path,
+    filters: Dict[str, Any],
+    group_by: Sequence[str] = (),
+    order: str = "seq",
+    limit: int = 100,
+    after: Optional[Tuple[Any, int]] = None,
+) -> Dict[str, Any]:
+    """
+    Sem group_by: itens paginados por keyset (after = (valor_cents, seq) ou
+    (seq, seq)). Com group_by: grupos por valor desc, after = (offset, 0).
+    Retorna {"linhas", "resumo", "proximo"} — proximo é o after da página seguinte.
+    """
+    duckdb = _duckdb()
+    bad = [g for g in group_by if g not in GROUPABLE]
+    if bad:
+        raise ValueError(f"agrupamento inválido: {', '.join(bad)} (use {', '.join(GROUPABLE)})")
+    source = f"read_parquet({_sql_str(str(path))}, hive_partitioning=true)"
+    conds, params = _where(filters)
+    where = (" WHERE " + " AND ".join(conds)) if conds else ""
+
+    con = duckdb.connect()
+    try:
+        resumo = con.execute(
+            f"SELECT count(*) AS itens, coalesce(sum(valor_cents), 0) AS valor_total_cents FROM {source}{where}",
+            params,
+        ).fetchone()
+
+        if group_by:
+            cols = ", ".join(group_by)
+            offset = int(after[0]) if after else 0
+            cur = con.execute(
+                f"SELECT {cols}, count(*) AS itens, sum(valor_cents) AS valor_total_cents "
+                f"FROM {source}{where} GROUP BY {cols} "
+                f"ORDER BY valor_total_cents DESC, {cols} LIMIT ? OFFSET ?",
+                params + [limit + 1, offset],
+            )
+            linhas = _rows(cur)
+            proximo = (offset + limit, 0) if len(linhas) > limit else None
+        else:
+            page_conds, page_params = list(conds), list(params)
+            if order == "valor":
+                if after:
+                    page_conds.append("(valor_cents < ? OR (valor_cents = ? AND seq < ?))")
+                    page_params += [after[0], after[0], after[1]]
+                order_sql = "valor_cents DESC, seq DESC"
+            else:
+                if after:
+                    page_conds.append("seq > ?")
+                    page_params.append(after[1])
+                order_sql = "seq"
+            page_where = (" WHERE " + " AND ".join(page_conds)) if page_conds else ""
+            cur = con.execute(
+                f"SELECT * FROM {source}{page_where} ORDER BY {order_sql} LIMIT ?",
+                page_params + [limit + 1],
+            )
+            linhas = _rows(cur)
+            proximo = None
+            if len(linhas) > limit:
+                last = linhas[limit - 1]
+                proximo = (last["valor_cents"] if order == "valor" else last["seq"], last["seq"])
+    finally:
+        con.close()
+
+    return {
+        "linhas": linhas[:limit],
+        "resumo": {"itens": resumo[0], "valor_total_cents": int(resumo[1])},
+        "proximo": proximo,
+    }
+
+
+# ============================================================
+# ⏱️ Benchmark: python -m app.services.item_store [N_ITENS]
+# ============================================================
+if __name__ == "__main__":
+    import random
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    rng = random.Random(3)
+    cats = ["cerveja", "refrigerante", "agua", "cigarro", None, None, None]
+    ncms = ["22030000", "22021000", "22011000", "24022000", "10063021", "19059090"]
+
+    def _synthetic() -> Iterator[Dict[str, Any]]:
+        for i in range(1, n + 1):
+            cat = rng.choice(cats)
+            st_ok = rng.random() < 0.6
+            yield {
+                "seq": i, "chave": f"{i // 5:044d}", "n_item": i % 5 + 1,
+                "data_emissao": datetime(2024, 1 + i % 12, 1 + i % 28), "mes": f"2024-{1 + i % 12:02d}",
+                "cprod": f"P{i % 5000}", "descricao": f"PRODUTO {i % 5000}", "ncm": rng.choice(ncms),
+                "cfop": "5405" if st_ok else "5102", "csosn": "500" if st_ok else "102",
+                "quantidade": 1.0, "valor_unitario": 9.99, "valor_cents": rng.randint(100, 50_000),
+                "categoria": cat, "monofasico": cat is not None,
+                "st_correto": cat is not None and st_ok, "excluido": cat is not None and not st_ok,
+            }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "items.parquet"
+        start = time.perf_counter()
+        write_parquet(_synthetic(), path)
+        print(f"{n} itens gravados em {time.perf_counter() - start:.1f}s ({path.stat().st_size / 1e6:.1f} MB)")
+        for nome, filtros, grupos in (
+            ("por NCM", {}, ["ncm"]),
+            ("excluídos por mês", {"excluido": True}, ["mes"]),
+            ("excluídos > R$ 400", {"excluido": True, "valor_min_cents": 40_000}, []),
+        ):
+            start = time.perf_counter()
+            res = query_items(path, filtros, grupos, order="valor")
+            print(f"{nome:20s} {len(res['linhas']):4d} linhas, {res['resumo']['itens']:>9,} itens "
+                  f"em {(time.perf_counter() - start) * 1000:.1f} ms")
@@ -0,0 +1,122 @@
+"""
+limits.py
+----------
+Proteção das rotas pesadas (análise do ZIP, relatório DOCX):
+
+  - TokenBucket / RateLimiter: taxa de requisições por usuário
+  - ConcurrencyLimiter: no máximo N execuções simultâneas por chave
+    (usuário e client_id)
+
+Requisições idênticas em andamento são coalescidas em singleflight.py.
+
+Tudo em memória, por worker. As rotas são `def` (rodam no threadpool), então
+a sincronização é com threading.
+"""
+
+from __future__ import annotations
+from typing import Dict, Hashable, Optional, Tuple
+import threading
+import time
+
+# Buckets/contadores ociosos há mais que isso são descartados
+IDLE_TTL_SECONDS = 600
+
+
+# ============================================================
+# 🪣 TOKEN BUCKET
+# ============================================================
+class TokenBucket:
+    def __init__(self, rate_per_sec: float, capacity: float):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, now: float, cost: float = 1.0) -> Tuple[bool, float]:
+        """Consome `cost` tokens; retorna (ok, segundos até haver saldo)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True, 0.0
+        wait = (cost - self.tokens) / self.rate if self.rate > 0 else float("inf")
+        return False, wait
+
+
+class RateLimiter:
+    """Um TokenBucket por chave (ex.: usuário)."""
+
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def _sweep(self, now: float) -> None:
+        if now - self._last_sweep < IDLE_TTL_SECONDS:
+            return
+        self._last_sweep = now
+        for key in [k for k, b in self._buckets.items() if now - b.updated > IDLE_TTL_SECONDS]:
+            del self._buckets[key]
+
+    def allow(self, key: Hashable) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            return bucket.take(now)
+
+
+# ============================================================
+# 🚦 CONCORRÊNCIA POR CHAVE
+# ============================================================
+class ConcurrencyLimiter:
+    def __init__(self, max_per_key: int):
+        self.max_per_key = max_per_key
+        self._active: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key: Hashable) -> bool:
+        with self._lock:
+            n = self._active.get(key, 0)
+            if n >= self.max_per_key:
+                return False
+            self._active[key] = n + 1
+            return True
+
+    def release(self, key: Hashable) -> None:
+        with self._lock:
+            n = self._active.get(key, 0) - 1
+            if n > 0:
+                self._active[key] = n
+            else:
+                self._active.pop(key, None)
+
+    def active(self, key: Hashable) -> int:
+        with self._lock:
+            return self._active.get(key, 0)
+
+
+# ============================================================
+# 🏭 INSTÂNCIAS DO WORKER (configuradas pelo Settings)
+# ============================================================
+_instances: Optional[Tuple[RateLimiter, ConcurrencyLimiter, ConcurrencyLimiter]] = None
+_instances_lock = threading.Lock()
+
+
+def get_limiters() -> Tuple[RateLimiter, ConcurrencyLimiter, ConcurrencyLimiter]:
+    """(rate por usuário, concorrência por usuário, concorrência por client_id)."""
+    global _instances
+    if _instances is None:
+        with _instances_lock:
+            if _instances is None:
+                from app.config import settings
+                _instances = (
+                    RateLimiter(settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST),
+                    ConcurrencyLimiter(settings.MAX_CONCURRENT_PER_USER),
+                    ConcurrencyLimiter(settings.MAX_CONCURRENT_PER_CLIENT),
+                )
+    return _instances
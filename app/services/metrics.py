@@ -0,0 +1,365 @@
+"""
+metrics.py
+-----------
+Registro de métricas em memória do processo, exportado no formato texto
+do Prometheus (sem dependência do prometheus_client).
+
+Cada worker do uvicorn tem o seu próprio registro: o scrape deve ser feito
+por instância/worker, como já acontece com o /health.
+"""
+
+from __future__ import annotations
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import functools
+import inspect
+import os
+import resource
+import threading
+import time
+
+# Buckets pensados para a API: rotas leves em ms, análises de ZIP em minutos
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+
+LabelKey = Tuple[str, ...]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names: Iterable[str], values: Iterable[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+# ============================================================
+# 📈 TIPOS DE MÉTRICA
+# ============================================================
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames: Tuple[str, ...] = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> List[str]:  # pragma: no cover - sobrescrito
+        return []
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets)) + (float("inf"),)
+        self._counts: Dict[LabelKey, List[int]] = {}
+        self._sums: Dict[LabelKey, float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * len(self.buckets)
+                self._sums[key] = 0.0
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(c), self._sums[k]) for k, c in self._counts.items()]
+        lines: List[str] = []
+        for key, counts, total in items:
+            acc = 0
+            for bound, n in zip(self.buckets, counts):
+                acc += n
+                lbl = _fmt_labels(self.labelnames, key, ("le", _fmt_value(bound)))
+                lines.append(f"{self.name}_bucket{lbl} {acc}")
+            lbl = _fmt_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{lbl} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{lbl} {acc}")
+        return lines
+
+
+# ============================================================
+# 🗂️ REGISTRO
+# ============================================================
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, fn: Callable[[], None]) -> None:
+        """Função chamada antes de cada exportação (para gauges amostrados)."""
+        with self._lock:
+            self._collectors.append(fn)
+
+    def render(self) -> str:
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics.values())
+        for fn in collectors:
+            try:
+                fn()
+            except Exception:
+                # coletor com problema não pode derrubar o /metrics
+                pass
+        lines: List[str] = []
+        for m in metrics:
+            lines.extend(m.header())
+            lines.extend(m.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ============================================================
+# 📊 MÉTRICAS DA API
+# ============================================================
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds",
+    "Latência das requisições HTTP por rota.",
+    ("method", "route", "status"),
+))
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight",
+    "Requisições HTTP em andamento neste worker.",
+))
+ANALYSIS_IN_PROGRESS = REGISTRY.register(Gauge(
+    "analysis_in_progress",
+    "Análises de ZIP em execução ou aguardando thread neste worker.",
+))
+ANALYSIS_DURATION = REGISTRY.register(Histogram(
+    "analysis_duration_seconds",
+    "Duração de run_analysis_from_bytes.",
+))
+DB_POOL = REGISTRY.register(Gauge(
+    "db_pool_connections",
+    "Conexões do pool SQLAlchemy por estado.",
+    ("state",),
+))
+DB_POOL_EVENTS = REGISTRY.register(Counter(
+    "db_pool_events_total",
+    "Eventos do pool SQLAlchemy (connect, checkout, invalidate).",
+    ("event",),
+))
+PROCESS_RSS = REGISTRY.register(Gauge(
+    "process_resident_memory_bytes",
+    "Memória residente (RSS) do processo.",
+))
+CLASSIFY_CACHE = REGISTRY.register(Gauge(
+    "classification_cache_events",
+    "Consultas ao cache de classificação do matcher (acumulado).",
+    ("result",),
+))
+CLASSIFY_CACHE_HIT_RATIO = REGISTRY.register(Gauge(
+    "classification_cache_hit_ratio",
+    "Taxa de acerto do cache de classificação do matcher.",
+))
+
+HEAVY_REJECTED = REGISTRY.register(Counter(
+    "heavy_requests_rejected_total",
+    "Requisições de análise/relatório recusadas (429) por motivo.",
+    ("reason",),
+))
+SINGLEFLIGHT_SHARED = REGISTRY.register(Counter(
+    "analysis_singleflight_shared_total",
+    "Requisições que reaproveitaram uma análise idêntica em andamento.",
+))
+ARCHIVES_REJECTED = REGISTRY.register(Counter(
+    "archives_rejected_total",
+    "ZIPs recusados na pré-análise, por motivo.",
+    ("reason",),
+))
+INGESTED_FILES = REGISTRY.register(Counter(
+    "ingest_files_total",
+    "ZIPs pegos nas pastas de ingestão, por resultado.",
+    ("result",),
+))
+
+
+def track_analysis(func: Callable) -> Callable:
+    """Decorator para medir análises (fila/execução e duração); aceita geradores."""
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def gen_wrapper(*args, **kwargs):
+            ANALYSIS_IN_PROGRESS.inc()
+            start = time.perf_counter()
+            try:
+                yield from func(*args, **kwargs)
+            finally:
+                ANALYSIS_DURATION.observe(time.perf_counter() - start)
+                ANALYSIS_IN_PROGRESS.dec()
+        return gen_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        ANALYSIS_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            ANALYSIS_DURATION.observe(time.perf_counter() - start)
+            ANALYSIS_IN_PROGRESS.dec()
+    return wrapper
+
+
+def route_label(scope) -> str:
+    """
+    Template completo da rota (/api/uploads/analyze/{upload_id}) para o rótulo
+    das métricas. Conforme a versão do FastAPI, a rota em scope["route"] traz
+    só o caminho dentro do router (sem o prefixo do include_router): o prefixo
+    é a parte literal do caminho antes do trecho que o template casa.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path_format", None) or getattr(route, "path", None)
+    if not template:
+        return "unmatched"
+    path = scope.get("path", "")
+    regex = getattr(route, "path_regex", None)
+    if regex is not None and not regex.match(path):
+        for i in range(1, len(path)):
+            if path[i] == "/" and regex.match(path[i:]):
+                return scope.get("root_path", "") + path[:i] + template
+    return scope.get("root_path", "") + template
+
+
+# ============================================================
+# 🔎 COLETORES AMOSTRADOS NO SCRAPE
+# ============================================================
+def read_rss_bytes() -> int:
+    """RSS atual via /proc (Linux); fallback para o pico do getrusage."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        # ru_maxrss vem em KB no Linux
+        return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) * 1024
+
+
+def pool_status(engine) -> Dict[str, int]:
+    """Estado do pool do engine (vazio para pools sem contagem, ex.: NullPool)."""
+    pool = engine.pool
+    status: Dict[str, int] = {}
+    for state, attr in (("size", "size"), ("checked_in", "checkedin"),
+                        ("checked_out", "checkedout"), ("overflow", "overflow")):
+        fn = getattr(pool, attr, None)
+        if callable(fn):
+            try:
+                status[state] = int(fn())
+            except Exception:
+                continue
+    return status
+
+
+def _collect_process() -> None:
+    PROCESS_RSS.set(read_rss_bytes())
+
+
+def _collect_db_pool() -> None:
+    from app.db import get_engine
+    for state, value in pool_status(get_engine()).items():
+        DB_POOL.set(value, state=state)
+
+
+def _collect_matcher_cache() -> None:
+    from app.services.ai_matcher import get_matcher, is_matcher_loaded
+    if not is_matcher_loaded():
+        return
+    stats = get_matcher().cache_stats()
+    CLASSIFY_CACHE.set(stats["hits"], result="hit")
+    CLASSIFY_CACHE.set(stats["misses"], result="miss")
+    CLASSIFY_CACHE_HIT_RATIO.set(stats["hit_ratio"])
+
+
+REGISTRY.add_collector(_collect_process)
+REGISTRY.add_collector(_collect_db_pool)
+REGISTRY.add_collector(_collect_matcher_cache)
+
+
+def render_prometheus() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,73 @@
+"""
+money.py
+---------
+Dinheiro em ponto fixo: valores das NF-e viram centavos inteiros já no parser,
+as somas são feitas em int (exatas) e a conversão para Decimal/float acontece
+só na borda (API e relatório).
+"""
+
+from __future__ import annotations
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
+from typing import Any, Optional
+
+
+# -------------------------------------------------
+# 🔢 Conversões
+# -------------------------------------------------
+def to_cents(value: Any) -> int:
+    """
+    Converte valor monetário em centavos inteiros (arredondamento comercial).
+    Aceita o formato das NF-e ('123.45'), o formato BR ('3.365,99' / '3365,99'),
+    int/float/Decimal. Valores inválidos viram 0.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, int):
+        return value * 100
+    if isinstance(value, float):
+        value = repr(value)
+    elif isinstance(value, Decimal):
+        return int((value * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+    s = str(value).strip().replace("R$", "").replace(" ", "")
+    if not s:
+        return 0
+
+    # caminho rápido: NF-e usa ponto decimal com até 2 casas ('1234.5', '1234.56')
+    intpart, dot, frac = s.partition(".")
+    if intpart.isdigit() and (not dot or (frac.isdigit() and len(frac) <= 2)):
+        return int(intpart) * 100 + (int(frac.ljust(2, "0")) if frac else 0)
+
+    if "," in s and s.count(",") == 1:
+        s = s.replace(".", "").replace(",", ".")
+    try:
+        return int((Decimal(s) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        return 0
+
+
+def cents_to_decimal(cents: int) -> Decimal:
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def cents_to_float(cents: int) -> float:
+    # float mais próximo do valor exato — só para serializar em JSON
+    return int(cents) / 100
+
+
+def apply_rate(cents: int, rate: Any) -> int:
+    """cents * alíquota, arredondado ao centavo, sem passar por float."""
+    if rate is None:
+        return 0
+    r = rate if isinstance(rate, Decimal) else Decimal(str(rate))
+    return int((Decimal(int(cents)) * r).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def month_key(dt: Optional[Any]) -> Optional[str]:
+    """Competência 'AAAA-MM' de um datetime (None se sem data)."""
+    if dt is None:
+        return None
+    try:
+        return f"{dt.year:04d}-{dt.month:02d}"
+    except AttributeError:
+        return None
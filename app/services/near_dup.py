@@ -0,0 +1,275 @@
+"""
+near_dup.py
+------------
+Agrupamento de descrições quase duplicadas (MinHash + LSH).
+
+"COCA COLA 2L", "COCA-COLA 2 L" e "REFRIG COCA COLA 2LT" são o mesmo
+produto, mas a deduplicação exata as separa. Comparar todas as descrições
+entre si é O(n²); aqui:
+
+  1. cada descrição vira um conjunto de shingles de 3 caracteres
+  2. assinatura MinHash (NUM_PERM permutações, NumPy), calculada em blocos de
+     até MAX_SHINGLES_PER_BLOCK shingles; de cada banda fica só uma chave de
+     64 bits (BANDS chaves por descrição, não a assinatura inteira)
+  3. LSH por bandas: descrições com as mesmas medidas que coincidem em alguma
+     banda viram candidatas
+  4. candidatas são confirmadas e unidas (union-find): mesmas medidas
+     (2L ≠ 350ML) e, fora prefixos genéricos (REFRIG, CERV, LATA...), os mesmos
+     tokens dos dois lados, tolerando erro de digitação por token. Um token a
+     mais separa: "COCA COLA 2L" ≠ "COCA COLA ZERO 2L", e "CERVEJA 350ML" não
+     liga "SKOL 350ML" a "BRAHMA 350ML"
+
+Cada grupo sai com um rótulo canônico (a variante mais frequente) e a soma
+de ocorrências e valores.
+
+Benchmark: python -m app.services.near_dup [N_DESCRICOES]
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import re
+import zlib
+
+import numpy as np
+from rapidfuzz import fuzz
+
+from .dictionary_artifact import norm_text
+from .money import cents_to_float
+
+SHINGLE = 3
+NUM_PERM = 64
+BANDS = 16          # 16 bandas x 4 linhas: limiar de candidatura ~ Jaccard 0,5
+ROWS = NUM_PERM // BANDS
+MAX_VARIANTS = 5    # variantes listadas por grupo
+MAX_SHINGLES_PER_BLOCK = 16_384  # bloco de NUM_PERM x shingles em uint64: ~8 MB
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240601)  # semente fixa: assinaturas estáveis entre execuções
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+_MIX = np.uint64(0x9E3779B97F4A7C15)  # junta as ROWS linhas de uma banda numa chave
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_UNITS = {
+    "l": "l", "lt": "l", "lts": "l", "litro": "l", "litros": "l",
+    "ml": "ml", "kg": "kg", "g": "g", "gr": "g", "un": "un", "und": "un", "cx": "cx",
+}
+# prefixos que descrevem o tipo de embalagem/produto, não a variante
+_NOISE = frozenset({
+    "refrig", "refrigerante", "refri", "beb", "bebida", "cerv", "cerveja",
+    "lata", "pet", "garrafa", "gf",
+})
+_MEASURE = re.compile(r"\b(\d+(?:[.,]\d+)?)\s*(" + "|".join(sorted(_UNITS, key=len, reverse=True)) + r")\b")
+
+
+# ============================================================
+# 🔤 NORMALIZAÇÃO
+# ============================================================
+def canonical_text(desc: str) -> str:
+    """Minúsculas, sem acento/pontuação e medidas juntas: 'Coca-Cola 2 LT' → 'coca cola 2l'."""
+    t = norm_text(desc).replace(",", ".")
+    t = _MEASURE.sub(lambda m: m.group(1).replace(".", "v") + _UNITS[m.group(2)], t)
+    return " ".join(_NON_ALNUM.sub(" ", t).split())
+
+
+def measures(text: str) -> frozenset:
+    """Tokens de medida/quantidade ('2l', '350ml', '12'): grupos só juntam medidas iguais."""
+    return frozenset(tok for tok in text.split() if tok[0].isdigit())
+
+
+def shingles(text: str) -> np.ndarray:
+    padded = f" {text} "
+    grams = {padded[i:i + SHINGLE] for i in range(max(1, len(padded) - SHINGLE + 1))}
+    return np.fromiter((zlib.crc32(g.encode()) & _PRIME for g in grams), dtype=np.uint64, count=len(grams))
+
+
+def minhash(text: str) -> np.ndarray:
+    x = shingles(text)
+    return ((_A[:, None] * x[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def _blocks(texts: List[str], max_shingles: int) -> Iterator[Tuple[int, List[np.ndarray]]]:
+    """(início, shingles) de blocos de textos com até max_shingles shingles no total."""
+    start, parts, size = 0, [], 0
+    for i, text in enumerate(texts):
+        x = shingles(text)
+        if parts and size + len(x) > max_shingles:
+            yield start, parts
+            start, parts, size = i, [], 0
+        parts.append(x)
+        size += len(x)
+    if parts:
+        yield start, parts
+
+
+def band_keys(texts: List[str], max_shingles: int = MAX_SHINGLES_PER_BLOCK) -> np.ndarray:
+    """
+    Chaves LSH (len(texts), BANDS): as ROWS linhas MinHash de cada banda numa
+    chave de 64 bits. A matriz NUM_PERM x shingles existe só por bloco.
+    """
+    out = np.empty((len(texts), BANDS), dtype=np.uint64)
+    for start, parts in _blocks(texts, max_shingles):
+        offsets = np.cumsum([0] + [len(p) for p in parts[:-1]])
+        hashed = np.multiply(_A[:, None], np.concatenate(parts)[None, :])
+        hashed += _B[:, None]
+        np.remainder(hashed, _PRIME, out=hashed)
+        sig = np.minimum.reduceat(hashed, offsets, axis=1).T.reshape(len(parts), BANDS, ROWS)
+        del hashed
+        keys = sig[:, :, 0].copy()
+        for row in range(1, ROWS):
+            keys *= _MIX  # uint64: estoura de propósito (mod 2^64)
+            keys ^= sig[:, :, row]
+        out[start:start + len(parts)] = keys
+    return out
+
+
+# ============================================================
+# 🔗 AGRUPAMENTO
+# ============================================================
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int) -> None:
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+
+def core_tokens(text: str) -> frozenset:
+    """Tokens que identificam o produto: sem medidas e sem prefixos genéricos."""
+    return frozenset(tok for tok in text.split() if not tok[0].isdigit() and tok not in _NOISE)
+
+
+def _covers(ta: frozenset, tb: frozenset, threshold: int) -> bool:
+    return all(t in tb or any(fuzz.ratio(t, u) >= threshold for u in tb) for t in ta)
+
+
+def _similar(a: frozenset, b: frozenset, ma: frozenset, mb: frozenset, threshold: int) -> bool:
+    """
+    Mesmas medidas e cada token de um lado tem par (igual ou com erro de
+    digitação) no outro. Subconjunto não basta: "coca cola" ⊂ "coca cola zero",
+    mas "zero" não tem par, então são produtos diferentes.
+    """
+    if ma != mb or not a or not b:
+        return ma == mb and a == b
+    return _covers(a, b, threshold) and _covers(b, a, threshold)
+
+
+def cluster_texts(texts: List[str], threshold: int = 85) -> List[int]:
+    """
+    Rótulo de grupo (índice do representante) para cada texto já normalizado.
+    O balde de cada banda inclui as medidas: textos com medidas diferentes
+    nunca se juntam, então o resultado não muda se os textos forem agrupados
+    antes por medida (spill.py agrupa assim fora da memória).
+    """
+    n = len(texts)
+    uf = _UnionFind(n)
+    if n < 2:
+        return list(range(n))
+
+    keys = band_keys(texts)
+    meas = [measures(t) for t in texts]
+    toks = [core_tokens(t) for t in texts]
+    ids: Dict[frozenset, int] = {}
+    meas_id = np.fromiter((ids.setdefault(m, len(ids)) for m in meas), dtype=np.int64, count=n)
+    for band in range(BANDS):
+        # baldes = runs de (medidas, chave) iguais; lexsort é estável: índices em ordem crescente
+        order = np.lexsort((keys[:, band], meas_id))
+        k, m = keys[order, band], meas_id[order]
+        cuts = np.flatnonzero((k[1:] != k[:-1]) | (m[1:] != m[:-1])) + 1
+        starts, ends = np.r_[0, cuts], np.r_[cuts, n]
+        for b in np.flatnonzero(ends - starts >= 2):
+            members = order[starts[b]:ends[b]].tolist()
+            # compara com o primeiro do balde e com o vizinho: linear mesmo em baldes grandes
+            head = members[0]
+            for prev, cur in zip(members, members[1:]):
+                if uf.find(cur) == uf.find(head):
+                    continue
+                if _similar(toks[head], toks[cur], meas[head], meas[cur], threshold):
+                    uf.union(head, cur)
+                elif prev != head and _similar(toks[prev], toks[cur], meas[prev], meas[cur], threshold):
+                    uf.union(prev, cur)
+    return [uf.find(i) for i in range(n)]
+
+
+def cluster_products(rows: Iterable[Dict[str, Any]], threshold: int = 85,
+                     max_variants: int = MAX_VARIANTS) -> List[Dict[str, Any]]:
+    """
+    rows: {"descricao", "codigo", "ocorrencias", "valor_total_cents"} (deduplicação exata).
+    Retorna um item por grupo, ordenado por valor: descrição canônica, código
+    da variante canônica, somas e as principais variantes.
+    """
+    groups = cluster_rows(rows, threshold, max_variants)
+    groups.sort(key=lambda fg: fg[1]["valor_total_cents"], reverse=True)
+    return [group for _, group in groups]
+
+
+def cluster_rows(rows: Iterable[Dict[str, Any]], threshold: int = 85,
+                 max_variants: int = MAX_VARIANTS) -> List[Tuple[int, Dict[str, Any]]]:
+    """
+    (índice da 1ª linha do grupo em rows, grupo), na ordem desse índice.
+    Valor igual desempata por ele (cluster_products; merge dos grupos em spill.py).
+    """
+    rows = list(rows)
+    by_text: Dict[str, List[int]] = {}
+    for i, row in enumerate(rows):
+        by_text.setdefault(canonical_text(row.get("descricao") or ""), []).append(i)
+
+    texts = list(by_text)
+    labels = cluster_texts(texts, threshold)
+    groups: Dict[int, List[int]] = {}
+    for text, label in zip(texts, labels):
+        groups.setdefault(label, []).extend(by_text[text])
+
+    out = []
+    for idx in groups.values():
+        variants = [rows[i] for i in idx]
+        variants.sort(key=lambda r: (r["ocorrencias"], r["valor_total_cents"]), reverse=True)
+        canon = variants[0]
+        cents = sum(r["valor_total_cents"] for r in variants)
+        descricoes: List[str] = []
+        for r in variants:
+            if r["descricao"] not in descricoes:
+                descricoes.append(r["descricao"])
+        group = {
+            "codigo": canon.get("codigo", ""),
+            "descricao": canon["descricao"],
+            "ocorrencias": sum(r["ocorrencias"] for r in variants),
+            "valor_total_cents": cents,
+            "valor_total": cents_to_float(cents),
+            "variantes": descricoes[:max_variants],
+            "n_variantes": len(descricoes),
+        }
+        if any(r.get("aproximado") for r in variants):  # ranking limitado (topk.py)
+            group["aproximado"] = True
+            group["erro_max_cents"] = sum(r.get("erro_max_cents", 0) for r in variants)
+        out.append((min(idx), group))
+    return out
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import random
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    marcas = ["COCA COLA", "PEPSI", "GUARANA ANTARCTICA", "SKOL", "BRAHMA", "HEINEKEN", "FANTA LARANJA"]
+    medidas = ["2L", "2 L", "2LT", "350ML", "600 ML", "1,5L", "LATA 350ML"]
+    prefixos = ["", "REFRIG ", "REFRIGERANTE ", "BEB ", "CERV "]
+    random.seed(1)
+    rows = [
+        {"descricao": f"{random.choice(prefixos)}{random.choice(marcas)} {random.choice(medidas)} {i % (n // 10 or 1)}",
+         "codigo": str(i), "ocorrencias": 1, "valor_total_cents": 100}
+        for i in range(n)
+    ]
+    start = time.perf_counter()
+    grupos = cluster_products(rows)
+    elapsed = time.perf_counter() - start
+    print(f"{n} descrições → {len(grupos)} grupos em {elapsed:.2f}s ({n / elapsed:,.0f} descrições/s)")
@@ -4,6 +4,15 @@ from typing import Dict, List, Any, Optional
 from datetime import datetime
 import xml.etree.ElementTree as ET
 
+from .money import to_cents, cents_to_float
+
+class NfeParseError(ValueError):
+    """XML bem formado que não é uma NF-e utilizável. `reason` é o código do erro."""
+
+    def __init__(self, reason: str, message: str):
+        self.reason = reason
+        super().__init__(message)
+
 def _txt(node: Optional[ET.Element]) -> str:
     return (node.text or "").strip() if node is not None and node.text else ""
 
@@ -27,12 +36,15 @@ def parse_nfe_xml(xml_bytes: bytes) -> Dict[str, Any]:
     """
     Retorna um dicionário padrão consumido por analysis.py com:
       - issue_date (datetime)
-      - total_value (float)
+      - total_value (float) / total_value_cents (int, exato)
       - cNF (número do documento)
       - chNFe (chave da NFe – preferindo a do protocolo, senão 'Id' do infNFe)
-      - items[]: cProd, xProd, NCM, CFOP, qCom, vUnCom, vProd, CSOSN/CST
+      - items[]: cProd, xProd, NCM, CFOP, qCom, vUnCom, vProd (+ vProd_cents), CSOSN/CST
     """
     root, ns = _nsroot(xml_bytes)
+    infNFe = _find(root, ".//nfe:infNFe", ns)
+    if infNFe is None:
+        raise NfeParseError("sem_infnfe", "XML sem o grupo infNFe")
 
     # ============== Cabeçalho / Datas ==============
     issue_date = None
@@ -56,16 +68,11 @@ def parse_nfe_xml(xml_bytes: bytes) -> Dict[str, Any]:
     chNFe = _txt(_find(root, ".//nfe:protNFe/nfe:infProt/nfe:chNFe", ns))
     if not chNFe:
         # 2) Usar atributo Id do infNFe (vem como 'NFe<chave>')
-        infNFe = _find(root, ".//nfe:infNFe", ns)
-        if infNFe is not None:
-            chNFe = (infNFe.attrib.get("Id", "") or "").replace("NFe", "").strip()
+        chNFe = (infNFe.attrib.get("Id", "") or "").replace("NFe", "").strip()
 
     # Valor total da nota (vNF)
     vNF = _txt(_find(root, ".//nfe:ICMSTot/nfe:vNF", ns))
-    try:
-        total_value = float(vNF.replace(",", ".")) if vNF else 0.0
-    except Exception:
-        total_value = 0.0
+    total_value_cents = to_cents(vNF)
 
     # ============== Itens ==============
     items: List[Dict[str, Any]] = []
@@ -81,11 +88,8 @@ def parse_nfe_xml(xml_bytes: bytes) -> Dict[str, Any]:
         vUnCom = _txt(_find(prod, "nfe:vUnCom", ns)) if prod is not None else "0"
         vProd  = _txt(_find(prod, "nfe:vProd", ns)) if prod is not None else "0"
 
-        # Converte números com vírgula para float/str coerente
-        try:
-            vProd_f = float(vProd.replace(",", ".")) if vProd else 0.0
-        except Exception:
-            vProd_f = 0.0
+        # Valor em centavos inteiros (sem drift de float nas somas)
+        vProd_cents = to_cents(vProd)
 
         # CSOSN/CST (pode estar em diferentes nós sob ICMS)
         csosn = ""
@@ -112,14 +116,15 @@ def parse_nfe_xml(xml_bytes: bytes) -> Dict[str, Any]:
             "cfop": CFOP,
             "qCom": qCom,
             "vUnCom": vUnCom,
-            "vProd": vProd_f,
+            "vProd": cents_to_float(vProd_cents),
+            "vProd_cents": vProd_cents,
             "csosn": csosn
         })
 
-    print("✅ parse_nfe_xml carregado de app/services/nfe.py")
     return {
         "issue_date": issue_date,
-        "total_value": total_value,
+        "total_value": cents_to_float(total_value_cents),
+        "total_value_cents": total_value_cents,
         "cNF": cNF,
         "chNFe": chNFe,
         "items": items
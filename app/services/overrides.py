@@ -0,0 +1,203 @@
+"""
+overrides.py
+-------------
+Correções de classificação confirmadas pelo contador.
+
+"FREE" cai na lista de cigarro, "BLACK" cai em qualquer coisa: a correção
+fica gravada (classification_overrides) e vale antes de qualquer regra do
+JsonMatcher. Escopos: global (client_id NULL) e por cliente; o do cliente
+vence. Dentro do escopo: cProd > descrição > NCM.
+
+As correções ficam num índice em memória (dict por (tipo, valor)), O(1) por
+item. A versão do índice (contagem + última alteração no banco) entra na
+chave do cache de análises: corrigir algo invalida os resultados guardados.
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import hashlib
+import logging
+import threading
+
+from sqlalchemy import func, or_, select
+
+from app.models.override import ClassificationOverride
+from .dictionary_artifact import norm_text
+
+logger = logging.getLogger(__name__)
+
+TIPOS = ("cprod", "descricao", "ncm")
+MISSING = object()  # sem correção para o item (None = "não é monofásico")
+
+Key = Tuple[str, str]
+
+
+def normalize_value(tipo: str, valor: str) -> str:
+    valor = valor or ""
+    if tipo == "descricao":
+        return " ".join(norm_text(valor).split())[:255]
+    if tipo == "ncm":
+        return "".join(ch for ch in valor if ch.isdigit())[:10]
+    return valor.strip().lower()[:60]
+
+
+# ============================================================
+# 🗂️ ÍNDICE EM MEMÓRIA
+# ============================================================
+class OverrideIndex:
+    def __init__(self, client: Dict[Key, Optional[str]], global_: Dict[Key, Optional[str]], version: str):
+        self._scopes = [m for m in (client, global_) if m]
+        self._has_desc = any(k[0] == "descricao" for m in self._scopes for k in m)
+        self.version = version
+        self.size = len(client) + len(global_)
+
+    def __bool__(self) -> bool:
+        return bool(self._scopes)
+
+    def lookup(self, cprod: str, desc: str, ncm: str) -> Any:
+        """Categoria, None ('não é monofásico') ou MISSING."""
+        keys = [("cprod", cprod.strip().lower())]
+        if self._has_desc:
+            keys.append(("descricao", normalize_value("descricao", desc)))
+        keys.append(("ncm", ncm.strip()))
+        for scope in self._scopes:
+            for key in keys:
+                if key in scope:
+                    return scope[key]
+        return MISSING
+
+    def items(self) -> Iterable[Tuple[Key, Optional[str]]]:
+        """(tipo, valor) → categoria, cliente primeiro (chave repetida na global é ignorada)."""
+        seen = set()
+        for scope in self._scopes:
+            for key, cat in scope.items():
+                if key not in seen:
+                    seen.add(key)
+                    yield key, cat
+
+
+EMPTY_INDEX = OverrideIndex({}, {}, "0")
+
+
+class OverrideStore:
+    """Índices por cliente, recarregados só quando a versão no banco muda."""
+
+    def __init__(self):
+        self._cache: Dict[Optional[int], Tuple[tuple, OverrideIndex]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _scope_filter(client_id: Optional[int]):
+        t = ClassificationOverride.__table__
+        if client_id is None:
+            return t.c.client_id.is_(None)
+        return or_(t.c.client_id.is_(None), t.c.client_id == client_id)
+
+    def get_index(self, client_id: Optional[int]) -> OverrideIndex:
+        from app.db import get_engine
+
+        t = ClassificationOverride.__table__
+        try:
+            with get_engine().connect() as conn:
+                stamp = tuple(conn.execute(
+                    select(func.count(), func.max(t.c.updated_at)).where(self._scope_filter(client_id))
+                ).one())
+                cached = self._cache.get(client_id)
+                if cached is not None and cached[0] == stamp:
+                    return cached[1]
+                if not stamp[0]:
+                    index = EMPTY_INDEX
+                else:
+                    rows = conn.execute(
+                        select(t.c.client_id, t.c.tipo, t.c.valor, t.c.categoria).where(self._scope_filter(client_id))
+                    ).all()
+                    client_map: Dict[Key, Optional[str]] = {}
+                    global_map: Dict[Key, Optional[str]] = {}
+                    for row in rows:
+                        target = global_map if row.client_id is None else client_map
+                        target[(row.tipo, row.valor)] = row.categoria
+                    version = hashlib.sha1(repr(stamp).encode()).hexdigest()[:12]
+                    index = OverrideIndex(client_map, global_map, version)
+        except Exception as e:
+            logger.warning(f"⚠️ Correções de classificação indisponíveis: {e}")
+            return EMPTY_INDEX
+        with self._lock:
+            self._cache[client_id] = (stamp, index)
+        return index
+
+
+_store = OverrideStore()
+
+
+def get_override_index(client_id: Optional[int] = None) -> OverrideIndex:
+    return _store.get_index(client_id)
+
+
+def override_version(client_id: Optional[int] = None) -> str:
+    return get_override_index(client_id).version
+
+
+# ============================================================
+# 📥 GRAVAÇÃO EM LOTE / EXPORTAÇÃO
+# ============================================================
+def validate_override(tipo: str, valor: str, categoria: Optional[str], categorias: Iterable[str]) -> Tuple[str, str, Optional[str]]:
+    """Normaliza e valida uma correção. Levanta ValueError com a mensagem para o usuário."""
+    tipo = (tipo or "").strip().lower()
+    if tipo not in TIPOS:
+        raise ValueError(f"tipo inválido: {tipo!r} (use {', '.join(TIPOS)})")
+    norm = normalize_value(tipo, valor)
+    if not norm:
+        raise ValueError("valor vazio")
+    cat = norm_text(categoria) if categoria else None
+    if cat is not None and cat not in categorias:
+        raise ValueError(f"categoria desconhecida: {categoria!r}")
+    return tipo, norm, cat
+
+
+def upsert_overrides(db, rows: List[Dict[str, Any]], user: Optional[str] = None) -> Dict[str, int]:
+    """
+    rows: {"client_id", "tipo", "valor", "categoria"} já validados.
+    Uma consulta para as existentes, um commit para tudo.
+    """
+    if not rows:
+        return {"criadas": 0, "atualizadas": 0}
+    client_ids = {r["client_id"] for r in rows}
+    conds = []
+    if None in client_ids:
+        conds.append(ClassificationOverride.client_id.is_(None))
+    ids = [c for c in client_ids if c is not None]
+    if ids:
+        conds.append(ClassificationOverride.client_id.in_(ids))
+    existing = {
+        (o.client_id, o.tipo, o.valor): o
+        for o in db.query(ClassificationOverride).filter(or_(*conds)).all()
+    }
+    created = updated = 0
+    for r in rows:
+        key = (r["client_id"], r["tipo"], r["valor"])
+        obj = existing.get(key)
+        if obj is None:
+            obj = ClassificationOverride(client_id=r["client_id"], tipo=r["tipo"], valor=r["valor"],
+                                         categoria=r["categoria"], criado_por=user)
+            db.add(obj)
+            existing[key] = obj
+            created += 1
+        elif obj.categoria != r["categoria"]:
+            obj.categoria = r["categoria"]
+            obj.criado_por = user
+            updated += 1
+    db.commit()
+    return {"criadas": created, "atualizadas": updated}
+
+
+def override_to_api(o: ClassificationOverride) -> Dict[str, Any]:
+    return {
+        "id": o.id,
+        "client_id": o.client_id,
+        "tipo": o.tipo,
+        "valor": o.valor,
+        "categoria": o.categoria,
+        "monofasico": o.categoria is not None,
+        "criado_por": o.criado_por,
+        "updated_at": o.updated_at.isoformat() if o.updated_at else None,
+    }
@@ -0,0 +1,86 @@
+"""
+partitioning.py
+----------------
+Particionamento declarativo (PostgreSQL) das tabelas de itens por client_id.
+
+nfe_items e nfe_documents crescem com cada upload de cada cliente, e toda
+consulta filtra por client_id. Com PARTITION BY HASH (client_id) cada
+cliente cai sempre na mesma partição: as consultas/deletes com client_id
+tocam uma partição só (partition pruning) e os índices ficam menores.
+
+Opcional e só para banco novo: o PostgreSQL não converte uma tabela comum
+em particionada. Rode antes do primeiro create_all/init_admin:
+
+    python -m app.services.partitioning --partitions 16
+    python -m app.services.partitioning --dry-run       # só imprime o DDL
+
+Em outros bancos (SQLite/MySQL) as tabelas continuam normais.
+"""
+
+from __future__ import annotations
+from typing import List
+import argparse
+import re
+
+from sqlalchemy import inspect
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex, CreateTable, Table
+
+from app.models.documents import NfeDocument, NfeItem
+
+PARTITIONED_TABLES = (NfeItem.__table__, NfeDocument.__table__)
+DEFAULT_PARTITIONS = 16
+
+
+def partitioned_table_ddl(table: Table, partitions: int = DEFAULT_PARTITIONS) -> List[str]:
+    """DDL da tabela particionada por HASH(client_id), das partições e dos índices."""
+    dialect = postgresql.dialect()
+    create = str(CreateTable(table).compile(dialect=dialect)).strip()
+    # a chave primária de tabela particionada precisa conter a coluna de partição
+    create, n = re.subn(r"PRIMARY KEY \(id\)", "PRIMARY KEY (id, client_id)", create)
+    if n != 1:
+        raise ValueError(f"PK inesperada em {table.name}")
+    statements = [f"{create} PARTITION BY HASH (client_id)"]
+    for i in range(partitions):
+        statements.append(
+            f"CREATE TABLE {table.name}_p{i:02d} PARTITION OF {table.name} "
+            f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i})"
+        )
+    # índices no pai são replicados em cada partição (PostgreSQL 11+)
+    for index in sorted(table.indexes, key=lambda ix: ix.name):
+        statements.append(str(CreateIndex(index).compile(dialect=dialect)).strip())
+    return statements
+
+
+def create_partitioned_tables(engine: Engine, partitions: int = DEFAULT_PARTITIONS) -> List[str]:
+    """Cria as tabelas particionadas que ainda não existem. Retorna as criadas."""
+    if engine.dialect.name != "postgresql":
+        raise RuntimeError("Particionamento declarativo só no PostgreSQL")
+    existing = set(inspect(engine).get_table_names())
+    created = []
+    with engine.begin() as conn:
+        for table in PARTITIONED_TABLES:
+            if table.name in existing:
+                continue
+            for stmt in partitioned_table_ddl(table, partitions):
+                conn.exec_driver_sql(stmt)
+            created.append(table.name)
+    return created
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cria nfe_items/nfe_documents particionadas por client_id")
+    parser.add_argument("--partitions", type=int, default=DEFAULT_PARTITIONS)
+    parser.add_argument("--dry-run", action="store_true", help="só imprime o DDL")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        for table in PARTITIONED_TABLES:
+            for stmt in partitioned_table_ddl(table, args.partitions):
+                print(stmt + ";\n")
+    else:
+        from app.db import get_engine
+
+        created = create_partitioned_tables(get_engine(), args.partitions)
+        print(f"✅ Tabelas particionadas criadas: {', '.join(created) or 'nenhuma (já existiam)'}")
@@ -0,0 +1,141 @@
+"""
+product_master.py
+------------------
+Cadastro de produtos por cliente com a classificação em cache.
+
+Na análise, cada item é procurado por (cProd, hash da descrição) no
+cadastro do cliente, carregado de uma vez no início (uma consulta pelo
+índice de client_id, só linhas da versão atual do dicionário). Só itens
+novos, com descrição alterada ou classificados por outra versão do
+dicionário passam pelo JsonMatcher; o resultado volta para o banco em
+lote no fim da análise. Do segundo upload em diante quase nada é
+reclassificado.
+"""
+
+from __future__ import annotations
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import logging
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+from app.models.product_master import ProductMaster
+from .dictionary_artifact import norm_text
+
+logger = logging.getLogger(__name__)
+
+_UPDATED = ("descricao", "categoria", "metodo", "score", "dictionary_version")
+
+Key = Tuple[str, str]
+Entry = Tuple[Optional[str], int]  # (categoria | None, score)
+
+
+def desc_hash(desc: str) -> str:
+    return hashlib.sha1(norm_text(desc).encode()).hexdigest()[:16]
+
+
+class ProductClassifier:
+    """
+    Classificador de uma análise: cadastro do cliente + matcher para o resto.
+    classify() tem o mesmo retorno de JsonMatcher.classify.
+    """
+
+    def __init__(self, engine: Engine, client_id: int, matcher):
+        self.engine = engine
+        self.client_id = client_id
+        self.matcher = matcher
+        self.version = matcher.version
+        self._known: Dict[Key, Entry] = {}
+        self._stale: Dict[Key, int] = {}   # chave → id da linha de outra versão do dicionário
+        self._pending: Dict[Key, dict] = {}
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self) -> None:
+        table = ProductMaster.__table__
+        stmt = select(table.c.id, table.c.cprod, table.c.desc_hash, table.c.categoria,
+                      table.c.score, table.c.dictionary_version).where(table.c.client_id == self.client_id)
+        with self.engine.connect() as conn:
+            for row in conn.execute(stmt):
+                key = (row.cprod, row.desc_hash)
+                if row.dictionary_version == self.version:
+                    self._known[key] = (row.categoria, row.score)
+                else:
+                    self._stale[key] = row.id
+
+    def classify(self, cprod: str, desc: str) -> Optional[Tuple[str, int]]:
+        key = (cprod[:60], desc_hash(desc))
+        entry = self._known.get(key)
+        if entry is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            cat, score, metodo = self.matcher.explain(desc)
+            entry = (cat, score)
+            self._known[key] = entry
+            self._pending[key] = {
+                "client_id": self.client_id,
+                "cprod": key[0],
+                "desc_hash": key[1],
+                "descricao": desc[:255],
+                "categoria": cat,
+                "metodo": metodo,
+                "score": score,
+                "dictionary_version": self.version,
+                "updated_at": datetime.now(timezone.utc),
+            }
+        return (entry[0], entry[1]) if entry[0] is not None else None
+
+    def flush(self) -> int:
+        """Grava em lote o que foi classificado nesta análise. Retorna nº de linhas."""
+        if not self._pending:
+            return 0
+        from .bulk_insert import bulk_insert
+
+        new_rows: List[dict] = []
+        updates: List[dict] = []
+        for key, row in self._pending.items():
+            row_id = self._stale.get(key)
+            if row_id is None:
+                new_rows.append(row)
+            else:
+                updates.append({"_id": row_id, **{f"_{k}": row[k] for k in _UPDATED}})
+        table = ProductMaster.__table__
+        try:
+            if updates:
+                stmt = (
+                    update(table)
+                    .where(table.c.id == bindparam("_id"))
+                    .values({k: bindparam(f"_{k}") for k in _UPDATED})
+                )
+                with self.engine.begin() as conn:
+                    conn.execute(stmt, updates)
+            if new_rows:
+                bulk_insert(self.engine, table, new_rows)
+        except IntegrityError:
+            # outra análise do mesmo cliente gravou antes; o cadastro é só um cache
+            logger.info(f"[CADASTRO] cliente {self.client_id}: linhas já gravadas por outra análise")
+        self._pending.clear()
+        return len(new_rows) + len(updates)
+
+    def stats(self) -> dict:
+        return {"cadastro": self.hits, "classificados": self.misses}
+
+
+def open_classifier(client_id: Optional[int], matcher) -> Optional[ProductClassifier]:
+    """Classificador com cadastro do cliente, ou None (sem cliente / desativado / sem banco)."""
+    from app.config import settings
+
+    if client_id is None or not settings.PRODUCT_MASTER_ENABLED:
+        return None
+    from app.db import get_engine
+
+    try:
+        return ProductClassifier(get_engine(), client_id, matcher)
+    except Exception as e:
+        logger.warning(f"⚠️ Cadastro de produtos indisponível (cliente {client_id}): {e}")
+        return None
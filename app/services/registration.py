@@ -0,0 +1,65 @@
+"""
+registration.py
+----------------
+Registro de um ZIP como Upload: pré-análise, blobstore (sha256, com
+deduplicação por cliente) e linhagem de versões do mesmo arquivo.
+
+Usado pelas rotas de /api/uploads e pela ingestão de pastas (ingest.py).
+Erros: ArchiveRejected (ZIP inválido) e LookupError (versao_de inexistente).
+"""
+
+from __future__ import annotations
+from typing import IO, Any, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models import Upload
+from .blobstore import store_content
+from .zipscan import check_archive
+
+
+def lineage_of(db: Session, client_id: int, filename: str, versao_de: Optional[int]) -> Optional[int]:
+    """Primeiro upload da linhagem: o informado em versao_de ou o último com o mesmo nome."""
+    q = db.query(Upload).filter(Upload.client_id == client_id)
+    if versao_de is not None:
+        previous = q.filter(Upload.id == versao_de).first()
+        if not previous:
+            raise LookupError("Upload de origem (versao_de) não encontrado")
+    else:
+        previous = q.filter(Upload.filename == filename).order_by(Upload.id.desc()).first()
+    if previous is None:
+        return None
+    return previous.lineage_id or previous.id
+
+
+def register_content(db: Session, client_id: int, filename: str, fileobj: IO[bytes],
+                     source_path: Optional[str] = None, versao_de: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Guarda o conteúdo no blobstore (endereçado por sha256). Se o cliente já
+    tem um upload com o mesmo conteúdo, devolve o existente em vez de duplicar.
+    A pré-análise roda antes: ZIP corrompido, zip bomb ou sem NF-e → ArchiveRejected.
+    Reenvio do mesmo arquivo (mesmo nome ou versao_de) entra na mesma
+    linhagem: a análise só processa os membros novos/alterados.
+    """
+    scan = check_archive(fileobj)
+    lineage_id = lineage_of(db, client_id, filename, versao_de)
+    sha, size = store_content(db, fileobj)
+    existing = (
+        db.query(Upload)
+        .filter(Upload.client_id == client_id, Upload.sha256 == sha)
+        .order_by(Upload.id)
+        .first()
+    )
+    if existing:
+        db.rollback()  # desfaz a referência extra ao blob
+        return {"message": "Arquivo já registrado", "upload_id": existing.id,
+                "sha256": sha, "deduplicado": True, "pre_analise": scan.to_api()}
+
+    new_upload = Upload(client_id=client_id, filename=filename, filepath=source_path,
+                        sha256=sha, size_bytes=size, lineage_id=lineage_id)
+    db.add(new_upload)
+    db.commit()
+    db.refresh(new_upload)
+    return {"message": "Arquivo salvo com sucesso", "upload_id": new_upload.id,
+            "lineage_id": new_upload.lineage_id, "sha256": sha, "deduplicado": False,
+            "pre_analise": scan.to_api()}
@@ -2,19 +2,22 @@ import os
 from datetime import datetime
 from typing import Any, Dict
 from collections import defaultdict
+from decimal import Decimal
 
 from docx import Document
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 
+from .money import cents_to_decimal, to_cents
+
 
 # ==========================
 # Utilitários de formatação
 # ==========================
 def _fmt_money(v: Any) -> str:
     try:
-        n = float(v or 0.0)
+        n = v if isinstance(v, Decimal) else float(v or 0.0)
     except Exception:
         n = 0.0
     return f"{n:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
@@ -170,6 +173,8 @@ def gerar_relatorio_fiscal(
     # ==========================
     if produtos_duplicados:
         doc.add_heading("4. Itens Deduplicados (por descrição)", level=1)
+        doc.add_paragraph("Descrições quase iguais (ex.: \"COCA COLA 2L\" e \"REFRIG COCA-COLA 2LT\") "
+                          "são agrupadas; a descrição exibida é a mais frequente do grupo.")
         t_dup = doc.add_table(rows=1, cols=4)
         t_dup.style = "Table Grid"
         hdr = t_dup.rows[0].cells
@@ -183,7 +188,11 @@ def gerar_relatorio_fiscal(
         for item in produtos_duplicados:
             r = t_dup.add_row().cells
             r[0].text = str(item.get("codigo") or "")
-            r[1].text = str(item.get("descricao") or "")
+            descricao = str(item.get("descricao") or "")
+            n_variantes = item.get("n_variantes") or 1
+            if n_variantes > 1:
+                descricao += f" (+{n_variantes - 1} variantes)"
+            r[1].text = descricao
             r[2].text = str(item.get("ocorrencias") or 0)
             r[3].text = f"R$ {_fmt_money(item.get('valor_total') or 0)}"
 
@@ -212,7 +221,7 @@ def gerar_relatorio_fiscal(
                     mes_ref = str(data)
             grupos[mes_ref].append(item)
     
-        total_geral = 0.0
+        total_geral = 0  # centavos
         for mes, lista in sorted(grupos.items()):
             doc.add_heading(f"Mês de referência: {mes}", level=2)
     
@@ -227,7 +236,7 @@ def gerar_relatorio_fiscal(
                 tabela.cell(0, idx).text = htxt
                 tabela.cell(0, idx).paragraphs[0].runs[0].bold = True
     
-            subtotal_mes = 0.0
+            subtotal_mes = 0  # centavos
             for it in lista:
                 r = tabela.add_row().cells
                 r[0].text = str(it.get("data_emissao") or "-")
@@ -240,16 +249,18 @@ def gerar_relatorio_fiscal(
                 r[7].text = str(it.get("csosn") or "-")                 # 👈 CSOSN
                 r[8].text = str(it.get("quantidade") or "-")
                 r[9].text = f"R$ {_fmt_money(it.get('valor_unitario') or 0)}"
-                vtotal = float(it.get("valor_total") or 0.0)
-                r[10].text = f"R$ {_fmt_money(vtotal)}"
+                vtotal_c = it.get("valor_total_cents")
+                if vtotal_c is None:
+                    vtotal_c = to_cents(it.get("valor_total"))
+                r[10].text = f"R$ {_fmt_money(cents_to_decimal(vtotal_c))}"
                 r[11].text = str(it.get("chave") or "-")                # 👈 chave NFe
-                subtotal_mes += vtotal
+                subtotal_mes += vtotal_c
     
             _format_table_borders(tabela)
-            doc.add_paragraph(f"Subtotal mês {mes}: R$ {_fmt_money(subtotal_mes)}")
+            doc.add_paragraph(f"Subtotal mês {mes}: R$ {_fmt_money(cents_to_decimal(subtotal_mes))}")
             total_geral += subtotal_mes
     
-        doc.add_paragraph(f"TOTAL GERAL DOS ITENS EXCLUÍDOS: R$ {_fmt_money(total_geral)}")
+        doc.add_paragraph(f"TOTAL GERAL DOS ITENS EXCLUÍDOS: R$ {_fmt_money(cents_to_decimal(total_geral))}")
         doc.add_paragraph("")
 
     # ==========================
@@ -265,10 +276,50 @@ def gerar_relatorio_fiscal(
     # 7. Estimativa de Restituição
     # ==========================
     doc.add_heading("7. Estimativa de Restituição", level=1)
-    economia_anual = float(economia) * 12.0
-    p_est1 = doc.add_paragraph(f"💰 R$ {_fmt_money(economia)} por mês (estimado)")
+    # Economia real mês a mês (competências do arquivo), sem multiplicar por 12.
+    # O total é sempre o do resumo tributário (economia_estimada), o mesmo do dashboard;
+    # meses sem alíquota/DAS informado usam a tabela do Anexo I e ficam marcados à parte.
+    periodos = totals.get("periodos") or []
+    economia_periodo_c = to_cents(economia)
+    n_meses = len(periodos) or 1
+    if periodos:
+        t_per = doc.add_table(rows=1, cols=6)
+        t_per.style = "Table Grid"
+        hdr = t_per.rows[0].cells
+        for c, titulo in zip(hdr, ["Competência", "Receita", "Excluída", "RBT12", "Alíquota", "Economia"]):
+            c.text = titulo
+            c.paragraphs[0].runs[0].bold = True
+        for p in periodos:
+            tabela_anexo = p.get("fonte_aliquota") == "anexo"
+            r = t_per.add_row().cells
+            r[0].text = str(p.get("competencia"))
+            r[1].text = f"R$ {_fmt_money(p.get('receita'))}"
+            r[2].text = f"R$ {_fmt_money(p.get('receita_excluida'))}"
+            r[3].text = f"R$ {_fmt_money(p.get('rbt12'))}" + (" *" if p.get("rbt12_estimado") else "")
+            r[4].text = _fmt_percent(p.get("aliquota")) + (" †" if tabela_anexo else "")
+            r[5].text = f"R$ {_fmt_money(p.get('economia'))}" + (" †" if tabela_anexo else "")
+        _format_table_borders(t_per)
+        if any(p.get("rbt12_estimado") for p in periodos):
+            doc.add_paragraph("* RBT12 estimado pela média dos meses disponíveis × 12 (histórico incompleto).")
+        estimados = [p for p in periodos if p.get("fonte_aliquota") == "anexo"]
+        if estimados:
+            estimativa_c = sum(to_cents(p.get("economia")) for p in estimados)
+            # com entradas mensais o total já é a soma das competências (analysis.py)
+            mensal = any(p.get("fonte_aliquota") in ("informada", "imposto_pago") for p in periodos)
+            doc.add_paragraph(
+                f"† Sem alíquota ou DAS informado: alíquota efetiva pela tabela do Anexo I. "
+                f"Estimativa pela tabela ({'incluída no total abaixo' if mensal else 'indicativa, fora do total abaixo'}): "
+                f"R$ {_fmt_money(cents_to_decimal(estimativa_c))} em {len(estimados)} "
+                f"{'mês' if len(estimados) == 1 else 'meses'}."
+            )
+
+    media_mensal = cents_to_decimal(economia_periodo_c // n_meses)
+    p_est1 = doc.add_paragraph(
+        f"💰 R$ {_fmt_money(cents_to_decimal(economia_periodo_c))} no período analisado "
+        f"({n_meses} {'mês' if n_meses == 1 else 'meses'})"
+    )
     p_est1.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    p_est2 = doc.add_paragraph(f"📅 Em um ano: R$ {_fmt_money(economia_anual)}")
+    p_est2 = doc.add_paragraph(f"📅 Média mensal: R$ {_fmt_money(media_mensal)}")
     p_est2.alignment = WD_ALIGN_PARAGRAPH.CENTER
 
     # ==========================
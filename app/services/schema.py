@@ -0,0 +1,192 @@
+"""
+schema.py
+----------
+Atualização idempotente de bancos já existentes.
+
+create_all só cria as tabelas que faltam: colunas e índices novos em
+tabelas antigas (users.username, users.token_version, ...) precisam de
+ALTER TABLE / CREATE INDEX. Cada passo confere no inspect se a coluna ou o
+índice já existe antes de alterar, então rodar de novo não faz nada.
+
+Roda no init_admin (startCommand do Render), depois do create_all:
+
+    python -m app.services.schema            # aplica
+    python -m app.services.schema --dry-run  # só imprime o DDL
+
+Colunas NOT NULL entram com DEFAULT (linhas antigas recebem o padrão);
+colunas sem padrão natural entram nulas e são preenchidas por um UPDATE.
+Coluna que muda de tipo e passa a aceitar NULL (uploads.filepath, que era
+LargeBinary NOT NULL) usa ALTER COLUMN no PostgreSQL, MODIFY no MySQL e,
+no SQLite (sem ALTER COLUMN), recria a tabela a partir do modelo e copia
+as linhas.
+"""
+
+from __future__ import annotations
+from typing import List, NamedTuple, Optional, Tuple
+import argparse
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app.db import Base
+
+
+class AddColumn(NamedTuple):
+    table: str
+    column: str
+    ddl: str                        # tipo + constraints, como no ADD COLUMN
+    backfill: Optional[str] = None  # UPDATE para as linhas que já existiam
+
+
+class AddIndex(NamedTuple):
+    table: str
+    name: str
+    columns: Tuple[str, ...]
+    unique: bool = False
+
+
+class RelaxColumn(NamedTuple):
+    table: str
+    column: str
+    type_ddl: str   # tipo novo (a coluna passa a aceitar NULL)
+    pg_using: str   # conversão dos valores antigos no PostgreSQL
+    sqlite_copy: str  # expressão da coluna na cópia ao recriar a tabela (SQLite)
+
+
+# ============================================================
+# 🧱 PASSOS (na ordem em que devem rodar)
+# ============================================================
+# users antes do login por username: só tinha id, email, hashed_password e
+# created_at. O username dos usuários antigos vira o email (até 50 chars).
+COLUMN_STEPS: List[AddColumn] = [
+    AddColumn("users", "username", "VARCHAR(50)",
+              "UPDATE users SET username = SUBSTR(email, 1, 50) WHERE username IS NULL"),
+    AddColumn("users", "is_active", "BOOLEAN NOT NULL DEFAULT TRUE"),
+    AddColumn("users", "role", "VARCHAR(20) NOT NULL DEFAULT 'user'"),
+    AddColumn("users", "token_version", "INTEGER NOT NULL DEFAULT 0"),
+    # uploads antes do blob store: o conteúdo estava no caminho (filepath);
+    # sem sha256 o upload continua lendo o caminho (load_upload_bytes)
+    AddColumn("uploads", "sha256", "VARCHAR(64)"),
+    AddColumn("uploads", "size_bytes", "BIGINT"),
+    AddColumn("uploads", "lineage_id", "INTEGER REFERENCES uploads(id)"),
+]
+
+INDEX_STEPS: List[AddIndex] = [
+    AddIndex("users", "ix_users_username", ("username",), unique=True),
+    AddIndex("uploads", "ix_uploads_sha256", ("sha256",)),
+    AddIndex("uploads", "ix_uploads_lineage_id", ("lineage_id",)),
+    AddIndex("uploads", "ix_uploads_client_uploaded", ("client_id", "uploaded_at", "id")),
+    AddIndex("companies", "ix_companies_client_id", ("client_id", "id")),
+    AddIndex("reports", "ix_reports_company_created", ("company_id", "created_at", "id")),
+    AddIndex("reports", "ix_reports_client_created", ("client_id", "created_at", "id")),
+]
+
+# filepath guardava o caminho em LargeBinary NOT NULL; agora é texto e
+# uploads enviados direto (sem caminho de origem) gravam NULL
+RELAX_STEPS: List[RelaxColumn] = [
+    RelaxColumn("uploads", "filepath", "VARCHAR(1024)",
+                pg_using="convert_from(filepath, 'UTF8')",
+                sqlite_copy="CAST(filepath AS TEXT)"),
+]
+
+
+def _rebuild_sqlite(table_name: str, copy_columns: List[str], exprs: dict) -> List[str]:
+    """Recria a tabela com o DDL do modelo e copia as linhas (padrão do SQLite)."""
+    from sqlalchemy.dialects import sqlite
+
+    import app.models  # noqa: F401  (registra as tabelas no metadata)
+
+    table = Base.metadata.tables[table_name]
+    tmp = f"_new_{table_name}"
+    create = str(CreateTable(table).compile(dialect=sqlite.dialect())).strip()
+    create = create.replace(f"CREATE TABLE {table_name} ", f"CREATE TABLE {tmp} ", 1)
+    cols = [c for c in copy_columns if c in table.columns]
+    select = ", ".join(exprs.get(c, c) for c in cols)
+    statements = [
+        create,
+        f"INSERT INTO {tmp} ({', '.join(cols)}) SELECT {select} FROM {table_name}",
+        f"DROP TABLE {table_name}",
+        f"ALTER TABLE {tmp} RENAME TO {table_name}",
+    ]
+    for index in sorted(table.indexes, key=lambda ix: ix.name):
+        statements.append(str(CreateIndex(index).compile(dialect=sqlite.dialect())).strip())
+    return statements
+
+
+def pending_ddl(engine: Engine) -> List[str]:
+    """Comandos que ainda faltam neste banco (tabelas inexistentes são ignoradas)."""
+    insp = inspect(engine)
+    tables = set(insp.get_table_names())
+    statements: List[str] = []
+    columns = {}
+    for step in COLUMN_STEPS:
+        if step.table not in tables:
+            continue  # create_all cria a tabela já completa
+        if step.table not in columns:
+            columns[step.table] = {c["name"] for c in insp.get_columns(step.table)}
+        if step.column in columns[step.table]:
+            continue
+        statements.append(f"ALTER TABLE {step.table} ADD COLUMN {step.column} {step.ddl}")
+        if step.backfill:
+            statements.append(step.backfill)
+        columns[step.table].add(step.column)
+    rebuilt = set()
+    relax = {}
+    for step in RELAX_STEPS:
+        if step.table not in tables:
+            continue
+        current = {c["name"]: c for c in insp.get_columns(step.table)}
+        if step.column not in current or current[step.column]["nullable"]:
+            continue
+        dialect = engine.dialect.name
+        if dialect == "postgresql":
+            statements.append(
+                f"ALTER TABLE {step.table} ALTER COLUMN {step.column} TYPE {step.type_ddl} "
+                f"USING {step.pg_using}, ALTER COLUMN {step.column} DROP NOT NULL"
+            )
+        elif dialect == "mysql":
+            statements.append(f"ALTER TABLE {step.table} MODIFY {step.column} {step.type_ddl} NULL")
+        elif dialect == "sqlite":
+            relax.setdefault(step.table, {})[step.column] = step.sqlite_copy
+    for table_name, exprs in relax.items():
+        # colunas atuais + as adicionadas acima; o rebuild já cria os índices do modelo
+        current = columns.get(table_name) or {c["name"] for c in insp.get_columns(table_name)}
+        statements.extend(_rebuild_sqlite(table_name, sorted(current), exprs))
+        rebuilt.add(table_name)
+    for step in INDEX_STEPS:
+        if step.table not in tables or step.table in rebuilt:
+            continue
+        existing = {ix["name"] for ix in insp.get_indexes(step.table)}
+        if step.name in existing:
+            continue
+        unique = "UNIQUE " if step.unique else ""
+        statements.append(
+            f"CREATE {unique}INDEX {step.name} ON {step.table} ({', '.join(step.columns)})"
+        )
+    return statements
+
+
+def upgrade_schema(engine: Engine) -> List[str]:
+    """Aplica os passos pendentes numa transação. Retorna o DDL executado."""
+    statements = pending_ddl(engine)
+    if statements:
+        with engine.begin() as conn:
+            for stmt in statements:
+                conn.exec_driver_sql(stmt)
+    return statements
+
+
+if __name__ == "__main__":
+    from app.db import get_engine
+
+    parser = argparse.ArgumentParser(description="Adiciona colunas/índices novos a um banco existente")
+    parser.add_argument("--dry-run", action="store_true", help="só imprime o DDL")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    done = pending_ddl(engine) if args.dry_run else upgrade_schema(engine)
+    for stmt in done:
+        print(f"{stmt};")
+    if not done:
+        print("✅ Schema já atualizado.")
@@ -0,0 +1,171 @@
+"""
+security.py
+------------
+Senhas e tokens.
+
+Senhas: scrypt com salt por usuário (hashlib, sem dependência nova), no
+formato 'scrypt$n$r$p$salt$hash' (base64). Hashes SHA-256 sem salt do
+init_admin antigo ainda são aceitos e marcados para re-hash no login.
+O cálculo roda num pool de threads próprio e pequeno: o scrypt usa ~16 MB e
+CPU por chamada, e não pode travar o event loop nem ocupar o threadpool das
+rotas.
+
+Tokens: JWT HS256. Access token curto; refresh token longo e de uso único
+(jti registrado em refresh_tokens). Os dois levam 'ver' (token_version do
+usuário): incrementar revoga todas as sessões de uma vez.
+As claims de access tokens já verificados ficam em cache até expirarem.
+"""
+
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+import jwt
+
+from app.config import settings
+
+JWT_ALGORITHM = "HS256"
+
+# scrypt: n=2**14, r=8, p=1 (~16 MB, dezenas de ms por hash)
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+_hash_pool = ThreadPoolExecutor(max_workers=settings.AUTH_HASH_THREADS, thread_name_prefix="pwhash")
+
+
+# ============================================================
+# 🔑 SENHAS
+# ============================================================
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii")
+
+
+def hash_password(password: str) -> str:
+    salt = os.urandom(SALT_BYTES)
+    digest = hashlib.scrypt(password.encode("utf-8"), salt=salt, n=SCRYPT_N, r=SCRYPT_R,
+                            p=SCRYPT_P, dklen=HASH_BYTES)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+def verify_password(password: str, stored: str) -> bool:
+    if not stored:
+        return False
+    if stored.startswith("scrypt$"):
+        try:
+            _, n, r, p, salt, expected = stored.split("$")
+            digest = hashlib.scrypt(password.encode("utf-8"), salt=base64.b64decode(salt),
+                                    n=int(n), r=int(r), p=int(p), dklen=len(base64.b64decode(expected)))
+        except (ValueError, TypeError):
+            return False
+        # compare_digest só aceita str ASCII: hash corrompido ou não-ASCII vira False, não TypeError
+        return hmac.compare_digest(_b64(digest).encode("ascii"), expected.encode("utf-8"))
+    # legado: sha256 hex sem salt
+    legacy = hashlib.sha256(password.encode("utf-8")).hexdigest()
+    return hmac.compare_digest(legacy.encode("ascii"), stored.encode("utf-8"))
+
+
+def needs_rehash(stored: str) -> bool:
+    return not (stored or "").startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+
+def submit_hash(password: str) -> Future[str]:
+    """hash_password no pool dedicado, sem depender de um event loop específico."""
+    return _hash_pool.submit(hash_password, password)
+
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, hash_password, password)
+
+
+async def verify_password_async(password: str, stored: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, verify_password, password, stored)
+
+
+# ============================================================
+# 🎟️ TOKENS
+# ============================================================
+def _encode(claims: Dict[str, Any], ttl: timedelta) -> str:
+    now = datetime.now(timezone.utc)
+    payload = {**claims, "iat": now, "exp": now + ttl}
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+
+def create_access_token(sub: str, **extra) -> str:
+    return _encode({"sub": sub, "typ": "access", **extra},
+                   timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
+
+
+def create_refresh_token(sub: str, version: int = 0, jti: Optional[str] = None) -> str:
+    claims = {"sub": sub, "typ": "refresh", "ver": version}
+    if jti:
+        claims["jti"] = jti
+    return _encode(claims, timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS))
+
+
+class ClaimsCache:
+    """token → claims verificadas, válido até o 'exp' do token."""
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._data: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        entry = self._data.get(token)
+        if entry is None:
+            return None
+        claims, exp = entry
+        if exp <= time.time():
+            with self._lock:
+                self._data.pop(token, None)
+            return None
+        return claims
+
+    def put(self, token: str, claims: Dict[str, Any]) -> None:
+        exp = float(claims.get("exp") or 0)
+        with self._lock:
+            if len(self._data) >= self.max_entries:
+                now = time.time()
+                for k in [k for k, (_, e) in self._data.items() if e <= now]:
+                    del self._data[k]
+                if len(self._data) >= self.max_entries:
+                    # sem expirados: descarta os mais antigos (ordem de inserção)
+                    for k in list(self._data)[: self.max_entries // 10 or 1]:
+                        del self._data[k]
+            self._data[token] = (claims, exp)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+claims_cache = ClaimsCache()
+
+
+def decode_token(token: str, expected_type: str = "access") -> Dict[str, Any]:
+    """Valida assinatura/expiração/tipo; levanta jwt.InvalidTokenError."""
+    claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[JWT_ALGORITHM])
+    # tokens antigos (sem 'typ') são access tokens
+    if claims.get("typ", "access") != expected_type:
+        raise jwt.InvalidTokenError("tipo de token inválido")
+    return claims
+
+
+def verify_access_token(token: str) -> Dict[str, Any]:
+    claims = claims_cache.get(token)
+    if claims is not None:
+        return claims
+    claims = decode_token(token, "access")
+    claims_cache.put(token, claims)
+    return claims
@@ -0,0 +1,373 @@
+"""
+singleflight.py
+----------------
+Coalescência de análises idênticas.
+
+O front chama o dashboard e o relatório DOCX em sequência para o mesmo
+upload, e cada um roda run_analysis_from_bytes do zero. Aqui a análise é
+identificada pelo sha256 do ZIP + parâmetros (+ versão do dicionário):
+
+  - SingleFlight (no processo): quem chega enquanto a análise está rodando
+    espera o mesmo Future, em thread (do) ou em código async (do_async).
+  - FileFlight (entre workers, opcional): flock num diretório compartilhado;
+    o worker que pega o lock calcula e grava o resultado por alguns segundos,
+    os demais esperam o lock e reaproveitam o arquivo.
+    Ative com SINGLEFLIGHT_DIR (ex.: /tmp/auditasimples-flight).
+  - Cache de resultado (blobstore): uploads com sha256 conhecido guardam o
+    resultado em results/<sha256>/<params>.pkl; reanálises e uploads com o
+    mesmo conteúdo não processam o ZIP de novo (ANALYSIS_CACHE_ENABLED).
+"""
+
+from __future__ import annotations
+from concurrent.futures import Future
+from typing import IO, Any, Callable, Dict, Hashable, Iterator, Optional, Tuple, Union
+import asyncio
+import hashlib
+import logging
+import os
+import pickle
+import queue
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: só coalescência no processo
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================
+# 🔁 NO PROCESSO
+# ============================================================
+class SingleFlight:
+    """
+    sf.do(key, fn): se já existe uma chamada em andamento com a mesma chave,
+    espera por ela e devolve o mesmo resultado (ou a mesma exceção).
+    O resultado é compartilhado: quem usa não deve alterá-lo.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        with self._lock:
+            fut = self._calls.get(key)
+            if fut is not None:
+                return fut, False
+            fut = self._calls[key] = Future()
+            return fut, True
+
+    def _run(self, key: Hashable, fut: Future, fn: Callable[[], Any]) -> None:
+        try:
+            fut.set_result(fn())
+        except BaseException as e:
+            fut.set_exception(e)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Retorna (resultado, compartilhado)."""
+        fut, leader = self._join(key)
+        if leader:
+            self._run(key, fut, fn)
+        return fut.result(), not leader
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Versão para rotas async: fn roda no executor padrão, ninguém bloqueia o loop."""
+        fut, leader = self._join(key)
+        if leader:
+            loop = asyncio.get_running_loop()
+            loop.run_in_executor(None, self._run, key, fut, fn)
+        return await asyncio.wrap_future(fut), not leader
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+# ============================================================
+# 🔒 ENTRE WORKERS (flock + resultado em arquivo)
+# ============================================================
+class FileFlight:
+    def __init__(self, directory: str, ttl_seconds: float = 120.0):
+        self.directory = directory
+        self.ttl = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, key)
+        return base + ".lock", base + ".pkl"
+
+    def _load_fresh(self, path: str) -> Tuple[bool, Any]:
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return False, None
+            with open(path, "rb") as f:
+                return True, pickle.load(f)
+        except FileNotFoundError:
+            return False, None
+        except Exception as e:
+            logger.warning(f"⚠️ Resultado compartilhado ilegível ({path}): {e}")
+            return False, None
+
+    def _store(self, path: str, value: Any) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".flight-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def sweep(self) -> None:
+        """
+        Remove resultados e locks vencidos (chamado de forma oportunista).
+        Apagar um lock em uso no máximo duplica uma análise; não gera erro.
+        """
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith((".pkl", ".lock")):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.unlink(path)
+            except OSError:
+                pass
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        lock_path, result_path = self._paths(key)
+        hit, value = self._load_fresh(result_path)
+        if hit:
+            return value, True
+
+        with open(lock_path, "a+") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                # outro worker pode ter terminado enquanto esperávamos o lock
+                hit, value = self._load_fresh(result_path)
+                if hit:
+                    return value, True
+                value = fn()
+                try:
+                    self._store(result_path, value)
+                except Exception as e:
+                    logger.warning(f"⚠️ Não foi possível compartilhar o resultado: {e}")
+                return value, False
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+
+# ============================================================
+# 🧾 ANÁLISE COMPARTILHADA
+# ============================================================
+def params_key(*args, **kwargs) -> str:
+    """
+    Parâmetros da análise + versão do dicionário + versão das correções do
+    cliente (sem o conteúdo do ZIP).
+    """
+    from .ai_matcher import get_matcher
+    from .overrides import override_version
+
+    # a linhagem (análise incremental) só muda o trabalho feito, não o resultado
+    params = sorted((k, v) for k, v in kwargs.items() if k != "lineage")
+    h = hashlib.sha256(repr((args, params)).encode())
+    h.update(get_matcher().version.encode())
+    h.update(override_version(kwargs.get("client_id")).encode())
+    return h.hexdigest()
+
+
+def analysis_key(zip_bytes: bytes, *args, content_sha256: Optional[str] = None, **kwargs) -> str:
+    """sha256 do ZIP + parâmetros + versão do dicionário."""
+    sha = content_sha256 or hashlib.sha256(zip_bytes).hexdigest()
+    return hashlib.sha256(f"{sha}:{params_key(*args, **kwargs)}".encode()).hexdigest()
+
+
+_flight = SingleFlight()
+_file_flight: Optional[FileFlight] = None
+_file_flight_lock = threading.Lock()
+
+
+def get_singleflight() -> SingleFlight:
+    return _flight
+
+
+def get_file_flight() -> Optional[FileFlight]:
+    global _file_flight
+    if fcntl is None:
+        return None
+    if _file_flight is None:
+        from app.config import settings
+        if not settings.SINGLEFLIGHT_DIR:
+            return None
+        with _file_flight_lock:
+            if _file_flight is None:
+                _file_flight = FileFlight(settings.SINGLEFLIGHT_DIR, settings.SINGLEFLIGHT_TTL_SECONDS)
+    return _file_flight
+
+
+def run_analysis_shared(zip_bytes: Union[bytes, Callable[[], IO[bytes]]], *args,
+                        content_sha256: Optional[str] = None,
+                        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                        **kwargs) -> Tuple[Dict[str, Any], bool]:
+    """
+    run_analysis_from_bytes com coalescência. Retorna (resultado, compartilhado).
+    zip_bytes pode ser uma função que abre o ZIP (blobstore.open_upload): o
+    arquivo só é aberto se a análise rodar de fato (sem resultado em cache nem
+    outra requisição calculando) e é lido do disco, sem carregar o ZIP inteiro.
+    Com content_sha256 (upload no blobstore) o ZIP não é re-hasheado e o
+    resultado fica em cache para as próximas chamadas com os mesmos parâmetros.
+    on_progress recebe os eventos 'progress' de analysis.iter_analysis quando
+    é esta chamada que analisa (quem espera outra requisição não recebe).
+    O resultado pode estar sendo usado por outras requisições: não altere.
+    """
+    from .analysis import iter_analysis, run_analysis_from_bytes
+    from .metrics import SINGLEFLIGHT_SHARED
+
+    pkey = params_key(*args, **kwargs)
+    sha = content_sha256 or _content_hash(zip_bytes)
+    key = hashlib.sha256(f"{sha}:{pkey}".encode()).hexdigest()
+    file_flight = get_file_flight()
+    from_other_worker = False
+
+    def analyze_file(source):
+        if on_progress is None:
+            return run_analysis_from_bytes(source, *args, **kwargs)
+        for step in iter_analysis(source, *args, **kwargs):
+            if step["event"] == "progress":
+                on_progress(step)
+        return step["totals"]
+
+    def run():
+        if not callable(zip_bytes):
+            return analyze_file(zip_bytes)
+        with zip_bytes() as f:
+            return analyze_file(f)
+
+    def analyze():
+        if content_sha256:
+            from .blobstore import get_cached_result, put_cached_result
+
+            cached = get_cached_result(content_sha256, pkey)
+            if cached is not None:
+                return cached
+            value = run()
+            put_cached_result(content_sha256, pkey, value)
+            return value
+        return run()
+
+    def compute():
+        nonlocal from_other_worker
+        if file_flight is None:
+            return analyze()
+        value, from_other_worker = file_flight.do(key, analyze)
+        if not from_other_worker:
+            file_flight.sweep()
+        return value
+
+    result, shared = _flight.do(key, compute)
+    shared = shared or from_other_worker
+    if shared:
+        SINGLEFLIGHT_SHARED.inc()
+    return result, shared
+
+
+def _content_hash(source: Union[bytes, Callable[[], IO[bytes]]]) -> str:
+    if not callable(source):
+        return hashlib.sha256(source).hexdigest()
+    from .blobstore import hash_fileobj
+
+    with source() as f:
+        return hash_fileobj(f)[0]
+
+
+def run_upload_analysis(upload, zip_bytes: Optional[bytes] = None, aliquota=None, imposto_pago=None,
+                        aliquotas_mensais: Optional[str] = None, impostos_pagos_mensais: Optional[str] = None,
+                        motor: Optional[str] = None, ranking: Optional[str] = None,
+                        top: Optional[int] = None,
+                        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                        ) -> Tuple[Dict[str, Any], bool]:
+    """
+    Análise de um upload registrado, com os argumentos na forma usada pelo
+    dashboard e pelo DOCX — a mesma chave de cache para quem pré-calcula
+    (ingest.py) e para quem abre o dashboard depois. Sem zip_bytes o ZIP é
+    aberto do blob store só se precisar ser analisado.
+    """
+    from .blobstore import open_upload
+    from .incremental import lineage_key
+
+    args, kwargs = _upload_args(upload, aliquota, imposto_pago, aliquotas_mensais,
+                                impostos_pagos_mensais, motor, ranking, top)
+    source = zip_bytes if zip_bytes is not None else (lambda: open_upload(upload))
+    return run_analysis_shared(source, *args, **kwargs, lineage=lineage_key(upload),
+                               content_sha256=upload.sha256, on_progress=on_progress)
+
+
+def start_upload_analysis(upload, aliquota=None, imposto_pago=None, on_done: Optional[Callable[[], None]] = None,
+                          **params) -> Iterator[Dict[str, Any]]:
+    """
+    run_upload_analysis numa thread, para o dashboard em streaming. Devolve
+    os eventos de iter_analysis ('progress'... e um 'result' com
+    "compartilhado"). A análise começa já e vai até o fim mesmo que ninguém
+    leia os eventos (cliente desconectou): o resultado fica no cache e com
+    quem esperava a mesma análise. on_done roda quando a thread termina.
+    """
+    events: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+
+    def work():
+        try:
+            result, shared = run_upload_analysis(upload, None, aliquota, imposto_pago, **params,
+                                                 on_progress=lambda step: events.put(("progress", step)))
+            events.put(("result", {"event": "result", "totals": result, "compartilhado": shared}))
+        except BaseException as e:
+            events.put(("error", e))
+        finally:
+            if on_done is not None:
+                on_done()
+
+    threading.Thread(target=work, name=f"analysis-upload-{upload.id}", daemon=True).start()
+
+    def iterate() -> Iterator[Dict[str, Any]]:
+        while True:
+            kind, value = events.get()
+            if kind == "error":
+                raise value
+            yield value
+            if kind == "result":
+                return
+
+    return iterate()
+
+
+def upload_params_key(upload, aliquota=None, imposto_pago=None, aliquotas_mensais: Optional[str] = None,
+                      impostos_pagos_mensais: Optional[str] = None, motor: Optional[str] = None,
+                      ranking: Optional[str] = None, top: Optional[int] = None) -> str:
+    """params_key de run_upload_analysis sem abrir o ZIP (ETag / respostas em cache)."""
+    args, kwargs = _upload_args(upload, aliquota, imposto_pago, aliquotas_mensais,
+                                impostos_pagos_mensais, motor, ranking, top)
+    return params_key(*args, **kwargs)
+
+
+def _upload_args(upload, aliquota, imposto_pago, aliquotas_mensais, impostos_pagos_mensais, motor,
+                 ranking=None, top=None):
+    from .analysis import resolve_engine
+    from .topk import resolve_ranking
+
+    kwargs = {
+        "aliquotas_mensais": aliquotas_mensais,
+        "impostos_pagos_mensais": impostos_pagos_mensais,
+        "client_id": upload.client_id,
+        "motor": resolve_engine(motor),
+    }
+    modo, k = resolve_ranking(ranking, top)
+    if modo != "completo":
+        # só entra na chave fora do padrão: resultados já em cache continuam valendo
+        kwargs.update(ranking=modo, top=k)
+    return (aliquota, imposto_pago), kwargs
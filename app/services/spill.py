@@ -0,0 +1,520 @@
+"""
+spill.py
+---------
+Análise fora da memória (ZIPs de vários anos de um supermercado).
+
+Mesmo lendo o ZIP membro a membro, a análise guarda em memória a lista de
+produtos monofásicos, a de excluídos e o mapa de deduplicação — crescem com
+o arquivo e derrubam instâncias de 512 MB. Com ANALYSIS_MEMORY_BUDGET_MB,
+ZIPs cujo XML passa do orçamento rodam com os agregados limitados:
+
+  - SpillList: lista só de acréscimo; passou do limite de linhas, o bloco
+    vai para um arquivo temporário (pickle em lotes). Iterar devolve tudo
+    na ordem original, lendo do disco.
+  - SpillDict: soma por chave (deduplicação); passou do limite de chaves,
+    grava um run ordenado pela chave e esvazia. A cada FAN_IN runs eles são
+    fundidos num só (o merge nunca lê mais que FAN_IN arquivos ao mesmo tempo);
+    no fim, heapq.merge dos runs soma as chaves repetidas.
+  - produtos_duplicados: as descrições do dedup vão para partições em disco
+    pelas medidas ("2l", "350ml": quase duplicados só se juntam com as mesmas
+    medidas), cada partição é agrupada sozinha (near_dup.cluster_rows) e os
+    grupos saem num heapq.merge por valor, numa SpillList.
+
+O resultado é o mesmo da análise em memória (products/produtos_excluidos/
+produtos_duplicados são SpillList: iteráveis e, no pickle do cache, listas
+comuns). A linhagem guarda o agregado de cada membro, então fica de fora
+nesse modo. Uma medida muito comum concentra suas descrições numa partição
+só: é ela que limita a memória do agrupamento (stats: maior_particao).
+O que ainda cresce é por membro do ZIP (diretório central do zipfile e a
+impressão digital de cada membro, ~1 KB), não por item.
+
+Benchmark (RSS de pico de run_analysis_from_bytes num ZIP sintético de NF-e, lido
+do disco, por modo): python -m app.services.spill [N_ITENS] [memoria,disco]
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+import heapq
+import itertools
+import logging
+import os
+import pickle
+import tempfile
+import weakref
+import zlib
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+BATCH = 1000            # linhas por pickle.dump nos arquivos temporários
+RUN_BATCH = 256         # lote dos runs lidos lado a lado num merge
+FAN_IN = 32             # runs do dedup fundidos de uma vez
+ROW_BYTES = 1200        # linha de produto em memória (dict de 14 campos), medido com tracemalloc
+DEDUP_BYTES = 400       # entrada do mapa de deduplicação (chave + [seq, código, descrição, n, centavos])
+CLUSTER_BYTES = 2500    # descrição no agrupamento (linha, texto, tokens, chaves LSH, grupo), medido
+MAX_PARTITIONS = 256
+PARTITION_BUFFER = 20_000  # linhas em memória entre todas as partições antes de gravar
+
+
+def _spill_dir() -> Optional[str]:
+    directory = settings.ANALYSIS_SPILL_DIR or None
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _temp_file():
+    """Arquivo temporário apagado quando o dono é coletado (ou no close)."""
+    fd, path = tempfile.mkstemp(dir=_spill_dir(), prefix="analysis-", suffix=".spill")
+    return os.fdopen(fd, "wb"), path
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _read_batches(path: str) -> Iterator[List[Any]]:
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def _write_run(rows: Iterable[Any], batch: int = RUN_BATCH) -> Tuple[str, int]:
+    """Grava um run (pickle em lotes) e devolve (caminho, nº de linhas)."""
+    f, path = _temp_file()
+    rows, n = iter(rows), 0
+    with f:
+        while True:
+            chunk = list(itertools.islice(rows, batch))
+            if not chunk:
+                return path, n
+            pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+            n += len(chunk)
+
+
+def _read_run(path: str) -> Iterator[Any]:
+    return itertools.chain.from_iterable(_read_batches(path))
+
+
+# ============================================================
+# 📜 LISTA COM TRANSBORDO
+# ============================================================
+class SpillList:
+    """
+    Lista só de acréscimo com no máximo `max_rows` linhas em memória.
+    Cada iteração abre o arquivo de novo: o resultado pode ser lido por várias
+    requisições ao mesmo tempo (single-flight). Não altere as linhas lidas.
+    """
+
+    def __init__(self, max_rows: int):
+        self.max_rows = max(max_rows, BATCH)
+        self._buffer: List[Any] = []
+        self._file = None
+        self._path: Optional[str] = None
+        self._on_disk = 0
+        self.runs = 0
+
+    def append(self, row: Any) -> None:
+        self._buffer.append(row)
+        if len(self._buffer) >= self.max_rows:
+            self._spill()
+
+    def extend(self, rows: Iterable[Any]) -> None:
+        for row in rows:
+            self.append(row)
+
+    def _spill(self) -> None:
+        if self._file is None:
+            self._file, self._path = _temp_file()
+            weakref.finalize(self, _unlink, self._path)
+        for start in range(0, len(self._buffer), BATCH):
+            pickle.dump(self._buffer[start:start + BATCH], self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._on_disk += len(self._buffer)
+        self._buffer = []
+        self.runs += 1
+
+    def close(self) -> None:
+        """Fim das escritas; as linhas em memória continuam em memória."""
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+
+    @property
+    def bytes_on_disk(self) -> int:
+        return os.path.getsize(self._path) if self._path else 0
+
+    def __iter__(self) -> Iterator[Any]:
+        if self._path is not None:
+            if not self._file.closed:
+                self._file.flush()
+            for batch in _read_batches(self._path):
+                yield from batch
+        yield from list(self._buffer)
+
+    def __len__(self) -> int:
+        return self._on_disk + len(self._buffer)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (list, SpillList)) or len(self) != len(other):
+            return False
+        return all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # pickle grava uma lista comum, em lotes, sem montá-la inteira na memória
+        return list, (), None, iter(self)
+
+    def __repr__(self) -> str:
+        return f"SpillList({len(self)} linhas, {self._on_disk} em disco)"
+
+
+# ============================================================
+# 🧮 SOMAS POR CHAVE COM TRANSBORDO
+# ============================================================
+class SpillDict:
+    """
+    Deduplicação (chave → código, descrição, ocorrências, centavos) com no
+    máximo `max_keys` chaves em memória. `seq` é a ordem da 1ª ocorrência:
+    o merge devolve as linhas na mesma ordem do mapa em memória.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max(max_keys, BATCH)
+        self._table: Dict[Hashable, list] = {}
+        self._runs: List[str] = []
+        self._on_disk = 0  # linhas nos runs (chaves repetidas entre runs contam mais de uma vez)
+        self._seq = itertools.count()
+        self.runs = 0
+
+    def add(self, key: Hashable, codigo: str, desc: str, n: int, cents: int) -> None:
+        entry = self._table.get(key)
+        if entry is None:
+            self._table[key] = [next(self._seq), codigo, desc, n, cents]
+            if len(self._table) >= self.max_keys:
+                self._spill()
+        else:
+            entry[3] += n
+            entry[4] += cents
+
+    def _spill(self) -> None:
+        path, n = _write_run(sorted(self._table.items(), key=lambda kv: kv[0]))
+        weakref.finalize(self, _unlink, path)
+        self._runs.append(path)
+        self._on_disk += n
+        self._table = {}
+        self.runs += 1
+        if len(self._runs) >= FAN_IN:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Funde os runs num só, somando as chaves repetidas."""
+        path, n = _write_run(self._merge([_read_run(p) for p in self._runs]))
+        weakref.finalize(self, _unlink, path)
+        for old in self._runs:
+            _unlink(old)
+        self._runs = [path]
+        self._on_disk = n
+
+    def __len__(self) -> int:
+        """Limite superior de chaves distintas (as repetidas entre runs contam dobrado)."""
+        return self._on_disk + len(self._table)
+
+    def _merged(self) -> Iterator[Tuple[Hashable, list]]:
+        sources = [_read_run(p) for p in self._runs]
+        sources.append(iter(sorted(self._table.items(), key=lambda kv: kv[0])))
+        return self._merge(sources)
+
+    @staticmethod
+    def _merge(sources: List[Iterator[Tuple[Hashable, list]]]) -> Iterator[Tuple[Hashable, list]]:
+        current_key, current = None, None
+        for key, entry in heapq.merge(*sources, key=lambda kv: kv[0]):
+            if current is not None and key == current_key:
+                if entry[0] < current[0]:  # código/descrição da 1ª ocorrência
+                    current[0], current[1], current[2] = entry[0], entry[1], entry[2]
+                current[3] += entry[3]
+                current[4] += entry[4]
+                continue
+            if current is not None:
+                yield current_key, current
+            current_key, current = key, list(entry)
+        if current is not None:
+            yield current_key, current
+
+    def entries(self) -> Iterator[list]:
+        """[seq, código, descrição, ocorrências, centavos] de cada chave, na ordem da chave."""
+        for _, entry in self._merged():
+            yield entry
+
+    def top_rows(self, k: int) -> List[Dict[str, Any]]:
+        """
+        As k linhas de maior valor no formato do dedup_map (LineageState.dedup),
+        como topk.top_k sobre as linhas na ordem da 1ª ocorrência.
+        """
+        best = heapq.nlargest(k, self.entries(), key=lambda e: (e[4], -e[0]))
+        return [_dedup_row(e) for e in best]
+
+
+def _dedup_row(entry: list) -> Dict[str, Any]:
+    _, codigo, desc, n, cents = entry
+    return {"codigo": codigo, "descricao": desc, "ocorrencias": n, "valor_total_cents": cents}
+
+
+# ============================================================
+# 🔗 PRODUTOS DUPLICADOS POR PARTIÇÃO
+# ============================================================
+class _Partitions:
+    """Linhas distribuídas em n arquivos, com PARTITION_BUFFER linhas em memória no total."""
+
+    def __init__(self, n: int):
+        self.paths: List[str] = []
+        for _ in range(n):
+            f, path = _temp_file()
+            f.close()
+            weakref.finalize(self, _unlink, path)
+            self.paths.append(path)
+        self.sizes = [0] * n
+        self._buffers: List[List[Any]] = [[] for _ in range(n)]
+        self._buffered = 0
+
+    def add(self, part: int, row: Any) -> None:
+        self._buffers[part].append(row)
+        self.sizes[part] += 1
+        self._buffered += 1
+        if self._buffered >= PARTITION_BUFFER:
+            self.flush()
+
+    def flush(self) -> None:
+        for path, buf in zip(self.paths, self._buffers):
+            if buf:
+                with open(path, "ab") as f:
+                    pickle.dump(buf, f, protocol=pickle.HIGHEST_PROTOCOL)
+                buf.clear()
+        self._buffered = 0
+
+    def load(self, part: int) -> List[Any]:
+        rows = list(_read_run(self.paths[part]))
+        _unlink(self.paths[part])
+        return rows
+
+
+def spilled_duplicates(dedup: SpillDict, budget_mb: int) -> Tuple[SpillList, Dict[str, Any]]:
+    """
+    produtos_duplicados completo (analysis._rank_duplicates com top=None) sem
+    todas as descrições na memória: partições pelas medidas, agrupamento por
+    partição e merge dos grupos por (valor desc, 1ª ocorrência), a mesma ordem
+    de cluster_products / sorted estável na análise em memória.
+    """
+    from app.services.money import cents_to_float
+
+    near = settings.NEAR_DUP_ENABLED
+    if near:
+        from app.services.near_dup import canonical_text, cluster_rows, measures
+
+    budget = budget_mb * MB
+    n_parts = min(MAX_PARTITIONS, max(1, -(-len(dedup) * CLUSTER_BYTES // (budget // 2))))
+    parts = _Partitions(n_parts)
+    for entry in dedup.entries():
+        if n_parts == 1:
+            part = 0
+        elif near:
+            part = zlib.crc32(" ".join(sorted(measures(canonical_text(entry[2])))).encode()) % n_parts
+        else:
+            part = entry[0] % n_parts
+        parts.add(part, entry)
+    parts.flush()
+
+    runs: List[str] = []
+    for part in range(n_parts):
+        entries = parts.load(part)
+        entries.sort(key=lambda e: e[0])  # ordem da 1ª ocorrência, como na análise em memória
+        rows = [_dedup_row(e) for e in entries]
+        if near:
+            groups = [(entries[i][0], g) for i, g in cluster_rows(rows, threshold=settings.NEAR_DUP_THRESHOLD)]
+        else:
+            groups = []
+            for e, row in zip(entries, rows):
+                row["valor_total"] = cents_to_float(row["valor_total_cents"])
+                groups.append((e[0], row))
+        del entries, rows
+        groups.sort(key=lambda sg: (-sg[1]["valor_total_cents"], sg[0]))
+        path, _ = _write_run(groups)
+        weakref.finalize(parts, _unlink, path)
+        runs.append(path)
+        del groups
+
+    out = SpillList(budget // 4 // ROW_BYTES)
+    merged = heapq.merge(*[_read_run(p) for p in runs], key=lambda sg: (-sg[1]["valor_total_cents"], sg[0]))
+    for _, group in merged:
+        out.append(group)
+    out.close()
+    for path in runs:
+        _unlink(path)
+    return out, {"particoes_duplicados": n_parts, "maior_particao": max(parts.sizes, default=0)}
+
+
+# ============================================================
+# 💽 AGREGADOS DA ANÁLISE FORA DA MEMÓRIA
+# ============================================================
+class SpilledProducts:
+    """
+    Consome os agregados por membro da análise (incremental.new_member),
+    como topk.BoundedProductRanking, mas sem perder nada:
+      prod  → products / excluded (SpillList, na ordem do ZIP)
+      dedup → SpillDict
+    """
+
+    def __init__(self, budget_mb: int):
+        budget = budget_mb * MB
+        self.budget_mb = budget_mb
+        # metade para os produtos, um quarto para os excluídos, um quarto para o dedup
+        self.products = SpillList(budget // 2 // ROW_BYTES)
+        self.excluded = SpillList(budget // 4 // ROW_BYTES)
+        self.dedup = SpillDict(budget // 4 // DEDUP_BYTES)
+        self._dup_stats: Dict[str, Any] = {}
+
+    def add_member(self, member: Dict[str, Any]) -> None:
+        for p in member["prod"]:
+            self.products.append(p)
+            if not p["st_correto"]:
+                self.excluded.append(p)
+        for key, (codigo, desc, n, cents) in member["dedup"].items():
+            self.dedup.add(key, codigo, desc, n, cents)
+
+    def finish(self) -> Tuple[SpillList, SpillList]:
+        """(produtos, excluídos) no formato da análise em memória."""
+        self.products.close()
+        self.excluded.close()
+        return self.products, self.excluded
+
+    def top_dedup_rows(self, k: int) -> List[Dict[str, Any]]:
+        """Candidatas do ranking com top (topk.top_k sobre o dedup), já na memória: só k linhas."""
+        return self.dedup.top_rows(k)
+
+    def duplicates(self) -> SpillList:
+        """produtos_duplicados completo, agrupado por partição em disco."""
+        out, self._dup_stats = spilled_duplicates(self.dedup, self.budget_mb)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "fora_da_memoria": True,
+            "orcamento_mb": self.budget_mb,
+            "produtos_em_disco": self.products.runs,
+            "excluidos_em_disco": self.excluded.runs,
+            "runs_dedup": self.dedup.runs,
+            "bytes_em_disco": self.products.bytes_on_disk + self.excluded.bytes_on_disk,
+            **self._dup_stats,
+        }
+
+
+def open_spill(xml_bytes: int) -> Optional[SpilledProducts]:
+    """Agregados em disco se o XML do ZIP passa do orçamento; None = análise em memória."""
+    budget = settings.ANALYSIS_MEMORY_BUDGET_MB
+    if budget <= 0 or xml_bytes <= budget * MB:
+        return None
+    logger.info(f"💽 Análise fora da memória: {xml_bytes / MB:.0f} MB de XML, orçamento {budget} MB")
+    return SpilledProducts(budget)
+
+
+if __name__ == "__main__":
+    import hashlib
+    import random
+    import resource
+    import subprocess
+    import sys
+    import time
+    import zipfile
+
+    ITEMS_PER_DOC = 50
+    MONO = ("REFRIGERANTE COLA {} LATA 350ML", "CERVEJA PILSEN {} LATA 350ML",
+            "AGUA MINERAL {} 500ML", "CIGARRO {} MACO 20UN")
+
+    def _item(pos: int, pid: int, cents: int) -> str:
+        # 80% monofásicos (o que vai para products/dedup), o resto mercearia
+        mono = pid % 5 != 0
+        desc = MONO[pid % len(MONO)].format(pid) if mono else f"FEIJAO CARIOCA {pid} 1KG"
+        st_ok = mono and pid % 4 == 0
+        cfop, csosn = ("5405", "500") if st_ok else ("5102", "102")
+        v = f"{cents / 100:.2f}"
+        return (f'<det nItem="{pos}"><prod><cProd>P{pid:06d}</cProd><xProd>{desc}</xProd>'
+                f'<NCM>{"22021000" if mono else "07133399"}</NCM><CFOP>{cfop}</CFOP><qCom>1.0000</qCom>'
+                f'<vUnCom>{v}</vUnCom><vProd>{v}</vProd></prod><imposto><ICMS><ICMSSN{csosn}>'
+                f'<CSOSN>{csosn}</CSOSN></ICMSSN{csosn}></ICMS></imposto></det>')
+
+    def _synthetic_zip(path: str, n_items: int) -> None:
+        """
+        ZIP sintético de NF-e: documentos de 50 itens, 70% de um catálogo de
+        30 mil produtos (Pareto) e 30% de cauda longa, ao longo de 7 anos.
+        """
+        rng = random.Random(7)
+        tail = max(n_items // 10, 30_000)
+        n_docs = max(n_items // ITEMS_PER_DOC, 1)
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+            for doc in range(n_docs):
+                ano = 2018 + doc * 7 // n_docs
+                itens, total = [], 0
+                for pos in range(1, ITEMS_PER_DOC + 1):
+                    pid = int(rng.paretovariate(1.1)) % 30_000 if rng.random() < 0.7 else 30_000 + rng.randrange(tail)
+                    cents = rng.randint(100, 50_000)
+                    total += cents
+                    itens.append(_item(pos, pid, cents))
+                xml = (f'<?xml version="1.0"?><nfeProc xmlns="http://www.portalfiscal.inf.br/nfe"><NFe>'
+                       f'<infNFe Id="NFe{doc:044d}"><ide><cNF>{doc}</cNF>'
+                       f'<dhEmi>{ano}-{doc % 12 + 1:02d}-15T10:00:00-03:00</dhEmi></ide>{"".join(itens)}'
+                       f'<total><ICMSTot><vNF>{total / 100:.2f}</vNF></ICMSTot></total></infNFe></NFe></nfeProc>')
+                zf.writestr(f"nfe/{doc}.xml", xml)
+
+    def _digest(result: Dict[str, Any]) -> str:
+        h = hashlib.sha256()
+        for name in ("products", "produtos_excluidos", "produtos_duplicados"):
+            for row in result[name]:
+                h.update(repr(sorted(row.items())).encode())
+            h.update(b"|")
+        return h.hexdigest()[:16]
+
+    def _run(modo: str, zip_path: str, budget_mb: int) -> None:
+        """Um processo por modo: o RSS de pico é só desta análise."""
+        from .analysis import run_analysis_from_bytes
+
+        # sem linhagem nem checkpoint: as duas execuções fazem o mesmo trabalho
+        settings.ANALYSIS_CACHE_ENABLED = False
+        settings.ANALYSIS_CHECKPOINT_ENABLED = False
+        settings.ANALYSIS_MEMORY_BUDGET_MB = budget_mb if modo == "disco" else 0
+        start = time.perf_counter()
+        with open(zip_path, "rb") as f:  # o ZIP é lido do disco, membro a membro
+            result = run_analysis_from_bytes(f)
+        digest = _digest(result)
+        elapsed = time.perf_counter() - start
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB no Linux
+        mem = result["memoria"]
+        extra = (f"  {mem['bytes_em_disco'] / MB:.0f} MB em disco, {mem['runs_dedup']} runs de dedup, "
+                 f"{mem['particoes_duplicados']} partições (maior: {mem['maior_particao']:,} descrições)"
+                 if mem.get("fora_da_memoria") else "")
+        print(f"  {modo:8s} {elapsed:6.1f}s  RSS pico {rss:7.0f} MB  {result['items']:,} itens, "
+              f"{len(result['produtos_duplicados']):,} descrições  resultado {digest}{extra}", flush=True)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--filho":
+        _run(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        sys.exit(0)
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    modos = sys.argv[2].split(",") if len(sys.argv) > 2 else ["memoria", "disco"]
+    budget = settings.ANALYSIS_MEMORY_BUDGET_MB or 64
+    with tempfile.TemporaryDirectory(prefix="spill-bench-") as tmp:
+        zip_path = os.path.join(tmp, "nfe.zip")
+        _synthetic_zip(zip_path, n)
+        with zipfile.ZipFile(zip_path) as zf:
+            xml_mb = sum(i.file_size for i in zf.infolist()) / MB
+        print(f"{n:,} itens sintéticos ({xml_mb:.0f} MB de XML, ZIP de {os.path.getsize(zip_path) / MB:.0f} MB), "
+              f"orçamento {budget} MB (um processo por modo, run_analysis_from_bytes)")
+        for modo in modos:
+            subprocess.run([sys.executable, "-m", "app.services.spill", "--filho", modo, zip_path, str(budget)],
+                           check=False)
@@ -0,0 +1,274 @@
+"""
+tax_periods.py
+---------------
+Apuração mês a mês, no mesmo recorte do PGDAS-D.
+
+O Simples Nacional é apurado por competência: a alíquota efetiva do mês
+depende do RBT12 (receita bruta dos 12 meses anteriores), e a exclusão da
+receita monofásica também é mensal. Aqui a receita e a receita excluída são
+agrupadas por mês e cada competência tem sua alíquota/imposto pago.
+
+O cálculo é incremental: alterar a receita de um mês só recalcula esse mês
+e os 12 seguintes (as janelas de RBT12 que o incluem).
+
+Alíquota/DAS informados para um mês sem NF-e no arquivo não geram economia:
+sem receita não há o que excluir, e o DAS inteiro viraria "economia". O mês
+sai com sem_receita=True (e fica fora do RBT12, que não conhece sua receita).
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, Set, Tuple
+import re
+
+from .money import apply_rate, cents_to_float, to_cents
+
+# ============================================================
+# 📋 ANEXO I (Comércio) — LC 123/2006, redação da LC 155/2016
+# ============================================================
+# (limite superior RBT12 em centavos, alíquota nominal, parcela a deduzir em centavos,
+#  participação de PIS + COFINS na alíquota efetiva)
+ANEXO_I: List[Tuple[int, Decimal, int, Decimal]] = [
+    (180_000_00,   Decimal("0.040"), 0,          Decimal("0.1550")),
+    (360_000_00,   Decimal("0.073"), 5_940_00,   Decimal("0.1550")),
+    (720_000_00,   Decimal("0.095"), 13_860_00,  Decimal("0.1550")),
+    (1_800_000_00, Decimal("0.107"), 22_500_00,  Decimal("0.1550")),
+    (3_600_000_00, Decimal("0.143"), 87_300_00,  Decimal("0.1550")),
+    (4_800_000_00, Decimal("0.190"), 378_000_00, Decimal("0.3440")),
+]
+
+ANEXOS = {"I": ANEXO_I}
+
+
+def faixa_anexo(rbt12_cents: int, anexo: str = "I") -> Tuple[int, Decimal, Decimal]:
+    """
+    Retorna (faixa, alíquota efetiva, participação PIS+COFINS) para o RBT12.
+    Efetiva = (RBT12 × nominal − parcela a deduzir) / RBT12.
+    """
+    tabela = ANEXOS[anexo]
+    for i, (limite, nominal, deduzir, pis_cofins) in enumerate(tabela, start=1):
+        if rbt12_cents <= limite:
+            break
+    if rbt12_cents <= 0:
+        return 1, tabela[0][1], tabela[0][3]
+    efetiva = (Decimal(rbt12_cents) * nominal - Decimal(deduzir)) / Decimal(rbt12_cents)
+    return i, efetiva, pis_cofins
+
+
+# ============================================================
+# 🗓️ COMPETÊNCIAS
+# ============================================================
+def shift_month(month: str, delta: int) -> str:
+    year, mon = int(month[:4]), int(month[5:7])
+    idx = year * 12 + (mon - 1) + delta
+    return f"{idx // 12:04d}-{idx % 12 + 1:02d}"
+
+
+# 'AAAA-MM:valor' — entradas separadas por ';' ou ','. O separador só conta
+# antes do próximo 'AAAA-MM:', então '2024-03:6,5,2024-04:7' lê 6,5 e 7.
+_ENTRY = re.compile(r"\s*(\d{4}-\d{2})\s*:\s*(.*?)\s*(?:[;,]\s*(?=\d{4}-\d{2}\s*:)|[;,]?\s*$)")
+_MONEY = re.compile(r"^(?:R\$)?\s*\d[\d.]*(?:,\d+)?$")
+
+
+def parse_monthly_param(raw: Optional[str], percent: bool = False) -> Dict[str, Any]:
+    """
+    Lê parâmetros mensais no formato 'AAAA-MM:valor;AAAA-MM:valor' (ou com ',').
+    percent=True converte '6,5' / '6.5' / '0.065' em fração.
+    Entrada malformada → ValueError (as rotas respondem 422).
+    """
+    out: Dict[str, Any] = {}
+    if not raw or not raw.strip():
+        return out
+    pos = 0
+    while pos < len(raw):
+        m = _ENTRY.match(raw, pos)
+        if m is None or m.end() == pos:
+            raise ValueError(f"entrada mensal inválida perto de {raw[pos:pos + 20]!r} (use AAAA-MM:valor;AAAA-MM:valor)")
+        pos = m.end()
+        month, value = m.group(1), m.group(2)
+        if not 1 <= int(month[5:7]) <= 12:
+            raise ValueError(f"competência inválida: {month!r}")
+        if percent:
+            try:
+                v = Decimal(value.replace("%", "").strip().replace(",", "."))
+            except InvalidOperation:
+                v = None
+            if v is None or not v.is_finite() or v < 0 or v > 100:
+                raise ValueError(f"alíquota inválida em {month}: {value!r}")
+            out[month] = v / 100 if v >= 1 else v
+        else:
+            if not _MONEY.match(value):
+                raise ValueError(f"valor inválido em {month}: {value!r}")
+            out[month] = to_cents(value)
+    return out
+
+
+# ============================================================
+# 🧮 LIVRO DE PERÍODOS
+# ============================================================
+@dataclass
+class _Month:
+    receita: int = 0      # centavos
+    excluida: int = 0     # centavos
+    aliquota: Optional[Decimal] = None
+    imposto_pago: Optional[int] = None  # centavos
+    com_receita: bool = False  # há NF-e do mês no arquivo (add_revenue)
+
+
+class PeriodLedger:
+    """
+    ledger = PeriodLedger(aliquota_padrao=Decimal("0.06"))
+    ledger.add_revenue("2024-03", receita_cents, excluida_cents)
+    ledger.set_month_inputs("2024-03", imposto_pago=123456)
+    ledger.results()  # lista por competência, recalculando só o que mudou
+    """
+
+    def __init__(self, anexo: str = "I", aliquota_padrao: Optional[Decimal] = None):
+        self.anexo = anexo
+        self.aliquota_padrao = aliquota_padrao
+        self._months: Dict[str, _Month] = {}
+        self._historico: Dict[str, int] = {}  # receita de meses fora do arquivo (só para RBT12)
+        self._cache: Dict[str, Dict[str, Any]] = {}
+        self._dirty: Set[str] = set()
+
+    # ---------- entradas ----------
+    def _touch_window(self, month: str) -> None:
+        # a receita do mês entra no RBT12 dos 12 meses seguintes
+        self._dirty.add(month)
+        for k in range(1, 13):
+            self._dirty.add(shift_month(month, k))
+
+    def add_revenue(self, month: str, receita_cents: int, excluida_cents: int = 0) -> None:
+        m = self._months.setdefault(month, _Month())
+        m.receita += int(receita_cents)
+        m.excluida += int(excluida_cents)
+        m.com_receita = True
+        self._touch_window(month)
+
+    def set_prior_revenue(self, month: str, receita_cents: int) -> None:
+        """Receita de competências anteriores ao arquivo (para o RBT12 dos primeiros meses)."""
+        self._historico[month] = int(receita_cents)
+        self._touch_window(month)
+
+    def set_month_inputs(self, month: str, aliquota: Optional[Any] = None,
+                         imposto_pago: Optional[Any] = None) -> None:
+        m = self._months.setdefault(month, _Month())
+        if aliquota is not None:
+            m.aliquota = aliquota if isinstance(aliquota, Decimal) else Decimal(str(aliquota))
+        if imposto_pago is not None:
+            m.imposto_pago = imposto_pago if isinstance(imposto_pago, int) else to_cents(imposto_pago)
+        self._dirty.add(month)
+
+    # ---------- cálculo ----------
+    def _receita(self, month: str) -> Optional[int]:
+        if month in self._historico:
+            return self._historico[month]
+        m = self._months.get(month)
+        return m.receita if m is not None and m.com_receita else None
+
+    def rbt12(self, month: str) -> Tuple[int, bool]:
+        """
+        RBT12 do mês e se foi estimado. Sem os 12 meses anteriores, segue a
+        regra de início de atividade: média dos meses disponíveis × 12
+        (no primeiro mês, a própria receita × 12).
+        """
+        anteriores = [self._receita(shift_month(month, -k)) for k in range(1, 13)]
+        conhecidos = [r for r in anteriores if r is not None]
+        if len(conhecidos) == 12:
+            return sum(conhecidos), False
+        if conhecidos:
+            return sum(conhecidos) * 12 // len(conhecidos), True
+        return (self._receita(month) or 0) * 12, True
+
+    def _compute(self, month: str) -> Dict[str, Any]:
+        m = self._months[month]
+        rbt12, estimado = self.rbt12(month)
+        faixa, aliq_tabela, pis_cofins = faixa_anexo(rbt12, self.anexo)
+
+        if m.aliquota is not None:
+            aliq, fonte = m.aliquota, "informada"
+        elif m.imposto_pago is not None and m.receita > 0:
+            aliq, fonte = Decimal(m.imposto_pago) / Decimal(m.receita), "imposto_pago"
+        elif self.aliquota_padrao is not None:
+            aliq, fonte = self.aliquota_padrao, "global"
+        else:
+            aliq, fonte = aliq_tabela, "anexo"
+
+        imposto_devido = apply_rate(m.receita, aliq)
+        imposto_pago = m.imposto_pago if m.imposto_pago is not None else imposto_devido
+        base_corrigida = m.receita - m.excluida
+        imposto_corrigido = apply_rate(base_corrigida, aliq)
+        sem_receita = not m.com_receita
+
+        return {
+            "competencia": month,
+            "receita_cents": m.receita,
+            "receita_excluida_cents": m.excluida,
+            "base_corrigida_cents": base_corrigida,
+            "rbt12_cents": rbt12,
+            "rbt12_estimado": estimado,
+            "faixa": faixa,
+            "aliquota_tabela": aliq_tabela,
+            "aliquota": aliq,
+            "fonte_aliquota": fonte,
+            "imposto_pago_cents": imposto_pago,
+            "imposto_corrigido_cents": imposto_corrigido,
+            "economia_cents": 0 if sem_receita else max(0, imposto_pago - imposto_corrigido),
+            # só a parcela de PIS/COFINS do DAS sobre a receita monofásica
+            "economia_pis_cofins_cents": apply_rate(m.excluida, aliq * pis_cofins),
+            "sem_receita": sem_receita,
+        }
+
+    def results(self) -> List[Dict[str, Any]]:
+        for month in sorted(self._dirty):
+            if month in self._months:
+                self._cache[month] = self._compute(month)
+        self._dirty.clear()
+        return [self._cache[month] for month in sorted(self._months)]
+
+    def summary(self) -> Dict[str, Any]:
+        todos = self.results()
+        rows = [r for r in todos if not r["sem_receita"]]
+        economia = sum(r["economia_cents"] for r in rows)
+        n = len(rows)
+        return {
+            "meses": n,
+            "meses_sem_receita": [r["competencia"] for r in todos if r["sem_receita"]],
+            "economia_cents": economia,
+            "economia_pis_cofins_cents": sum(r["economia_pis_cofins_cents"] for r in rows),
+            "economia_media_mensal_cents": (economia // n) if n else 0,
+        }
+
+
+# ============================================================
+# 🔚 BORDA DA API
+# ============================================================
+def period_to_api(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "competencia": row["competencia"],
+        "receita": cents_to_float(row["receita_cents"]),
+        "receita_excluida": cents_to_float(row["receita_excluida_cents"]),
+        "base_corrigida": cents_to_float(row["base_corrigida_cents"]),
+        "rbt12": cents_to_float(row["rbt12_cents"]),
+        "rbt12_estimado": row["rbt12_estimado"],
+        "faixa": row["faixa"],
+        "aliquota_tabela": round(float(row["aliquota_tabela"]), 6),
+        "aliquota": round(float(row["aliquota"]), 6),
+        "fonte_aliquota": row["fonte_aliquota"],
+        "imposto_pago": cents_to_float(row["imposto_pago_cents"]),
+        "imposto_corrigido": cents_to_float(row["imposto_corrigido_cents"]),
+        "economia": cents_to_float(row["economia_cents"]),
+        "economia_pis_cofins": cents_to_float(row["economia_pis_cofins_cents"]),
+        "sem_receita": row["sem_receita"],
+    }
+
+
+def summary_to_api(summary: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "meses": summary["meses"],
+        "meses_sem_receita": summary["meses_sem_receita"],
+        "economia": cents_to_float(summary["economia_cents"]),
+        "economia_pis_cofins": cents_to_float(summary["economia_pis_cofins_cents"]),
+        "economia_media_mensal": cents_to_float(summary["economia_media_mensal_cents"]),
+    }
@@ -0,0 +1,386 @@
+"""
+tfidf_matcher.py
+-----------------
+Segundo motor de classificação: TF-IDF de n-gramas de caracteres.
+
+O JsonMatcher é regex de palavra-chave + token_sort_ratio item a item.
+Aqui cada descrição vira um vetor esparso de n-gramas de 3 a 5 caracteres
+(dentro das palavras), com TF sublinear, IDF e norma L2. O treino usa:
+
+  - as palavras-chave do dicionário (monofasicos.json), por categoria
+  - as correções por descrição confirmadas pelo contador (overrides.py);
+    correções "não monofásico" formam a classe negativa
+
+Cada categoria vira um centróide; classificar um lote é um produto
+esparso × denso (lote × n-gramas) @ (n-gramas × categorias) e um argmax.
+Sem GPU: SciPy quando instalado, senão NumPy puro (bincount por coluna).
+
+Escolhido por requisição (motor=tfidf nas rotas de análise); NCM, categorias
+e versão do dicionário continuam vindo do JsonMatcher.
+
+Benchmark: python -m app.services.tfidf_matcher [N_ITENS] [corpus.csv]
+(corpus: descricao;categoria, categoria vazia = não monofásico). A avaliação
+é sempre em descrições fora do treino: sem corpus, ~1/4 das palavras-chave
+de cada categoria sai do dicionário dos dois motores e vira o corpus
+sintético; com corpus, metade das linhas treina o TF-IDF (como correções do
+contador) e a outra metade é avaliada.
+"""
+
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import hashlib
+import math
+import re
+import threading
+
+import numpy as np
+
+try:  # opcional: produto esparso nativo
+    from scipy import sparse as _sparse
+except ImportError:
+    _sparse = None
+
+from .dictionary_artifact import norm_text
+
+NGRAM_MIN = 3
+NGRAM_MAX = 5
+MIN_SCORE = 0.10        # cosseno mínimo com o centróide (TFIDF_MIN_SCORE)
+CACHE_MAX = 100_000     # descrições classificadas guardadas (zera ao estourar)
+NEGATIVE = "__nenhum__"
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def canonical(text: str) -> str:
+    return " ".join(_NON_ALNUM.sub(" ", norm_text(text)).split())
+
+
+def char_ngrams(text: str) -> Dict[str, int]:
+    """Contagem dos n-gramas de cada palavra com bordas (' skol ' → ' sk', 'sko', ...)."""
+    counts: Dict[str, int] = {}
+    for word in text.split():
+        padded = f" {word} "
+        for n in range(NGRAM_MIN, NGRAM_MAX + 1):
+            for i in range(max(1, len(padded) - n + 1)):
+                g = padded[i:i + n]
+                counts[g] = counts.get(g, 0) + 1
+    return counts
+
+
+# ============================================================
+# 🧮 MATRIZ ESPARSA (CSR) MÍNIMA
+# ============================================================
+class SparseRows:
+    """Linhas CSR (indptr, indices, data) com produto por matriz densa."""
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, n_cols: int):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = (len(indptr) - 1, n_cols)
+
+    def dot(self, dense: np.ndarray) -> np.ndarray:
+        n_rows = self.shape[0]
+        if _sparse is not None:
+            m = _sparse.csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+            return np.asarray(m @ dense)
+        rows = np.repeat(np.arange(n_rows), np.diff(self.indptr))
+        out = np.empty((n_rows, dense.shape[1]), dtype=np.float64)
+        for j in range(dense.shape[1]):
+            out[:, j] = np.bincount(rows, weights=self.data * dense[self.indices, j], minlength=n_rows)
+        return out
+
+
+class CharTfidf:
+    """Vetorizador: vocabulário e IDF aprendidos no treino."""
+
+    def __init__(self, docs: Sequence[str]):
+        df: Dict[str, int] = {}
+        for doc in docs:
+            for g in char_ngrams(doc):
+                df[g] = df.get(g, 0) + 1
+        n = len(docs)
+        self.vocab: Dict[str, int] = {g: i for i, g in enumerate(sorted(df))}
+        self.idf = np.array([math.log((1 + n) / (1 + df[g])) + 1 for g in sorted(df)])
+        # n-grama nunca visto: IDF máximo, só entra na norma (não casa com centróide nenhum)
+        self.unseen_idf = math.log(1 + n) + 1
+
+    def transform(self, texts: Iterable[str]) -> SparseRows:
+        indptr, indices, data = [0], [], []
+        vocab, idf = self.vocab, self.idf
+        for text in texts:
+            row_idx: List[int] = []
+            row_val: List[float] = []
+            norm2 = 0.0
+            for g, tf in char_ngrams(text).items():
+                w = 1.0 + math.log(tf)
+                col = vocab.get(g)
+                if col is None:
+                    norm2 += (w * self.unseen_idf) ** 2
+                    continue
+                w *= idf[col]
+                norm2 += w * w
+                row_idx.append(col)
+                row_val.append(w)
+            inv = 1.0 / math.sqrt(norm2) if norm2 else 0.0
+            indices.extend(row_idx)
+            data.extend(v * inv for v in row_val)
+            indptr.append(len(indices))
+        return SparseRows(
+            np.asarray(indptr, dtype=np.int64),
+            np.asarray(indices, dtype=np.int64),
+            np.asarray(data, dtype=np.float64),
+            len(vocab),
+        )
+
+
+# ============================================================
+# 🎯 CLASSIFICADOR POR CENTRÓIDES
+# ============================================================
+class TfidfMatcher:
+    """
+    Mesma interface usada pela análise (classify, is_monofasico,
+    validate_ncm_for_category, categorias, version) + classify_many para lotes.
+    """
+
+    def __init__(self, base, labeled: Iterable[Tuple[str, Optional[str]]] = (),
+                 min_score: float = MIN_SCORE, labels_version: str = ""):
+        self.base = base
+        self.categorias = base.categorias
+        self.min_score = min_score
+
+        texts: List[str] = []
+        classes: List[str] = []
+        for cat, words in base.categorias.items():
+            for w in words:
+                texts.append(canonical(w))
+                classes.append(cat)
+        for desc, cat in labeled:
+            texts.append(canonical(desc))
+            classes.append(cat if cat is not None else NEGATIVE)
+        if not texts:
+            raise ValueError("sem exemplos para treinar o TF-IDF")
+
+        self.classes: List[str] = sorted(set(classes))
+        self.vectorizer = CharTfidf(texts)
+        X = self.vectorizer.transform(texts)
+        self.centroids = self._centroids(X, [self.classes.index(c) for c in classes])
+
+        self.version = "tfidf-" + hashlib.sha1(
+            f"{base.version}:{labels_version}:{NGRAM_MIN}-{NGRAM_MAX}:{min_score}".encode()
+        ).hexdigest()[:12]
+        # compartilhado entre as análises do mesmo modelo (get_tfidf_matcher): leituras
+        # e o clear ao estourar ficam sob o lock
+        self._cache: Dict[str, Optional[Tuple[str, int]]] = {}
+        self._cache_lock = threading.Lock()
+
+    def _centroids(self, X: SparseRows, labels: List[int]) -> np.ndarray:
+        """(n-gramas × classes): média dos vetores de cada classe, normalizada."""
+        C = np.zeros((X.shape[1], len(self.classes)), dtype=np.float64)
+        for r, label in enumerate(labels):
+            lo, hi = X.indptr[r], X.indptr[r + 1]
+            C[X.indices[lo:hi], label] += X.data[lo:hi]
+        norms = np.linalg.norm(C, axis=0)
+        norms[norms == 0] = 1.0
+        return C / norms
+
+    # ---- classificação ----
+    def scores(self, texts: Sequence[str]) -> np.ndarray:
+        """Cossenos (len(texts) × classes) de textos já canônicos: um produto só."""
+        return self.vectorizer.transform(texts).dot(self.centroids)
+
+    def classify_many(self, texts: Sequence[str]) -> List[Optional[Tuple[str, int]]]:
+        """Classifica um lote; descrições repetidas ou já vistas não são recalculadas."""
+        canon = [canonical(t) for t in texts]
+        distinct = dict.fromkeys(canon)
+        with self._cache_lock:
+            found = {t: self._cache[t] for t in distinct if t in self._cache}
+        todo = [t for t in distinct if t not in found]
+        if todo:
+            sims = self.scores(todo)
+            best = sims.argmax(axis=1)
+            for t, b, row in zip(todo, best, sims):
+                cat = self.classes[b]
+                score = float(row[b])
+                found[t] = None if cat == NEGATIVE or score < self.min_score else (cat, int(round(score * 100)))
+            with self._cache_lock:
+                if len(self._cache) + len(todo) > CACHE_MAX:
+                    self._cache.clear()
+                self._cache.update((t, found[t]) for t in todo)
+        return [found[t] for t in canon]
+
+    def classify(self, text: str) -> Optional[Tuple[str, int]]:
+        return self.classify_many([text])[0]
+
+    # ---- delegados ao dicionário ----
+    def is_monofasico(self, categoria: str) -> bool:
+        return self.base.is_monofasico(categoria)
+
+    def ncm_category(self, ncm: str) -> Optional[str]:
+        return self.base.ncm_category(ncm)
+
+    def validate_ncm_for_category(self, ncm: str, categoria: str) -> dict:
+        return self.base.validate_ncm_for_category(ncm, categoria)
+
+
+# ============================================================
+# 💤 INSTÂNCIAS POR (DICIONÁRIO, CORREÇÕES)
+# ============================================================
+_models: Dict[Tuple[str, str], TfidfMatcher] = {}
+_models_lock = threading.Lock()
+_MODELS_MAX = 32
+
+
+def _labeled_examples(client_id: Optional[int]) -> List[Tuple[str, Optional[str]]]:
+    """Correções por descrição (globais + do cliente) como exemplos rotulados."""
+    from .overrides import get_override_index
+
+    index = get_override_index(client_id)
+    return [(valor, cat) for (tipo, valor), cat in index.items() if tipo == "descricao"]
+
+
+def get_tfidf_matcher(client_id: Optional[int] = None) -> TfidfMatcher:
+    """Modelo treinado para o dicionário atual + correções do cliente (em cache)."""
+    from .ai_matcher import get_matcher
+    from .overrides import override_version
+
+    from app.config import settings
+
+    base = get_matcher()
+    key = (base.version, override_version(client_id))
+    model = _models.get(key)
+    if model is None:
+        model = TfidfMatcher(base, _labeled_examples(client_id),
+                             min_score=settings.TFIDF_MIN_SCORE, labels_version=key[1])
+        with _models_lock:
+            if len(_models) >= _MODELS_MAX:
+                _models.clear()
+            _models[key] = model
+    return model
+
+
+# ============================================================
+# 🏁 BENCHMARK (regras × TF-IDF)
+# ============================================================
+_NEGATIVOS = [
+    "ARROZ TIPO 1 5KG", "FEIJAO CARIOCA 1KG", "PIZZA CALABRESA", "SABONETE 90G", "DETERGENTE 500ML",
+    "PAO DE FORMA", "LEITE INTEGRAL 1L", "CAFE TORRADO 500G", "BISCOITO RECHEADO", "MACARRAO ESPAGUETE",
+    "OLEO DE SOJA 900ML", "ACUCAR REFINADO 1KG", "PAPEL HIGIENICO 12UN", "SUCO DE UVA INTEGRAL",
+    "IOGURTE MORANGO", "QUEIJO MUSSARELA KG", "PRESUNTO FATIADO", "SHAMPOO 350ML", "ESPONJA DUPLA FACE",
+    "CHOCOLATE AO LEITE", "MOLHO DE TOMATE", "SAL REFINADO 1KG", "FARINHA DE TRIGO", "MARGARINA 500G",
+]
+_RUIDO = ["", "LATA 350ML", "PET 2L", "600ML", "LONG NECK", "CX 12UN", "1L", "MACO 20UN", "GARRAFA 750ML"]
+
+
+def sample_corpus(categorias: Dict[str, List[str]], n: int, seed: int = 7) -> List[Tuple[str, Optional[str]]]:
+    """Corpus rotulado sintético: palavra-chave com ruído/erro de digitação + negativos."""
+    import random
+
+    rng = random.Random(seed)
+    pos = [(w, cat) for cat, words in categorias.items() for w in words]
+    out: List[Tuple[str, Optional[str]]] = []
+    for i in range(n):
+        if i % 3 == 0:
+            out.append((f"{rng.choice(_NEGATIVOS)} {rng.choice(_RUIDO)}".strip(), None))
+            continue
+        word, cat = rng.choice(pos)
+        word = word.upper()
+        if len(word) > 5 and rng.random() < 0.3:  # erro de digitação: troca duas letras
+            k = rng.randrange(1, len(word) - 2)
+            word = word[:k] + word[k + 1] + word[k] + word[k + 2:]
+        out.append((f"{word} {rng.choice(_RUIDO)}".strip(), cat))
+    return out
+
+
+def split_keywords(categorias: Dict[str, List[str]], holdout: float = 0.25,
+                   seed: int = 7) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+    """
+    (treino, avaliação): ~holdout das palavras-chave de cada categoria com
+    duas ou mais ficam só na avaliação; as demais continuam no dicionário.
+    """
+    import random
+
+    rng = random.Random(seed)
+    train: Dict[str, List[str]] = {}
+    test: Dict[str, List[str]] = {}
+    for cat, words in categorias.items():
+        words = sorted(set(words))
+        rng.shuffle(words)
+        k = max(1, round(len(words) * holdout)) if len(words) > 1 else 0
+        train[cat] = words[k:]
+        if k:
+            test[cat] = words[:k]
+    return train, test
+
+
+def split_corpus(corpus: Sequence[Tuple[str, Optional[str]]]) -> Tuple[List[Tuple[str, Optional[str]]],
+                                                                       List[Tuple[str, Optional[str]]]]:
+    """(treino, avaliação) pela descrição canônica: a mesma descrição nunca cai nos dois lados."""
+    train, test = [], []
+    for desc, cat in corpus:
+        h = hashlib.sha1(canonical(desc).encode()).digest()[0]
+        (train if h % 2 == 0 else test).append((desc, cat))
+    return train, test
+
+
+def _metrics(pred: List[Optional[str]], gold: List[Optional[str]]) -> Dict[str, float]:
+    tp = sum(1 for p, g in zip(pred, gold) if p is not None and p == g)
+    n_pred = sum(1 for p in pred if p is not None)
+    n_gold = sum(1 for g in gold if g is not None)
+    precision = tp / n_pred if n_pred else 0.0
+    recall = tp / n_gold if n_gold else 0.0
+    return {"precision": precision, "recall": recall}
+
+
+if __name__ == "__main__":
+    import csv
+    import json
+    import os
+    import sys
+    import tempfile
+    import time
+
+    from .ai_matcher import JsonMatcher
+    from .dictionary_artifact import NCM_PATH
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    full = JsonMatcher()
+    with tempfile.TemporaryDirectory() as tmp:
+        if len(sys.argv) > 2:
+            # corpus real: o dicionário inteiro nos dois motores, metade das linhas como correções
+            with open(sys.argv[2], encoding="utf-8-sig") as f:
+                rows = [(r["descricao"], norm_text(r.get("categoria") or "") or None)
+                        for r in csv.DictReader(f, delimiter=";")]
+            labeled, corpus = split_corpus(rows)
+            base = full
+            origem = f"{sys.argv[2]}: {len(labeled)} linhas de treino"
+        else:
+            # sintético: as palavras-chave avaliadas saem do dicionário dos dois motores
+            train, test = split_keywords(full.categorias)
+            mono_path = os.path.join(tmp, "monofasicos.json")
+            with open(mono_path, "w", encoding="utf-8") as f:
+                json.dump(train, f, ensure_ascii=False)
+            base = JsonMatcher(mono_path, NCM_PATH, os.path.join(tmp, "artifact.pkl"))
+            labeled, corpus = [], sample_corpus(test, n)
+            origem = f"{sum(map(len, test.values()))} palavras-chave fora do dicionário de treino"
+    texts = [t for t, _ in corpus]
+    gold = [c for _, c in corpus]
+
+    start = time.perf_counter()
+    regras = []
+    for t in texts:
+        cat, _, _ = base.explain(t)  # sem cache: mede o custo real por item
+        regras.append(cat)
+    t_regras = time.perf_counter() - start
+
+    model = TfidfMatcher(base, labeled)
+    start = time.perf_counter()
+    tfidf = [hit[0] if hit else None for hit in model.classify_many(texts)]
+    t_tfidf = time.perf_counter() - start
+
+    print(f"{len(texts)} itens avaliados ({origem}), {len(set(texts))} descrições distintas, "
+          f"{len(model.vectorizer.vocab)} n-gramas, esparso: {'scipy' if _sparse else 'numpy'}")
+    for nome, pred, secs in (("regras (JsonMatcher)", regras, t_regras), ("tfidf", tfidf, t_tfidf)):
+        m = _metrics(pred, gold)
+        print(f"{nome:22s} precisão {m['precision']:.3f}  recall {m['recall']:.3f}  "
+              f"{len(texts) / secs:,.0f} itens/s")
@@ -0,0 +1,305 @@
+"""
+topk.py
+--------
+Rankings (Top-K) sem ordenar tudo e com memória limitada.
+
+O dashboard mostra os maiores produtos duplicados, mas a análise ordenava o
+dedup_map inteiro (200 mil descrições num ZIP grande) e mandava tudo. Aqui:
+
+  - top_k / TopK: heap de tamanho K, O(n log K) em vez de ordenar O(n log n)
+  - CountMinSketch: contagem aproximada de ocorrências em memória fixa
+    (largura x profundidade); nunca subestima, erro ≤ 2N/largura com
+    probabilidade ≥ 1 - 2^-profundidade
+  - SpaceSaving: heavy hitters por valor com no máximo `capacidade` chaves;
+    toda chave com valor total > N/capacidade fica retida. Para as retidas,
+    a soma desde a entrada é exata; `erro` é o quanto pode faltar (0 = exata)
+
+Modos do ranking (resolve_ranking, parâmetro ?ranking= do dashboard):
+  completo   tudo, ordenado (comportamento original)
+  topk       agregação exata; só os K maiores grupos são selecionados/agrupados
+  limitado   streaming: SpaceSaving + CountMinSketch, sem guardar o mapa de
+             descrições nem a lista de produtos; memória fixa, valores com
+             erro máximo informado
+
+Benchmark: python -m app.services.topk [N_DESCRICOES] [K]
+"""
+
+from __future__ import annotations
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+import heapq
+import itertools
+import zlib
+
+from app.config import settings
+
+RANKINGS = ("completo", "topk", "limitado")
+CANDIDATES_PER_GROUP = 4   # topk: agrupa quase duplicados entre os 4·K maiores
+
+
+def resolve_ranking(ranking: Optional[str], top: Optional[int] = None) -> Tuple[str, Optional[int]]:
+    """(modo, K) da requisição; None = RANKING_MODE / RANKING_TOP_K. ValueError se desconhecido."""
+    modo = (ranking or settings.RANKING_MODE or "completo").strip().lower()
+    if modo not in RANKINGS:
+        raise ValueError(f"ranking inválido: {modo!r} (use {', '.join(RANKINGS)})")
+    if modo == "completo":
+        return modo, None
+    k = int(top or settings.RANKING_TOP_K)
+    if k < 1:
+        raise ValueError("top deve ser ≥ 1")
+    return modo, k
+
+
+# ============================================================
+# 🔝 TOP-K EXATO
+# ============================================================
+def top_k(rows: Iterable[Any], k: int, key: Callable[[Any], Any]) -> List[Any]:
+    """Os k maiores por `key`, em ordem decrescente (heap de tamanho k)."""
+    return heapq.nlargest(k, rows, key=key)
+
+
+class TopK:
+    """Top-K em streaming: push(score, item) guarda só os K maiores."""
+
+    def __init__(self, k: int):
+        self.k = k
+        self._heap: List[Tuple[Any, int, Any]] = []
+        self._seq = itertools.count()
+        self.seen = 0
+
+    def push(self, score, item) -> None:
+        self.seen += 1
+        # desempate pela ordem de chegada: o primeiro visto fica na frente
+        entry = (score, -next(self._seq), item)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+
+    def items(self) -> List[Any]:
+        return [item for _, _, item in sorted(self._heap, key=lambda e: e[:2], reverse=True)]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+# ============================================================
+# 📐 CONTAGEM APROXIMADA
+# ============================================================
+def _key_bytes(key: Hashable) -> bytes:
+    if isinstance(key, tuple):
+        return "\x1f".join(map(str, key)).encode()
+    return str(key).encode()
+
+
+class CountMinSketch:
+    """
+    Contagens em largura x profundidade inteiros, com atualização conservadora.
+    Listas Python e não NumPy: são poucas células por chamada e o custo por
+    chamada do NumPy dominaria.
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.table = [[0] * width for _ in range(depth)]
+        self.total = 0
+
+    def _cells(self, key: Hashable) -> List[int]:
+        data = _key_bytes(key)
+        h1 = zlib.crc32(data)
+        h2 = zlib.adler32(data) | 1  # duplo hashing: h1 + i·h2
+        width = self.width
+        return [(h1 + i * h2) % width for i in range(self.depth)]
+
+    def add(self, key: Hashable, n: int = 1) -> None:
+        cells = self._cells(key)
+        rows = self.table
+        values = [row[c] for row, c in zip(rows, cells)]
+        # conservadora: só sobe as células abaixo do novo mínimo (erro menor, mesma garantia)
+        target = min(values) + n
+        for row, c, v in zip(rows, cells, values):
+            if v < target:
+                row[c] = target
+        self.total += n
+
+    def estimate(self, key: Hashable) -> int:
+        return min(row[c] for row, c in zip(self.table, self._cells(key)))
+
+    @property
+    def max_error(self) -> float:
+        """Erro aditivo garantido com probabilidade ≥ 1 - 2^-profundidade."""
+        return 2.0 * self.total / self.width
+
+
+# ============================================================
+# 🏋️ HEAVY HITTERS (SPACE-SAVING)
+# ============================================================
+class SpaceSaving:
+    """
+    Space-Saving ponderado (Metwally et al.): no máximo `capacity` chaves.
+    Chave nova com a tabela cheia toma o lugar da de menor peso e herda
+    esse peso como erro. Por chave: peso (estimativa ≥ real), erro, soma e
+    contagem exatas desde a entrada, e um payload (rótulo para a resposta).
+
+    O heap tem uma entrada por chave com o peso da última vez em que foi
+    empurrada; como pesos só crescem, na remoção uma entrada desatualizada é
+    reempurrada com o peso atual (atualizar uma chave não mexe no heap).
+    """
+
+    __slots__ = ("capacity", "_table", "_heap", "_seq", "total")
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self._table: Dict[Hashable, list] = {}     # chave → [peso, erro, soma, n, payload]
+        self._heap: List[Tuple[int, int, Hashable]] = []  # (peso visto, seq, chave)
+        self._seq = itertools.count()
+        self.total = 0
+
+    def add(self, key: Hashable, weight: int, n: int = 1, payload: Any = None) -> None:
+        w = max(int(weight), 0)
+        self.total += w
+        entry = self._table.get(key)
+        if entry is None:
+            error = 0
+            if len(self._table) >= self.capacity:
+                error = self._evict()
+            entry = self._table[key] = [error, error, 0, 0, payload]
+            heapq.heappush(self._heap, (error + w, next(self._seq), key))
+        entry[0] += w
+        entry[2] += weight
+        entry[3] += n
+
+    def _evict(self) -> int:
+        while True:
+            weight, _, key = heapq.heappop(self._heap)
+            current = self._table[key][0]
+            if current == weight:
+                del self._table[key]
+                return weight
+            heapq.heappush(self._heap, (current, next(self._seq), key))
+
+    def top(self, k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Chaves retidas: {'chave', 'peso', 'erro', 'soma', 'n', 'payload', 'exato'},
+        ordenadas pelo valor garantido (peso - erro): uma chave recém-entrada
+        herda o erro da removida e não deve passar à frente das realmente pesadas.
+        """
+        rows = [
+            {"chave": key, "peso": e[0], "erro": e[1], "soma": e[2], "n": e[3], "payload": e[4], "exato": e[1] == 0}
+            for key, e in self._table.items()
+        ]
+        order = lambda r: (r["peso"] - r["erro"], r["peso"])  # noqa: E731
+        return top_k(rows, k, key=order) if k else sorted(rows, key=order, reverse=True)
+
+    @property
+    def guaranteed_threshold(self) -> float:
+        """Toda chave com peso total acima disto está retida."""
+        return self.total / self.capacity if self.capacity else float("inf")
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+
+# ============================================================
+# 🧾 RANKING DE PRODUTOS (modo limitado)
+# ============================================================
+class BoundedProductRanking:
+    """
+    Consome os agregados por membro da análise (incremental.new_member) sem
+    guardar o mapa de descrições nem a lista de produtos:
+      dedup → SpaceSaving por valor + CountMinSketch de ocorrências
+      prod  → TopK por valor (todos os monofásicos e os com receita excluída)
+    """
+
+    def __init__(self, k: int, capacity: Optional[int] = None,
+                 width: Optional[int] = None, depth: Optional[int] = None):
+        self.k = k
+        self.values = SpaceSaving(max(capacity or settings.RANKING_CAPACITY, k))
+        self.counts = CountMinSketch(width or settings.RANKING_SKETCH_WIDTH, depth or settings.RANKING_SKETCH_DEPTH)
+        self.products = TopK(k)
+        self.excluded = TopK(k)
+
+    def add_member(self, member: Dict[str, Any]) -> None:
+        for key, (codigo, desc, n, cents) in member["dedup"].items():
+            self.counts.add(key, n)
+            self.values.add(key, cents, n, payload=(codigo, desc))
+        for p in member["prod"]:
+            self.products.push(p["valor_total_cents"], p)
+            if not p["st_correto"]:
+                self.excluded.push(p["valor_total_cents"], p)
+
+    def dedup_rows(self) -> List[Dict[str, Any]]:
+        """Linhas no formato do dedup_map; as inexatas vêm com 'aproximado' e o erro máximo."""
+        rows = []
+        for r in self.values.top():
+            codigo, desc = r["payload"]
+            row = {"codigo": codigo, "descricao": desc, "valor_total_cents": r["soma"]}
+            if r["exato"]:
+                row["ocorrencias"] = r["n"]
+            else:
+                row["ocorrencias"] = self.counts.estimate(r["chave"])
+                row["aproximado"] = True
+                row["erro_max_cents"] = r["erro"]
+            rows.append(row)
+        return rows
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "capacidade": self.values.capacity,
+            "descricoes_retidas": len(self.values),
+            "valor_garantido_acima_de_cents": int(self.values.guaranteed_threshold),
+            "sketch": {"largura": self.counts.width, "profundidade": self.counts.depth,
+                       "erro_max_ocorrencias": round(self.counts.max_error, 1)},
+            "produtos_vistos": self.products.seen,
+        }
+
+
+if __name__ == "__main__":
+    import random
+    import sys
+    import time
+    import tracemalloc
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    random.seed(1)
+
+    # 30% dos itens vêm de poucos produtos (Pareto), o resto é cauda longa quase sem repetição
+    def _pid():
+        return int(random.paretovariate(1.2)) % 1000 if random.random() < 0.3 else random.randrange(n)
+
+    stream = [(f"p{pid}", f"PRODUTO {pid}", random.randint(100, 50_000)) for pid in (_pid() for _ in range(n * 2))]
+
+    def exact_run():
+        rows: Dict[Tuple[str, str], list] = {}
+        for cprod, desc, cents in stream:
+            row = rows.setdefault((cprod, desc), [0, 0])
+            row[0] += 1
+            row[1] += cents
+        return rows, top_k(rows.items(), k, key=lambda kv: kv[1][1])
+
+    def bounded_run():
+        ranking = BoundedProductRanking(k)
+        for cprod, desc, cents in stream:
+            ranking.add_member({"dedup": {(cprod, desc): (cprod, desc, 1, cents)}, "prod": []})
+        return ranking, ranking.values.top(k)
+
+    def measure(fn):
+        start = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()  # memória numa segunda execução: o tracemalloc distorce o tempo
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return out, elapsed, peak
+
+    (rows, truth), t_exact, m_exact = measure(exact_run)
+    (ranking, approx), t_bounded, m_bounded = measure(bounded_run)
+    recall = len({key for key, _ in truth} & {r["chave"] for r in approx}) / k
+    exatos = sum(1 for r in approx if r["exato"])
+    print(f"{len(stream):,} itens, {len(rows):,} descrições distintas, top {k}, "
+          f"capacidade {ranking.values.capacity}")
+    print(f"  exato:    {t_exact:.2f}s  pico {m_exact / 1e6:.1f} MB")
+    print(f"  limitado: {t_bounded:.2f}s  pico {m_bounded / 1e6:.1f} MB  "
+          f"recall {recall:.0%}  somas exatas {exatos}/{k}")
@@ -0,0 +1,233 @@
+"""
+zipscan.py
+-----------
+Pré-análise do ZIP antes da análise completa.
+
+Lê só o diretório central e os primeiros bytes de cada membro:
+  - classifica cada membro (NF-e, outro XML, PDF, ZIP aninhado, duplicado...)
+  - conta os documentos candidatos e estima o custo da análise
+  - detecta zip bomb pela taxa de compressão / tamanho total declarado
+  - recusa cedo ZIPs corrompidos, perigosos ou sem nenhuma NF-e
+
+A análise processa só os candidatos: um PDF ou um XML de evento no meio do
+ZIP vira uma linha em `ignorados`, em vez de quebrar o ET.fromstring.
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import IO, Any, Dict, List, Optional, Union
+import io
+import re
+import zipfile
+import zlib
+
+from app.config import settings
+
+MB = 1024 * 1024
+HEAD_BYTES = 1024
+MAX_LISTED = 100  # membros ignorados listados na resposta
+
+_NFE_ROOT = re.compile(rb"<(?:[\w-]+:)?(?:nfeProc|NFe|enviNFe)[\s>/]")
+
+MAGIC = (
+    (b"%PDF", "pdf"),
+    (b"PK\x03\x04", "zip"),
+    (b"\x89PNG", "imagem"),
+    (b"\xff\xd8\xff", "imagem"),
+    (b"GIF8", "imagem"),
+    (b"Rar!", "rar"),
+    (b"7z\xbc\xaf", "7z"),
+)
+
+# motivos de recusa (também usados no label da métrica)
+CORRUPTED = "zip_corrompido"
+BOMB = "zip_bomb"
+TOO_MANY = "membros_demais"
+NO_DOCUMENTS = "sem_nfe"
+TOO_EXPENSIVE = "custo_excedido"
+
+_MESSAGES = {
+    CORRUPTED: "Arquivo ZIP corrompido ou inválido.",
+    BOMB: "ZIP recusado: taxa de compressão ou tamanho descompactado suspeito.",
+    TOO_MANY: "ZIP recusado: quantidade de arquivos acima do limite.",
+    NO_DOCUMENTS: "Nenhum XML de NF-e encontrado no ZIP.",
+    TOO_EXPENSIVE: "ZIP recusado: custo estimado da análise acima do limite.",
+}
+
+
+class ArchiveRejected(ValueError):
+    """ZIP recusado na pré-análise. `reason` é um dos códigos acima."""
+
+    def __init__(self, reason: str, scan: Optional["ArchiveScan"] = None, detail: str = ""):
+        self.reason = reason
+        self.scan = scan
+        super().__init__(detail or _MESSAGES.get(reason, reason))
+
+    def to_detail(self) -> Dict[str, Any]:
+        body: Dict[str, Any] = {"motivo": self.reason, "mensagem": str(self)}
+        if self.scan is not None:
+            body["pre_analise"] = self.scan.to_api()
+        return body
+
+
+@dataclass
+class ArchiveScan:
+    membros: int = 0
+    bytes_comprimidos: int = 0
+    bytes_descomprimidos: int = 0
+    bytes_candidatos: int = 0
+    maior_taxa: float = 0.0
+    por_tipo: Dict[str, int] = field(default_factory=dict)
+    ignorados: List[Dict[str, str]] = field(default_factory=list)
+    suspeitos: List[str] = field(default_factory=list)
+    candidates: List[zipfile.ZipInfo] = field(default_factory=list)
+
+    @property
+    def candidatos(self) -> int:
+        return len(self.candidates)
+
+    @property
+    def custo_estimado_segundos(self) -> float:
+        return self.bytes_candidatos / MB / max(settings.ANALYSIS_MB_PER_SECOND, 0.001)
+
+    def ignore(self, name: str, kind: str) -> None:
+        self.por_tipo[kind] = self.por_tipo.get(kind, 0) + 1
+        if len(self.ignorados) < MAX_LISTED:
+            self.ignorados.append({"arquivo": name, "motivo": kind})
+
+    def to_api(self) -> Dict[str, Any]:
+        return {
+            "membros": self.membros,
+            "candidatos": self.candidatos,
+            "bytes_comprimidos": self.bytes_comprimidos,
+            "bytes_descomprimidos": self.bytes_descomprimidos,
+            "maior_taxa_compressao": round(self.maior_taxa, 1),
+            "custo_estimado_segundos": round(self.custo_estimado_segundos, 2),
+            "por_tipo": dict(self.por_tipo),
+            "ignorados": list(self.ignorados),
+        }
+
+
+# ============================================================
+# 🔎 CLASSIFICAÇÃO DOS MEMBROS
+# ============================================================
+def sniff(head: bytes) -> str:
+    """Tipo do membro pelos primeiros bytes (magic bytes / raiz do XML)."""
+    for magic, kind in MAGIC:
+        if head.startswith(magic):
+            return kind
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if not text.startswith(b"<"):
+        return "nao_xml"
+    if _NFE_ROOT.search(head):
+        return "nfe"
+    return "xml_outro"
+
+
+def _ratio(info: zipfile.ZipInfo) -> float:
+    return info.file_size / max(info.compress_size, 1)
+
+
+def scan_zipfile(zf: zipfile.ZipFile) -> ArchiveScan:
+    scan = ArchiveScan()
+    seen = set()
+    max_member = settings.ZIP_MAX_MEMBER_MB * MB
+
+    infos = zf.infolist()
+    scan.membros = len(infos)
+    if scan.membros > settings.ZIP_MAX_MEMBERS:
+        return scan
+
+    for info in infos:
+        scan.bytes_comprimidos += info.compress_size
+        scan.bytes_descomprimidos += info.file_size
+        if info.is_dir():
+            scan.por_tipo["diretorio"] = scan.por_tipo.get("diretorio", 0) + 1
+            continue
+
+        ratio = _ratio(info)
+        scan.maior_taxa = max(scan.maior_taxa, ratio)
+        # taxas altas só importam em membros grandes (XML pequeno comprime bem)
+        if info.file_size > MB and ratio > settings.ZIP_MAX_RATIO:
+            scan.suspeitos.append(info.filename)
+            continue
+        if info.flag_bits & 0x1:
+            scan.ignore(info.filename, "criptografado")
+            continue
+
+        try:
+            with zf.open(info) as f:
+                head = f.read(HEAD_BYTES)
+        except (zipfile.BadZipFile, zlib.error, NotImplementedError, EOFError, OSError):
+            scan.ignore(info.filename, "corrompido")
+            continue
+
+        kind = sniff(head)
+        if kind != "nfe":
+            scan.ignore(info.filename, kind)
+            continue
+        # o limite por membro vale só para os XMLs que seriam lidos: um PDF
+        # grande é ignorado como os demais, sem recusar o ZIP
+        if info.file_size > max_member:
+            scan.ignore(info.filename, "xml_grande_demais")
+            continue
+
+        # mesma pasta copiada duas vezes: mesmo CRC e tamanho
+        fingerprint = (info.CRC, info.file_size)
+        if fingerprint in seen:
+            scan.ignore(info.filename, "duplicado")
+            continue
+        seen.add(fingerprint)
+
+        scan.por_tipo["nfe"] = scan.por_tipo.get("nfe", 0) + 1
+        scan.bytes_candidatos += info.file_size
+        scan.candidates.append(info)
+    return scan
+
+
+def _reject(reason: str, scan: Optional[ArchiveScan] = None, detail: str = "") -> ArchiveRejected:
+    from .metrics import ARCHIVES_REJECTED
+
+    ARCHIVES_REJECTED.inc(reason=reason)
+    return ArchiveRejected(reason, scan, detail)
+
+
+def check_zipfile(zf: zipfile.ZipFile) -> ArchiveScan:
+    """Pré-análise + regras de recusa. Levanta ArchiveRejected."""
+    scan = scan_zipfile(zf)
+    if scan.membros > settings.ZIP_MAX_MEMBERS:
+        raise _reject(TOO_MANY, scan)
+    if scan.suspeitos or scan.bytes_descomprimidos > settings.ZIP_MAX_UNCOMPRESSED_MB * MB:
+        raise _reject(BOMB, scan)
+    if not scan.candidates:
+        raise _reject(NO_DOCUMENTS, scan)
+    max_seconds = settings.ANALYSIS_MAX_ESTIMATED_SECONDS
+    if max_seconds and scan.custo_estimado_segundos > max_seconds:
+        raise _reject(TOO_EXPENSIVE, scan)
+    return scan
+
+
+def open_zip(source: Union[bytes, IO[bytes]]) -> zipfile.ZipFile:
+    try:
+        return zipfile.ZipFile(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source, "r")
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, OSError, EOFError):
+        raise _reject(CORRUPTED)
+
+
+def check_archive(source: Union[bytes, IO[bytes]]) -> ArchiveScan:
+    """Pré-análise de um ZIP em bytes ou arquivo aberto (só lê o necessário)."""
+    with open_zip(source) as zf:
+        return check_zipfile(zf)
+
+
+def read_member(zf: zipfile.ZipFile, info: zipfile.ZipInfo) -> bytes:
+    """
+    Lê um membro sem confiar no tamanho declarado no diretório central:
+    para de descompactar se passar do limite por membro.
+    """
+    limit = settings.ZIP_MAX_MEMBER_MB * MB
+    with zf.open(info) as f:
+        data = f.read(limit + 1)
+    if len(data) > limit:
+        raise _reject(BOMB, detail=f"{info.filename}: tamanho real acima do declarado")
+    return data
@@ -0,0 +1,56 @@
+"""
+authbench.py
+-------------
+Custo de autenticação por requisição.
+
+Uso:
+    python -m app.utils.authbench            # 20000 verificações de token
+    python -m app.utils.authbench 100000
+"""
+
+from __future__ import annotations
+import sys
+import time
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.routers.auth import _user_status, get_current_user
+from app.services.security import (
+    claims_cache,
+    create_access_token,
+    decode_token,
+    hash_password,
+    verify_password,
+)
+
+
+def _per_op(fn, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n
+
+
+def run(n: int = 20_000) -> None:
+    stored = hash_password("senha-de-teste")
+    t_hash = _per_op(lambda: hash_password("senha-de-teste"), 10)
+    t_verify = _per_op(lambda: verify_password("senha-de-teste", stored), 10)
+
+    token = create_access_token("bench", ver=0)
+    # usuário fictício: o estado (ativo, versão) fica no cache sem ir ao banco
+    _user_status["bench"] = (True, 0, float("inf"))
+    creds = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    t_decode = _per_op(lambda: decode_token(token), n)
+    claims_cache.clear()
+    get_current_user(creds)  # aquece o cache
+    t_cached = _per_op(lambda: get_current_user(creds), n)
+
+    print(f"🔑 hash de senha (scrypt):      {t_hash * 1e3:8.1f} ms  (só no login, pool dedicado)")
+    print(f"🔑 verificação de senha:        {t_verify * 1e3:8.1f} ms")
+    print(f"🎟️ JWT decode + verificação:    {t_decode * 1e6:8.1f} µs/req")
+    print(f"⚡ get_current_user com cache:  {t_cached * 1e6:8.1f} µs/req  ({t_decode / t_cached:.0f}x)")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,230 @@
+"""
+compression.py
+---------------
+Compressão das respostas (gzip / brotli).
+
+O dashboard com produtos_duplicados passa de alguns MB de JSON repetitivo e
+ia sem compressão. CompressionMiddleware comprime, conforme o
+Accept-Encoding, as respostas de texto/JSON com COMPRESSION_MIN_BYTES ou mais:
+
+  - br (pacote brotli, opcional) tem preferência sobre gzip
+  - resposta que já traz Content-Encoding (variante pré-comprimida, ver
+    http_cache.py) passa direto
+  - streaming (NDJSON) é comprimido pedaço a pedaço com flush, sem segurar
+    os eventos de progresso; SSE não é comprimido
+  - o ETag ganha o sufixo da codificação ("abc" → "abc-gzip"), um ETag forte
+    por representação; no If-None-Match o sufixo é retirado antes de chegar
+    à rota, que só conhece o ETag base
+"""
+
+from __future__ import annotations
+from typing import Dict, Optional, Tuple
+import gzip
+import re
+import zlib
+
+try:
+    import brotli
+except ImportError:  # só gzip
+    brotli = None
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.config import settings
+
+COMPRESSIBLE = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+NOT_STREAMED = ("text/event-stream",)   # o proxy/navegador seguraria os eventos
+PRECOMPRESS_LEVEL = {"br": 9, "gzip": 9}  # variantes gravadas: o custo é pago uma vez
+
+_ETAG_SUFFIX = re.compile(r'-(?:gzip|br)"')
+
+
+def available_encodings() -> Tuple[str, ...]:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """Melhor codificação aceita pelo cliente (q > 0), br antes de gzip; None = identidade."""
+    accepted: Dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        token, _, params = part.partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    for encoding in available_encodings():
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.lower().startswith(COMPRESSIBLE)
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    if encoding == "br":
+        quality = settings.COMPRESSION_BROTLI_QUALITY if level is None else level
+        return brotli.compress(data, quality=quality)
+    if encoding == "gzip":
+        level = settings.COMPRESSION_GZIP_LEVEL if level is None else level
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    raise ValueError(f"Codificação não suportada: {encoding}")
+
+
+def precompress(data: bytes) -> Dict[str, bytes]:
+    """Corpo + variantes comprimidas para gravar junto do resultado ('identity' = original)."""
+    variants = {"identity": data}
+    if len(data) >= settings.COMPRESSION_MIN_BYTES:
+        for encoding in available_encodings():
+            variants[encoding] = compress(data, encoding, PRECOMPRESS_LEVEL[encoding])
+    return variants
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """ETag da representação comprimida: "abc" → "abc-gzip" (W/ preservado)."""
+    if not etag.endswith('"') or _ETAG_SUFFIX.search(etag):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def strip_etag_encoding(value: str) -> str:
+    """If-None-Match com ETags de representações comprimidas → ETags base."""
+    return _ETAG_SUFFIX.sub('"', value)
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._c = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 = cabeçalho gzip
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._c.process(data) + self._c.flush()
+        return self._c.compress(data) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._c.finish() if self.encoding == "br" else self._c.flush()
+
+
+# ============================================================
+# 🗜️ MIDDLEWARE
+# ============================================================
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: Optional[int] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        if "if-none-match" in request_headers:
+            scope = dict(scope)
+            scope["headers"] = [
+                (k, strip_etag_encoding(v.decode("latin-1")).encode("latin-1") if k == b"if-none-match" else v)
+                for k, v in scope["headers"]
+            ]
+        encoding = negotiate(request_headers.get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        minimum = settings.COMPRESSION_MIN_BYTES if self.minimum_size is None else self.minimum_size
+        await _Responder(self.app, encoding, minimum)(scope, receive, send)
+
+
+class _Responder:
+    def __init__(self, app, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.mode: Optional[str] = None   # None (decidindo) | "pass" | "stream"
+        self.stream: Optional[_StreamCompressor] = None
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.wrapped_send)
+
+    def _eligible(self, headers: MutableHeaders) -> bool:
+        status = self.start_message["status"]
+        return (
+            status >= 200 and status not in (204, 206, 304)
+            and "content-encoding" not in headers
+            and is_compressible(headers.get("content-type"))
+        )
+
+    def _mark_encoded(self, headers: MutableHeaders) -> None:
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if "etag" in headers:
+            headers["ETag"] = encoded_etag(headers["etag"], self.encoding)
+
+    async def wrapped_send(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        if self.mode == "pass":
+            await self.send(message)
+            return
+        if self.mode == "stream":
+            body = self.stream.chunk(message.get("body", b""))
+            if not message.get("more_body", False):
+                body += self.stream.finish()
+            await self.send({"type": "http.response.body", "body": body,
+                             "more_body": message.get("more_body", False)})
+            return
+
+        # primeiro pedaço do corpo: decide
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        content_type = (headers.get("content-type") or "").lower()
+
+        if not self._eligible(headers) or (more_body and content_type.startswith(NOT_STREAMED)):
+            self.mode = "pass"
+        elif not more_body:
+            if len(body) < self.minimum_size:
+                self.mode = "pass"
+            else:
+                body = compress(body, self.encoding)
+                self._mark_encoded(headers)
+                headers["Content-Length"] = str(len(body))
+                await self.send(self.start_message)
+                await self.send({"type": "http.response.body", "body": body, "more_body": False})
+                return
+        else:
+            self.mode = "stream"
+            self.stream = _StreamCompressor(self.encoding)
+            self._mark_encoded(headers)
+            del headers["Content-Length"]
+            await self.send(self.start_message)
+            await self.send({"type": "http.response.body", "body": self.stream.chunk(body), "more_body": True})
+            return
+
+        await self.send(self.start_message)
+        await self.send(message)
@@ -0,0 +1,213 @@
+"""
+http_cache.py
+--------------
+Validação de cache HTTP: ETag / Last-Modified / 304.
+
+O front refaz as leituras (/api/uploads/list, /api/clients/, dicionário,
+dashboard) a cada tela. Com ETag o navegador manda If-None-Match e, se nada
+mudou, a resposta é um 304 sem corpo:
+
+  - ETagMiddleware: GET com JSON que a rota não versionou ganha um ETag
+    forte = hash do corpo (listagens: o corpo já é a versão das linhas)
+  - rotas caras (dashboard, DOCX, dicionário) calculam o ETag antes do
+    trabalho, a partir de versões (sha256 do ZIP + parâmetros da análise,
+    mtime do arquivo), e respondem 304 sem rodar a análise
+  - dashboard: o JSON serializado e as variantes gzip/br ficam gravados ao
+    lado do resultado da análise (blobstore.put_rendered); a resposta seguinte
+    sai do arquivo, sem montar nem comprimir nada
+
+Cache-Control: private, no-cache (dados do usuário; o navegador guarda, mas
+sempre revalida).
+"""
+
+from __future__ import annotations
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional
+import hashlib
+import json
+import os
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.config import settings
+from .compression import encoded_etag, negotiate, precompress
+
+CACHE_CONTROL = "private, no-cache"
+MAX_BUFFER = 8 * 1024 * 1024   # JSON maior que isso segue sem ETag de conteúdo
+
+
+def make_etag(*parts: Any) -> str:
+    """ETag forte a partir de versões (sha256, chave de parâmetros, mtime...)."""
+    return '"' + hashlib.sha256(repr(parts).encode()).hexdigest()[:32] + '"'
+
+
+def content_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def file_validators(path: str) -> tuple[str, datetime]:
+    """ETag + Last-Modified de um arquivo, sem ler o conteúdo."""
+    st = os.stat(path)
+    return make_etag(path, st.st_mtime_ns, st.st_size), datetime.fromtimestamp(st.st_mtime, timezone.utc)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Comparação fraca (RFC 9110 §13.1.2): W/ não importa para GET."""
+    if if_none_match.strip() == "*":
+        return True
+    target = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+def is_not_modified(headers: Headers, etag: Optional[str], last_modified: Optional[datetime] = None) -> bool:
+    """If-None-Match manda; If-Modified-Since só vale sem ele."""
+    if not settings.HTTP_ETAGS_ENABLED:
+        return False
+    inm = headers.get("if-none-match")
+    if inm is not None:
+        return etag is not None and _etag_matches(inm, etag)
+    ims = headers.get("if-modified-since")
+    if ims and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def cache_headers(etag: Optional[str], last_modified: Optional[datetime] = None) -> Dict[str, str]:
+    if not settings.HTTP_ETAGS_ENABLED:
+        return {}
+    headers = {"Cache-Control": CACHE_CONTROL}
+    if etag:
+        headers["ETag"] = etag
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def not_modified(etag: Optional[str], last_modified: Optional[datetime] = None) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, last_modified))
+
+
+def render_json(payload: Any) -> bytes:
+    """Mesma serialização do JSONResponse do FastAPI."""
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+# ============================================================
+# 📦 RESPOSTAS PRÉ-SERIALIZADAS (dashboard)
+# ============================================================
+def cached_json_response(request: Request, sha256: str, name: str, etag: str) -> Optional[Response]:
+    """Resposta gravada por store_json_response, na melhor codificação aceita; None se não houver."""
+    from app.services.blobstore import get_rendered
+
+    encoding = negotiate(request.headers.get("accept-encoding"))
+    if encoding is not None:
+        body = get_rendered(sha256, name, encoding)
+        if body is not None:
+            return _encoded_response(body, encoding, etag)
+    body = get_rendered(sha256, name)
+    if body is None:
+        return None
+    # sem variante comprimida: o CompressionMiddleware comprime na hora
+    return Response(body, media_type="application/json", headers=cache_headers(etag))
+
+
+def store_json_response(request: Request, sha256: str, name: str, etag: str, payload: Any) -> Response:
+    """Serializa uma vez, grava corpo + gzip/br junto do resultado e responde com a variante aceita."""
+    from app.services.blobstore import put_rendered
+
+    body = render_json(payload)
+    if not (settings.ANALYSIS_CACHE_ENABLED and settings.PRECOMPRESSED_RESULTS):
+        return Response(body, media_type="application/json", headers=cache_headers(etag))
+    variants = precompress(body)
+    put_rendered(sha256, name, variants)
+    encoding = negotiate(request.headers.get("accept-encoding"))
+    if encoding in variants:
+        return _encoded_response(variants[encoding], encoding, etag)
+    return Response(body, media_type="application/json", headers=cache_headers(etag))
+
+
+def _encoded_response(body: bytes, encoding: str, etag: str) -> Response:
+    headers = cache_headers(encoded_etag(etag, encoding))
+    headers["Content-Encoding"] = encoding
+    headers["Vary"] = "Accept-Encoding"
+    return Response(body, media_type="application/json", headers=headers)
+
+
+# ============================================================
+# 🏷️ MIDDLEWARE (ETag pelo conteúdo)
+# ============================================================
+class ETagMiddleware:
+    """GET 200 com JSON e sem ETag da rota: ETag = hash do corpo; If-None-Match igual → 304."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] != "GET"
+                or not settings.HTTP_ETAGS_ENABLED):
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        start_message = None
+        passthrough = False
+        chunks: list[bytes] = []
+        buffered = 0
+
+        async def wrapped_send(message):
+            nonlocal start_message, passthrough, buffered
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = (headers.get("content-type") or "").lower()
+                if (message["status"] != 200 or "etag" in headers
+                        or not content_type.startswith("application/json")):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            # o corpo pode vir em pedaços (middlewares de função repassam em stream)
+            chunks.append(message.get("body", b""))
+            buffered += len(chunks[-1])
+            if message.get("more_body", False):
+                if buffered > MAX_BUFFER:
+                    # grande demais para segurar: segue sem ETag
+                    passthrough = True
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": True})
+                return
+
+            body = b"".join(chunks)
+            etag = content_etag(body)
+            if is_not_modified(request_headers, etag):
+                await send({"type": "http.response.start", "status": 304,
+                            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1"))
+                                        for k, v in cache_headers(etag).items()]})
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+                return
+            headers = MutableHeaders(raw=start_message["headers"])
+            for k, v in cache_headers(etag).items():
+                headers[k] = v
+            headers["Content-Length"] = str(len(body))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body, "more_body": False})
+
+        await self.app(scope, receive, wrapped_send)
@@ -0,0 +1,143 @@
+"""
+importtime.py
+--------------
+Orçamento de cold start: importa `app.main` num processo limpo com
+`python -X importtime` e falha (exit 1) se estourar o orçamento ou se algum
+efeito colateral pesado voltar para o import.
+
+Uso (CI / antes do deploy):
+    python -m app.utils.importtime
+    IMPORT_BUDGET_MS=1200 APP_SELF_BUDGET_MS=80 python -m app.utils.importtime
+
+Também roda na suíte (tests/test_importtime.py). Os .pyc de app/ são gravados
+antes (senão o módulo recém-editado mede a compilação, não o import)
+e vale a melhor de IMPORT_RUNS medições: numa máquina ocupada o ruído só
+soma tempo, nunca tira.
+"""
+
+from __future__ import annotations
+from typing import Dict, List, Tuple
+import compileall
+import os
+import subprocess
+import sys
+
+# Tempo total (cumulativo) do import de app.main, incluindo FastAPI/SQLAlchemy
+IMPORT_BUDGET_MS = int(os.getenv("IMPORT_BUDGET_MS", "1500"))
+# Soma do tempo próprio dos módulos app.* (o que é responsabilidade nossa),
+# sem o registro das rotas, que é medido à parte
+APP_SELF_BUDGET_MS = int(os.getenv("APP_SELF_BUDGET_MS", "70"))
+# FastAPI monta um TypeAdapter por parâmetro ao registrar cada rota: cresce
+# com a API, não com efeitos colaterais do import
+ROUTES_BUDGET_MS = int(os.getenv("ROUTES_BUDGET_MS", "150"))
+IMPORT_RUNS = int(os.getenv("IMPORT_RUNS", "5"))
+
+# Módulos que não podem ser carregados só por importar o app
+# (numpy: ~90 ms, só a análise/MinHash/TF-IDF precisam dele)
+FORBIDDEN_MODULES = ("docx", "numpy")
+
+_PROBE = (
+    "import sys, time, fastapi.routing as r\n"
+    "orig, spent, depth = r.APIRouter.add_api_route, [0.0], [0]\n"
+    "def timed(*a, **k):\n"
+    "    depth[0] += 1; t = time.perf_counter()\n"
+    "    try: return orig(*a, **k)\n"
+    "    finally:\n"
+    "        depth[0] -= 1\n"
+    "        if not depth[0]: spent[0] += time.perf_counter() - t\n"
+    "r.APIRouter.add_api_route = timed\n"
+    "import app.main, app.db, app.services.ai_matcher as m;"
+    "print('ROUTES_US', int(spent[0] * 1e6));"
+    "print('ENGINE', app.db._engine is not None);"
+    "print('MATCHER', m.is_matcher_loaded());"
+    "print('MODULES', ','.join(sorted(k for k in sys.modules if '.' not in k)))"
+)
+
+
+def _parse_importtime(stderr: str) -> List[Tuple[str, int, int, bool]]:
+    """Linhas 'import time: self | cumulative | nome' → (nome, self_us, cum_us, raiz)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            _, rest = line.split(":", 1)
+            self_us, cum_us, name = rest.split("|", 2)
+            # a indentação do nome marca o aninhamento; raiz = import feito pelo probe
+            rows.append((name.strip(), int(self_us), int(cum_us), not name.startswith("  ")))
+        except ValueError:
+            continue
+    return rows
+
+
+def measure() -> Dict[str, object]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Falha ao importar app.main:\n{proc.stderr[-2000:]}")
+
+    rows = _parse_importtime(proc.stderr)
+    out = dict(
+        line.split(" ", 1) for line in proc.stdout.splitlines() if " " in line
+    )
+    # app.main + o que o probe importou antes dele (fastapi.routing, para medir as rotas)
+    total_us = sum(cum for name, _, cum, root in rows
+                   if root and (name == "app.main" or name.split(".")[0] == "fastapi"))
+    routes_us = int(out.get("ROUTES_US") or 0)
+    app_self_us = sum(s for name, s, _, _ in rows if name == "app" or name.startswith("app.")) - routes_us
+    top_app = sorted(
+        ((name, s) for name, s, _, _ in rows if name.startswith("app.")),
+        key=lambda x: x[1], reverse=True,
+    )[:10]
+    return {
+        "total_ms": total_us / 1000.0,
+        "app_self_ms": app_self_us / 1000.0,
+        "routes_ms": routes_us / 1000.0,
+        "top_app_modules": [(n, s / 1000.0) for n, s in top_app],
+        "engine_created": out.get("ENGINE") == "True",
+        "matcher_loaded": out.get("MATCHER") == "True",
+        "modules": set((out.get("MODULES") or "").split(",")),
+    }
+
+
+def best_of(runs: int = IMPORT_RUNS) -> Dict[str, object]:
+    """Grava os .pyc de app/ e fica com a medição mais rápida (total e app.* separadamente)."""
+    compileall.compile_dir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), quiet=1)
+    samples = [measure() for _ in range(max(1, runs))]
+    best = min(samples, key=lambda m: m["app_self_ms"])
+    best["total_ms"] = min(m["total_ms"] for m in samples)
+    best["routes_ms"] = min(m["routes_ms"] for m in samples)
+    return best
+
+
+def check() -> List[str]:
+    m = best_of()
+    problems: List[str] = []
+    if m["total_ms"] > IMPORT_BUDGET_MS:
+        problems.append(f"import app.main levou {m['total_ms']:.0f} ms (orçamento {IMPORT_BUDGET_MS} ms)")
+    if m["app_self_ms"] > APP_SELF_BUDGET_MS:
+        problems.append(f"módulos app.* somam {m['app_self_ms']:.0f} ms (orçamento {APP_SELF_BUDGET_MS} ms)")
+    if m["routes_ms"] > ROUTES_BUDGET_MS:
+        problems.append(f"registro das rotas levou {m['routes_ms']:.0f} ms (orçamento {ROUTES_BUDGET_MS} ms)")
+    if m["engine_created"]:
+        problems.append("engine do banco criado no import (use get_engine())")
+    if m["matcher_loaded"]:
+        problems.append("JsonMatcher construído no import (use get_matcher())")
+    for mod in FORBIDDEN_MODULES:
+        if mod in m["modules"]:
+            problems.append(f"módulo '{mod}' importado no startup")
+
+    print(f"⏱️ import app.main: {m['total_ms']:.0f} ms | app.*: {m['app_self_ms']:.1f} ms"
+          f" | rotas: {m['routes_ms']:.1f} ms")
+    for name, ms in m["top_app_modules"]:
+        print(f"   {ms:7.1f} ms  {name}")
+    return problems
+
+
+if __name__ == "__main__":
+    problems = check()
+    for p in problems:
+        print(f"❌ {p}")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,92 @@
+"""
+pagination.py
+--------------
+Paginação por keyset (cursor) para as listagens.
+
+OFFSET obriga o banco a ler e descartar todas as linhas anteriores; com
+keyset a página seguinte começa direto no índice, a partir da última linha
+vista: WHERE (sort, id) < (:sort, :id) ORDER BY sort DESC, id DESC.
+
+O corpo das respostas continua sendo a lista; o cursor da próxima página
+vai no header X-Next-Cursor (ausente na última página).
+"""
+
+from __future__ import annotations
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+import base64
+import json
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import and_, or_
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams:
+    """Dependência: ?limit=&cursor="""
+
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+        cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor da página anterior"),
+    ):
+        self.limit = limit
+        self.cursor = cursor
+
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    if isinstance(sort_value, datetime):
+        sort_value = {"dt": sort_value.isoformat()}
+    raw = json.dumps([sort_value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+        if isinstance(sort_value, dict) and "dt" in sort_value:
+            sort_value = datetime.fromisoformat(sort_value["dt"])
+        return sort_value, int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def keyset_page(query, sort_col, id_col, page: PageParams, response: Optional[Response] = None,
+                descending: bool = True) -> List[Any]:
+    """
+    Aplica o keyset em `query` e devolve até page.limit linhas. Se houver
+    mais, grava o cursor da próxima página em `response`.
+    sort_col pode ser o próprio id (listas ordenadas só pela PK); senão deve
+    ser preenchido em todas as linhas (server_default/default), e o índice
+    composto (filtro, sort_col, id) atende a consulta.
+    """
+    same_col = sort_col is id_col
+    if page.cursor:
+        sort_value, last_id = decode_cursor(page.cursor)
+        if same_col:
+            cond = id_col < last_id if descending else id_col > last_id
+        elif descending:
+            cond = or_(sort_col < sort_value, and_(sort_col == sort_value, id_col < last_id))
+        else:
+            cond = or_(sort_col > sort_value, and_(sort_col == sort_value, id_col > last_id))
+        query = query.filter(cond)
+
+    if same_col:
+        order = [id_col.desc() if descending else id_col.asc()]
+    elif descending:
+        order = [sort_col.desc(), id_col.desc()]
+    else:
+        order = [sort_col.asc(), id_col.asc()]
+    rows = query.order_by(*order).limit(page.limit + 1).all()
+
+    has_more = len(rows) > page.limit
+    rows = rows[: page.limit]
+    if has_more and response is not None:
+        last = rows[-1]
+        sort_value = getattr(last, sort_col.key)
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(sort_value, getattr(last, id_col.key))
+    return rows
@@ -0,0 +1,106 @@
+import io
+import zipfile
+
+import pytest
+
+from app import db as app_db
+from app.config import settings
+from app.services import blobstore
+
+
+@pytest.fixture(autouse=True)
+def storage(tmp_path, monkeypatch):
+    """Blob store local em diretório temporário (linhagens, checkpoints, cache)."""
+    monkeypatch.setattr(settings, "LOCAL_STORAGE_DIR", str(tmp_path / "storage"))
+    monkeypatch.setattr(settings, "BLOB_BACKEND", "local")
+    monkeypatch.setattr(blobstore, "_store", None)
+    yield tmp_path / "storage"
+    blobstore._store = None
+
+
+def nfe_xml(numero, itens, emissao="2024-01-16T10:00:00-03:00"):
+    """NF-e mínima aceita por nfe.parse_nfe_xml. itens: [(cProd, xProd, ncm, cfop, csosn, valor)]."""
+    dets = []
+    total = 0.0
+    for pos, (cprod, desc, ncm, cfop, csosn, valor) in enumerate(itens, 1):
+        total += valor
+        dets.append(
+            f'<det nItem="{pos}"><prod><cProd>{cprod}</cProd><xProd>{desc}</xProd><NCM>{ncm}</NCM>'
+            f"<CFOP>{cfop}</CFOP><qCom>1.0000</qCom><vUnCom>{valor:.2f}</vUnCom><vProd>{valor:.2f}</vProd>"
+            f"</prod><imposto><ICMS><ICMSSN{csosn}><CSOSN>{csosn}</CSOSN></ICMSSN{csosn}></ICMS></imposto></det>"
+        )
+    return (
+        '<?xml version="1.0"?><nfeProc xmlns="http://www.portalfiscal.inf.br/nfe"><NFe>'
+        f'<infNFe Id="NFe{numero:044d}"><ide><cNF>{numero}</cNF><dhEmi>{emissao}</dhEmi></ide>'
+        f'{"".join(dets)}<total><ICMSTot><vNF>{total:.2f}</vNF></ICMSTot></total></infNFe></NFe></nfeProc>'
+    ).encode()
+
+
+def make_zip(members):
+    """members: {nome: bytes} → bytes do ZIP."""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+class Api:
+    """TestClient do app com SQLite temporário; add_upload grava o ZIP no blob store."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def add_upload(self, data, client_id=1, filename="nfe.zip"):
+        from app.models import Client, Upload
+
+        session = app_db.SessionLocal()
+        try:
+            if session.get(Client, client_id) is None:
+                session.add(Client(id=client_id, name=f"Cliente {client_id}", password_hash="x",
+                                   cnpj=f"{client_id:014d}"))
+            sha, size = blobstore.store_content(session, io.BytesIO(data))
+            upload = Upload(client_id=client_id, filename=filename, sha256=sha, size_bytes=size)
+            session.add(upload)
+            session.commit()
+            session.refresh(upload)
+            session.expunge(upload)
+            return upload
+        finally:
+            session.close()
+
+    def add_user(self, username="contador", password="senha-forte", hashed_password=None):
+        """Cria o usuário e devolve o header Authorization de um access token dele."""
+        from app.models import User
+        from app.services.security import create_access_token, hash_password
+
+        session = app_db.SessionLocal()
+        try:
+            session.add(User(username=username, hashed_password=hashed_password or hash_password(password),
+                             is_active=True))
+            session.commit()
+        finally:
+            session.close()
+        return {"Authorization": f"Bearer {create_access_token(username)}"}
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import app.models  # noqa: F401  (registra as tabelas no metadata)
+    from app.main import app
+    from app.routers import auth
+    from app.services import limits
+
+    monkeypatch.setattr(auth, "_user_status", {})  # usuários de outros bancos de teste
+    monkeypatch.setattr(limits, "_instances", None)  # rate limit e vagas zerados por teste
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'api.db'}")
+    monkeypatch.setattr(app_db, "_engine", None)
+    monkeypatch.setattr(settings, "INGEST_ENABLED", False)
+    monkeypatch.setattr(settings, "MATCHER_WARMUP", False)
+    engine = app_db.get_engine()
+    app_db.Base.metadata.create_all(engine)
+    with TestClient(app) as client:
+        yield Api(client)
+    engine.dispose()
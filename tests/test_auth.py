@@ -0,0 +1,61 @@
+import hashlib
+import threading
+
+import pytest
+
+from app import db as app_db
+from app.models import User
+from app.routers import auth
+from app.services import security
+from app.services.security import hash_password, needs_rehash, verify_password
+
+LOGIN = "/api/auth/login"
+
+
+def _sha256(password):
+    return hashlib.sha256(password.encode("utf-8")).hexdigest()
+
+
+@pytest.mark.parametrize("stored", ["não-ascii-ção", "scrypt$16384$8$1$c2FsdA==$hãsh", "€" * 64])
+def test_hash_corrompido_ou_nao_ascii_e_recusado(stored):
+    assert verify_password("senha", stored) is False
+
+
+def test_hash_legado_e_scrypt():
+    assert verify_password("pão de queijo", _sha256("pão de queijo"))
+    assert not verify_password("pão de quejo", _sha256("pão de queijo"))
+    assert verify_password("çenha", hash_password("çenha"))
+
+
+@pytest.fixture
+def threads_do_hash(monkeypatch):
+    """Threads em que hash_password rodou."""
+    nomes = []
+    original = security.hash_password
+
+    def registrando(password):
+        nomes.append(threading.current_thread().name)
+        return original(password)
+
+    monkeypatch.setattr(security, "hash_password", registrando)
+    monkeypatch.setattr(auth, "_dummy", None)
+    return nomes
+
+
+def test_usuario_inexistente_usa_hash_do_pool(threads_do_hash, api):
+    # o lifespan já agendou o hash de referência, fora do event loop
+    assert auth._dummy is not None
+    r = api.client.post(LOGIN, data={"username": "ninguem", "password": "x"})
+    assert r.status_code == 401
+    assert threads_do_hash and all(n.startswith("pwhash") for n in threads_do_hash)
+
+
+def test_login_legado_nao_ascii_migra_para_scrypt(api):
+    api.add_user("ana", hashed_password=_sha256("çenha-€"))
+    assert api.client.post(LOGIN, data={"username": "ana", "password": "errada"}).status_code == 401
+    r = api.client.post(LOGIN, data={"username": "ana", "password": "çenha-€"})
+    assert r.status_code == 200 and r.json()["access_token"]
+
+    with app_db.SessionLocal() as session:
+        stored = session.query(User).filter_by(username="ana").one().hashed_password
+    assert not needs_rehash(stored) and verify_password("çenha-€", stored)
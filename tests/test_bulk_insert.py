@@ -0,0 +1,59 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, func, select
+
+from app.models.documents import NfeDocument, NfeItem
+from app.services.bulk_insert import persist_zip, tune_batch_size
+
+from conftest import make_zip, nfe_xml
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'bulk.db'}")
+    NfeDocument.__table__.create(engine)
+    NfeItem.__table__.create(engine)
+    yield engine
+    engine.dispose()
+
+
+def _zip(n_docs=7, quebrado=None):
+    docs = {}
+    for d in range(n_docs):
+        itens = [(f"P{d}{i}", f"PRODUTO {d} {i}", "22021000", "5405", "500", 0.1 * (i + 1)) for i in range(3)]
+        docs[f"nfe/{d}.xml"] = b"<nfeProc><NFe>sem fechar" if d == quebrado else nfe_xml(d + 1, itens)
+    return make_zip(docs)
+
+
+def _contagem(engine, upload_id):
+    with engine.connect() as conn:
+        itens, soma = conn.execute(
+            select(func.count(), func.sum(NfeItem.vprod)).where(NfeItem.upload_id == upload_id)).one()
+        docs = conn.execute(select(func.count()).select_from(NfeDocument).where(
+            NfeDocument.upload_id == upload_id)).scalar()
+    return docs, itens, Decimal(str(soma))
+
+
+@pytest.mark.parametrize("method", ["values", "executemany"])
+def test_lotes_pequenos_gravam_tudo_com_centavos_exatos(engine, method):
+    stats = persist_zip(engine, 1, 1, _zip(), batch_size=4, method=method)
+    assert (stats["documents"], stats["items"], stats["documentos_com_erro"]) == (7, 21, 0)
+    # 0.10 + 0.20 + 0.30 por documento, sem erro de float acumulado
+    assert _contagem(engine, 1) == (7, 21, Decimal("4.20"))
+
+
+def test_reprocessar_substitui_e_pula_documento_quebrado(engine):
+    persist_zip(engine, 1, 1, _zip(), batch_size=5)
+    persist_zip(engine, 2, 1, _zip(2), batch_size=5)
+    stats = persist_zip(engine, 1, 1, _zip(quebrado=3), batch_size=5)
+    assert stats["documentos_com_erro"] == 1
+    assert [e["arquivo"] for e in stats["errors"]] == ["nfe/3.xml"]
+    assert _contagem(engine, 1) == (6, 18, Decimal("3.60"))
+    assert _contagem(engine, 2)[:2] == (2, 6)  # outro upload intacto
+
+
+def test_lote_respeita_limite_de_parametros():
+    assert tune_batch_size("sqlite", 13, 10_000) == 32766 // 13
+    assert tune_batch_size("postgresql", 13, 10_000, method="copy") == 10_000
+    assert tune_batch_size("desconhecido", 2000) == 1
@@ -0,0 +1,114 @@
+import io
+import pickle
+import zipfile
+
+import pytest
+
+from app.config import settings
+from app.services import analysis, checkpoint
+from app.services.analysis import run_analysis_from_bytes
+from app.services.blobstore import get_blob_store
+
+from conftest import make_zip, nfe_xml
+
+LINHAGEM = "client-1-upload-1"
+RUIM = b"<nfeProc><NFe>sem fechar"
+
+
+def _membros(n=6, quebrado=None):
+    membros = {}
+    for d in range(n):
+        itens = [
+            (f"R{d}", f"REFRIGERANTE COLA {d} LATA 350ML", "22021000", "5405", "500", 5.0 + d),
+            (f"F{d}", "FEIJAO CARIOCA 1KG", "07133399", "5102", "102", 8.0),
+        ]
+        membros[f"nfe/{d}.xml"] = RUIM if d == quebrado else nfe_xml(d + 1, itens)
+    return membros
+
+
+@pytest.fixture
+def lidos(monkeypatch):
+    """Nomes dos membros parseados em cada análise."""
+    nomes = []
+    read = checkpoint.read_member
+
+    def read_member(zf, info):
+        nomes.append(info.filename)
+        return read(zf, info)
+
+    monkeypatch.setattr(checkpoint, "read_member", read_member)
+    return nomes
+
+
+def _sem_contadores(result):
+    out = dict(result)
+    for key in ("documentos_do_checkpoint", "incremental"):
+        out.pop(key, None)
+    for key in ("products", "produtos_excluidos", "produtos_duplicados"):
+        out[key] = list(out.get(key) or [])
+    return out
+
+
+@pytest.mark.parametrize("modo", ["sem_incremental", "limitado"])
+def test_nova_tentativa_so_le_o_membro_que_falhou(monkeypatch, lidos, modo):
+    kwargs = {"lineage": LINHAGEM}
+    if modo == "sem_incremental":
+        monkeypatch.setattr(settings, "INCREMENTAL_ANALYSIS_ENABLED", False)
+    else:
+        kwargs.update(ranking="limitado", top=3)
+
+    falhou = run_analysis_from_bytes(make_zip(_membros(quebrado=2)), **kwargs)
+    assert [e["arquivo"] for e in falhou["errors"]] == ["nfe/2.xml"]
+    assert len(lidos) == 6
+
+    lidos.clear()
+    corrigido = make_zip(_membros())
+    retomado = run_analysis_from_bytes(corrigido, **kwargs)
+    assert lidos == ["nfe/2.xml"]
+    assert retomado["documentos_do_checkpoint"] == 5
+    assert retomado["errors"] == []
+    # sem falhas o checkpoint sai da linhagem
+    assert not get_blob_store().exists(f"checkpoints/{LINHAGEM}.pkl")
+    assert list(get_blob_store().list(f"checkpoints/{LINHAGEM}/")) == []
+
+    monkeypatch.setattr(settings, "ANALYSIS_CHECKPOINT_ENABLED", False)
+    assert _sem_contadores(retomado) == _sem_contadores(run_analysis_from_bytes(corrigido, **kwargs))
+
+
+def test_erro_interno_e_tentado_de_novo(monkeypatch, lidos):
+    monkeypatch.setattr(settings, "INCREMENTAL_ANALYSIS_ENABLED", False)
+    agregado = analysis._member_aggregate
+
+    def quebra_no_3(doc, *args):
+        if doc.get("items") and doc["items"][0].get("cProd") == "R3":
+            raise RuntimeError("classificador fora do ar")
+        return agregado(doc, *args)
+
+    data = make_zip(_membros())
+    monkeypatch.setattr(analysis, "_member_aggregate", quebra_no_3)
+    falhou = run_analysis_from_bytes(data, lineage=LINHAGEM)
+    assert [(e["arquivo"], e["motivo"]) for e in falhou["errors"]] == [("nfe/3.xml", checkpoint.INTERNAL)]
+    assert falhou["documentos_com_erro"] == 1  # os outros documentos seguem
+
+    monkeypatch.setattr(analysis, "_member_aggregate", agregado)
+    lidos.clear()
+    retomado = run_analysis_from_bytes(data, lineage=LINHAGEM)
+    assert lidos == ["nfe/3.xml"]
+    assert retomado["errors"] == []
+
+
+def test_checkpoint_de_outro_formato_ou_versao_e_ignorado(monkeypatch, lidos):
+    monkeypatch.setattr(settings, "INCREMENTAL_ANALYSIS_ENABLED", False)
+    data = make_zip(_membros(quebrado=2))
+    primeiro = zipfile.ZipFile(io.BytesIO(data)).getinfo("nfe/0.xml")
+    # formato antigo: só {fingerprint: erro}
+    antigo = {checkpoint.fingerprint(primeiro): {"arquivo": "nfe/0.xml", "motivo": "x", "detalhe": ""}}
+    get_blob_store().put(f"checkpoints/{LINHAGEM}.pkl", pickle.dumps(antigo))
+    result = run_analysis_from_bytes(data, lineage=LINHAGEM)
+    assert len(lidos) == 6
+    assert [e["arquivo"] for e in result["errors"]] == ["nfe/2.xml"]
+
+    # outra versão da análise (motor): os agregados guardados não valem, os erros sim
+    lidos.clear()
+    run_analysis_from_bytes(data, lineage=LINHAGEM, motor="tfidf")
+    assert sorted(lidos) == [f"nfe/{d}.xml" for d in (0, 1, 3, 4, 5)]
@@ -0,0 +1,43 @@
+from app.routers.dashboard import build_dashboard_payload
+from app.services.analysis import run_analysis_from_bytes
+
+from conftest import make_zip, nfe_xml
+
+
+def _zip():
+    return make_zip({
+        "nfe/1.xml": nfe_xml(1, [
+            ("E1", "ENERGETICO RED BULL 250ML", "22029900", "5102", "102", 12.50),
+            ("E2", "MONSTER ENERGY LATA 473ML", "22029900", "5102", "102", 9.90),
+            ("R1", "REFRIGERANTE COCA-COLA 2L", "22021000", "5405", "500", 10.00),
+            ("F1", "FEIJAO CARIOCA 1KG", "07133399", "5102", "102", 8.00),
+        ]),
+    })
+
+
+def _categorias(payload):
+    return {c["categoria"]: c for c in payload["erros_fiscais"]["categorias_detectadas"]}
+
+
+def test_categoria_com_acento_tem_exemplos_e_nome_do_dicionario():
+    result = run_analysis_from_bytes(_zip())
+    cats = _categorias(build_dashboard_payload(result, None, None))
+
+    assert "energético" in cats  # nome como está no monofasicos.json
+    assert cats["energético"]["ocorrencias"] == 2
+    assert [e["descricao"] for e in cats["energético"]["exemplos"]] == [
+        "ENERGETICO RED BULL 250ML", "MONSTER ENERGY LATA 473ML",
+    ]
+    assert cats["refrigerante"]["ocorrencias"] == 1
+
+
+def test_contagens_nao_dependem_da_lista_truncada():
+    completo = run_analysis_from_bytes(_zip())
+    limitado = run_analysis_from_bytes(_zip(), ranking="limitado", top=1)
+    assert len(limitado["products"]) == 1
+
+    a = build_dashboard_payload(completo, None, None)["erros_fiscais"]
+    b = build_dashboard_payload(limitado, None, None)["erros_fiscais"]
+    assert b["monofasico_desc"] == a["monofasico_desc"] == 3
+    assert {c["categoria"]: c["ocorrencias"] for c in b["categorias_detectadas"]} == \
+        {c["categoria"]: c["ocorrencias"] for c in a["categorias_detectadas"]}
@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from app.routers import dictionary
+from app.utils.compression import strip_etag_encoding
+
+from conftest import make_zip, nfe_xml
+
+URL = "/api/dictionary/"
+
+
+@pytest.fixture
+def dicionario(tmp_path, monkeypatch):
+    """Cópia do dicionário: o teste pode mexer no arquivo à vontade."""
+    path = tmp_path / "monofasicos.json"
+    path.write_bytes(dictionary.DICTIONARY_FILE.read_bytes())
+    monkeypatch.setattr(dictionary, "DICTIONARY_FILE", path)
+    return path
+
+
+def test_dicionario_exige_autenticacao(api, dicionario):
+    # a rota GET / é a do dicionário (nenhum stub na frente dela)
+    assert api.client.get(URL).status_code == 401
+
+
+def test_dicionario_responde_304_enquanto_o_arquivo_nao_muda(api, dicionario):
+    auth = api.add_user()
+    first = api.client.get(URL, headers=auth)
+    assert first.status_code == 200
+    assert first.json() == dictionary.load_dictionary()
+    etag, last_modified = first.headers["etag"], first.headers["last-modified"]
+
+    r = api.client.get(URL, headers={**auth, "If-None-Match": etag})
+    assert r.status_code == 304 and r.content == b"" and r.headers["etag"] == strip_etag_encoding(etag)
+    r = api.client.get(URL, headers={**auth, "If-Modified-Since": last_modified})
+    assert r.status_code == 304
+
+    # arquivo alterado: validadores novos e corpo atualizado
+    dicionario.write_text('{"cerveja": ["skol"]}', encoding="utf-8")
+    st = dicionario.stat()
+    os.utime(dicionario, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    r = api.client.get(URL, headers={**auth, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert strip_etag_encoding(r.headers["etag"]) != strip_etag_encoding(etag)
+    assert r.json() == {"cerveja": ["skol"]}
+
+
+def test_dashboard_etag_por_parametros(api):
+    upload = api.add_upload(make_zip({
+        "nfe/1.xml": nfe_xml(1, [("R1", "REFRIGERANTE COCA COLA 2L", "22021000", "5405", "500", 10.0)]),
+    }))
+    url = f"/api/dashboard/?client_id=1&upload_id={upload.id}"
+    etag = api.client.get(url).headers["etag"]
+    assert api.client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    outro = api.client.get(url + "&aliquota=6")
+    assert outro.status_code == 200 and outro.headers["etag"] != etag
+    assert api.client.get(url + "&aliquota=6", headers={"If-None-Match": etag}).status_code == 200
@@ -0,0 +1,65 @@
+import pytest
+
+from app.config import settings
+from app.services.limits import get_limiters
+
+from conftest import make_zip, nfe_xml
+
+DASH = "/api/dashboard/?client_id=1&upload_id={}"
+
+
+def _zip(n=1):
+    return make_zip({
+        "nfe/1.xml": nfe_xml(n, [("R1", "REFRIGERANTE COCA COLA 2L", "22021000", "5405", "500", 10.0)]),
+    })
+
+
+@pytest.fixture
+def rate(monkeypatch):
+    """Duas análises por usuário, sem reposição durante o teste."""
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(settings, "RATE_LIMIT_BURST", 2)
+    monkeypatch.setattr(settings, "RATE_LIMIT_PER_MINUTE", 0.001)
+
+
+def test_cache_e_304_nao_gastam_token(api, rate):
+    upload = api.add_upload(_zip())
+    first = api.client.get(DASH.format(upload.id))
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    for _ in range(5):
+        assert api.client.get(DASH.format(upload.id)).status_code == 200
+        assert api.client.get(DASH.format(upload.id), headers={"If-None-Match": etag}).status_code == 304
+    # outro parâmetro: análise nova (2º token); a terceira análise passa do limite
+    assert api.client.get(DASH.format(upload.id) + "&aliquota=6").status_code == 200
+    r = api.client.get(DASH.format(upload.id) + "&aliquota=7")
+    assert r.status_code == 429 and "Retry-After" in r.headers
+    # o que já está em cache continua respondendo
+    assert api.client.get(DASH.format(upload.id) + "&aliquota=6").status_code == 200
+
+
+@pytest.mark.parametrize("rota", ["analyze", "persist"])
+def test_rotas_por_upload_usam_o_client_id_do_upload(api, monkeypatch, rota):
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    upload = api.add_upload(_zip(), client_id=7)
+    _, _, per_client = get_limiters()
+    for _ in range(settings.MAX_CONCURRENT_PER_CLIENT):
+        assert per_client.try_acquire(7)  # análises do cliente 7 em andamento
+
+    method = api.client.get if rota == "analyze" else api.client.post
+    r = method(f"/api/uploads/{rota}/{upload.id}")
+    assert r.status_code == 429
+    assert "cliente" in r.json()["detail"]
+
+    per_client.release(7)
+    assert method(f"/api/uploads/{rota}/{upload.id}").status_code != 429
+    assert per_client.active(7) == settings.MAX_CONCURRENT_PER_CLIENT - 1  # vaga devolvida
+
+
+def test_consulta_de_itens_cobra_so_ao_gerar_o_parquet(api, rate):
+    urls = [f"/api/items/query?client_id=1&upload_id={api.add_upload(_zip(n)).id}" for n in (1, 2, 3)]
+    assert api.client.get(urls[0]).status_code == 200  # gera o Parquet: 1º token
+    for _ in range(3):
+        assert api.client.get(urls[0]).status_code == 200  # só lê o arquivo
+    assert api.client.get(urls[1]).status_code == 200
+    assert api.client.get(urls[2]).status_code == 429
@@ -0,0 +1,5 @@
+from app.utils import importtime
+
+
+def test_import_do_app_dentro_do_orcamento():
+    assert importtime.check() == []
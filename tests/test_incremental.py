@@ -0,0 +1,83 @@
+import threading
+
+from app.services import incremental
+from app.services.analysis import run_analysis_from_bytes
+from app.services.blobstore import get_blob_store
+
+from conftest import make_zip, nfe_xml
+
+STRIP = ("incremental", "memoria", "ranking")
+
+
+def _versao(n, serie=0):
+    return make_zip({
+        f"nfe/{i}.xml": nfe_xml(i, [
+            (f"R{i}", f"REFRIGERANTE COCA-COLA 2L LOTE {i}", "22021000", "5405", "500", 10.0 + i + serie),
+            (f"F{i}", "FEIJAO CARIOCA 1KG", "07133399", "5102", "102", 8.0),
+        ])
+        for i in range(1, n + 1)
+    })
+
+
+def _sem_meta(result):
+    return {k: v for k, v in result.items() if k not in STRIP}
+
+
+def test_versao_nova_reaproveita_membros_e_bate_com_completa():
+    run_analysis_from_bytes(_versao(5), lineage="lin")
+    inc = run_analysis_from_bytes(_versao(8), lineage="lin")
+    assert inc["incremental"]["membros_reaproveitados"] == 5
+    assert inc["incremental"]["membros_analisados"] == 3
+    assert _sem_meta(inc) == _sem_meta(run_analysis_from_bytes(_versao(8)))
+
+    menor = run_analysis_from_bytes(_versao(4), lineage="lin")
+    assert menor["incremental"]["membros_removidos"] == 4
+    assert _sem_meta(menor) == _sem_meta(run_analysis_from_bytes(_versao(4)))
+
+
+def test_analises_concorrentes_da_mesma_linhagem(monkeypatch):
+    # metade reaproveita os membros da série 0; a outra metade troca todos (o save
+    # dela apaga os segmentos que a primeira ainda vai ler em state.products())
+    casos = [(6, 0), (3, 1), (7, 0), (4, 2), (8, 0), (5, 3)]
+    esperado = {c: _sem_meta(run_analysis_from_bytes(_versao(*c))) for c in casos}
+    run_analysis_from_bytes(_versao(3), lineage="lin")
+    erros, resultados = [], []
+
+    save = incremental.LineageState.save
+
+    def save_lento(self):
+        save(self)
+        threading.Event().wait(0.05)
+
+    monkeypatch.setattr(incremental.LineageState, "save", save_lento)
+
+    def roda(caso):
+        try:
+            resultados.append((caso, run_analysis_from_bytes(_versao(*caso), lineage="lin")))
+        except Exception as e:  # pragma: no cover - falha do teste
+            erros.append(e)
+
+    threads = [threading.Thread(target=roda, args=(c,)) for c in casos]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert erros == []
+    for caso, r in resultados:
+        assert _sem_meta(r) == esperado[caso]
+
+    # o estado que ficou aponta só para segmentos que existem: a mesma versão é toda reaproveitada
+    ultimo = resultados[-1][0]
+    final = run_analysis_from_bytes(_versao(*ultimo), lineage="lin")
+    assert final["incremental"]["membros_analisados"] == 0
+    assert _sem_meta(final) == esperado[ultimo]
+
+
+def test_drop_lineage_apaga_estado_e_segmentos():
+    run_analysis_from_bytes(_versao(3), lineage="lin")
+    store = get_blob_store()
+    assert store.exists("lineages/lin.pkl")
+    incremental.drop_lineage("lin")
+    assert not store.exists("lineages/lin.pkl")
+    assert list(store.list("lineages/lin/")) == []
@@ -0,0 +1,48 @@
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.services import metrics
+
+
+def _labels_app():
+    """App mínimo com um router incluído sob prefixo, rotulando como o main.py."""
+    router = APIRouter()
+
+    @router.get("/")
+    def raiz():
+        return {}
+
+    @router.get("/analyze/{upload_id}")
+    def analyze(upload_id: int):
+        return {}
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api/uploads")
+    labels = []
+
+    @app.middleware("http")
+    async def capture(request, call_next):
+        response = await call_next(request)
+        labels.append(metrics.route_label(request.scope))
+        return response
+
+    return app, labels
+
+
+def test_route_label_includes_router_prefix():
+    app, labels = _labels_app()
+    client = TestClient(app)
+    client.get("/api/uploads/")
+    client.get("/api/uploads/analyze/42")
+    client.get("/nao-existe")
+    assert labels == ["/api/uploads/", "/api/uploads/analyze/{upload_id}", "unmatched"]
+
+
+def test_metrics_middleware_labels_prefixed_route():
+    from app.main import app
+
+    client = TestClient(app, raise_server_exceptions=False)
+    client.get("/api/dashboard/")  # 422 (faltam client_id/upload_id): não toca no banco
+    exported = metrics.render_prometheus()
+    assert 'route="/api/dashboard/"' in exported
+    assert 'route="/",' not in exported
@@ -0,0 +1,34 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from app.services.money import apply_rate, cents_to_decimal, cents_to_float, month_key, to_cents
+
+
+@pytest.mark.parametrize("valor, cents", [
+    ("123.45", 12345), ("1234.5", 123450), ("10", 1000),
+    ("3.365,99", 336599), ("3365,99", 336599), ("R$ 1.000,00", 100000),
+    ("0.005", 1), ("0.004", 0),  # arredondamento comercial na 3ª casa
+    (0.1, 10), (0.29, 29), (7, 700), (Decimal("2.675"), 268),
+    (None, 0), ("", 0), ("abc", 0),
+])
+def test_to_cents(valor, cents):
+    assert to_cents(valor) == cents
+
+
+def test_soma_em_centavos_e_exata():
+    total = sum(to_cents("0.10") for _ in range(1000))
+    assert cents_to_decimal(total) == Decimal("100.00")
+    assert cents_to_float(to_cents("0.30")) == 0.3
+
+
+def test_apply_rate_sem_float():
+    assert apply_rate(12345, Decimal("0.06")) == 741  # 740,7 → 741
+    assert apply_rate(12345, "0.045") == 556      # 555,525 → 556
+    assert apply_rate(12345, None) == 0
+
+
+def test_month_key():
+    assert month_key(datetime(2024, 3, 9)) == "2024-03"
+    assert month_key(None) is None and month_key("2024-03-09") is None
@@ -0,0 +1,49 @@
+from app.services.near_dup import canonical_text, cluster_products, cluster_texts
+
+
+def _grupos(descricoes):
+    texts = [canonical_text(d) for d in descricoes]
+    labels = cluster_texts(texts)
+    grupos = {}
+    for desc, label in zip(descricoes, labels):
+        grupos.setdefault(label, set()).add(desc)
+    return sorted(grupos.values(), key=len, reverse=True)
+
+
+def test_variantes_do_mesmo_produto_se_juntam():
+    grupos = _grupos(["COCA COLA 2L", "COCA-COLA 2 L", "REFRIG COCA COLA 2LT", "REFRIGERANTE COCA COLA 2L"])
+    assert len(grupos) == 1
+
+
+def test_token_a_mais_separa_produtos():
+    grupos = _grupos(["COCA COLA 2L", "COCA COLA ZERO 2L", "COCA COLA ZERO ACUCAR 2L"])
+    assert len(grupos) == 3
+
+
+def test_descricao_generica_nao_encadeia_marcas():
+    grupos = _grupos(["CERVEJA 350ML", "CERVEJA SKOL 350ML", "CERVEJA BRAHMA 350ML",
+                      "SKOL 350ML", "BRAHMA 350ML"])
+    assert {"CERVEJA SKOL 350ML", "SKOL 350ML"} in grupos
+    assert {"CERVEJA BRAHMA 350ML", "BRAHMA 350ML"} in grupos
+    assert {"CERVEJA 350ML"} in grupos
+
+
+def test_medidas_diferentes_nao_se_juntam():
+    assert len(_grupos(["COCA COLA 2L", "COCA COLA 350ML"])) == 2
+
+
+def test_erro_de_digitacao_ainda_junta():
+    assert len(_grupos(["GUARANA ANTARCTICA 2L", "GUARANA ANTARTICA 2L"])) == 1
+
+
+def test_cluster_products_soma_variantes():
+    rows = [
+        {"descricao": "COCA COLA 2L", "codigo": "1", "ocorrencias": 3, "valor_total_cents": 3000},
+        {"descricao": "REFRIG COCA-COLA 2LT", "codigo": "2", "ocorrencias": 1, "valor_total_cents": 1000},
+        {"descricao": "COCA COLA ZERO 2L", "codigo": "3", "ocorrencias": 1, "valor_total_cents": 900},
+    ]
+    grupos = {g["descricao"]: g for g in cluster_products(rows)}
+    assert set(grupos) == {"COCA COLA 2L", "COCA COLA ZERO 2L"}
+    assert grupos["COCA COLA 2L"]["ocorrencias"] == 4
+    assert grupos["COCA COLA 2L"]["valor_total_cents"] == 4000
+    assert grupos["COCA COLA 2L"]["n_variantes"] == 2
@@ -0,0 +1,78 @@
+import pytest
+
+from app.config import settings
+from app.services import spill
+from app.services.analysis import run_analysis_from_bytes
+
+from conftest import make_zip, nfe_xml
+
+MARCAS = ("COCA COLA", "GUARANA ANTARCTICA", "SKOL", "BRAHMA", "AGUA CRYSTAL", "CIGARRO DERBY")
+
+
+def _zip(n_docs=40):
+    docs = {}
+    for d in range(n_docs):
+        itens = []
+        for i in range(6):
+            k = d * 6 + i
+            marca = MARCAS[k % len(MARCAS)]
+            # variantes de escrita da mesma bebida (near-dup) + códigos distintos
+            desc = f"REFRIGERANTE {marca} {k % 7} LATA 350ML" if k % 3 else f"REFRIG {marca} {k % 7} LT 350ML"
+            ncm = "22021000" if k % 5 else "24022000"
+            itens.append((f"P{k % 50}", desc, ncm, "5405", "500", 1.0 + (k * 37 % 900) / 10))
+        itens.append((f"F{d}", f"FEIJAO CARIOCA {d % 4} 1KG", "07133399", "5102", "102", 8.0))
+        mes = 1 + d % 3
+        docs[f"nfe/{d}.xml"] = nfe_xml(d + 1, itens, emissao=f"2024-{mes:02d}-10T10:00:00-03:00")
+    return make_zip(docs)
+
+
+@pytest.fixture
+def disco(monkeypatch):
+    """Orçamento de 16 KB: produtos, excluídos e dedup transbordam em vários runs."""
+    monkeypatch.setattr(spill, "MB", 16 * 1024)
+    monkeypatch.setattr(spill, "BATCH", 8)
+    monkeypatch.setattr(spill, "FAN_IN", 4)  # compactação dos runs do dedup
+    monkeypatch.setattr(settings, "ANALYSIS_MEMORY_BUDGET_MB", 1)
+
+
+def _comparavel(result):
+    out = dict(result)
+    for key in ("products", "produtos_excluidos", "produtos_duplicados"):
+        out[key] = list(out.get(key) or [])
+    out.pop("memoria", None)
+    return out
+
+
+@pytest.mark.parametrize("near_dup", [True, False])
+def test_fora_da_memoria_igual_a_analise_em_memoria(disco, monkeypatch, near_dup):
+    monkeypatch.setattr(settings, "NEAR_DUP_ENABLED", near_dup)
+    data = _zip()
+    monkeypatch.setattr(settings, "ANALYSIS_MEMORY_BUDGET_MB", 0)
+    memoria = run_analysis_from_bytes(data)
+    monkeypatch.setattr(settings, "ANALYSIS_MEMORY_BUDGET_MB", 1)
+    disco_ = run_analysis_from_bytes(data)
+
+    stats = disco_["memoria"]
+    assert stats["fora_da_memoria"] and stats["runs_dedup"] > 0 and stats["particoes_duplicados"] > 1
+    assert memoria["memoria"] == {"fora_da_memoria": False}
+    assert _comparavel(disco_) == _comparavel(memoria)
+
+
+def test_fora_da_memoria_com_topk(disco, monkeypatch):
+    data = _zip()
+    monkeypatch.setattr(settings, "ANALYSIS_MEMORY_BUDGET_MB", 0)
+    memoria = run_analysis_from_bytes(data, ranking="topk", top=5)
+    monkeypatch.setattr(settings, "ANALYSIS_MEMORY_BUDGET_MB", 1)
+    disco_ = run_analysis_from_bytes(data, ranking="topk", top=5)
+
+    assert disco_["memoria"]["fora_da_memoria"]
+    assert len(disco_["produtos_duplicados"]) == 5
+    assert _comparavel(disco_) == _comparavel(memoria)
+
+
+def test_zip_aberto_do_disco(disco, tmp_path):
+    path = tmp_path / "nfe.zip"
+    path.write_bytes(_zip())
+    with open(path, "rb") as f:
+        em_arquivo = run_analysis_from_bytes(f)
+    assert _comparavel(em_arquivo) == _comparavel(run_analysis_from_bytes(path.read_bytes()))
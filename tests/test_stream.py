@@ -0,0 +1,73 @@
+import json
+
+from app.services import analysis, blobstore
+
+from conftest import make_zip, nfe_xml
+
+URL = "/api/dashboard/stream?client_id=1&upload_id={}"
+
+
+def _zip():
+    return make_zip({
+        f"nfe/{d}.xml": nfe_xml(d + 1, [
+            (f"R{d}", f"REFRIGERANTE COCA COLA {d} 2L", "22021000", "5405", "500", 10.0 + d),
+            (f"F{d}", "FEIJAO CARIOCA 1KG", "07133399", "5102", "102", 8.0),
+        ])
+        for d in range(5)
+    })
+
+
+def _events(response):
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+def _contar_analises(monkeypatch):
+    chamadas = []
+    steps = analysis._analysis_steps
+
+    def contando(*args, **kwargs):
+        chamadas.append(1)
+        return steps(*args, **kwargs)
+
+    monkeypatch.setattr(analysis, "_analysis_steps", contando)
+    return chamadas
+
+
+def test_stream_usa_a_analise_compartilhada(api, monkeypatch):
+    chamadas = _contar_analises(monkeypatch)
+    upload = api.add_upload(_zip())
+
+    r = api.client.get(URL.format(upload.id))
+    assert r.status_code == 200
+    events = _events(r)
+    assert [e["event"] for e in events][0] == "status"
+    assert events[-2]["event"] == "progress" and events[-2]["documentos"] == 5
+    assert events[-1]["event"] == "result" and not events[-1]["compartilhado"]
+
+    # dashboard e stream seguinte saem do cache de resultado: nenhuma análise nova
+    dashboard = api.client.get(f"/api/dashboard/?client_id=1&upload_id={upload.id}").json()
+    again = _events(api.client.get(URL.format(upload.id)))
+    assert [e["event"] for e in again] == ["result"] and again[0]["compartilhado"]
+    assert again[0]["dashboard"] == events[-1]["dashboard"] == dashboard
+    assert len(chamadas) == 1
+
+
+def test_stream_sse(api):
+    upload = api.add_upload(_zip())
+    r = api.client.get(URL.format(upload.id) + "&formato=sse")
+    assert r.headers["content-type"].startswith("text/event-stream")
+    assert r.text.startswith("event: status\n")
+    assert "event: result\n" in r.text
+
+
+def test_erros_do_zip_antes_do_stream(api):
+    sem_blob = api.add_upload(_zip())
+    blobstore.get_blob_store().delete(blobstore.blob_key(sem_blob.sha256))
+    r = api.client.get(URL.format(sem_blob.id))
+    assert r.status_code == 404
+
+    corrompido = api.add_upload(b"PK\x03\x04 isto nao e um zip", filename="ruim.zip")
+    r = api.client.get(URL.format(corrompido.id))
+    assert r.status_code == 422
+
+    assert api.client.get(URL.format(9999)).status_code == 404
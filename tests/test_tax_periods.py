@@ -0,0 +1,76 @@
+from decimal import Decimal
+
+import pytest
+
+from app.services.tax_periods import PeriodLedger, parse_monthly_param
+
+
+def _por_mes(ledger):
+    return {r["competencia"]: r for r in ledger.results()}
+
+
+def test_das_em_mes_sem_nfe_nao_vira_economia():
+    ledger = PeriodLedger(aliquota_padrao=Decimal("0.06"))
+    ledger.add_revenue("2024-01", 100_000_00, 20_000_00)
+    ledger.set_month_inputs("2024-02", imposto_pago=600_000)
+
+    meses = _por_mes(ledger)
+    assert meses["2024-02"]["sem_receita"] is True
+    assert meses["2024-02"]["economia_cents"] == 0
+    assert meses["2024-01"]["sem_receita"] is False
+    assert meses["2024-01"]["economia_cents"] == 6_000_00 - 4_800_00
+
+    resumo = ledger.summary()
+    assert resumo["economia_cents"] == 1_200_00
+    assert resumo["meses"] == 1
+    assert resumo["meses_sem_receita"] == ["2024-02"]
+
+
+def test_mes_sem_nfe_fica_fora_do_rbt12():
+    ledger = PeriodLedger()
+    ledger.add_revenue("2024-01", 10_000_00)
+    ledger.set_month_inputs("2024-02", aliquota="0.05")
+    ledger.add_revenue("2024-03", 10_000_00)
+    # só janeiro é conhecido: média × 12, sem contar fevereiro como receita zero
+    assert ledger.rbt12("2024-03") == (120_000_00, True)
+
+
+def test_imposto_pago_define_aliquota_do_mes():
+    ledger = PeriodLedger()
+    ledger.add_revenue("2024-05", 50_000_00, 10_000_00)
+    ledger.set_month_inputs("2024-05", imposto_pago="3.000,00")
+    row = _por_mes(ledger)["2024-05"]
+    assert row["fonte_aliquota"] == "imposto_pago"
+    assert row["imposto_corrigido_cents"] == 2_400_00
+    assert row["economia_cents"] == 600_00
+
+
+def test_receita_nova_recalcula_janela():
+    ledger = PeriodLedger()
+    ledger.add_revenue("2024-01", 300_000_00)
+    ledger.add_revenue("2024-02", 300_000_00)
+    antes = _por_mes(ledger)["2024-02"]["rbt12_cents"]
+    ledger.add_revenue("2024-01", 300_000_00)
+    assert _por_mes(ledger)["2024-02"]["rbt12_cents"] == antes * 2
+
+
+def test_parse_monthly_param():
+    assert parse_monthly_param("2024-03:6,5;2024-04:7", percent=True) == {
+        "2024-03": Decimal("0.065"), "2024-04": Decimal("0.07"),
+    }
+    assert parse_monthly_param("2024-03:1.234,56") == {"2024-03": 123456}
+    with pytest.raises(ValueError):
+        parse_monthly_param("2024-13:10")
+
+
+def test_analise_ignora_das_de_mes_sem_nfe():
+    from app.services.analysis import run_analysis_from_bytes
+    from conftest import make_zip, nfe_xml
+
+    zip_bytes = make_zip({"1.xml": nfe_xml(1, [("R1", "REFRIGERANTE COCA-COLA 2L", "22021000", "5405", "500", 100.0)])})
+    result = run_analysis_from_bytes(zip_bytes, impostos_pagos_mensais="2024-01:6,00;2024-02:6000,00")
+    periodos = {p["competencia"]: p for p in result["periodos"]}
+    assert periodos["2024-02"]["sem_receita"] is True
+    assert periodos["2024-02"]["economia"] == 0
+    assert result["tax_summary"]["economia_estimada"] == periodos["2024-01"]["economia"]
+    assert result["periodos_resumo"]["meses_sem_receita"] == ["2024-02"]
@@ -0,0 +1,64 @@
+import sys
+import threading
+
+import pytest
+
+from app.services import tfidf_matcher
+from app.services.ai_matcher import get_matcher
+from app.services.tfidf_matcher import TfidfMatcher, canonical, split_corpus, split_keywords
+
+
+@pytest.fixture(scope="module")
+def base():
+    return get_matcher()
+
+
+def test_classifica_monofasicos_e_recusa_negativos(base):
+    model = TfidfMatcher(base, [("ARROZ TIPO 1 5KG", None)])
+    hits = model.classify_many(["CERVEJA SKOL LATA 350ML", "REFRIGERANTE COCA COLA 2L", "ARROZ TIPO 1 5KG"])
+    assert [h[0] if h else None for h in hits] == ["cerveja", "refrigerante", None]
+    assert model.classify("CERVEJA SKOL LATA 350ML") == hits[0]
+
+
+def test_cache_compartilhado_entre_threads(base, monkeypatch):
+    # cache minúsculo: o clear acontece o tempo todo enquanto outras threads leem
+    monkeypatch.setattr(tfidf_matcher, "CACHE_MAX", 8)
+    model = TfidfMatcher(base)
+    lotes = [[f"CERVEJA SKOL {t}{i} LATA" for i in range(20)] + ["FEIJAO CARIOCA 1KG"] for t in range(8)]
+    esperado = [TfidfMatcher(base).classify_many(lote) for lote in lotes]
+    erros, resultados = [], {}
+
+    def worker(t):
+        try:
+            for _ in range(30):
+                resultados[t] = model.classify_many(lotes[t])
+        except Exception as e:  # KeyError com o clear sem lock
+            erros.append(e)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=worker, args=(t,)) for t in range(len(lotes))]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert erros == []
+    assert [resultados[t] for t in range(len(lotes))] == esperado
+
+
+def test_avaliacao_fora_do_treino(base):
+    train, test = split_keywords(base.categorias)
+    assert test
+    for cat, words in base.categorias.items():
+        assert not set(train[cat]) & set(test.get(cat, []))
+        assert set(train[cat]) | set(test.get(cat, [])) == set(words)
+        if len(set(words)) > 1:
+            assert train[cat] and test[cat]
+
+    corpus = tfidf_matcher.sample_corpus(base.categorias, 500)
+    treino, avaliacao = split_corpus(corpus)
+    assert treino and avaliacao
+    assert not {canonical(d) for d, _ in treino} & {canonical(d) for d, _ in avaliacao}
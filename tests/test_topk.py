@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from app.config import settings
+from app.services.analysis import run_analysis_from_bytes
+from app.services.topk import BoundedProductRanking, CountMinSketch, SpaceSaving, TopK, resolve_ranking
+
+from conftest import make_zip, nfe_xml
+
+
+def test_topk_igual_a_ordenar_com_empate_pela_chegada():
+    rng = random.Random(3)
+    valores = [rng.randrange(50) for _ in range(2000)]
+    heap = TopK(10)
+    for pos, v in enumerate(valores):
+        heap.push(v, pos)
+    esperado = sorted(range(len(valores)), key=lambda p: (-valores[p], p))[:10]
+    assert heap.items() == esperado and heap.seen == 2000
+
+
+def test_sketch_nunca_subestima():
+    rng = random.Random(5)
+    sketch, real = CountMinSketch(width=64, depth=4), {}
+    for _ in range(5000):
+        key = f"p{int(rng.paretovariate(1.1)) % 500}"
+        sketch.add(key)
+        real[key] = real.get(key, 0) + 1
+    for key, n in real.items():
+        assert n <= sketch.estimate(key) <= n + sketch.max_error * 2
+
+
+def test_space_saving_retem_os_pesados_com_soma_exata():
+    rng = random.Random(7)
+    ss, real = SpaceSaving(capacity=20), {}
+    fluxo = [("pesado", 900)] * 40 + [(f"cauda{i}", rng.randint(1, 50)) for i in range(2000)]
+    rng.shuffle(fluxo)
+    for key, cents in fluxo:
+        ss.add(key, cents)
+        real[key] = real.get(key, 0) + cents
+    assert len(ss) == 20
+    topo = ss.top(1)[0]
+    assert topo["chave"] == "pesado" and real["pesado"] > ss.guaranteed_threshold
+    for row in ss.top():
+        assert row["peso"] >= real[row["chave"]] >= row["soma"]
+        assert row["peso"] - row["erro"] <= real[row["chave"]]
+
+
+def test_ranking_limitado_marca_linhas_aproximadas():
+    ranking = BoundedProductRanking(2, capacity=3, width=32, depth=2)
+    for i, cents in enumerate([500, 10, 20, 400, 30]):
+        ranking.add_member({"dedup": {(f"P{i}", f"D{i}"): (f"P{i}", f"D{i}", 1, cents)}, "prod": []})
+    rows = ranking.dedup_rows()
+    assert [r["codigo"] for r in rows][:2] == ["P0", "P3"]
+    assert all(("aproximado" in r) == ("erro_max_cents" in r) for r in rows)
+    assert any(r.get("aproximado") for r in rows)  # a vaga da cauda foi disputada
+
+
+def test_resolve_ranking():
+    assert resolve_ranking("completo", 5) == ("completo", None)
+    assert resolve_ranking(" TopK ", 5) == ("topk", 5)
+    for ruim in [("ranking", None), ("topk", -1)]:
+        with pytest.raises(ValueError):
+            resolve_ranking(*ruim)
+
+
+def test_analise_topk_igual_ao_comeco_da_completa(monkeypatch):
+    monkeypatch.setattr(settings, "NEAR_DUP_ENABLED", False)
+    docs = {}
+    for d in range(12):
+        itens = [(f"P{(d * 3 + i) % 17}", f"CERVEJA MARCA {(d * 3 + i) % 17} LATA", "22030000", "5405", "500",
+                  1.0 + ((d * 3 + i) * 37 % 90)) for i in range(3)]
+        docs[f"nfe/{d}.xml"] = nfe_xml(d + 1, itens)
+    data = make_zip(docs)
+
+    completa = run_analysis_from_bytes(data, ranking="completo")
+    topk = run_analysis_from_bytes(data, ranking="topk", top=4)
+    assert list(topk["produtos_duplicados"]) == list(completa["produtos_duplicados"])[:4]
+    assert len(completa["produtos_duplicados"]) == 17
+    for key in ("total_value_cents", "revenue_excluded_cents", "items", "monofasico_total"):
+        assert topk[key] == completa[key]